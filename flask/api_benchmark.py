@@ -0,0 +1,135 @@
+"""
+API 响应基准测试
+在内存数据库中生成文章，对比文章列表接口的响应体积与延迟：
+- 改造前的实现（按小时的查询缓存 + jsonify，每次请求重新序列化）
+- 未压缩 / gzip 预压缩响应
+- 携带 ETag 的条件请求（304）
+- 标准库 json 与 orjson 的序列化耗时
+
+用法: python api_benchmark.py [--posts 200] [--per-page 50] [--requests 300]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify, request
+
+from app import create_app, db, cache, limiter
+from app.api import http_cache
+from app.cache_service import get_cached_posts_list
+from app.models import User, Post
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(func, requests):
+    samples = []
+    result = None
+    for _ in range(requests):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, samples
+
+
+def seed(count):
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    for i in range(count):
+        db.session.add(Post(
+            title=f'基准测试文章 {i}', content='<p>正文内容</p>' * 50, summary='这是一段文章摘要，' * 8,
+            user_id=user.id, published=True, published_at=datetime.utcnow(),
+        ))
+    db.session.commit()
+
+
+def legacy_posts():
+    """改造前的文章列表接口：查询缓存命中时仍要逐项组装并用 jsonify 序列化"""
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    cached = get_cached_posts_list(page=page, per_page=per_page, category=None)
+    posts_payload = [{
+        'id': item['id'],
+        'title': item['title'],
+        'slug': item.get('slug'),
+        'summary': item.get('summary'),
+        'published_at': item.get('published_at'),
+        'author': item.get('author', {}).get('username') if isinstance(item.get('author'), dict) else item.get('author'),
+        'views': item.get('views')
+    } for item in cached.get('items', [])]
+    return jsonify({
+        'posts': posts_payload,
+        'total': cached.get('total', 0),
+        'pages': cached.get('pages', 0),
+        'current_page': cached.get('page', page)
+    })
+
+
+def report(name, response, samples):
+    print(f"{name:<24} status={response.status_code:<4} bytes={len(response.data):<8} "
+          f"p50={statistics.median(samples):.3f}ms p95={percentile(samples, 95):.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API 响应基准测试')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.add_url_rule('/bench/legacy-posts', 'legacy_posts', legacy_posts)
+    limiter.enabled = False
+    with app.app_context():
+        db.create_all()
+        cache.clear()
+        seed(args.posts)
+        client = app.test_client()
+        url = f'/api/v1/posts?per_page={args.per_page}'
+
+        legacy_url = f'/bench/legacy-posts?per_page={args.per_page}'
+
+        def legacy_uncached():
+            cache.clear()
+            return client.get(legacy_url)
+
+        def uncached():
+            cache.clear()
+            return client.get(url)
+
+        report('改造前（无缓存）', *measure(legacy_uncached, max(args.requests // 10, 10)))
+        report('改造前（查询缓存命中）', *measure(lambda: client.get(legacy_url), args.requests))
+        report('首次请求（无缓存）', *measure(uncached, max(args.requests // 10, 10)))
+        report('缓存命中', *measure(lambda: client.get(url), args.requests))
+        report('缓存命中 + gzip', *measure(
+            lambda: client.get(url, headers={'Accept-Encoding': 'gzip'}), args.requests))
+        etag = client.get(url).headers['ETag']
+        report('条件请求（304）', *measure(
+            lambda: client.get(url, headers={'If-None-Match': etag}), args.requests))
+
+        payload = json.loads(client.get(url).data)
+        for name, encode in (
+            ('json.dumps', lambda: json.dumps(payload, ensure_ascii=False).encode('utf-8')),
+            ('http_cache.dumps', lambda: http_cache.dumps(payload)),
+        ):
+            body, samples = measure(encode, args.requests)
+            print(f"{name:<24} bytes={len(body):<8} p50={statistics.median(samples):.3f}ms "
+                  f"p95={percentile(samples, 95):.3f}ms")
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
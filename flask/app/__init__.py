@@ -130,6 +130,30 @@ def create_app(config_name='default'):
             app.logger.warning(f'Celery 初始化失败: {e}, 继续启动应用...')
             celery = None
     
+    # 注册媒体文件落位钩子（提交后移动，回滚时清理）
+    from app.media.storage import init_media_storage
+    init_media_storage(app)
+    
+    # 初始化媒体后台处理流水线
+    from app.media.processing import init_media_processing
+    init_media_processing(app)
+    
+    # 注册站点计数器维护钩子与对账命令
+    from app.site_counters import init_site_counters
+    init_site_counters(app)
+    
+    # 注册相关文章刷新钩子与重建命令
+    from app.related_posts import init_related_posts
+    init_related_posts(app)
+    
+    # 注册 API 响应缓存失效钩子
+    from app.api.http_cache import init_http_cache
+    init_http_cache(app)
+    
+    # 注册站点地图缓存失效钩子
+    from app.sitemap import init_sitemap
+    init_sitemap(app)
+    
     # 注册缓存命令
     from app.cache_commands import init_cache_commands
     init_cache_commands(app)
@@ -1,6 +1,6 @@
 from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
-from app import db
+from app import db, site_counters
 from app.admin import bp
 from app.admin.utils import admin_required
 from app.models import User, Post, Comment, Category, Tag
@@ -12,11 +12,12 @@ from app.admin.forms import EditUserForm  # Import EditUserForm
 @admin_required
 def index():
     """管理员仪表板"""
-    # 统计信息
-    user_count = User.query.count()
-    post_count = Post.query.count()
-    comment_count = Comment.query.count()
-    category_count = Category.query.count()
+    # 统计信息（增量维护的计数器，不做全表 COUNT）
+    counters = site_counters.get_counters()
+    user_count = counters.get(site_counters.USERS, 0)
+    post_count = counters.get(site_counters.POSTS, 0)
+    comment_count = counters.get(site_counters.COMMENTS, 0)
+    category_count = counters.get(site_counters.CATEGORIES, 0)
     
     # 最新文章
     recent_posts = Post.query.order_by(Post.created_at.desc()).limit(5).all()
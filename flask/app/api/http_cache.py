@@ -0,0 +1,204 @@
+"""
+API 响应缓存
+把序列化后的 JSON 连同预压缩的 gzip/brotli 版本、ETag 与 Last-Modified 一起缓存，
+缓存键包含文章代数令牌：文章变更提交后更新令牌，旧响应自然失效。条件请求
+（If-None-Match / If-Modified-Since）只需读取令牌与缓存条目即可返回 304，
+不访问数据库也不重新序列化。
+"""
+
+import gzip
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from app import cache, db
+from app.models import Post
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，缺失时使用标准库
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GENERATION_KEY_PREFIX = 'api_generation'
+RESPONSE_KEY_PREFIX = 'api_response'
+
+# 文章列表的代数令牌；单篇文章使用 post:<id>
+POSTS_SCOPE = 'posts'
+
+# 出现在文章列表中的字段；只有浏览量变化时列表令牌不变，列表依靠缓存超时刷新浏览量
+LIST_FIELDS = ('published', 'published_at', 'title', 'slug', 'summary', 'user_id', 'category_id')
+
+# 只有这些字段变化时详情令牌也不变：每次访问都会自增浏览量，否则 ETag 每次都变，
+# 详情同样依靠缓存超时刷新浏览量
+VOLATILE_FIELDS = frozenset({'views'})
+
+# 小于该大小的响应不压缩
+MIN_COMPRESS_SIZE = 512
+
+# session.info 中暂存本事务内的令牌更新：scope -> True
+PENDING_KEY = 'api_generation_pending'
+
+_hooks_registered = False
+
+
+def dumps(payload):
+    """序列化为 UTF-8 JSON 字节（优先使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def _generation_timeout():
+    # 令牌过期后生成的新令牌只会让旧响应失效，不会命中过期内容
+    return current_app.config.get('API_GENERATION_TIMEOUT', 24 * 3600)
+
+
+def generation(scope, create=True):
+    """代数令牌；缓存中没有（首次、过期或被淘汰）时生成新令牌，不会命中旧响应
+
+    create=False 时只读取，令牌不存在返回 None。
+    """
+    key = f"{GENERATION_KEY_PREFIX}:{scope}"
+    token = cache.get(key)
+    if token is None and create:
+        token = time.time_ns()
+        cache.set(key, token, timeout=_generation_timeout())
+    return token
+
+
+def bump(scopes):
+    for scope in scopes:
+        try:
+            cache.set(f"{GENERATION_KEY_PREFIX}:{scope}", time.time_ns(), timeout=_generation_timeout())
+        except Exception as e:
+            current_app.logger.warning(f"更新 API 缓存代数失败: {scope}, {e}")
+
+
+def response_key(name, scope, *parts, create=True):
+    """响应缓存键：端点名 + 所属令牌 + 请求参数；create=False 且令牌不存在时返回 None"""
+    token = generation(scope, create=create)
+    if token is None:
+        return None
+    suffix = ':'.join(str(p) for p in parts)
+    return f"{RESPONSE_KEY_PREFIX}:{name}:{token}:{suffix}"
+
+
+def build_entry(payload, last_modified=None):
+    """序列化并预压缩，返回缓存条目"""
+    body = dumps(payload)
+    entry = {
+        'etag': hashlib.sha1(body).hexdigest(),
+        'last_modified': (last_modified or datetime.utcnow()).replace(microsecond=0),
+        'identity': body,
+    }
+    if len(body) >= MIN_COMPRESS_SIZE:
+        entry['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            entry['br'] = brotli.compress(body, quality=5)
+    return entry
+
+
+def store_entry(key, entry):
+    cache.set(key, entry, timeout=current_app.config.get('API_RESPONSE_CACHE_TIMEOUT', 60))
+    return entry
+
+
+def _choose_encoding(entry):
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in entry and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+def _etag(entry, encoding):
+    # 不同编码的字节不同，强 ETag 也要区分
+    return entry['etag'] if encoding == 'identity' else f"{entry['etag']}-{encoding}"
+
+
+def is_not_modified(entry):
+    """条目与请求中的验证器匹配时返回 True（If-None-Match 优先于 If-Modified-Since）"""
+    if entry is None:
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains(_etag(entry, _choose_encoding(entry)))
+    if request.if_modified_since:
+        return entry['last_modified'] <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def make_cached_response(entry):
+    """按 Accept-Encoding 返回条目中的对应编码，条件请求匹配时返回 304"""
+    encoding = _choose_encoding(entry)
+    not_modified = is_not_modified(entry)
+    response = current_app.response_class(
+        b'' if not_modified else entry[encoding],
+        status=304 if not_modified else 200,
+        mimetype='application/json',
+    )
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(_etag(entry, encoding))
+    response.last_modified = entry['last_modified']
+    response.cache_control.no_cache = True  # 客户端可缓存，但每次使用前需要重新验证
+    return response
+
+
+# --- 文章钩子 ---
+
+def _mark_pending(target, list_changed):
+    session = object_session(target)
+    if session is None or target.id is None:
+        return
+    pending = session.info.setdefault(PENDING_KEY, set())
+    pending.add(post_scope(target.id))
+    if list_changed:
+        pending.add(POSTS_SCOPE)
+
+
+def init_http_cache(app):
+    """注册文章变更钩子（事件监听器全局只注册一次）"""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+
+    @event.listens_for(Post, 'after_insert')
+    def after_post_insert(mapper, connection, target):
+        _mark_pending(target, True)
+
+    @event.listens_for(Post, 'after_update')
+    def after_post_update(mapper, connection, target):
+        # 只有浏览量变化时令牌都不变；列表只关心展示的字段
+        changed = {attr.key for attr in inspect(target).attrs if attr.history.has_changes()}
+        if changed - VOLATILE_FIELDS:
+            _mark_pending(target, bool(changed.intersection(LIST_FIELDS)))
+
+    @event.listens_for(Post, 'after_delete')
+    def after_post_delete(mapper, connection, target):
+        _mark_pending(target, True)
+
+    @event.listens_for(db.session, 'after_commit')
+    def after_session_commit(session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if pending:
+            bump(pending)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def after_session_rollback(session):
+        session.info.pop(PENDING_KEY, None)
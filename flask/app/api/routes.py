@@ -4,6 +4,7 @@ from app import db, cache, limiter
 from app.api import bp
 from app.models import User, Post, Comment
 from app.api.auth import token_required
+from app.api import http_cache
 from app.cache_service import get_cached_posts_list, get_cached_post_detail, CacheInvalidation
 
 @bp.route('/auth/login', methods=['POST'])
@@ -107,24 +108,30 @@ def get_posts():
             current_app.logger.error(f"搜索失败，回退到基础列表: {e}")
             # 回退到基础列表查询（下面的缓存路径）
 
-    # 没有关键词：使用缓存的文章列表（可按分类名或ID过滤）
-    cached = get_cached_posts_list(page=page, per_page=per_page, category=category)
-    posts_payload = [{
-        'id': item['id'],
-        'title': item['title'],
-        'slug': item.get('slug'),
-        'summary': item.get('summary'),
-        'published_at': item.get('published_at'),
-        'author': item.get('author', {}).get('username') if isinstance(item.get('author'), dict) else item.get('author'),
-        'views': item.get('views')
-    } for item in cached.get('items', [])]
+    # 没有关键词：使用缓存的响应（序列化与压缩结果随文章列表代数失效）
+    key = http_cache.response_key('posts', http_cache.POSTS_SCOPE, page, per_page, category or '')
+    entry = cache.get(key)
+    if entry is None:
+        # 代数令牌已保证新鲜度，绕过按小时分组的查询缓存直接查询（可按分类名或ID过滤）
+        cached = get_cached_posts_list.__wrapped__(page=page, per_page=per_page, category=category)
+        posts_payload = [{
+            'id': item['id'],
+            'title': item['title'],
+            'slug': item.get('slug'),
+            'summary': item.get('summary'),
+            'published_at': item.get('published_at'),
+            'author': item.get('author', {}).get('username') if isinstance(item.get('author'), dict) else item.get('author'),
+            'views': item.get('views')
+        } for item in cached.get('items', [])]
 
-    return jsonify({
-        'posts': posts_payload,
-        'total': cached.get('total', 0),
-        'pages': cached.get('pages', 0),
-        'current_page': cached.get('page', page)
-    })
+        entry = http_cache.store_entry(key, http_cache.build_entry({
+            'posts': posts_payload,
+            'total': cached.get('total', 0),
+            'pages': cached.get('pages', 0),
+            'current_page': cached.get('page', page)
+        }))
+
+    return http_cache.make_cached_response(entry)
 
 @bp.route('/search/suggest', methods=['GET'])
 @limiter.limit("30/minute")
@@ -150,24 +157,48 @@ def search_suggest():
 @limiter.limit("10/minute")
 @cache.cached(timeout=300, query_string=True)
 def search_popular():
-    """热门搜索词接口"""
+    """热门搜索词接口（window 取 hour/day/week/all）"""
     limit = request.args.get('limit', 10, type=int)
+    window = request.args.get('window', 'all', type=str)
     try:
         from app.search_service import get_search_service
         service = get_search_service()
         if not service:
             return jsonify([])
-        popular = service.get_popular_searches(limit=limit) or []
+        popular = service.get_popular_searches(limit=limit, window=window) or []
         # 统一返回数组形式（若为简单字符串数组则直接返回）
         return jsonify(popular)
     except Exception as e:
         current_app.logger.error(f"获取热门搜索失败: {e}")
         return jsonify([])
 
+@bp.route('/search/trending', methods=['GET'])
+@limiter.limit("10/minute")
+@cache.cached(timeout=60, query_string=True)
+def search_trending():
+    """趋势搜索词接口（最近一小时热度上升最快）"""
+    limit = request.args.get('limit', 10, type=int)
+    try:
+        from app.search_service import get_search_service
+        service = get_search_service()
+        if not service:
+            return jsonify([])
+        return jsonify(service.get_trending_searches(limit=limit) or [])
+    except Exception as e:
+        current_app.logger.error(f"获取趋势搜索失败: {e}")
+        return jsonify([])
+
 @bp.route('/posts/<int:id>', methods=['GET'])
 @limiter.limit("120/minute")
 def get_post(id):
     """获取单篇文章"""
+    # 条件请求命中时直接返回 304（不访问数据库，重新验证不计入浏览量）；
+    # 只读取已有的令牌，不为不存在的文章创建令牌
+    key = http_cache.response_key('post', http_cache.post_scope(id), create=False)
+    entry = cache.get(key) if key is not None else None
+    if http_cache.is_not_modified(entry):
+        return http_cache.make_cached_response(entry)
+
     post = Post.query.get_or_404(id)
 
     if not post.published:
@@ -187,12 +218,19 @@ def get_post(id):
     except Exception as e:
         current_app.logger.error(f"文章缓存失效失败: {e}")
 
+    # 浏览量不更新令牌：缓存条目仍有效时直接返回，ETag 在缓存超时前保持不变
+    if entry is not None:
+        return http_cache.make_cached_response(entry)
+
     # 通过缓存方法获取并返回最新详情
     detail = get_cached_post_detail(post.id)
     if not detail:
         return jsonify({'message': '文章未发布'}), 404
 
-    return jsonify(detail)
+    # 文章已确认存在，此时才创建令牌并保存本次响应供后续条件请求使用
+    entry = http_cache.build_entry(detail, last_modified=post.updated_at)
+    http_cache.store_entry(http_cache.response_key('post', http_cache.post_scope(post.id)), entry)
+    return http_cache.make_cached_response(entry)
 
 @bp.route('/posts', methods=['POST'])
 @jwt_required()
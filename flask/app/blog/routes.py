@@ -13,6 +13,8 @@ from app.models import Post, Comment, Category, Tag
 from app.blog.forms import PostForm, CommentForm
 from app.cache_service import get_cached_posts_list, get_cached_categories, CacheInvalidation
 from app.query_optimization import QueryOptimization
+from app import sitemap as sitemap_service
+from app.related_posts import get_related_posts
 
 def save_uploaded_file(file):
     """保存上传的文件"""
@@ -213,23 +215,11 @@ def post(id):
     post.views += 1
     db.session.commit()
     
-    # 获取相关文章
-    related_posts = []
-    if post.category_id:
-        related_posts = QueryOptimization.get_posts_with_relations(
-            page=1,
-            per_page=5,
-            category_id=post.category_id,
-            published_only=True
-        ).items
-        related_posts = [p for p in related_posts if p.id != post.id]
-    
-    if len(related_posts) < 5:
-        additional_posts = QueryOptimization.get_popular_posts(
-            limit=5 - len(related_posts),
-            days=90
-        )
-        related_posts.extend([p for p in additional_posts if p.id != post.id])
+    # 获取相关文章（预计算，见 app.related_posts）；尚未计算时退回热门文章
+    related_posts = get_related_posts(post.id, limit=5)
+    if not related_posts:
+        additional_posts = QueryOptimization.get_popular_posts(limit=6, days=90)
+        related_posts = [p for p in additional_posts if p.id != post.id]
     
     form = CommentForm()
     
@@ -725,30 +715,28 @@ def api_publish_draft(id):
 
 @bp.route('/sitemap.xml', methods=['GET'])
 def sitemap():
-    """生成sitemap.xml"""
-    pages = []
-    
-    # 添加静态页面
-    for rule in current_app.url_map.iter_rules():
-        if "GET" in rule.methods and not rule.arguments and not rule.rule.startswith("/admin"):
-            try:
-                url = url_for(rule.endpoint, _external=True)
-            except Exception:
-                # 兜底：如果无法反向生成URL，则使用rule字符串
-                url = rule.rule
-            pages.append([url, datetime.utcnow().strftime('%Y-%m-%d')])
-    
-    # 添加文章页面
-    posts = Post.query.filter_by(published=True).all()
-    for post in posts:
-        url = url_for('blog.post', id=post.id, _external=True)
-        last_mod = post.updated_at or getattr(post, 'published_at', None) or getattr(post, 'created_at', None)
-        date_str = last_mod.strftime('%Y-%m-%d') if last_mod else datetime.utcnow().strftime('%Y-%m-%d')
-        pages.append([url, date_str])
-    
-    # 生成XML
-    sitemap_xml = render_template('sitemap_template.xml', pages=pages)
-    response = make_response(sitemap_xml)
+    """sitemap 索引，指向页面分片与各文章分片"""
+    return _sitemap_response(sitemap_service.INDEX_SHARD)
+
+
+@bp.route('/sitemap-<name>.xml', methods=['GET'])
+def sitemap_shard(name):
+    """单个 sitemap 分片：pages 或 posts-<序号>"""
+    if name == sitemap_service.PAGES_SHARD:
+        return _sitemap_response(name)
+    prefix, _, number = name.partition('-')
+    if prefix != 'posts' or not number.isdigit():
+        abort(404)
+    return _sitemap_response(int(number))
+
+
+def _sitemap_response(shard):
+    document = sitemap_service.get_document(shard)
+    response = make_response(document['body'])
     response.headers['Content-Type'] = 'application/xml'
-    
-    return response
+    response.set_etag(document['etag'])
+    response.last_modified = document['last_modified']
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('SITEMAP_MAX_AGE', 3600)
+    # If-None-Match / If-Modified-Since 命中时返回 304
+    return response.make_conditional(request)
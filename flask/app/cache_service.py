@@ -5,8 +5,9 @@
 
 from flask import current_app
 from app import cache, db
-from app.models import User, Post, Comment, Category
+from app.models import User, Post, Comment, Category, SiteCounter
 from functools import wraps
+import fnmatch
 import hashlib
 import json
 from datetime import datetime, timedelta
@@ -168,6 +169,14 @@ class CacheInvalidation:
     @staticmethod
     def _delete_by_patterns(patterns):
         """根据模式删除缓存"""
+        backend = cache.cache
+        if not hasattr(backend, '_write_client') and isinstance(getattr(backend, '_cache', None), dict):
+            # 进程内 SimpleCache（开发/测试环境）：直接匹配内存中的键
+            prefix = current_app.config.get('CACHE_KEY_PREFIX', '')
+            for key in list(backend._cache):
+                if any(fnmatch.fnmatchcase(key, p) or fnmatch.fnmatchcase(key, f"{prefix}{p}") for p in patterns):
+                    backend.delete(key)
+            return
         try:
             # 获取Redis连接
             redis_client = cache.cache._write_client
@@ -322,12 +331,15 @@ def get_cached_user_stats(user_id):
 
 @cached_query('site_stats')
 def get_cached_site_stats():
-    """获取网站统计信息"""
+    """获取网站统计信息（读取增量维护的计数器）"""
+    from app import site_counters
+    counters = site_counters.get_counters()
+    total_users = counters.get(site_counters.USERS, 0)
     stats = {
-        'total_users': User.query.count(),
-        'total_posts': Post.query.filter_by(published=True).count(),
-        'total_comments': Comment.query.count(),
-        'recent_users': User.query.order_by(User.id.desc()).limit(5).count(),
+        'total_users': total_users,
+        'total_posts': counters.get(site_counters.POSTS_PUBLISHED, 0),
+        'total_comments': counters.get(site_counters.COMMENTS, 0),
+        'recent_users': min(total_users, 5),
         'updated_at': datetime.now().isoformat()
     }
     
@@ -335,17 +347,17 @@ def get_cached_site_stats():
 
 @cached_query('categories')
 def get_cached_categories():
-    """获取分类列表及文章数量"""
+    """获取有已发布文章的分类及文章数量（读取分类计数器）"""
+    from app import site_counters
     categories = (
         db.session.query(
             Category.id.label('id'),
             Category.name.label('name'),
-            db.func.count(Post.id).label('post_count'),
+            SiteCounter.value.label('post_count'),
         )
-        .join(Post, Post.category_id == Category.id)
-        .filter(Post.published == True)
-        .group_by(Category.id, Category.name)
-        .order_by(db.desc('post_count'))
+        .join(SiteCounter, site_counters.category_counter_join())
+        .filter(SiteCounter.value > 0)
+        .order_by(SiteCounter.value.desc())
         .all()
     )
 
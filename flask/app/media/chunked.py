@@ -0,0 +1,207 @@
+"""
+分块上传（可断点续传）
+init 创建上传会话；append 把每个分块从请求流写入独立的暂存文件并增量计算 sha256，
+以数据库中的偏移做条件更新确认后才拼接到临时文件的对应偏移处；连接中断后客户端查询
+已接收的偏移量继续上传；complete 校验大小与客户端提供的哈希后交给内容存储（MediaBlob）
+与后台处理流水线。整个过程内存占用与文件大小无关。
+
+会话状态保存在数据库中，多个 worker 都能处理后续分块；增量哈希状态只保存在处理分块的
+进程内，分块落到其他进程时在 complete 阶段重新顺序读取临时文件计算哈希。
+"""
+
+import glob
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import MediaUploadSession
+from app.media.storage import CHUNK_SIZE, copy_stream, store_blob
+from app.media.utils import MediaFileProcessor
+
+
+class UploadOffsetMismatch(ValueError):
+    """分块起始偏移与服务器已接收的字节数不一致（客户端应从 expected 处续传）"""
+
+    def __init__(self, expected):
+        super().__init__(f"分块偏移不匹配，应从 {expected} 字节处继续上传")
+        self.expected = expected
+
+
+# 进程内的增量哈希状态：upload_id -> (已计入哈希的字节数, hasher)
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+_MAX_HASHERS = 256
+
+
+def temp_path(upload_id):
+    tmp_dir = os.path.join(current_app.static_folder, 'uploads', 'media', 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    return os.path.join(tmp_dir, f"{upload_id}.part")
+
+
+def init_upload(user_id, filename, total_size):
+    """创建上传会话；文件类型与大小限制在上传开始前校验"""
+    file_type = MediaFileProcessor.get_file_type(filename or '')
+    if file_type == 'unknown':
+        raise ValueError(f"不支持的文件类型: {filename}")
+    max_size = MediaFileProcessor.MAX_FILE_SIZE.get(file_type, 10 * 1024 * 1024)
+    if total_size is None or total_size <= 0:
+        raise ValueError("无效的文件大小")
+    if total_size > max_size:
+        raise ValueError(f"文件太大，最大允许 {max_size // (1024 * 1024)}MB")
+
+    purge_expired_sessions()
+    session = MediaUploadSession(id=uuid.uuid4().hex, user_id=user_id, filename=filename,
+                                 file_type=file_type, total_size=total_size, received=0)
+    # 预先创建空的临时文件，后续分块按偏移写入
+    open(temp_path(session.id), 'wb').close()
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+
+def append_chunk(session, stream, start):
+    """把分块写入临时文件的 start 处，返回新的已接收字节数
+
+    start 必须等于已接收字节数。分块先完整写入暂存文件，随后的条件更新决定同一偏移的
+    并发或重传请求中哪一个胜出；只有胜出者在提交前把暂存内容拼接进临时文件，
+    落败的请求不会改动已确认的字节。
+    """
+    if start != session.received:
+        raise UploadOffsetMismatch(session.received)
+
+    hasher, valid = _take_hasher(session.id, start)
+    scratch = f"{temp_path(session.id)}.{uuid.uuid4().hex}.chunk"
+    try:
+        with open(scratch, 'wb') as out:
+            received = copy_stream(stream, out, hasher, session.total_size, written=start)
+
+        # 以数据库中的偏移做条件更新；行在提交前保持写锁，同一偏移的其他请求会等待并失败
+        updated = MediaUploadSession.query.filter_by(id=session.id, received=start).update(
+            {MediaUploadSession.received: received, MediaUploadSession.updated_at: datetime.utcnow()},
+            synchronize_session=False,
+        )
+        if not updated:
+            db.session.rollback()
+            current = db.session.query(MediaUploadSession.received).filter_by(id=session.id).scalar()
+            raise UploadOffsetMismatch(current or 0)
+        try:
+            _splice(scratch, temp_path(session.id), start)
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.commit()
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+
+    if valid:
+        _put_hasher(session.id, received, hasher)
+    db.session.refresh(session)
+    return received
+
+
+def complete_upload(session, expected_sha256):
+    """校验并登记上传内容，返回可用于创建 MediaFile 的字段
+
+    客户端必须提供整个文件的 sha256；大小与哈希任一不符时丢弃上传。
+    """
+    if session.received != session.total_size:
+        raise ValueError(f"上传未完成: {session.received}/{session.total_size}")
+    if not expected_sha256:
+        raise ValueError("缺少文件的 sha256 校验值")
+
+    path = temp_path(session.id)
+    if not os.path.exists(path) or os.path.getsize(path) != session.total_size:
+        discard_upload(session)
+        raise ValueError("文件大小校验失败，请重新上传")
+
+    with _hashers_lock:
+        entry = _hashers.pop(session.id, None)
+    if entry is not None and entry[0] == session.total_size:
+        digest = entry[1].hexdigest()
+    else:
+        digest = _hash_file(path)
+
+    if expected_sha256.lower() != digest:
+        discard_upload(session)
+        raise ValueError("文件校验失败，请重新上传")
+
+    stored_filename = MediaFileProcessor.generate_unique_filename(session.filename)
+    _, ext = os.path.splitext(stored_filename)
+    mime_type = MediaFileProcessor.guess_mime_type(session.filename)
+    blob, _ = store_blob(path, digest, session.total_size, session.file_type, ext, mime_type)
+    db.session.delete(session)
+    return MediaFileProcessor.build_file_info(session.filename, stored_filename, blob)
+
+
+def discard_upload(session):
+    """放弃上传会话并删除临时文件"""
+    with _hashers_lock:
+        _hashers.pop(session.id, None)
+    path = temp_path(session.id)
+    # 进程中途退出时可能残留暂存分块
+    for leftover in [path] + glob.glob(f"{glob.escape(path)}.*.chunk"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    db.session.delete(session)
+    db.session.commit()
+
+
+def purge_expired_sessions(limit=20):
+    """清理长时间没有新分块的上传会话（每次最多 limit 个，摊销到 init 请求中）"""
+    ttl = current_app.config.get('MEDIA_UPLOAD_SESSION_TTL', 24 * 3600)
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    expired = MediaUploadSession.query.filter(MediaUploadSession.updated_at < cutoff).limit(limit).all()
+    for session in expired:
+        discard_upload(session)
+    return len(expired)
+
+
+class _NullHasher:
+    """增量哈希状态不在本进程时使用，complete 阶段再整体计算"""
+
+    def update(self, data):
+        pass
+
+
+def _take_hasher(upload_id, start):
+    """取出与 start 对齐的增量哈希；对不上时返回空 hasher 并标记为无效"""
+    if start == 0:
+        return hashlib.sha256(), True
+    with _hashers_lock:
+        entry = _hashers.pop(upload_id, None)
+    if entry is not None and entry[0] == start:
+        return entry[1], True
+    return _NullHasher(), False
+
+
+def _put_hasher(upload_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[upload_id] = (offset, hasher)
+        _hashers.move_to_end(upload_id)
+        while len(_hashers) > _MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def _splice(scratch, path, start):
+    """把暂存的分块写入临时文件的 start 处，并丢弃其后的内容"""
+    with open(scratch, 'rb') as src, open(path, 'r+b') as out:
+        out.seek(start)
+        out.truncate()
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            out.write(chunk)
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,127 @@
+"""
+媒体库关键字搜索
+filename/description/alt_text 建全文索引：SQLite 使用 FTS5（trigram 分词，支持中文与子串匹配），
+PostgreSQL 使用 tsvector 表达式 GIN 索引；标签按名称走 media_tag 索引精确匹配。
+索引随 media_file 表一起创建（create_all 与迁移），不可用时退回 LIKE 扫描。
+"""
+
+import weakref
+
+from sqlalchemy import Integer, column, event, or_, select, text
+
+from app import db
+from app.models import MediaFile, MediaTag, media_file_tags
+
+FTS_TABLE = 'media_file_fts'
+
+# trigram 分词至少需要 3 个字符，更短的关键字退回 LIKE
+MIN_FTS_KEYWORD_LENGTH = 3
+
+# PostgreSQL 索引表达式，查询时必须使用完全相同的表达式才能命中索引
+PG_TSVECTOR = (
+    "to_tsvector('simple', coalesce(filename, '') || ' ' || "
+    "coalesce(description, '') || ' ' || coalesce(alt_text, ''))"
+)
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "filename, description, alt_text, content='media_file', content_rowid='id', tokenize='trigram')",
+    # 外部内容表通过触发器与 media_file 保持同步
+    f"CREATE TRIGGER IF NOT EXISTS media_file_fts_ai AFTER INSERT ON media_file BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, filename, description, alt_text) "
+    "VALUES (new.id, new.filename, new.description, new.alt_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS media_file_fts_ad AFTER DELETE ON media_file BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, filename, description, alt_text) "
+    "VALUES ('delete', old.id, old.filename, old.description, old.alt_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS media_file_fts_au AFTER UPDATE OF filename, description, alt_text ON media_file BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, filename, description, alt_text) "
+    "VALUES ('delete', old.id, old.filename, old.description, old.alt_text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, filename, description, alt_text) "
+    "VALUES (new.id, new.filename, new.description, new.alt_text); END",
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_media_file_fulltext ON media_file USING gin ({PG_TSVECTOR})",
+]
+
+# engine -> 全文索引是否可用
+_available = weakref.WeakKeyDictionary()
+
+
+def create_fulltext_index(connection):
+    """为当前数据库创建全文索引（幂等），返回是否可用"""
+    dialect = connection.dialect.name
+    statements = SQLITE_DDL if dialect == 'sqlite' else POSTGRES_DDL if dialect == 'postgresql' else []
+    if not statements:
+        return False
+    try:
+        for statement in statements:
+            connection.execute(text(statement))
+    except Exception:
+        # 例如 SQLite 未编译 FTS5 扩展
+        return False
+    return True
+
+
+@event.listens_for(MediaFile.__table__, 'after_create')
+def _create_fulltext_after_table(target, connection, **kw):
+    create_fulltext_index(connection)
+
+
+@event.listens_for(MediaFile.__table__, 'after_drop')
+def _drop_fulltext_after_table(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def fulltext_available():
+    engine = db.engine
+    available = _available.get(engine)
+    if available is None:
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                available = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': FTS_TABLE},
+                ).first() is not None
+        else:
+            available = engine.dialect.name == 'postgresql'
+        _available[engine] = available
+    return available
+
+
+def keyword_filter(keyword):
+    """返回匹配关键字的过滤条件：全文索引命中或标签名相同"""
+    keyword = (keyword or '').strip()
+    by_tag = tag_filter(keyword)
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite' and len(keyword) >= MIN_FTS_KEYWORD_LENGTH and fulltext_available():
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        matched = MediaFile.id.in_(
+            text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query")
+            .bindparams(fts_query=phrase)
+            .columns(column('rowid', Integer))
+        )
+        return or_(matched, by_tag)
+    if dialect == 'postgresql':
+        matched = text(f"{PG_TSVECTOR} @@ plainto_tsquery('simple', :fts_query)").bindparams(fts_query=keyword)
+        return or_(matched, by_tag)
+
+    like = f"%{keyword}%"
+    return or_(
+        MediaFile.filename.like(like),
+        MediaFile.description.like(like),
+        MediaFile.alt_text.like(like),
+        by_tag,
+    )
+
+
+def tag_filter(tag_name):
+    """按标签精确过滤"""
+    return MediaFile.id.in_(
+        select(media_file_tags.c.media_file_id)
+        .join(MediaTag, MediaTag.id == media_file_tags.c.media_tag_id)
+        .where(MediaTag.name == tag_name.strip())
+    )
+
@@ -0,0 +1,229 @@
+"""
+媒体文件后台处理流水线
+上传请求只负责保存原文件并写入 MediaFile（状态 pending），缩略图、尺寸、时长等
+衍生数据交给后台生成后写回数据库：
+- celery：提交 process_media_async 任务（需配置可用的 broker）
+- local：本进程的进程池并行处理，完成回调中写回结果
+- sync：在当前请求内同步处理（测试环境）
+"""
+
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app import db
+from app.media.utils import MediaFileProcessor
+
+logger = logging.getLogger(__name__)
+
+# 处理状态
+STATUS_PENDING = 'pending'
+STATUS_PROCESSING = 'processing'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+# 需要生成衍生数据的文件类型
+PROCESSABLE_TYPES = ('image', 'video', 'audio')
+
+
+def absolute_media_path(app, media_file):
+    return os.path.join(app.static_folder, media_file.file_path)
+
+
+def record_processing_result(media_id, metadata=None, error=None):
+    """把处理结果写回 MediaFile（需在应用上下文中调用）
+
+    衍生文件属于内容对象，结果同时写入 MediaBlob 与共享该内容、尚未就绪的其他 MediaFile。
+    """
+    from app.models import MediaFile
+
+    media_file = db.session.get(MediaFile, media_id)
+    if media_file is None:
+        return False
+    values = {'processed_at': datetime.utcnow()}
+    if error is None:
+        for key in ('dimensions', 'duration', 'variants'):
+            if metadata and metadata.get(key) is not None:
+                values[key] = metadata[key]
+        values.update(processing_status=STATUS_READY, processing_error=None)
+    else:
+        values.update(processing_status=STATUS_FAILED, processing_error=str(error)[:500])
+
+    for key, value in values.items():
+        setattr(media_file, key, value)
+    blob = media_file.blob
+    if blob is not None:
+        blob.processing_status = values['processing_status']
+        blob.dimensions = values.get('dimensions', blob.dimensions)
+        blob.duration = values.get('duration', blob.duration)
+        blob.variants = values.get('variants', blob.variants)
+        MediaFile.query.filter(
+            MediaFile.blob_id == blob.id,
+            MediaFile.id != media_file.id,
+            MediaFile.processing_status != STATUS_READY,
+        ).update(values, synchronize_session=False)
+    db.session.commit()
+    return True
+
+
+def process_media_file(media_id):
+    """处理单个媒体文件并写回结果（Celery 任务与同步模式共用，需在应用上下文中调用）"""
+    from flask import current_app
+    from app.models import MediaFile
+
+    media_file = db.session.get(MediaFile, media_id)
+    if media_file is None:
+        return {'status': 'missing', 'media_id': media_id}
+
+    media_file.processing_status = STATUS_PROCESSING
+    db.session.commit()
+    try:
+        metadata = MediaFileProcessor.process_derivatives(
+            absolute_media_path(current_app, media_file), media_file.file_type
+        )
+    except Exception as e:
+        logger.error(f"媒体文件处理失败: media_id={media_id}, error={e}")
+        record_processing_result(media_id, error=e)
+        return {'status': STATUS_FAILED, 'media_id': media_id, 'error': str(e)}
+
+    record_processing_result(media_id, metadata)
+    return {'status': STATUS_READY, 'media_id': media_id}
+
+
+class MediaProcessingPipeline:
+    """衍生文件生成调度器"""
+
+    def __init__(self, app, backend='local', max_workers=None):
+        self.app = app
+        self.backend = backend
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0  # 本进程处理（local/sync）的数量，Celery 任务不计入
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, media_files):
+        """提交一批已提交到数据库的 MediaFile；不需要处理的类型直接标记为 ready
+
+        复用了已处理内容（重复上传）的记录状态已是 ready，不会再次处理；同一批中共享内容的
+        记录只处理一次，结果由 record_processing_result 一并写回。
+        """
+        todo = []
+        seen_blobs = set()
+        for media_file in media_files:
+            if media_file.processing_status == STATUS_READY:
+                continue
+            if media_file.blob_id is not None:
+                if media_file.blob_id in seen_blobs:
+                    continue
+                seen_blobs.add(media_file.blob_id)
+            if media_file.file_type in PROCESSABLE_TYPES:
+                todo.append(media_file)
+            else:
+                media_file.processing_status = STATUS_READY
+                media_file.processed_at = datetime.utcnow()
+        if db.session.dirty:
+            db.session.commit()
+
+        for media_file in todo:
+            if self.backend == 'celery' and self._submit_celery(media_file.id):
+                continue
+            with self._lock:
+                self.submitted += 1
+            if self.backend == 'sync':
+                self._count(process_media_file(media_file.id)['status'] == STATUS_READY)
+                continue
+            self._submit_local(media_file)
+        return len(todo)
+
+    def _submit_celery(self, media_id):
+        try:
+            from app.tasks_definitions import process_media_async
+            if process_media_async is None:
+                return False
+            process_media_async.delay(media_id)
+            return True
+        except Exception as e:
+            logger.warning(f"提交 Celery 媒体处理任务失败，改用本地进程池: {e}")
+            return False
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _submit_local(self, media_file):
+        media_id = media_file.id
+        future = self._get_executor().submit(
+            MediaFileProcessor.process_derivatives,
+            absolute_media_path(self.app, media_file),
+            media_file.file_type,
+        )
+        future.add_done_callback(lambda f: self._on_local_done(media_id, f))
+
+    def _on_local_done(self, media_id, future):
+        # 回调运行在执行器的管理线程中，需要自行推入应用上下文
+        error = future.exception()
+        with self.app.app_context():
+            try:
+                record_processing_result(media_id, None if error else future.result(), error)
+            except Exception as e:
+                logger.error(f"写回媒体处理结果失败: media_id={media_id}, error={e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+        self._count(error is None)
+
+    def _count(self, ok):
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'max_workers': self.max_workers,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'in_flight': self.submitted - self.completed - self.failed,
+        }
+
+
+# 全局流水线实例
+media_pipeline = None
+
+
+def init_media_processing(app):
+    """根据配置初始化媒体处理流水线"""
+    global media_pipeline
+    media_pipeline = MediaProcessingPipeline(
+        app,
+        backend=app.config.get('MEDIA_PROCESSING_BACKEND', 'local'),
+        max_workers=app.config.get('MEDIA_PROCESSING_WORKERS'),
+    )
+    if media_pipeline.backend == 'local':
+        atexit.register(media_pipeline.shutdown)
+    return media_pipeline
+
+
+def get_media_pipeline():
+    """获取媒体处理流水线实例"""
+    global media_pipeline
+    if media_pipeline is None:
+        from flask import current_app
+        init_media_processing(current_app._get_current_object())
+    return media_pipeline
@@ -2,14 +2,23 @@ import os
 from flask import render_template, redirect, url_for, flash, request, abort, jsonify, current_app, send_file
 from flask_login import current_user, login_required
 from sqlalchemy import and_, or_, desc, asc
+from sqlalchemy.orm import selectinload
 from datetime import datetime
+from werkzeug.http import parse_content_range_header
 
-from app import db
+from app import db, cache
 from app.media import bp
-from app.models import MediaFile, MediaFolder, PostMediaFile, User
+from app.models import MediaFile, MediaFolder, PostMediaFile, User, MediaUploadSession
 from app.media.forms import (MediaUploadForm, MediaEditForm, MediaFolderForm, 
                             MediaSearchForm, MediaBatchOperationForm)
 from app.media.utils import MediaFileProcessor
+from app.media.processing import get_media_pipeline
+from app.media.fulltext import keyword_filter, tag_filter
+from app.media.tags import add_tags, remove_tags
+from app.media.chunked import (UploadOffsetMismatch, init_upload, append_chunk, complete_upload,
+                               discard_upload)
+from app.media.variants import (available_formats, build_srcset, ensure_variant, original_width,
+                                picture_sources, target_widths)
 
 
 @bp.route('/')
@@ -25,15 +34,7 @@ def index():
     # 应用过滤条件
     if form.validate():
         if form.keyword.data:
-            keyword = f"%{form.keyword.data}%"
-            query = query.filter(
-                or_(
-                    MediaFile.filename.like(keyword),
-                    MediaFile.description.like(keyword),
-                    MediaFile.tags.like(keyword),
-                    MediaFile.alt_text.like(keyword)
-                )
-            )
+            query = query.filter(keyword_filter(form.keyword.data))
         
         if form.file_type.data:
             query = query.filter_by(file_type=form.file_type.data)
@@ -97,6 +98,7 @@ def upload():
     
     if form.validate_on_submit():
         uploaded_files = []
+        media_files = []
         errors = []
         
         for file in form.files.data:
@@ -115,6 +117,9 @@ def upload():
                     file_size=file_info['file_size'],
                     dimensions=file_info['dimensions'],
                     duration=file_info['duration'],
+                    variants=file_info['variants'],
+                    processing_status=file_info['processing_status'],
+                    blob_id=file_info['blob_id'],
                     description=form.description.data,
                     tags=form.tags.data,
                     uploaded_by=current_user.id,
@@ -122,6 +127,7 @@ def upload():
                 )
                 
                 db.session.add(media_file)
+                media_files.append(media_file)
                 uploaded_files.append(file_info['filename'])
                 
             except Exception as e:
@@ -129,6 +135,7 @@ def upload():
         
         try:
             db.session.commit()
+            _submit_processing(media_files)
             
             if uploaded_files:
                 flash(f'成功上传 {len(uploaded_files)} 个文件', 'success')
@@ -188,6 +195,8 @@ def edit_file(file_id):
         media_file.description = form.description.data
         media_file.alt_text = form.alt_text.data
         media_file.tags = form.tags.data
+        if media_file.is_public and not form.is_public.data:
+            _forget_variant_urls(media_file)
         media_file.is_public = form.is_public.data
         
         if current_user.is_admin:
@@ -331,28 +340,20 @@ def batch_operation():
             
             elif operation == 'set_private':
                 for media_file in media_files:
+                    _forget_variant_urls(media_file)
                     media_file.is_public = False
                     success_count += 1
             
             elif operation == 'add_tags':
-                new_tags = form.tags_to_add.data
-                if new_tags:
-                    for media_file in media_files:
-                        existing_tags = media_file.get_tags_list()
-                        new_tags_list = [tag.strip() for tag in new_tags.split(',')]
-                        combined_tags = list(set(existing_tags + new_tags_list))
-                        media_file.set_tags_list(combined_tags)
-                        success_count += 1
+                # 集合操作：一条 INSERT ... SELECT 完成所有文件的标签关联
+                if form.tags_to_add.data:
+                    add_tags([m.id for m in media_files], form.tags_to_add.data)
+                    success_count = len(media_files)
             
             elif operation == 'remove_tags':
-                tags_to_remove = form.tags_to_remove.data
-                if tags_to_remove:
-                    tags_to_remove_list = [tag.strip() for tag in tags_to_remove.split(',')]
-                    for media_file in media_files:
-                        existing_tags = media_file.get_tags_list()
-                        filtered_tags = [tag for tag in existing_tags if tag not in tags_to_remove_list]
-                        media_file.set_tags_list(filtered_tags)
-                        success_count += 1
+                if form.tags_to_remove.data:
+                    remove_tags([m.id for m in media_files], form.tags_to_remove.data)
+                    success_count = len(media_files)
             
             db.session.commit()
             flash(f'批量操作完成，处理了 {success_count} 个文件', 'success')
@@ -374,6 +375,7 @@ def api_files():
     per_page = request.args.get('per_page', 20, type=int)
     file_type = request.args.get('type')
     keyword = request.args.get('keyword')
+    tag = request.args.get('tag')
     
     query = MediaFile.query.filter_by(is_active=True)
     
@@ -381,14 +383,10 @@ def api_files():
         query = query.filter_by(file_type=file_type)
     
     if keyword:
-        keyword_filter = f"%{keyword}%"
-        query = query.filter(
-            or_(
-                MediaFile.filename.like(keyword_filter),
-                MediaFile.description.like(keyword_filter),
-                MediaFile.tags.like(keyword_filter)
-            )
-        )
+        query = query.filter(keyword_filter(keyword))
+    
+    if tag:
+        query = query.filter(tag_filter(tag))
     
     # 权限过滤
     if not current_user.is_admin:
@@ -399,7 +397,7 @@ def api_files():
             )
         )
     
-    files = query.order_by(desc(MediaFile.uploaded_at)).paginate(
+    files = query.options(selectinload(MediaFile.tag_items)).order_by(desc(MediaFile.uploaded_at)).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
@@ -409,11 +407,13 @@ def api_files():
             'filename': f.filename,
             'file_url': f.file_url,
             'thumbnail_url': MediaFileProcessor.get_thumbnail_url(f),
+            'srcset': {fmt: build_srcset(f, fmt) for fmt in available_formats()} if f.is_image else {},
             'file_type': f.file_type,
             'file_size': f.formatted_size,
             'uploaded_at': f.uploaded_at.strftime('%Y-%m-%d %H:%M'),
             'dimensions': f.dimensions,
-            'alt_text': f.alt_text
+            'alt_text': f.alt_text,
+            'tags': f.get_tags_list()
         } for f in files.items],
         'pagination': {
             'page': files.page,
@@ -449,47 +449,225 @@ def api_use_file(file_id):
 @bp.route('/api/upload', methods=['POST'])
 @login_required
 def api_upload():
-    """API文件上传（用于编辑器）"""
-    if 'file' not in request.files:
-        return jsonify({'error': '没有文件'}), 400
+    """API文件上传（用于编辑器与拖拽批量上传）
     
-    file = request.files['file']
-    if file.filename == '':
+    文件保存并写入数据库后立即返回，缩略图等衍生数据由后台流水线并行生成，
+    可通过 /api/file/<id>/status 查询处理进度。
+    """
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f and f.filename]
+    if not files:
         return jsonify({'error': '没有选择文件'}), 400
     
+    media_files = []
+    errors = []
+    for file in files:
+        try:
+            # 处理文件上传
+            file_info = MediaFileProcessor.save_file(file)
+            
+            # 创建数据库记录
+            media_file = MediaFile(
+                filename=file_info['filename'],
+                stored_filename=file_info['stored_filename'],
+                file_path=file_info['file_path'],
+                file_url=file_info['file_url'],
+                file_type=file_info['file_type'],
+                mime_type=file_info['mime_type'],
+                file_size=file_info['file_size'],
+                dimensions=file_info['dimensions'],
+                duration=file_info['duration'],
+                variants=file_info['variants'],
+                processing_status=file_info['processing_status'],
+                blob_id=file_info['blob_id'],
+                uploaded_by=current_user.id,
+                is_public=True
+            )
+            db.session.add(media_file)
+            media_files.append(media_file)
+        except Exception as e:
+            errors.append(f"{file.filename}: {str(e)}")
+    
+    if not media_files:
+        return jsonify({'error': '; '.join(errors)}), 400
+    
     try:
-        # 处理文件上传
-        file_info = MediaFileProcessor.save_file(file)
-        
-        # 创建数据库记录
-        media_file = MediaFile(
-            filename=file_info['filename'],
-            stored_filename=file_info['stored_filename'],
-            file_path=file_info['file_path'],
-            file_url=file_info['file_url'],
-            file_type=file_info['file_type'],
-            mime_type=file_info['mime_type'],
-            file_size=file_info['file_size'],
-            dimensions=file_info['dimensions'],
-            duration=file_info['duration'],
-            uploaded_by=current_user.id,
-            is_public=True
-        )
-        
-        db.session.add(media_file)
         db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'file': {
-                'id': media_file.id,
-                'filename': media_file.filename,
-                'file_url': media_file.file_url,
-                'file_type': media_file.file_type,
-                'thumbnail_url': MediaFileProcessor.get_thumbnail_url(media_file)
-            }
-        })
-        
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
+    
+    _submit_processing(media_files)
+    
+    results = [_upload_result(media_file) for media_file in media_files]
+    return jsonify({
+        'success': True,
+        'file': results[0],
+        'files': results,
+        'errors': errors
+    })
+
+
+@bp.route('/api/upload/init', methods=['POST'])
+@login_required
+def api_upload_init():
+    """创建分块上传会话：{filename, size} -> {upload_id, chunk_size}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        session = init_upload(current_user.id, data.get('filename'), int(data.get('size') or 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'upload_id': session.id,
+        'chunk_size': current_app.config.get('MEDIA_UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024),
+        'received': 0,
+        'total_size': session.total_size
+    }), 201
+
+
+@bp.route('/api/upload/<upload_id>', methods=['GET'])
+@login_required
+def api_upload_status(upload_id):
+    """查询已接收的字节数（断线后据此续传）"""
+    session = _get_upload_session(upload_id)
+    return jsonify({'upload_id': session.id, 'received': session.received, 'total_size': session.total_size})
+
+
+@bp.route('/api/upload/<upload_id>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id):
+    """追加分块：请求体为原始字节，偏移由 Content-Range（bytes start-end/total）或 ?offset= 指定"""
+    session = _get_upload_session(upload_id)
+    content_range = parse_content_range_header(request.headers.get('Content-Range'))
+    start = content_range.start if content_range else request.args.get('offset', 0, type=int)
+    
+    try:
+        # 直接读取请求流，不经过表单解析，分块不会整体载入内存
+        received = append_chunk(session, request.stream, start)
+    except UploadOffsetMismatch as e:
+        return jsonify({'error': str(e), 'received': e.expected}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e), 'received': session.received}), 400
+    
+    return jsonify({'upload_id': session.id, 'received': received, 'total_size': session.total_size})
+
+
+@bp.route('/api/upload/<upload_id>/complete', methods=['POST'])
+@login_required
+def api_upload_complete(upload_id):
+    """完成分块上传：校验大小/哈希，登记内容并提交后台处理"""
+    session = _get_upload_session(upload_id)
+    data = request.get_json(silent=True) or {}
+    try:
+        file_info = complete_upload(session, data.get('sha256'))
+        media_file = MediaFile(**file_info, uploaded_by=current_user.id, is_public=bool(data.get('is_public', True)))
+        db.session.add(media_file)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
+    _submit_processing([media_file])
+    return jsonify({'success': True, 'file': _upload_result(media_file)})
+
+
+@bp.route('/api/upload/<upload_id>', methods=['DELETE'])
+@login_required
+def api_upload_abort(upload_id):
+    """放弃分块上传"""
+    discard_upload(_get_upload_session(upload_id))
+    return jsonify({'success': True})
+
+
+def _get_upload_session(upload_id):
+    session = db.session.get(MediaUploadSession, upload_id)
+    if session is None or session.user_id != current_user.id:
+        abort(404)
+    return session
+
+
+@bp.route('/api/file/<int:file_id>/status')
+@login_required
+def api_file_status(file_id):
+    """查询文件后台处理状态API"""
+    media_file = MediaFile.query.get_or_404(file_id)
+    
+    # 检查权限
+    if not media_file.is_public and media_file.uploaded_by != current_user.id and not current_user.is_admin:
+        abort(403)
+    
+    return jsonify({
+        'id': media_file.id,
+        'processing_status': media_file.processing_status,
+        'processing_error': media_file.processing_error,
+        'dimensions': media_file.dimensions,
+        'duration': media_file.duration,
+        'thumbnail_url': MediaFileProcessor.get_thumbnail_url(media_file)
+    })
+
+
+@bp.route('/variant/<int:file_id>/w<int:width>.<fmt>')
+def variant(file_id, width, fmt):
+    """按需生成缺失的图片变体并重定向到静态文件"""
+    cache_key = f"media_variant:{file_id}:{width}:{fmt}"
+    url = cache.get(cache_key)
+    # 只缓存公开文件的地址，命中缓存即为公开文件
+    is_public = url is not None
+    if url is None:
+        media_file = MediaFile.query.get_or_404(file_id)
+        if not media_file.is_active or not media_file.is_image or not media_file.is_processed:
+            abort(404)
+        if not media_file.is_public and not (
+                current_user.is_authenticated
+                and (media_file.uploaded_by == current_user.id or current_user.is_admin)):
+            abort(404)
+        # 只接受预定义的宽度档位与可编码的格式，避免任意尺寸触发生成
+        if fmt not in available_formats() or width not in target_widths(original_width(media_file)):
+            abort(404)
+        
+        url = ensure_variant(media_file, width, fmt)
+        is_public = media_file.is_public
+        if is_public:
+            cache.set(cache_key, url, timeout=current_app.config.get('MEDIA_VARIANT_CACHE_TIMEOUT', 3600))
+    
+    response = redirect(url)
+    # 私有文件的重定向经过权限检查，不能被共享缓存（CDN/代理）保存后提供给其他用户
+    response.headers['Cache-Control'] = 'public, max-age=86400' if is_public else 'private, no-store'
+    return response
+
+
+def _forget_variant_urls(media_file):
+    """文件改为私有时删除缓存的变体地址，之后的请求重新经过权限检查"""
+    if not media_file.is_image:
+        return
+    for width in target_widths(original_width(media_file)):
+        for fmt in available_formats():
+            cache.delete(f"media_variant:{media_file.id}:{width}:{fmt}")
+
+
+@bp.app_template_global('media_picture_sources')
+def media_picture_sources(media_file):
+    """模板中生成 <picture> 的 <source> 列表"""
+    return picture_sources(media_file)
+
+
+def _submit_processing(media_files):
+    """把已提交的媒体文件交给后台流水线；提交失败不影响上传结果，状态保持 pending"""
+    if not media_files:
+        return
+    try:
+        get_media_pipeline().submit(media_files)
+    except Exception as e:
+        current_app.logger.error(f"提交媒体处理任务失败: {e}")
+
+
+def _upload_result(media_file):
+    return {
+        'id': media_file.id,
+        'filename': media_file.filename,
+        'file_url': media_file.file_url,
+        'file_type': media_file.file_type,
+        'processing_status': media_file.processing_status,
+        # 衍生文件就绪前为原文件地址
+        'thumbnail_url': MediaFileProcessor.get_thumbnail_url(media_file)
+    }
@@ -0,0 +1,170 @@
+"""
+按内容寻址的媒体存储
+上传内容边写入临时文件边计算 sha256，哈希相同的内容只保存一份（MediaBlob），
+缩略图等衍生数据也随之复用；MediaBlob.ref_count 记录引用数，最后一个 MediaFile
+删除时才清理磁盘文件。
+
+新内容在事务提交后才从临时文件移动到最终位置，事务回滚（或会话未提交就关闭）时
+删除临时文件，磁盘上不会留下没有 MediaBlob 记录的文件。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import MediaBlob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# session.info 中暂存本事务内待落位的文件：[(临时路径, 最终绝对路径)]
+PENDING_KEY = 'media_blob_pending'
+
+# 事件监听器注册在全局的 db.session 上，多次 create_app（如测试）时只注册一次
+_hooks_registered = False
+
+
+class FileTooLargeError(ValueError):
+    """上传内容超过大小限制"""
+
+
+def blob_relative_path(file_type, digest, ext):
+    """内容哈希 -> 相对 static 的存储路径，两级目录分散文件数量"""
+    return os.path.join('uploads', 'media', file_type, 'blobs', digest[:2], digest[2:4], f"{digest}{ext.lower()}")
+
+
+def copy_stream(stream, out, hasher, max_size, written=0):
+    """分块把 stream 写入 out 并更新哈希，返回累计写入字节数；超过 max_size 立即中止"""
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return written
+        written += len(chunk)
+        if max_size is not None and written > max_size:
+            raise FileTooLargeError(f"文件太大，最大允许 {max_size // (1024 * 1024)}MB")
+        hasher.update(chunk)
+        out.write(chunk)
+
+
+def stream_to_temp(stream, max_size=None):
+    """把上传流写入 static 目录下的临时文件，返回 (临时路径, sha256, 大小)
+
+    临时文件与最终存储位置在同一文件系统，落盘后可直接 os.replace。
+    """
+    tmp_dir = os.path.join(current_app.static_folder, 'uploads', 'media', 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+    hasher = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            size = copy_stream(stream, out, hasher, max_size)
+    except Exception:
+        _remove_quietly(tmp_path)
+        raise
+    return tmp_path, hasher.hexdigest(), size
+
+
+def store_blob(tmp_path, digest, size, file_type, ext, mime_type):
+    """把已落盘的临时文件登记为内容对象并增加一次引用，返回 (blob, created)
+
+    哈希已存在时丢弃临时文件（磁盘上的内容缺失时用它补回）；并发上传相同新内容时
+    依靠 sha256 唯一约束判定胜者，失败的一方转为增加引用。文件在事务提交后才移动到最终位置。
+    """
+    blob = MediaBlob.query.filter_by(sha256=digest).first()
+    if blob is None:
+        relative_path = blob_relative_path(file_type, digest, ext)
+        _place(tmp_path, relative_path)
+        try:
+            with db.session.begin_nested():
+                blob = MediaBlob(sha256=digest, file_path=relative_path, file_type=file_type,
+                                 mime_type=mime_type, file_size=size, ref_count=1)
+                db.session.add(blob)
+            return blob, True
+        except IntegrityError:
+            blob = MediaBlob.query.filter_by(sha256=digest).one()
+    else:
+        _place(tmp_path, blob.file_path)
+
+    _adjust_ref_count(blob.id, 1)
+    return blob, False
+
+
+def release_blob(media_file):
+    """解除 MediaFile 对内容对象的引用；引用归零时删除 MediaBlob，返回是否应清理磁盘文件"""
+    blob_id = media_file.blob_id
+    if blob_id is None:
+        return True
+    media_file.blob_id = None
+    db.session.flush()
+
+    _adjust_ref_count(blob_id, -1)
+    remaining = db.session.query(MediaBlob.ref_count).filter_by(id=blob_id).scalar()
+    if remaining is not None and remaining > 0:
+        return False
+    MediaBlob.query.filter_by(id=blob_id).delete(synchronize_session='fetch')
+    return True
+
+
+def _adjust_ref_count(blob_id, delta):
+    # 在数据库中原子地加减，避免并发请求互相覆盖计数
+    MediaBlob.query.filter_by(id=blob_id).update(
+        {MediaBlob.ref_count: MediaBlob.ref_count + delta}, synchronize_session='fetch'
+    )
+
+
+def _place(tmp_path, relative_path):
+    """登记提交后要移动的临时文件；目标已存在时直接丢弃临时文件"""
+    target = os.path.join(current_app.static_folder, relative_path)
+    if os.path.exists(target):
+        _remove_quietly(tmp_path)
+        return
+    db.session.info.setdefault(PENDING_KEY, []).append((tmp_path, target))
+
+
+def _move_into_place(tmp_path, target):
+    if os.path.exists(target):
+        _remove_quietly(tmp_path)
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(tmp_path, target)
+
+
+def init_media_storage(app):
+    """注册事务钩子：提交后移动文件，未提交的事务结束时删除临时文件"""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+
+    @event.listens_for(db.session, 'after_commit')
+    def after_session_commit(session):
+        # 保存点提交也会触发 after_commit，此时外层事务仍可能回滚
+        if session.in_nested_transaction():
+            return
+        for tmp_path, target in session.info.pop(PENDING_KEY, ()):
+            try:
+                _move_into_place(tmp_path, target)
+            except OSError as e:
+                logger.error(f"移动媒体文件失败: {tmp_path} -> {target}, {e}")
+
+    @event.listens_for(db.session, 'after_transaction_end')
+    def after_transaction_end(session, transaction):
+        # 只处理最外层事务；提交时已在 after_commit 中取走，剩下的属于回滚或未提交就关闭的事务
+        if transaction.parent is not None:
+            return
+        for tmp_path, _ in session.info.pop(PENDING_KEY, ()):
+            _remove_quietly(tmp_path)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"删除临时文件失败: {path}, {e}")
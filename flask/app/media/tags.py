@@ -0,0 +1,90 @@
+"""
+媒体文件标签
+标签保存在 media_tag 表中，通过 media_file_tags 关联；批量添加/移除标签以集合方式执行，
+语句数量与选中文件数无关。
+"""
+
+import re
+
+from sqlalchemy import and_, exists, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import MediaFile, MediaTag, media_file_tags
+
+MAX_TAG_LENGTH = 100
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def parse_tags(value):
+    """把逗号分隔的字符串或列表解析为去重、去空白的标签列表（保持原顺序）"""
+    if not value:
+        return []
+    items = value.split(',') if isinstance(value, str) else value
+    tags = []
+    for item in items:
+        tag = _WHITESPACE_RE.sub(' ', str(item)).strip()[:MAX_TAG_LENGTH]
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def get_or_create_tags(names):
+    """按名称获取标签，不存在的批量创建；并发创建同名标签时以唯一约束为准"""
+    if not names:
+        return []
+    existing = {tag.name: tag for tag in MediaTag.query.filter(MediaTag.name.in_(names))}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        try:
+            with db.session.begin_nested():
+                for name in missing:
+                    existing[name] = MediaTag(name=name)
+                    db.session.add(existing[name])
+        except IntegrityError:
+            existing = {tag.name: tag for tag in MediaTag.query.filter(MediaTag.name.in_(names))}
+    return [existing[name] for name in names if name in existing]
+
+
+def add_tags(media_ids, names):
+    """为一批媒体文件添加标签（单条 INSERT ... SELECT，跳过已存在的关联），返回新增关联数"""
+    tags = get_or_create_tags(parse_tags(names))
+    if not media_ids or not tags:
+        return 0
+    pairs = select(MediaFile.id, MediaTag.id).where(
+        MediaFile.id.in_(media_ids),
+        MediaTag.id.in_([tag.id for tag in tags]),
+        ~exists().where(and_(
+            media_file_tags.c.media_file_id == MediaFile.id,
+            media_file_tags.c.media_tag_id == MediaTag.id,
+        )),
+    )
+    result = db.session.execute(
+        media_file_tags.insert().from_select(['media_file_id', 'media_tag_id'], pairs)
+    )
+    _expire_tag_items(media_ids)
+    return result.rowcount
+
+
+def remove_tags(media_ids, names):
+    """从一批媒体文件移除标签（单条 DELETE），返回删除的关联数"""
+    names = parse_tags(names)
+    if not media_ids or not names:
+        return 0
+    tag_ids = select(MediaTag.id).where(MediaTag.name.in_(names))
+    result = db.session.execute(
+        media_file_tags.delete().where(
+            media_file_tags.c.media_file_id.in_(media_ids),
+            media_file_tags.c.media_tag_id.in_(tag_ids),
+        )
+    )
+    _expire_tag_items(media_ids)
+    return result.rowcount
+
+
+def _expire_tag_items(media_ids):
+    # 直接执行的 SQL 不会同步会话中已加载的关系，让它们下次访问时重新加载
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, MediaFile) and obj.id in media_ids:
+            db.session.expire(obj, ['tag_items'])
@@ -1,13 +1,20 @@
 import os
 import uuid
 import mimetypes
-from PIL import Image, ImageOps
+from PIL import Image
 from werkzeug.utils import secure_filename
 from flask import current_app, url_for
 import subprocess
 import json
+import logging
 from datetime import datetime
 
+from app.media.storage import stream_to_temp, store_blob, release_blob
+from app.media.variants import generate_variants, variant_relative_path, thumbnail_url as variant_thumbnail_url
+
+# 衍生文件生成可能运行在进程池/Celery worker 中（无应用上下文），统一使用模块日志
+logger = logging.getLogger(__name__)
+
 class MediaFileProcessor:
     """媒体文件处理器"""
     
@@ -74,203 +81,167 @@ class MediaFileProcessor:
         if file_type == 'unknown':
             raise ValueError(f"不支持的文件类型: {original_filename}")
         
-        # 检查文件大小
-        file.seek(0, 2)  # 移动到文件末尾
-        file_size = file.tell()
-        file.seek(0)  # 重置到文件开头
-        
-        if file_size > cls.MAX_FILE_SIZE.get(file_type, 10 * 1024 * 1024):
-            max_size_mb = cls.MAX_FILE_SIZE.get(file_type, 10 * 1024 * 1024) // (1024 * 1024)
-            raise ValueError(f"文件太大，最大允许 {max_size_mb}MB")
-        
-        # 生成存储路径和文件名
-        upload_path = cls.get_upload_path(file_type)
+        max_size = cls.MAX_FILE_SIZE.get(file_type, 10 * 1024 * 1024)
         stored_filename = cls.generate_unique_filename(original_filename)
-        file_path = os.path.join(upload_path, stored_filename)
-        
-        # 保存文件
-        file.save(file_path)
-        
-        # 获取相对路径和URL
-        relative_path = os.path.relpath(file_path, current_app.static_folder)
-        file_url = url_for('static', filename=relative_path.replace('\\', '/'))
+        _, ext = os.path.splitext(stored_filename)
         
         # 获取文件信息
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if not mime_type:
-            mime_type = 'application/octet-stream'
+        mime_type = cls.guess_mime_type(original_filename)
         
-        file_info = {
+        # 边写入边计算哈希，超出大小限制立即中止；相同内容复用已有存储对象
+        tmp_path, digest, file_size = stream_to_temp(file.stream, max_size)
+        blob, _ = store_blob(tmp_path, digest, file_size, file_type, ext, mime_type)
+        return cls.build_file_info(original_filename, stored_filename, blob)
+    
+    @classmethod
+    def guess_mime_type(cls, filename):
+        """根据文件名推断 MIME 类型"""
+        mime_type, _ = mimetypes.guess_type(filename)
+        return mime_type or 'application/octet-stream'
+    
+    @classmethod
+    def build_file_info(cls, original_filename, stored_filename, blob):
+        """根据存储对象生成 MediaFile 字段；内容已处理过时直接带上衍生元数据"""
+        reused = blob.processing_status == 'ready'
+        return {
             'filename': original_filename,
             'stored_filename': stored_filename,
-            'file_path': relative_path,
-            'file_url': file_url,
-            'file_type': file_type,
-            'mime_type': mime_type,
-            'file_size': file_size,
-            'dimensions': None,
-            'duration': None
+            'file_path': blob.file_path,
+            'file_url': url_for('static', filename=blob.file_path.replace('\\', '/')),
+            'file_type': cls.get_file_type(original_filename),
+            'mime_type': blob.mime_type,
+            'file_size': blob.file_size,
+            'dimensions': blob.dimensions if reused else None,
+            'duration': blob.duration if reused else None,
+            'variants': blob.variants if reused else None,
+            'processing_status': 'ready' if reused else 'pending',
+            'blob_id': blob.id
         }
+    
+    @classmethod
+    def process_derivatives(cls, file_path, file_type):
+        """生成衍生文件并返回元数据（dimensions/duration）
         
-        # 处理不同类型的文件
+        不依赖应用上下文，可在进程池或 Celery worker 中执行；失败时抛出异常。
+        """
         if file_type == 'image':
-            file_info.update(cls.process_image(file_path))
-        elif file_type == 'video':
-            file_info.update(cls.process_video(file_path))
-        elif file_type == 'audio':
-            file_info.update(cls.process_audio(file_path))
-        
-        return file_info
+            return cls.process_image(file_path)
+        if file_type == 'video':
+            return cls.process_video(file_path)
+        if file_type == 'audio':
+            return cls.process_audio(file_path)
+        return {}
     
     @classmethod
     def process_image(cls, file_path):
-        """处理图片文件"""
-        try:
-            with Image.open(file_path) as img:
-                # 获取尺寸
-                width, height = img.size
-                dimensions = f"{width},{height}"
-                
-                # 生成缩略图
-                cls.generate_thumbnail(file_path, img)
-                
-                return {
-                    'dimensions': dimensions
-                }
-        except Exception as e:
-            current_app.logger.error(f"处理图片失败: {e}")
+        """处理图片文件：读取尺寸并生成按宽度的 WebP/AVIF 变体"""
+        if file_path.lower().endswith('.svg'):
+            # 矢量图无需生成位图变体
             return {}
-    
-    @classmethod
-    def generate_thumbnail(cls, file_path, img=None):
-        """生成缩略图"""
-        try:
-            if img is None:
-                img = Image.open(file_path)
-            
-            # 创建缩略图目录
-            thumbnail_dir = os.path.join(os.path.dirname(file_path), 'thumbnails')
-            os.makedirs(thumbnail_dir, exist_ok=True)
+        
+        with Image.open(file_path) as img:
+            # 获取尺寸
+            width, height = img.size
+            dimensions = f"{width},{height}"
             
-            # 生成不同尺寸的缩略图
-            sizes = [(150, 150), (300, 300), (600, 600)]
+            # 生成响应式变体
+            variants = generate_variants(file_path, img=img)
             
-            for size in sizes:
-                # 保持宽高比的缩略图
-                thumbnail = ImageOps.fit(img, size, Image.Resampling.LANCZOS)
-                
-                # 保存缩略图
-                filename = os.path.basename(file_path)
-                name, ext = os.path.splitext(filename)
-                thumbnail_name = f"{name}_{size[0]}x{size[1]}{ext}"
-                thumbnail_path = os.path.join(thumbnail_dir, thumbnail_name)
-                
-                thumbnail.save(thumbnail_path, optimize=True, quality=85)
-                
-        except Exception as e:
-            current_app.logger.error(f"生成缩略图失败: {e}")
+            return {
+                'dimensions': dimensions,
+                'variants': variants
+            }
     
+    @staticmethod
+    def _ffprobe(file_path, *show):
+        """调用 ffprobe 读取媒体信息；ffprobe 不可用或无法解析文件时抛出异常"""
+        cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', *show, file_path]
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffprobe 无法解析文件 (exit {result.returncode})")
+        return json.loads(result.stdout)
+
     @classmethod
     def process_video(cls, file_path):
-        """处理视频文件"""
-        try:
-            # 使用ffprobe获取视频信息
-            cmd = [
-                'ffprobe', '-v', 'quiet', '-print_format', 'json',
-                '-show_format', '-show_streams', file_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                info = json.loads(result.stdout)
-                
-                # 获取视频流信息
-                video_stream = next((s for s in info['streams'] if s['codec_type'] == 'video'), None)
-                
-                if video_stream:
-                    width = video_stream.get('width')
-                    height = video_stream.get('height')
-                    dimensions = f"{width},{height}" if width and height else None
-                    
-                    # 获取时长
-                    duration = float(info['format'].get('duration', 0))
-                    
-                    # 生成视频缩略图
-                    cls.generate_video_thumbnail(file_path)
-                    
-                    return {
-                        'dimensions': dimensions,
-                        'duration': int(duration)
-                    }
-            
-        except Exception as e:
-            current_app.logger.error(f"处理视频失败: {e}")
-        
-        return {}
+        """处理视频文件（失败时抛出异常，由处理流水线记录为 failed）"""
+        info = cls._ffprobe(file_path, '-show_format', '-show_streams')
+
+        # 获取视频流信息
+        video_stream = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), None)
+        if video_stream is None:
+            raise ValueError("文件中没有视频流")
+
+        width = video_stream.get('width')
+        height = video_stream.get('height')
+        dimensions = f"{width},{height}" if width and height else None
+
+        # 获取时长
+        duration = float(info.get('format', {}).get('duration', 0))
+
+        # 生成视频缩略图
+        cls.generate_video_thumbnail(file_path)
+
+        return {
+            'dimensions': dimensions,
+            'duration': int(duration)
+        }
     
     @classmethod
     def generate_video_thumbnail(cls, file_path):
-        """生成视频缩略图"""
-        try:
-            # 创建缩略图目录
-            thumbnail_dir = os.path.join(os.path.dirname(file_path), 'thumbnails')
-            os.makedirs(thumbnail_dir, exist_ok=True)
-            
-            # 生成缩略图文件名
-            filename = os.path.basename(file_path)
-            name, _ = os.path.splitext(filename)
-            thumbnail_name = f"{name}_thumbnail.jpg"
-            thumbnail_path = os.path.join(thumbnail_dir, thumbnail_name)
-            
-            # 使用ffmpeg生成缩略图（视频中间帧）
-            cmd = [
-                'ffmpeg', '-i', file_path, '-ss', '00:00:01.000',
-                '-vframes', '1', '-f', 'image2', '-y', thumbnail_path
-            ]
-            
-            subprocess.run(cmd, capture_output=True, timeout=30)
-            
-        except Exception as e:
-            current_app.logger.error(f"生成视频缩略图失败: {e}")
+        """生成视频缩略图（失败时抛出异常）"""
+        # 创建缩略图目录
+        thumbnail_dir = os.path.join(os.path.dirname(file_path), 'thumbnails')
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        
+        # 生成缩略图文件名
+        filename = os.path.basename(file_path)
+        name, _ = os.path.splitext(filename)
+        thumbnail_name = f"{name}_thumbnail.jpg"
+        thumbnail_path = os.path.join(thumbnail_dir, thumbnail_name)
+        
+        # 使用ffmpeg生成缩略图（视频中间帧）
+        cmd = [
+            'ffmpeg', '-i', file_path, '-ss', '00:00:01.000',
+            '-vframes', '1', '-f', 'image2', '-y', thumbnail_path
+        ]
+        
+        result = subprocess.run(cmd, capture_output=True, timeout=30)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg 生成缩略图失败 (exit {result.returncode})")
     
     @classmethod
     def process_audio(cls, file_path):
-        """处理音频文件"""
-        try:
-            # 使用ffprobe获取音频信息
-            cmd = [
-                'ffprobe', '-v', 'quiet', '-print_format', 'json',
-                '-show_format', file_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                info = json.loads(result.stdout)
-                
-                # 获取时长
-                duration = float(info['format'].get('duration', 0))
-                
-                return {
-                    'duration': int(duration)
-                }
-            
-        except Exception as e:
-            current_app.logger.error(f"处理音频失败: {e}")
-        
-        return {}
+        """处理音频文件（失败时抛出异常，由处理流水线记录为 failed）"""
+        info = cls._ffprobe(file_path, '-show_format')
+
+        # 获取时长
+        duration = float(info.get('format', {}).get('duration', 0))
+
+        return {
+            'duration': int(duration)
+        }
     
     @classmethod
     def delete_file(cls, media_file):
-        """删除文件及其相关资源"""
+        """删除文件及其相关资源（共享内容仍被其他记录引用时只减少引用计数）"""
+        variants = media_file.variants
+        if not release_blob(media_file):
+            return True
+        
         try:
             # 删除主文件
             file_path = os.path.join(current_app.static_folder, media_file.file_path)
             if os.path.exists(file_path):
                 os.remove(file_path)
             
-            # 删除缩略图
+            # 删除响应式变体
+            for entry in variants or []:
+                variant_path = os.path.join(current_app.static_folder,
+                                            variant_relative_path(media_file.file_path, entry['file']))
+                if os.path.exists(variant_path):
+                    os.remove(variant_path)
+            
+            # 删除缩略图（旧版本生成的方形缩略图与视频缩略图）
             if media_file.is_image or media_file.is_video:
                 thumbnail_dir = os.path.join(os.path.dirname(file_path), 'thumbnails')
                 if os.path.exists(thumbnail_dir):
@@ -301,24 +272,12 @@ class MediaFileProcessor:
     
     @classmethod
     def get_thumbnail_url(cls, media_file, size='300x300'):
-        """获取缩略图URL"""
+        """获取缩略图URL（根据变体清单生成，不访问文件系统）"""
         if not media_file.is_image:
             return media_file.thumbnail_url
         
         try:
-            # 构建缩略图路径
-            file_dir = os.path.dirname(media_file.file_path)
-            filename = os.path.basename(media_file.file_path)
-            name, ext = os.path.splitext(filename)
-            
-            thumbnail_path = os.path.join(file_dir, 'thumbnails', f"{name}_{size}{ext}")
-            thumbnail_full_path = os.path.join(current_app.static_folder, thumbnail_path)
-            
-            if os.path.exists(thumbnail_full_path):
-                return url_for('static', filename=thumbnail_path.replace('\\', '/'))
-            else:
-                # 如果缩略图不存在，返回原图
-                return media_file.file_url
-                
-        except Exception:
-            return media_file.file_url
+            min_width = int(str(size).split('x')[0])
+        except ValueError:
+            min_width = 300
+        return variant_thumbnail_url(media_file, min_width)
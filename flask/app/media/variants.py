@@ -0,0 +1,186 @@
+"""
+响应式图片变体
+按宽度生成 WebP（Pillow 支持时同时生成 AVIF）变体，变体清单以 JSON 记录在
+MediaFile/MediaBlob.variants 中。模板与 API 直接根据清单拼出 srcset，不再访问文件系统；
+缺失的变体由 /media/variant/... 在首次请求时按需生成并补入清单。
+"""
+
+import os
+import tempfile
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+# 生成的目标宽度（不超过原图宽度）
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+
+# 按优先级排列，<picture> 中靠前的 <source> 优先被浏览器选用
+PREFERRED_FORMATS = ('avif', 'webp')
+
+# 各格式的编码参数
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 50},
+}
+
+MIME_TYPES = {
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+
+
+@lru_cache(maxsize=1)
+def available_formats():
+    """当前 Pillow 可编码的变体格式"""
+    Image.init()
+    return tuple(fmt for fmt in PREFERRED_FORMATS if SAVE_OPTIONS[fmt]['format'] in Image.SAVE)
+
+
+def target_widths(original_width, widths=VARIANT_WIDTHS):
+    """原图宽度以内的目标宽度；原图比最大宽度小时以原图宽度作为最大档"""
+    if not original_width:
+        return []
+    return sorted({min(width, original_width) for width in widths})
+
+
+def variant_filename(file_path, width, fmt):
+    name, _ = os.path.splitext(os.path.basename(file_path))
+    return f"{name}_w{width}.{fmt}"
+
+
+def variant_relative_path(file_path, filename):
+    """变体文件相对 static 的路径（与原文件同目录下的 variants/）"""
+    return os.path.join(os.path.dirname(file_path), 'variants', filename).replace('\\', '/')
+
+
+def generate_variants(file_path, widths=None, formats=None, img=None):
+    """为原图生成变体并返回清单（不依赖应用上下文，可在进程池中执行）
+
+    清单项：{'width', 'height', 'format', 'file'}，file 为 variants/ 目录下的文件名。
+    """
+    formats = formats or available_formats()
+    own_image = img is None
+    if own_image:
+        img = Image.open(file_path)
+    try:
+        source = ImageOps.exif_transpose(img)
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+        variant_dir = os.path.join(os.path.dirname(file_path), 'variants')
+        os.makedirs(variant_dir, exist_ok=True)
+
+        entries = []
+        # 从大到小逐级缩放，每一档都以上一档为源，减少重采样开销
+        current = source
+        for width in sorted(widths or target_widths(source.width), reverse=True):
+            if width < current.width:
+                height = max(1, round(current.height * width / current.width))
+                current = current.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                filename = variant_filename(file_path, current.width, fmt)
+                _atomic_save(current, os.path.join(variant_dir, filename), fmt)
+                entries.append({'width': current.width, 'height': current.height, 'format': fmt, 'file': filename})
+        return sorted(entries, key=lambda e: (e['format'], e['width']))
+    finally:
+        if own_image:
+            img.close()
+
+
+def _atomic_save(image, path, fmt):
+    # 先写临时文件再替换，并发生成同一变体时不会读到半个文件
+    options = dict(SAVE_OPTIONS[fmt])
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        image.save(tmp_path, **options)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def merge_variants(existing, new_entries):
+    """合并变体清单，(format, width) 相同时以新项为准"""
+    merged = {(e['format'], e['width']): e for e in (existing or [])}
+    merged.update({(e['format'], e['width']): e for e in new_entries})
+    return sorted(merged.values(), key=lambda e: (e['format'], e['width']))
+
+
+def pick_variant(variants, min_width, fmt='webp'):
+    """宽度不小于 min_width 的最小变体；都不够宽时返回最大的一个"""
+    candidates = [e for e in (variants or []) if e['format'] == fmt]
+    if not candidates:
+        return None
+    wide_enough = [e for e in candidates if e['width'] >= min_width]
+    if wide_enough:
+        return min(wide_enough, key=lambda e: e['width'])
+    return max(candidates, key=lambda e: e['width'])
+
+
+# --- URL 与按需生成（需在应用上下文中调用） ---
+
+def original_width(media_file):
+    try:
+        return int((media_file.dimensions or '').split(',')[0])
+    except ValueError:
+        return None
+
+
+def variant_url(media_file, entry):
+    from flask import url_for
+    return url_for('static', filename=variant_relative_path(media_file.file_path, entry['file']))
+
+
+def _lazy_url(media_file, width, fmt):
+    from flask import url_for
+    return url_for('media.variant', file_id=media_file.id, width=width, fmt=fmt)
+
+
+def build_srcset(media_file, fmt='webp'):
+    """根据变体清单生成 srcset；清单中缺少该格式时指向按需生成接口"""
+    entries = [e for e in (media_file.variants or []) if e['format'] == fmt]
+    if entries:
+        return ', '.join(f"{variant_url(media_file, e)} {e['width']}w" for e in entries)
+    if not media_file.is_image or not media_file.is_processed:
+        return ''
+    return ', '.join(f"{_lazy_url(media_file, w, fmt)} {w}w" for w in target_widths(original_width(media_file)))
+
+
+def picture_sources(media_file):
+    """<picture> 的 <source> 列表 [{'type', 'srcset'}]，按格式优先级排列"""
+    sources = []
+    for fmt in available_formats():
+        srcset = build_srcset(media_file, fmt)
+        if srcset:
+            sources.append({'type': MIME_TYPES[fmt], 'srcset': srcset})
+    return sources
+
+
+def thumbnail_url(media_file, min_width=300, fmt='webp'):
+    """列表缩略图地址：优先使用已生成的变体，不访问文件系统"""
+    entry = pick_variant(media_file.variants, min_width, fmt)
+    if entry is not None:
+        return variant_url(media_file, entry)
+    widths = target_widths(original_width(media_file))
+    if media_file.is_processed and widths and fmt in available_formats():
+        width = next((w for w in widths if w >= min_width), widths[-1])
+        return _lazy_url(media_file, width, fmt)
+    return media_file.file_url
+
+
+def ensure_variant(media_file, width, fmt):
+    """返回指定变体的地址，缺失时立即生成并补入清单（MediaFile 与共享的 MediaBlob）"""
+    from flask import current_app
+    from app import db
+
+    entry = next((e for e in (media_file.variants or []) if e['format'] == fmt and e['width'] == width), None)
+    if entry is None:
+        file_path = os.path.join(current_app.static_folder, media_file.file_path)
+        new_entries = generate_variants(file_path, widths=[width], formats=[fmt])
+        entry = new_entries[0]
+        media_file.variants = merge_variants(media_file.variants, new_entries)
+        if media_file.blob is not None:
+            media_file.blob.variants = merge_variants(media_file.blob.variants, new_entries)
+        db.session.commit()
+    return variant_url(media_file, entry)
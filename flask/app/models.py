@@ -21,6 +21,13 @@ post_tags = db.Table('post_tags',
     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
 )
 
+# 媒体文件标签关联表（主键覆盖 文件->标签，反向查询走 media_tag_id 索引）
+media_file_tags = db.Table('media_file_tags',
+    db.Column('media_file_id', db.Integer, db.ForeignKey('media_file.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('media_tag_id', db.Integer, db.ForeignKey('media_tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_media_file_tags_tag', 'media_tag_id', 'media_file_id')
+)
+
 class User(UserMixin, db.Model):
     """用户模型"""
     id = db.Column(db.Integer, primary_key=True)
@@ -195,12 +202,63 @@ class Comment(db.Model):
     def __repr__(self):
         return f'<Comment {self.id}>'
 
+
+class RelatedPost(db.Model):
+    """预计算的相关文章（由 app.related_posts 离线/增量维护）"""
+    __tablename__ = 'related_post'
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True, index=True)
+    score = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # 文章页按 post_id 取分数最高的几条
+    __table_args__ = (
+        db.Index('ix_related_post_post_score', 'post_id', 'score'),
+    )
+
+    def __repr__(self):
+        return f'<RelatedPost {self.post_id}->{self.related_id} {self.score:.3f}>'
+
+
+class SiteCounter(db.Model):
+    """站点统计计数器（由 ORM 事件在同一事务内增量维护，见 app.site_counters）"""
+    __tablename__ = 'site_counter'
+    name = db.Column(db.String(64), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True, default=0)  # 0 为全站计数，其余为分类等对象 ID
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SiteCounter {self.name}:{self.scope_id}={self.value}>'
+
 @login_manager.user_loader
 def load_user(user_id):
     """加载用户回调函数"""
     return User.query.get(int(user_id))
 
 
+class MediaBlob(db.Model):
+    """按内容寻址的媒体存储对象（同一内容只保存、处理一次，多个 MediaFile 共享）"""
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, unique=True, index=True)  # 内容哈希
+    file_path = db.Column(db.String(500), nullable=False)  # 相对 static 的存储路径
+    file_type = db.Column(db.String(50), nullable=False)
+    mime_type = db.Column(db.String(100), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # 引用该内容的 MediaFile 数量
+    
+    # 衍生数据（与内容绑定，重复上传直接复用）
+    dimensions = db.Column(db.String(50))
+    duration = db.Column(db.Integer)
+    variants = db.Column(db.JSON)  # 响应式图片变体清单，见 app.media.variants
+    processing_status = db.Column(db.String(20), default='pending')
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaBlob {self.sha256[:12]} refs={self.ref_count}>'
+
+
 class MediaFile(db.Model):
     """媒体文件模型"""
     id = db.Column(db.Integer, primary_key=True)
@@ -215,7 +273,7 @@ class MediaFile(db.Model):
     duration = db.Column(db.Integer)  # 视频/音频时长（秒）
     description = db.Column(db.Text)  # 文件描述
     alt_text = db.Column(db.String(255))  # 图片替代文本
-    tags = db.Column(db.String(500))  # 标签（逗号分隔）
+    legacy_tags = db.Column('tags', db.String(500))  # 旧版逗号分隔标签，已迁移到 media_file_tags，不再写入
     
     # 上传信息
     uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -229,8 +287,20 @@ class MediaFile(db.Model):
     is_active = db.Column(db.Boolean, default=True, index=True)
     is_public = db.Column(db.Boolean, default=True, index=True)  # 是否公开可见
     
+    # 后台处理状态（pending/processing/ready/failed，见 app.media.processing）
+    processing_status = db.Column(db.String(20), default='pending', index=True)
+    processing_error = db.Column(db.String(500))
+    processed_at = db.Column(db.DateTime)
+    variants = db.Column(db.JSON)  # 响应式图片变体清单 [{'width', 'height', 'format', 'file'}]
+    
+    # 内容存储（历史数据为空，直接使用 file_path 指向的独占文件）
+    blob_id = db.Column(db.Integer, db.ForeignKey('media_blob.id'), index=True)
+    
     # 关系
     uploader = db.relationship('User', backref='media_files')
+    blob = db.relationship('MediaBlob', backref=db.backref('media_files', lazy='dynamic'))
+    tag_items = db.relationship('MediaTag', secondary=media_file_tags, order_by='MediaTag.name',
+                                backref=db.backref('media_files', lazy='dynamic'))
     
     # 复合索引
     __table_args__ = (
@@ -278,8 +348,9 @@ class MediaFile(db.Model):
     def thumbnail_url(self):
         """获取缩略图URL"""
         if self.is_image:
-            # 如果是图片，返回原图URL（可以后续添加缩略图生成逻辑）
-            return self.file_url
+            # 根据变体清单选择合适宽度的 WebP 变体，没有变体时返回原图
+            from app.media.variants import thumbnail_url
+            return thumbnail_url(self)
         elif self.is_video:
             # 视频缩略图（可以后续添加视频帧提取逻辑）
             return '/static/img/video-thumbnail.png'
@@ -288,24 +359,60 @@ class MediaFile(db.Model):
         else:
             return '/static/img/document-icon.png'
     
+    @property
+    def is_processed(self):
+        """衍生文件是否已生成（历史数据没有处理状态，视为已处理）"""
+        return self.processing_status in (None, 'ready')
+    
     def increment_download_count(self):
         """增加下载计数"""
         self.download_count += 1
         self.last_accessed = datetime.utcnow()
         db.session.commit()
     
+    @property
+    def tags(self):
+        """标签（逗号分隔），兼容表单与旧接口"""
+        return ','.join(self.get_tags_list()) or None
+    
+    @tags.setter
+    def tags(self, value):
+        from app.media.tags import parse_tags
+        self.set_tags_list(parse_tags(value))
+    
     def get_tags_list(self):
         """获取标签列表"""
-        if self.tags:
-            return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
-        return []
+        return [tag.name for tag in self.tag_items]
     
     def set_tags_list(self, tags_list):
         """设置标签列表"""
-        if tags_list:
-            self.tags = ','.join([tag.strip() for tag in tags_list if tag.strip()])
-        else:
-            self.tags = None
+        from app.media.tags import get_or_create_tags, parse_tags
+        self.tag_items = get_or_create_tags(parse_tags(tags_list or []))
+
+
+class MediaTag(db.Model):
+    """媒体文件标签"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaTag {self.name}>'
+
+
+class MediaUploadSession(db.Model):
+    """分块上传会话（可断点续传，见 app.media.chunked）"""
+    id = db.Column(db.String(32), primary_key=True)  # 随机上传ID，同时作为临时文件名
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)  # 原始文件名
+    file_type = db.Column(db.String(50), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)  # 声明的文件总大小
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # 已连续写入的字节数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<MediaUploadSession {self.id} {self.received}/{self.total_size}>'
 
 
 class MediaFolder(db.Model):
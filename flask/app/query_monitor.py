@@ -3,102 +3,84 @@
 监控查询执行时间、N+1查询问题、慢查询等
 """
 
+import hmac
 import time
 import logging
+from collections import Counter
 from functools import wraps
-from flask import current_app, g
+from flask import current_app, g, has_app_context, has_request_context, request
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
 import sqlite3
 
+from app.query_telemetry import QueryTelemetry, RedisTelemetrySink, normalize_statement
+
 # 配置日志
 query_logger = logging.getLogger('query_performance')
 query_logger.setLevel(logging.INFO)
 
-# 查询统计
-query_stats = {
-    'total_queries': 0,
-    'slow_queries': 0,
-    'query_times': [],
-    'n_plus_one_detection': []
-}
+# 查询遥测（固定大小直方图，内存不随查询数量增长）
+telemetry = QueryTelemetry()
+# 多 worker 汇总（配置 Redis 时启用）
+telemetry_sink = None
+
+_listeners_registered = False
 
-def monitor_queries():
+def monitor_queries(app=None):
     """启用查询监控"""
+    global _listeners_registered
+    if app is not None:
+        telemetry.slow_threshold = app.config.get('SLOW_QUERY_THRESHOLD', 0.1)
+        telemetry.sample_rate = app.config.get('QUERY_TELEMETRY_SAMPLE_RATE', 0.01)
+        telemetry.max_fingerprints = app.config.get('QUERY_TELEMETRY_MAX_FINGERPRINTS', 500)
+        telemetry.max_endpoints = app.config.get('QUERY_TELEMETRY_MAX_ENDPOINTS', 200)
+        telemetry.n_plus_one_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 3)
+    if _listeners_registered:
+        return
+    _listeners_registered = True
+
     @event.listens_for(Engine, "before_cursor_execute")
     def receive_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
         """查询执行前"""
-        context._query_start_time = time.time()
-        
-        # 存储查询信息用于N+1检测
-        if not hasattr(g, 'query_stack'):
-            g.query_stack = []
-        
-        g.query_stack.append({
-            'statement': statement,
-            'parameters': parameters,
-            'start_time': context._query_start_time
-        })
+        context._query_start_time = time.perf_counter()
 
     @event.listens_for(Engine, "after_cursor_execute")
     def receive_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
         """查询执行后"""
-        if hasattr(context, '_query_start_time'):
-            execution_time = time.time() - context._query_start_time
-            
-            # 更新统计
-            query_stats['total_queries'] += 1
-            query_stats['query_times'].append(execution_time)
-            
-            # 检测慢查询 (超过100ms)
-            if execution_time > 0.1:
-                query_stats['slow_queries'] += 1
-                query_logger.warning(f"慢查询检测: {execution_time:.3f}s - {statement[:100]}...")
-            
-            # 检测N+1查询
-            if hasattr(g, 'query_stack') and len(g.query_stack) > 1:
-                detect_n_plus_one_queries()
-            
+        if not hasattr(context, '_query_start_time'):
+            return
+        execution_time = time.perf_counter() - context._query_start_time
+        endpoint = (request.endpoint or telemetry.UNMATCHED) if has_request_context() else None
+        fingerprint = telemetry.record(statement, execution_time, endpoint=endpoint, parameters=parameters)
+
+        if execution_time > telemetry.slow_threshold:
+            query_logger.warning(f"慢查询检测: {execution_time:.3f}s - {statement[:100]}...")
+
+        if has_app_context():
+            # 每个请求只累计各查询形状的次数，N+1 检测在请求结束时执行一次
+            g.query_count = g.get('query_count', 0) + 1
+            if 'query_fingerprints' not in g:
+                g.query_fingerprints = Counter()
+            g.query_fingerprints[fingerprint] += 1
+
             # 记录查询详情（开发环境）
             if current_app.debug:
                 query_logger.info(f"查询执行: {execution_time:.3f}s - {statement[:100]}...")
 
 def detect_n_plus_one_queries():
-    """检测N+1查询问题"""
-    if not hasattr(g, 'query_stack') or len(g.query_stack) < 2:
-        return
-    
-    recent_queries = g.query_stack[-10:]  # 检查最近10个查询
-    similar_queries = {}
-    
-    for query in recent_queries:
-        # 简化查询语句进行匹配
-        normalized = normalize_query(query['statement'])
-        if normalized in similar_queries:
-            similar_queries[normalized] += 1
-        else:
-            similar_queries[normalized] = 1
-    
-    # 检测重复查询
-    for normalized, count in similar_queries.items():
-        if count >= 3:  # 3次以上相似查询
-            query_stats['n_plus_one_detection'].append({
-                'pattern': normalized,
-                'count': count,
-                'timestamp': time.time()
-            })
-            query_logger.warning(f"疑似N+1查询: {normalized} 执行了 {count} 次")
+    """检测N+1查询问题（基于当前请求中各查询形状的执行次数）"""
+    fingerprints = g.get('query_fingerprints') if has_app_context() else None
+    if not fingerprints:
+        return []
+    endpoint = request.endpoint if has_request_context() else None
+    issues = telemetry.check_n_plus_one(fingerprints, endpoint=endpoint)
+    for issue in issues:
+        query_logger.warning(f"疑似N+1查询: {issue['pattern'][:100]} 执行了 {issue['count']} 次")
+    return issues
 
 def normalize_query(statement):
     """标准化查询语句用于匹配"""
-    # 移除参数占位符和具体值
-    normalized = statement.lower()
-    # 简单的参数替换
-    import re
-    normalized = re.sub(r'\?\s*', '?', normalized)
-    normalized = re.sub(r'=\s*\?', '=?', normalized)
-    normalized = re.sub(r'in\s*\([^)]+\)', 'in(?)', normalized)
-    return normalized[:100]  # 截取前100字符
+    return normalize_statement(statement)[:100]  # 截取前100字符
 
 def query_performance_decorator(operation_name):
     """查询性能装饰器"""
@@ -106,35 +88,28 @@ def query_performance_decorator(operation_name):
         @wraps(func)
         def wrapper(*args, **kwargs):
             start_time = time.time()
+            start_count = g.get('query_count', 0)
             
-            # 重置查询栈
-            g.query_stack = []
+            result = func(*args, **kwargs)
+            execution_time = time.time() - start_time
             
-            try:
-                result = func(*args, **kwargs)
-                execution_time = time.time() - start_time
-                
-                # 记录操作性能
-                query_count = len(g.query_stack) if hasattr(g, 'query_stack') else 0
-                
-                if execution_time > 0.5:  # 操作超过500ms
-                    query_logger.warning(
-                        f"慢操作: {operation_name} 耗时 {execution_time:.3f}s, "
-                        f"执行了 {query_count} 个查询"
-                    )
-                
-                if current_app.debug:
-                    query_logger.info(
-                        f"操作: {operation_name} 完成, "
-                        f"耗时: {execution_time:.3f}s, "
-                        f"查询数: {query_count}"
-                    )
-                
-                return result
-            finally:
-                # 清理查询栈
-                if hasattr(g, 'query_stack'):
-                    del g.query_stack
+            # 记录操作性能
+            query_count = g.get('query_count', 0) - start_count
+            
+            if execution_time > 0.5:  # 操作超过500ms
+                query_logger.warning(
+                    f"慢操作: {operation_name} 耗时 {execution_time:.3f}s, "
+                    f"执行了 {query_count} 个查询"
+                )
+            
+            if current_app.debug:
+                query_logger.info(
+                    f"操作: {operation_name} 完成, "
+                    f"耗时: {execution_time:.3f}s, "
+                    f"查询数: {query_count}"
+                )
+            
+            return result
         
         return wrapper
     return decorator
@@ -142,38 +117,50 @@ def query_performance_decorator(operation_name):
 class QueryAnalyzer:
     """查询分析器"""
     
+    @staticmethod
+    def get_telemetry_snapshot(limit=20):
+        """获取遥测快照；配置 Redis 时返回所有 worker 汇总后的数据"""
+        if telemetry_sink is not None:
+            try:
+                telemetry_sink.maybe_flush(telemetry)
+                shared = telemetry_sink.snapshot(limit=limit)
+                local = telemetry.snapshot(limit=limit)
+                # 样本与 N+1 记录只保存在本进程；总数与慢查询数都取自 Redis，比例才有意义
+                for key in ('n_plus_one', 'slow_samples', 'samples', 'endpoints'):
+                    shared[key] = local[key]
+                return shared
+            except Exception as e:
+                query_logger.warning(f"读取共享查询遥测失败，使用本进程数据: {e}")
+        return telemetry.snapshot(limit=limit)
+    
     @staticmethod
     def get_performance_stats():
         """获取性能统计"""
-        if not query_stats['query_times']:
-            return {
-                'total_queries': 0,
-                'avg_time': 0,
-                'max_time': 0,
-                'slow_queries': 0,
-                'n_plus_one_issues': 0
-            }
-        
-        times = query_stats['query_times']
+        snapshot = QueryAnalyzer.get_telemetry_snapshot()
+        overall = snapshot['overall']
+        total = snapshot['total_queries']
+        slow = snapshot.get('slow_queries', 0)
         return {
-            'total_queries': query_stats['total_queries'],
-            'avg_time': sum(times) / len(times),
-            'max_time': max(times),
-            'slow_queries': query_stats['slow_queries'],
-            'n_plus_one_issues': len(query_stats['n_plus_one_detection']),
-            'slow_query_percentage': (query_stats['slow_queries'] / query_stats['total_queries'] * 100) if query_stats['total_queries'] > 0 else 0
+            'total_queries': total,
+            'avg_time': overall['avg'],
+            'max_time': overall['max'],
+            'p50_time': overall['p50'],
+            'p95_time': overall['p95'],
+            'p99_time': overall['p99'],
+            'slow_queries': slow,
+            'n_plus_one_issues': len(snapshot.get('n_plus_one', [])),
+            'slow_query_percentage': (slow / total * 100) if total > 0 else 0
         }
     
+    @staticmethod
+    def get_query_shapes(limit=20):
+        """按查询形状（SQL 指纹）返回 p50/p95/p99，按 p95×次数 排序"""
+        return QueryAnalyzer.get_telemetry_snapshot(limit=limit)['shapes']
+    
     @staticmethod
     def reset_stats():
         """重置统计数据"""
-        global query_stats
-        query_stats = {
-            'total_queries': 0,
-            'slow_queries': 0,
-            'query_times': [],
-            'n_plus_one_detection': []
-        }
+        telemetry.reset()
     
     @staticmethod
     def get_optimization_suggestions():
@@ -190,6 +177,9 @@ class QueryAnalyzer:
         if stats['avg_time'] > 0.05:
             suggestions.append("平均查询时间较长，建议优化查询语句和数据库结构")
         
+        if stats['p99_time'] > 0.5:
+            suggestions.append("p99 查询耗时超过500ms，建议查看 shapes 中的慢查询形状")
+        
         if stats['total_queries'] > 50:
             suggestions.append("查询数量较多，建议使用缓存减少数据库访问")
         
@@ -197,8 +187,47 @@ class QueryAnalyzer:
 
 def init_query_monitoring(app):
     """初始化查询监控"""
+    global telemetry_sink
     if app.config.get('ENABLE_QUERY_MONITORING', False):
-        monitor_queries()
+        monitor_queries(app)
+        
+        redis_url = app.config.get('QUERY_TELEMETRY_REDIS_URL')
+        if redis_url and telemetry_sink is None:
+            try:
+                import redis
+                client = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                client.ping()
+                telemetry_sink = RedisTelemetrySink(
+                    client,
+                    flush_interval=app.config.get('QUERY_TELEMETRY_FLUSH_INTERVAL', 10.0),
+                    ttl=app.config.get('QUERY_TELEMETRY_TTL', 7 * 24 * 3600),
+                )
+            except Exception as e:
+                app.logger.warning(f"查询遥测无法连接 Redis，仅统计本进程: {e}")
+        
+        @app.teardown_request
+        def finish_request_telemetry(exc):
+            detect_n_plus_one_queries()
+            if telemetry_sink is not None:
+                try:
+                    telemetry_sink.maybe_flush(telemetry)
+                except Exception as e:
+                    query_logger.warning(f"推送查询遥测失败: {e}")
+        
+        # 遥测导出接口：配置 QUERY_TELEMETRY_TOKEN 时需在请求头提供令牌，否则仅调试模式可用
+        @app.route('/metrics/query-telemetry')
+        def query_telemetry_export():
+            from flask import abort, jsonify
+            token = app.config.get('QUERY_TELEMETRY_TOKEN')
+            if token:
+                provided = request.headers.get('X-Telemetry-Token', '')
+                if not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+                    abort(403)
+            elif not app.debug:
+                abort(404)
+            limit = request.args.get('limit', 20, type=int)
+            return jsonify(QueryAnalyzer.get_telemetry_snapshot(limit=limit))
+        
         app.logger.info("数据库查询监控已启用")
     
     # 添加性能统计路由（仅开发环境）
@@ -212,7 +241,8 @@ def init_query_monitoring(app):
             return jsonify({
                 'stats': stats,
                 'suggestions': suggestions,
-                'recent_n_plus_one': query_stats['n_plus_one_detection'][-5:]  # 最近5个N+1问题
+                'shapes': QueryAnalyzer.get_query_shapes(10),
+                'recent_n_plus_one': list(telemetry.n_plus_one)[-5:]  # 最近5个N+1问题
             })
 
 # 常用的优化查询示例
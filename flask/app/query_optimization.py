@@ -7,7 +7,7 @@ from flask import current_app
 from sqlalchemy import text, func, and_, or_
 from sqlalchemy.orm import joinedload, subqueryload, selectinload, contains_eager
 from app import db
-from app.models import Post, User, Comment, Category, Tag
+from app.models import Post, User, Comment, Category, Tag, SiteCounter
 import logging
 from datetime import datetime, timedelta
 
@@ -236,67 +236,48 @@ class QueryOptimization:
     @staticmethod
     def get_statistics_optimized():
         """
-        获取站点统计信息，使用优化的聚合查询
+        获取站点统计信息，直接读取增量维护的计数器（见 app.site_counters）
         
         Returns:
             dict: 包含各种统计数据的字典
         """
-        # 使用单次查询获取多个统计数据
-        stats = db.session.query(
-            func.count(Post.id).label('total_posts'),
-            func.count(func.case([(Post.published == True, 1)])).label('published_posts'),
-            func.sum(Post.views).label('total_views'),
-            func.sum(Post.likes).label('total_likes')
-        ).first()
-        
-        user_stats = db.session.query(
-            func.count(User.id).label('total_users'),
-            func.count(func.case([(User.confirmed == True, 1)])).label('confirmed_users')
-        ).first()
-        
-        comment_stats = db.session.query(
-            func.count(Comment.id).label('total_comments'),
-            func.count(func.case([(Comment.approved == True, 1)])).label('approved_comments')
-        ).first()
-        
-        category_stats = db.session.query(
-            func.count(Category.id).label('total_categories')
-        ).first()
+        from app import site_counters
+        counters = site_counters.get_counters()
         
         return {
             'posts': {
-                'total': stats.total_posts or 0,
-                'published': stats.published_posts or 0,
-                'total_views': stats.total_views or 0,
-                'total_likes': stats.total_likes or 0
+                'total': counters.get(site_counters.POSTS, 0),
+                'published': counters.get(site_counters.POSTS_PUBLISHED, 0),
+                'total_views': counters.get(site_counters.POST_VIEWS, 0)
             },
             'users': {
-                'total': user_stats.total_users or 0,
-                'confirmed': user_stats.confirmed_users or 0
+                'total': counters.get(site_counters.USERS, 0),
+                'confirmed': counters.get(site_counters.USERS_CONFIRMED, 0)
             },
             'comments': {
-                'total': comment_stats.total_comments or 0,
-                'approved': comment_stats.approved_comments or 0
+                'total': counters.get(site_counters.COMMENTS, 0),
+                'approved': counters.get(site_counters.COMMENTS_APPROVED, 0)
             },
             'categories': {
-                'total': category_stats.total_categories or 0
+                'total': counters.get(site_counters.CATEGORIES, 0)
             }
         }
     
     @staticmethod
     def get_categories_with_post_counts():
         """
-        获取分类列表及其文章数量，使用JOIN查询避免N+1问题
+        获取分类列表及其已发布文章数量，文章数来自分类计数器，不扫描文章表
         
         Returns:
             list: 包含分类和文章数量的列表
         """
+        from app import site_counters
         return db.session.query(
             Category,
-            func.count(Post.id).label('post_count')
+            site_counters.category_post_count_column().label('post_count')
         ).outerjoin(
-            Post, and_(Category.id == Post.category_id, Post.published == True)
-        ).group_by(Category.id).order_by(Category.name).all()
+            SiteCounter, site_counters.category_counter_join()
+        ).order_by(Category.name).all()
     
     @staticmethod
     def get_tags_with_post_counts(limit=20):
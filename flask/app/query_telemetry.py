@@ -0,0 +1,355 @@
+"""
+数据库查询遥测
+固定大小的对数分桶直方图（按 SQL 指纹 / 按端点）、抽样记录完整语句，
+可选通过 Redis 在多个 gunicorn worker 之间汇总，内存与单次查询开销均为常数。
+"""
+
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+# --- SQL 指纹 ---
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'(?:\?|%\(\w+\)s|%s|:\w+)')
+_IN_LIST_RE = re.compile(r'\bin\s*\((?:\s*\?\s*,?)+\)')
+_POSTCOMPILE_RE = re.compile(r'\(__\[postcompile_\w+\]\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_statement(statement):
+    """将 SQL 归一化为查询形状：常量与占位符替换为 ?，IN 列表折叠，空白合并"""
+    text = statement.lower()
+    text = _STRING_RE.sub('?', text)
+    text = _POSTCOMPILE_RE.sub('(?)', text)
+    text = _PLACEHOLDER_RE.sub('?', text)
+    text = _NUMBER_RE.sub('?', text)
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+    return _IN_LIST_RE.sub('in (?)', text)
+
+
+class LogHistogram:
+    """对数分桶直方图
+
+    桶边界按 growth 倍数增长，覆盖 [min_value, max_value]，相对误差约 (growth-1)/2；
+    桶数量固定，记录 O(1)，分位数计算 O(桶数)，可直接相加合并。
+    """
+
+    def __init__(self, min_value=1e-5, max_value=60.0, growth=1.25):
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.size = int(math.ceil(math.log(max_value / min_value) / self._log_growth)) + 1
+        self.counts = [0] * self.size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def bucket_of(self, value):
+        if value <= self.min_value:
+            return 0
+        return min(self.size - 1, int(math.log(value / self.min_value) / self._log_growth) + 1)
+
+    def bucket_value(self, index):
+        """桶的代表值（上下边界的几何中点）"""
+        if index == 0:
+            return self.min_value
+        low = self.min_value * self.growth ** (index - 1)
+        return low * math.sqrt(self.growth)
+
+    def record(self, value):
+        self.counts[self.bucket_of(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * pct / 100.0)
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.bucket_value(i)
+        return self.bucket_value(self.size - 1)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class QueryTelemetry:
+    """进程内查询遥测聚合器（线程安全）"""
+
+    OTHER = '__other__'
+    UNMATCHED = '__unmatched__'  # 未匹配到路由的请求（404 等），不按原始路径区分
+
+    def __init__(self, slow_threshold=0.1, sample_rate=0.01, max_fingerprints=500,
+                 max_samples=100, n_plus_one_threshold=5, max_endpoints=200):
+        self.slow_threshold = slow_threshold
+        self.sample_rate = sample_rate
+        self.max_fingerprints = max_fingerprints
+        self.max_endpoints = max_endpoints
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+        self._lock = threading.Lock()
+        self._fingerprint_cache = OrderedDict()  # statement -> (fingerprint, shape)，LRU
+        self.by_fingerprint = {}  # fingerprint -> {'histogram', 'shape'}
+        self.by_endpoint = OrderedDict()  # endpoint -> LogHistogram，LRU，淘汰的并入 __other__
+        self.samples = deque(maxlen=max_samples)       # 抽样的完整语句
+        self.slow_samples = deque(maxlen=max_samples)  # 慢查询总是记录
+        self.n_plus_one = deque(maxlen=50)
+        self.total_queries = 0
+        self.slow_queries = 0
+        self._pending = {}  # 尚未推送到共享存储的增量：fingerprint -> LogHistogram
+        self._pending_slow = 0  # 尚未推送的慢查询数
+
+    def fingerprint(self, statement):
+        """返回 (fingerprint, shape)，按语句文本做 LRU 缓存，避免每次都跑正则"""
+        cached = self._fingerprint_cache.get(statement)
+        if cached is not None:
+            return cached
+        shape = normalize_statement(statement)
+        result = (hashlib.md5(shape.encode('utf-8')).hexdigest()[:12], shape[:300])
+        with self._lock:
+            self._fingerprint_cache[statement] = result
+            if len(self._fingerprint_cache) > 2048:
+                self._fingerprint_cache.popitem(last=False)
+        return result
+
+    def record(self, statement, duration, endpoint=None, parameters=None):
+        fp, shape = self.fingerprint(statement)
+        endpoint = endpoint or 'background'
+        with self._lock:
+            entry = self.by_fingerprint.get(fp)
+            if entry is None:
+                if len(self.by_fingerprint) >= self.max_fingerprints:
+                    fp, shape = self.OTHER, self.OTHER
+                    entry = self.by_fingerprint.get(fp)
+                if entry is None:
+                    entry = self.by_fingerprint[fp] = {'histogram': LogHistogram(), 'shape': shape}
+            entry['histogram'].record(duration)
+
+            self._endpoint_histogram(endpoint).record(duration)
+
+            pending = self._pending.get(fp)
+            if pending is None:
+                pending = self._pending[fp] = LogHistogram()
+            pending.record(duration)
+
+            self.total_queries += 1
+            slow = duration > self.slow_threshold
+            if slow:
+                self.slow_queries += 1
+                self._pending_slow += 1
+
+        if slow or random.random() < self.sample_rate:
+            sample = {
+                'fingerprint': fp,
+                'statement': statement[:2000],
+                'parameters': repr(parameters)[:500] if parameters is not None else None,
+                'duration': duration,
+                'endpoint': endpoint,
+                'timestamp': time.time(),
+            }
+            (self.slow_samples if slow else self.samples).append(sample)
+        return fp
+
+    def _endpoint_histogram(self, endpoint):
+        """取端点直方图（调用方持有锁）；超出上限时把最久未用的端点并入 __other__"""
+        hist = self.by_endpoint.get(endpoint)
+        if hist is not None:
+            self.by_endpoint.move_to_end(endpoint)
+            return hist
+        hist = self.by_endpoint[endpoint] = LogHistogram()
+        while len(self.by_endpoint) > max(self.max_endpoints, 2):
+            name, evicted = next((k, v) for k, v in self.by_endpoint.items() if k != self.OTHER)
+            del self.by_endpoint[name]
+            other = self.by_endpoint.get(self.OTHER)
+            if other is None:
+                self.by_endpoint[self.OTHER] = evicted
+            else:
+                other.merge(evicted)
+        return hist
+
+    def check_n_plus_one(self, request_fingerprints, endpoint=None):
+        """请求结束时检查同一形状查询的重复次数（每个请求只检查一次）"""
+        issues = []
+        for fp, count in request_fingerprints.items():
+            # __other__ 混合了超出上限后的各种形状，次数多不代表同一查询重复执行
+            if fp == self.OTHER:
+                continue
+            if count >= self.n_plus_one_threshold:
+                entry = self.by_fingerprint.get(fp)
+                issue = {
+                    'fingerprint': fp,
+                    'pattern': entry['shape'] if entry else fp,
+                    'count': count,
+                    'endpoint': endpoint,
+                    'timestamp': time.time(),
+                }
+                self.n_plus_one.append(issue)
+                issues.append(issue)
+        return issues
+
+    def take_pending(self):
+        """取出尚未推送的增量直方图与慢查询数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            slow, self._pending_slow = self._pending_slow, 0
+            shapes = {fp: self.by_fingerprint[fp]['shape'] for fp in pending if fp in self.by_fingerprint}
+        return pending, shapes, slow
+
+    def restore_pending(self, pending, slow=0):
+        """推送失败时把增量放回"""
+        with self._lock:
+            self._pending_slow += slow
+            for fp, hist in pending.items():
+                current = self._pending.get(fp)
+                if current is None:
+                    self._pending[fp] = hist
+                else:
+                    current.merge(hist)
+
+    def snapshot(self, limit=20):
+        """导出本进程的统计"""
+        with self._lock:
+            overall = LogHistogram()
+            shapes = []
+            for fp, entry in self.by_fingerprint.items():
+                overall.merge(entry['histogram'])
+                shapes.append(dict(fingerprint=fp, shape=entry['shape'], **entry['histogram'].summary()))
+            endpoints = [dict(endpoint=name, **hist.summary()) for name, hist in self.by_endpoint.items()]
+            data = {
+                'total_queries': self.total_queries,
+                'slow_queries': self.slow_queries,
+                'overall': overall.summary(),
+                'n_plus_one': list(self.n_plus_one),
+                'slow_samples': list(self.slow_samples)[-limit:],
+                'samples': list(self.samples)[-limit:],
+            }
+        data['shapes'] = sorted(shapes, key=lambda s: s['p95'] * s['count'], reverse=True)[:limit]
+        data['endpoints'] = sorted(endpoints, key=lambda s: s['p95'], reverse=True)[:limit]
+        data['source'] = 'local'
+        return data
+
+    def reset(self):
+        with self._lock:
+            self.by_fingerprint.clear()
+            self.by_endpoint.clear()
+            self.samples.clear()
+            self.slow_samples.clear()
+            self.n_plus_one.clear()
+            self._pending.clear()
+            self._pending_slow = 0
+            self.total_queries = 0
+            self.slow_queries = 0
+
+
+class RedisTelemetrySink:
+    """把各 worker 的直方图增量累加到 Redis 哈希中，导出时合并全部 worker 的数据
+
+    每次推送都会刷新写入过的键的过期时间，停止上报 ttl 秒后数据自动清除。
+    """
+
+    def __init__(self, client, prefix='query_telemetry', flush_interval=10.0, ttl=7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._last_flush = time.monotonic()
+        self._flush_lock = threading.Lock()
+
+    def maybe_flush(self, telemetry):
+        if time.monotonic() - self._last_flush < self.flush_interval:
+            return False
+        if not self._flush_lock.acquire(blocking=False):
+            return False
+        try:
+            self._last_flush = time.monotonic()
+            pending, shapes, slow = telemetry.take_pending()
+            if not pending:
+                return False
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for fp, hist in pending.items():
+                    key = f"{self.prefix}:fp:{fp}"
+                    for index, count in enumerate(hist.counts):
+                        if count:
+                            pipe.hincrby(key, f"b{index}", count)
+                    pipe.hincrbyfloat(key, 'total', hist.total)
+                    pipe.expire(key, self.ttl)
+                    pipe.sadd(f"{self.prefix}:fps", fp)
+                    if fp in shapes:
+                        pipe.hsetnx(f"{self.prefix}:shapes", fp, shapes[fp])
+                if slow:
+                    pipe.incrby(f"{self.prefix}:slow", slow)
+                for key in ('fps', 'shapes', 'slow'):
+                    pipe.expire(f"{self.prefix}:{key}", self.ttl)
+                pipe.execute()
+            except Exception:
+                telemetry.restore_pending(pending, slow)
+                raise
+            return True
+        finally:
+            self._flush_lock.release()
+
+    def snapshot(self, limit=20):
+        fps = [fp.decode() if isinstance(fp, bytes) else fp for fp in self.client.smembers(f"{self.prefix}:fps")]
+        pipe = self.client.pipeline(transaction=False)
+        for fp in fps:
+            pipe.hgetall(f"{self.prefix}:fp:{fp}")
+        rows = pipe.execute() if fps else []
+        raw_shapes = self.client.hgetall(f"{self.prefix}:shapes") or {}
+        slow = int(self.client.get(f"{self.prefix}:slow") or 0)
+        shapes_by_fp = {
+            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in raw_shapes.items()
+        }
+
+        overall = LogHistogram()
+        shapes = []
+        for fp, row in zip(fps, rows):
+            if not row:
+                # 直方图已过期而集合尚未过期
+                continue
+            hist = LogHistogram()
+            for field, value in row.items():
+                field = field.decode() if isinstance(field, bytes) else field
+                if field == 'total':
+                    hist.total = float(value)
+                elif field.startswith('b'):
+                    index = int(field[1:])
+                    if index < hist.size:
+                        hist.counts[index] = int(value)
+            hist.count = sum(hist.counts)
+            hist.max = hist.bucket_value(max((i for i, c in enumerate(hist.counts) if c), default=0))
+            overall.merge(hist)
+            shapes.append(dict(fingerprint=fp, shape=shapes_by_fp.get(fp, fp), **hist.summary()))
+        return {
+            'total_queries': overall.count,
+            'slow_queries': slow,
+            'overall': overall.summary(),
+            'shapes': sorted(shapes, key=lambda s: s['p95'] * s['count'], reverse=True)[:limit],
+            'source': 'redis',
+        }
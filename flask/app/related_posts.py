@@ -0,0 +1,460 @@
+"""
+相关文章
+按标签（Jaccard）、分类与正文 TF-IDF 余弦相似度为每篇已发布文章预先计算最相关的若干篇，
+结果保存在 related_post 表中，文章页只需一次按 post_id 的索引查询。
+
+- 全量重建（rebuild_related_posts）：流式读取全部已发布文章，建立倒排表后逐篇计算，
+  由定期任务或 `flask related rebuild` 执行，同时修正 IDF 随语料变化产生的漂移；
+- 增量刷新（refresh_related_posts）：文章发布、编辑、下线或删除后，只重新读取变更的文章，
+  在进程内缓存的倒排索引中替换它，重写该文章自己的列表，并把它插入/移出其他文章的列表。
+
+进程内的索引在首次刷新时建立，超过 RELATED_POSTS_INDEX_TTL 或全量重建后重新加载，
+以吸收其他进程处理的变更。线程后端由每个应用一个后台线程按文章 ID 去重后依次刷新。
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, event, inspect
+from sqlalchemy.orm import Session, lazyload, object_session
+
+from app import db
+from app.models import Post, RelatedPost, post_tags
+from app.search_service import clean_html, jieba
+
+logger = logging.getLogger(__name__)
+
+# 每篇文章保存的相关文章数
+DEFAULT_LIMIT = 10
+
+# 综合得分中各信号的权重
+TEXT_WEIGHT = 0.6
+TAG_WEIGHT = 0.3
+CATEGORY_WEIGHT = 0.1
+
+# 每篇文章只保留权重最高的若干词，限制倒排表大小与计算量
+MAX_TERMS = 64
+
+# 影响相关性的文章字段；浏览量等变化不触发刷新
+RELATED_FIELDS = ('published', 'title', 'summary', 'content', 'category_id', 'tags')
+
+# session.info 中暂存本事务内变更的文章，事务提交后才刷新
+PENDING_KEY = 'related_posts_pending'
+
+_WORD_RE = re.compile(r'\w+')
+
+_hooks_registered = False
+
+
+def tokenize(text):
+    """分词（jieba 不可用时按单词切分），去掉单字与纯数字"""
+    text = text.lower()
+    words = jieba.lcut_for_search(text) if jieba is not None else _WORD_RE.findall(text)
+    return [w for w in words if len(w.strip()) > 1 and not w.isdigit()]
+
+
+class Document:
+    """参与计算的文章：只保存 id、分类、标签集合与词频"""
+    __slots__ = ('id', 'category_id', 'tags', 'terms', 'vector')
+
+    def __init__(self, id, category_id, tags, terms):
+        self.id = id
+        self.category_id = category_id
+        self.tags = tags
+        self.terms = terms
+        self.vector = {}
+
+
+def load_documents(session, post_ids=None, batch_size=500):
+    """流式读取已发布文章的列数据（不加载 ORM 对象），返回 Document 列表；post_ids 限定读取范围"""
+    tags = defaultdict(set)
+    tag_rows = (
+        session.query(post_tags.c.post_id, post_tags.c.tag_id)
+        .join(Post, Post.id == post_tags.c.post_id)
+        .filter(Post.published == True)
+    )
+    rows = (
+        session.query(Post.id, Post.title, Post.summary, Post.content, Post.category_id)
+        .filter(Post.published == True)
+        .order_by(Post.id)
+    )
+    if post_ids is not None:
+        tag_rows = tag_rows.filter(Post.id.in_(post_ids))
+        rows = rows.filter(Post.id.in_(post_ids))
+    for post_id, tag_id in tag_rows:
+        tags[post_id].add(tag_id)
+
+    documents = []
+    for post_id, title, summary, content, category_id in rows.yield_per(batch_size):
+        # 标题重复一次以提高权重
+        text = ' '.join(filter(None, [title, title, summary, clean_html(content)]))
+        documents.append(Document(post_id, category_id, frozenset(tags.get(post_id, ())), Counter(tokenize(text))))
+    return documents
+
+
+class RelatedIndex:
+    """基于倒排表的相似度计算
+
+    支持逐篇替换/移除文章：只重新计算变更文章的向量，其他文章的向量沿用建立时的 IDF，
+    由全量重建修正漂移。
+    """
+
+    def __init__(self, documents):
+        self.documents = {}
+        self.df = Counter()
+        self.postings = defaultdict(dict)  # term -> {doc_id: weight}
+        self.tag_postings = defaultdict(set)
+        self.by_category = defaultdict(set)
+        self.lock = threading.Lock()
+        self.loaded_at = time.monotonic()
+
+        for doc in documents:
+            self.documents[doc.id] = doc
+            self.df.update(doc.terms.keys())
+        for doc in documents:
+            self._insert(doc)
+
+    def _idf(self, term):
+        return math.log((1 + len(self.documents)) / (1 + self.df.get(term, 0))) + 1
+
+    def _vectorize(self, terms):
+        weights = {term: (1 + math.log(count)) * self._idf(term) for term, count in terms.items()}
+        top = sorted(weights.items(), key=lambda item: item[1], reverse=True)[:MAX_TERMS]
+        norm = math.sqrt(sum(w * w for _, w in top)) or 1.0
+        return {term: w / norm for term, w in top}
+
+    def _insert(self, doc):
+        doc.vector = self._vectorize(doc.terms)
+        for term, weight in doc.vector.items():
+            self.postings[term][doc.id] = weight
+        for tag in doc.tags:
+            self.tag_postings[tag].add(doc.id)
+        if doc.category_id is not None:
+            self.by_category[doc.category_id].add(doc.id)
+
+    def remove(self, doc_id):
+        doc = self.documents.pop(doc_id, None)
+        if doc is None:
+            return
+        self.df.subtract(doc.terms.keys())
+        for term in doc.terms:
+            if self.df[term] <= 0:
+                del self.df[term]
+        for term in doc.vector:
+            self.postings[term].pop(doc_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+        for tag in doc.tags:
+            self.tag_postings[tag].discard(doc_id)
+        if doc.category_id is not None:
+            self.by_category[doc.category_id].discard(doc_id)
+
+    def upsert(self, doc):
+        self.remove(doc.id)
+        self.documents[doc.id] = doc
+        self.df.update(doc.terms.keys())
+        self._insert(doc)
+
+    def scores(self, doc_id):
+        """与 doc_id 相关的文章及综合得分 {id: score}（得分对称）"""
+        doc = self.documents[doc_id]
+        text = Counter()
+        for term, weight in doc.vector.items():
+            for other, other_weight in self.postings[term].items():
+                text[other] += weight * other_weight
+        shared_tags = Counter()
+        for tag in doc.tags:
+            shared_tags.update(self.tag_postings[tag])
+
+        scores = {}
+        for other in set(text) | set(shared_tags):
+            if other == doc_id:
+                continue
+            other_doc = self.documents[other]
+            overlap = shared_tags.get(other, 0)
+            jaccard = overlap / (len(doc.tags) + len(other_doc.tags) - overlap) if overlap else 0.0
+            same_category = doc.category_id is not None and doc.category_id == other_doc.category_id
+            scores[other] = (TEXT_WEIGHT * min(text.get(other, 0.0), 1.0) + TAG_WEIGHT * jaccard
+                             + CATEGORY_WEIGHT * same_category)
+        return scores
+
+    def top(self, doc_id, limit):
+        """得分最高的 limit 篇；不足时用同分类的最新文章补齐"""
+        scores = self.scores(doc_id)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+        if len(ranked) < limit:
+            doc = self.documents[doc_id]
+            chosen = {other for other, _ in ranked}
+            for other in sorted(self.by_category.get(doc.category_id, ()), reverse=True):
+                if len(ranked) >= limit:
+                    break
+                if other != doc_id and other not in chosen:
+                    ranked.append((other, CATEGORY_WEIGHT))
+        return ranked
+
+
+def _limit():
+    return current_app.config.get('RELATED_POSTS_LIMIT', DEFAULT_LIMIT)
+
+
+def _index_ttl():
+    return current_app.config.get('RELATED_POSTS_INDEX_TTL', 3600)
+
+
+def get_index(session):
+    """当前应用进程内缓存的索引；不存在或过期时从数据库重新加载"""
+    index = current_app.extensions.get('related_posts_index')
+    if index is None or time.monotonic() - index.loaded_at > _index_ttl():
+        index = RelatedIndex(load_documents(session))
+        current_app.extensions['related_posts_index'] = index
+    return index
+
+
+def rebuild_related_posts(session=None, limit=None):
+    """全量重建相关文章表，返回写入的行数"""
+    session = session or db.session
+    limit = limit or _limit()
+    index = RelatedIndex(load_documents(session))
+    now = datetime.utcnow()
+    with index.lock:
+        rows = [
+            {'post_id': doc_id, 'related_id': other, 'score': score, 'updated_at': now}
+            for doc_id in index.documents
+            for other, score in index.top(doc_id, limit)
+        ]
+    session.query(RelatedPost).delete(synchronize_session=False)
+    if rows:
+        session.execute(RelatedPost.__table__.insert(), rows)
+    session.commit()
+    current_app.extensions['related_posts_index'] = index
+    logger.info(f"相关文章已重建: {len(index.documents)} 篇文章, {len(rows)} 条关联")
+    return len(rows)
+
+
+def refresh_related_posts(post_ids, session=None, limit=None):
+    """增量刷新：在缓存的索引中替换变更的文章，重写其列表，并把它插入/移出其他文章的列表
+
+    与变更文章有共同词的文章很多，但只有得分超过对方当前第 limit 名的才会进入其列表：
+    先读取这些文章当前的列表，只写入能进入前 limit 名的行，并删除被挤出的行。
+    其他文章因变更文章移出而空出的位置要到下一次全量重建才会补上。
+    """
+    session = session or db.session
+    limit = limit or _limit()
+    post_ids = set(post_ids)
+    if not post_ids:
+        return 0
+
+    index = get_index(session)
+    changed = {doc.id: doc for doc in load_documents(session, post_ids)}
+    now = datetime.utcnow()
+    own_rows = []
+    offers = defaultdict(list)  # 其他文章 -> [(score, 变更文章)]
+    with index.lock:
+        for post_id in post_ids:
+            if post_id in changed:
+                index.upsert(changed[post_id])
+            else:
+                index.remove(post_id)
+        for doc_id in changed:
+            for other, score in index.top(doc_id, limit):
+                own_rows.append({'post_id': doc_id, 'related_id': other, 'score': score, 'updated_at': now})
+            # 得分对称：变更文章也可能进入其他文章的列表
+            for other, score in index.scores(doc_id).items():
+                if other not in post_ids:
+                    offers[other].append((score, doc_id))
+
+    table = RelatedPost.__table__
+    session.execute(table.delete().where(table.c.post_id.in_(post_ids) | table.c.related_id.in_(post_ids)))
+    candidate_rows, displaced = [], []
+    current = _current_lists(session, offers.keys())
+    for post_id, offered in offers.items():
+        existing = current.get(post_id, [])
+        kept = {related_id for _, related_id in _ranked(existing + offered)[:limit]}
+        candidate_rows.extend(
+            {'post_id': post_id, 'related_id': related_id, 'score': score, 'updated_at': now}
+            for score, related_id in offered if related_id in kept
+        )
+        displaced.extend((post_id, related_id) for _, related_id in existing if related_id not in kept)
+
+    if own_rows or candidate_rows:
+        session.execute(table.insert(), own_rows + candidate_rows)
+    if displaced:
+        session.execute(
+            table.delete().where(table.c.post_id == bindparam('p'), table.c.related_id == bindparam('r')),
+            [{'p': post_id, 'r': related_id} for post_id, related_id in displaced],
+        )
+    session.commit()
+    return len(own_rows)
+
+
+def _ranked(items):
+    """[(score, related_id)] 按得分降序，同分时新文章在前（与 get_related_posts 的顺序一致）"""
+    return sorted(items, key=lambda item: (-item[0], -item[1]))
+
+
+def _current_lists(session, post_ids, chunk_size=500):
+    """分批读取若干文章当前保存的相关文章 {post_id: [(score, related_id)]}"""
+    table = RelatedPost.__table__
+    post_ids = sorted(post_ids)
+    lists = defaultdict(list)
+    for start in range(0, len(post_ids), chunk_size):
+        rows = session.execute(
+            table.select().with_only_columns(table.c.post_id, table.c.related_id, table.c.score)
+            .where(table.c.post_id.in_(post_ids[start:start + chunk_size]))
+        )
+        for post_id, related_id, score in rows:
+            lists[post_id].append((score, related_id))
+    return lists
+
+
+def get_related_posts(post_id, limit=5):
+    """文章页使用：按 (post_id, score) 索引取出相关文章"""
+    return (
+        Post.query.options(lazyload(Post.tags))  # 侧栏不显示标签，不做子查询预加载
+        .join(RelatedPost, RelatedPost.related_id == Post.id)
+        .filter(RelatedPost.post_id == post_id, Post.published == True)
+        .order_by(RelatedPost.score.desc(), Post.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+# --- 刷新调度 ---
+
+def _run_refresh(app, post_ids):
+    with app.app_context():
+        # 使用独立会话，可在 after_commit 钩子、线程或 Celery 任务中执行
+        with Session(db.engine) as session:
+            try:
+                refresh_related_posts(post_ids, session=session)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"刷新相关文章失败: {sorted(post_ids)}, {e}")
+
+
+class RelatedRefreshQueue:
+    """按文章 ID 去重的刷新队列，由单个后台线程依次处理，同一进程内的刷新不会并发"""
+
+    def __init__(self, app):
+        self.app = app
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def enqueue(self, post_ids):
+        with self._lock:
+            self._pending.update(post_ids)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='related-posts-refresh', daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+
+    def drain(self):
+        """处理当前积压的全部文章，返回处理的数量"""
+        with self._lock:
+            batch, self._pending = self._pending, set()
+        if batch:
+            _run_refresh(self.app, batch)
+        return len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.drain()
+
+
+def _refresh_queue(app):
+    queue = app.extensions.get('related_posts_queue')
+    if queue is None:
+        queue = app.extensions.setdefault('related_posts_queue', RelatedRefreshQueue(app))
+    return queue
+
+
+def schedule_refresh(post_ids):
+    """按配置的后端刷新：celery（不可用时退回线程）/ thread / sync"""
+    app = current_app._get_current_object()
+    post_ids = sorted(post_ids)
+    backend = app.config.get('RELATED_POSTS_BACKEND', 'thread')
+    if backend == 'celery':
+        from app import tasks_definitions
+        if tasks_definitions.refresh_related_posts_async is not None:
+            try:
+                tasks_definitions.refresh_related_posts_async.delay(post_ids)
+                return
+            except Exception as e:
+                logger.warning(f"提交相关文章刷新任务失败，改为本地线程: {e}")
+        backend = 'thread'
+    if backend == 'thread':
+        _refresh_queue(app).enqueue(post_ids)
+    else:
+        _run_refresh(app, post_ids)
+
+
+# --- 文章钩子 ---
+
+def _mark_pending(target):
+    session = object_session(target)
+    if session is not None and target.id is not None:
+        session.info.setdefault(PENDING_KEY, set()).add(target.id)
+
+
+def _related_fields_changed(target):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in RELATED_FIELDS)
+
+
+@click.group()
+def related():
+    """相关文章命令"""
+    pass
+
+
+@related.command()
+@with_appcontext
+def rebuild():
+    """全量重建相关文章表"""
+    count = rebuild_related_posts()
+    click.echo(f"✅ 相关文章已重建，共 {count} 条关联")
+
+
+def init_related_posts(app):
+    """注册文章变更钩子与管理命令（事件监听器全局只注册一次）"""
+    global _hooks_registered
+    app.cli.add_command(related)
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+
+    @event.listens_for(Post, 'after_insert')
+    def after_post_insert(mapper, connection, target):
+        if target.published:
+            _mark_pending(target)
+
+    @event.listens_for(Post, 'after_update')
+    def after_post_update(mapper, connection, target):
+        if _related_fields_changed(target):
+            _mark_pending(target)
+
+    @event.listens_for(Post, 'after_delete')
+    def after_post_delete(mapper, connection, target):
+        _mark_pending(target)
+
+    @event.listens_for(db.session, 'after_commit')
+    def after_session_commit(session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if pending:
+            schedule_refresh(pending)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def after_session_rollback(session):
+        session.info.pop(PENDING_KEY, None)
@@ -7,6 +7,7 @@ import click
 from flask.cli import with_appcontext
 from app.search_service import get_search_service
 from app.models import Post
+from sqlalchemy.orm import selectinload
 
 @click.group()
 def search():
@@ -14,21 +15,43 @@ def search():
     pass
 
 @search.command()
+@click.option('--procs', default=None, type=int, help='写入进程数（默认读取 SEARCH_REBUILD_PROCS）')
+@click.option('--batch-size', default=None, type=int, help='每批读取的文章数（默认读取 SEARCH_REBUILD_BATCH_SIZE）')
 @with_appcontext
-def build():
+def build(procs, batch_size):
     """构建搜索索引"""
     click.echo('开始构建搜索索引...')
     
     search_service = get_search_service()
     
-    if search_service.rebuild_index():
+    if search_service.rebuild_index(batch_size=batch_size, procs=procs):
         stats = search_service.get_stats()
+        rebuild = search_service.last_rebuild_stats or {}
         click.echo(f'搜索索引构建完成！')
         click.echo(f'索引文档数: {stats.get("total_documents", 0)}')
         click.echo(f'索引大小: {stats.get("index_size", 0)} 字节')
+        click.echo(f'耗时: {rebuild.get("seconds", 0)} 秒 ({rebuild.get("docs_per_sec", 0)} docs/sec, '
+                   f'{rebuild.get("procs", 1)} 进程)')
+        peak = _peak_memory_mb()
+        if peak is not None:
+            click.echo(f'峰值内存: {peak:.1f} MB')
     else:
         click.echo('搜索索引构建失败！')
 
+def _peak_memory_mb():
+    """当前进程（含已结束的写入子进程）的峰值常驻内存，平台不支持时返回 None"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    import sys
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
 @search.command()
 @with_appcontext
 def update():
@@ -37,19 +60,18 @@ def update():
     
     search_service = get_search_service()
     
-    # 获取所有文章并更新索引
-    posts = Post.query.all()
-    updated_count = 0
-    
-    for post in posts:
-        if post.published:
-            if search_service.update_post_in_index(post):
-                updated_count += 1
-        else:
-            # 如果文章未发布，从索引中删除
-            search_service.remove_post_from_index(post.id)
+    # 获取所有文章，合并为一次索引提交
+    posts = Post.query.options(
+        selectinload(Post.tags), selectinload(Post.category), selectinload(Post.author)
+    ).all()
+    published = [post for post in posts if post.published]
+    # 未发布的文章从索引中删除
+    unpublished_ids = [post.id for post in posts if not post.published]
     
-    click.echo(f'搜索索引更新完成！更新了 {updated_count} 篇文章')
+    if search_service.apply_index_batch(published, unpublished_ids):
+        click.echo(f'搜索索引更新完成！更新了 {len(published)} 篇文章')
+    else:
+        click.echo('搜索索引更新失败！')
 
 @search.command()
 @with_appcontext
@@ -65,18 +87,33 @@ def stats():
 
 @search.command()
 @click.option('--limit', default=10, help='显示前N个热门搜索词')
+@click.option('--window', default='all', type=click.Choice(['hour', 'day', 'week', 'all']), help='统计窗口')
 @with_appcontext
-def popular(limit):
-    """显示热门搜索词（基于搜索日志统计）"""
+def popular(limit, window):
+    """显示热门搜索词（基于 top-K 统计）"""
     search_service = get_search_service()
-    terms = search_service.get_popular_searches(limit=limit)
+    terms = search_service.get_popular_searches(limit=limit, window=window)
     if not terms:
-        click.echo('暂无热门搜索数据（可能尚无搜索日志）。')
+        click.echo('暂无热门搜索数据。')
         return
     click.echo('热门搜索词:')
     for i, term in enumerate(terms, 1):
         click.echo(f'  {i}. {term}')
 
+@search.command()
+@click.option('--limit', default=10, help='显示前N个趋势搜索词')
+@with_appcontext
+def trending(limit):
+    """显示最近一小时热度上升最快的搜索词"""
+    search_service = get_search_service()
+    terms = search_service.get_trending_searches(limit=limit)
+    if not terms:
+        click.echo('暂无趋势搜索数据。')
+        return
+    click.echo('趋势搜索词:')
+    for i, term in enumerate(terms, 1):
+        click.echo(f'  {i}. {term}')
+
 @search.command()
 @click.argument('query')
 @with_appcontext
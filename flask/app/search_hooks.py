@@ -2,16 +2,47 @@
 
 """
 搜索索引钩子
-在文章创建、更新、删除时自动维护搜索索引
+在文章创建、更新、删除时把文章ID放入异步索引队列，事务提交后由后台批量写入索引
 """
 
 from flask import current_app
-from sqlalchemy import event
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from app import db
 from app.models import Post, Category, Tag # 导入 Category 和 Tag 以便未来扩展钩子
-from app.search_service import get_search_service
+from app.search_service import INDEXED_POST_ATTRIBUTES, get_search_service
+from app.search_queue import (
+    ACTION_DELETE, ACTION_UPSERT, get_search_index_queue, init_search_index_queue
+)
+
+# session.info 中暂存本事务内待索引的文章，事务提交后才真正入队
+PENDING_KEY = 'search_index_pending'
+
+# 事件监听器是注册在模型类上的全局对象，多次 create_app（如测试）时只注册一次
+_hooks_registered = False
+
+
+def _mark_pending(target, action):
+    """记录文章在当前事务中的索引操作（同一事务内多次变更只保留最后一次）"""
+    session = object_session(target)
+    if session is None:
+        # 不在会话中（极少见），直接入队
+        queue = get_search_index_queue()
+        if queue is not None:
+            queue.enqueue(target.id, action)
+        return
+    session.info.setdefault(PENDING_KEY, {})[target.id] = action
+
+
+def _indexed_fields_changed(target):
+    """本次 flush 是否修改了影响索引内容的属性（浏览量等变化不触发重新索引）"""
+    attrs = inspect(target).attrs
+    return any(attrs[name].history.has_changes() for name in INDEXED_POST_ATTRIBUTES if name in attrs)
+
 
 def init_search_hooks(app):
     """初始化搜索索引钩子"""
+    global _hooks_registered
     
     # 确保事件监听器在 Flask 应用上下文中注册
     with app.app_context():
@@ -23,68 +54,59 @@ def init_search_hooks(app):
             # 如果Whoosh不可用，直接返回，不注册钩子
             return
 
+        # 钩子只把文章ID放入去重队列，由后台线程批量写入索引
+        init_search_index_queue(app, search_service)
+
+        if _hooks_registered:
+            return
+        _hooks_registered = True
+
         @event.listens_for(Post, 'after_insert')
         def after_post_insert(mapper, connection, target):
-            """文章创建后添加到搜索索引"""
-            # 在事件监听器中，再次获取服务实例以确保在当前请求上下文中的有效性
-            local_search_service = get_search_service() 
-            if local_search_service and local_search_service.whoosh_available:
-                if target.published: # 只添加已发布的文章
-                    try:
-                        local_search_service.add_post_to_index(target)
-                        current_app.logger.info(f"Hook: 文章 {target.id} 已添加到搜索索引")
-                    except Exception as e:
-                        current_app.logger.error(f"Hook: 添加文章 {target.id} 到搜索索引失败: {e}")
-            else:
-                current_app.logger.warning(f"Hook: Whoosh服务不可用，无法添加文章 {target.id} 到索引。")
+            """文章创建后加入索引队列"""
+            if target.published: # 只添加已发布的文章
+                _mark_pending(target, ACTION_UPSERT)
         
         @event.listens_for(Post, 'after_update')
         def after_post_update(mapper, connection, target):
-            """文章更新后更新搜索索引"""
-            local_search_service = get_search_service()
-            if local_search_service and local_search_service.whoosh_available:
-                try:
-                    if target.published:
-                        local_search_service.update_post_in_index(target)
-                        current_app.logger.info(f"Hook: 文章 {target.id} 搜索索引已更新")
-                    else:
-                        # 如果文章变为未发布，从索引中删除
-                        local_search_service.remove_post_from_index(target.id)
-                        current_app.logger.info(f"Hook: 文章 {target.id} 已从搜索索引中删除 (变为未发布)")
-                except Exception as e:
-                    current_app.logger.error(f"Hook: 更新文章 {target.id} 搜索索引失败: {e}")
-            else:
-                current_app.logger.warning(f"Hook: Whoosh服务不可用，无法更新文章 {target.id} 索引。")
+            """文章更新后加入索引队列（变为未发布时出队阶段会从索引删除）"""
+            if _indexed_fields_changed(target):
+                _mark_pending(target, ACTION_UPSERT)
         
         @event.listens_for(Post, 'after_delete')
         def after_post_delete(mapper, connection, target):
-            """文章删除后从搜索索引中删除"""
-            local_search_service = get_search_service()
-            if local_search_service and local_search_service.whoosh_available:
-                try:
-                    local_search_service.remove_post_from_index(target.id)
-                    current_app.logger.info(f"Hook: 文章 {target.id} 已从搜索索引中删除")
-                except Exception as e:
-                    current_app.logger.error(f"Hook: 从搜索索引删除文章 {target.id} 失败: {e}")
+            """文章删除后加入索引队列"""
+            _mark_pending(target, ACTION_DELETE)
+
+        @event.listens_for(db.session, 'after_commit')
+        def after_session_commit(session):
+            """事务提交后再入队，保证后台线程能读到已提交的数据"""
+            pending = session.info.pop(PENDING_KEY, None)
+            if not pending:
+                return
+            queue = get_search_index_queue()
+            if queue is not None:
+                queue.enqueue_many(pending)
             else:
-                current_app.logger.warning(f"Hook: Whoosh服务不可用，无法从索引删除文章 {target.id}。")
+                current_app.logger.warning(f"Hook: 搜索索引队列未初始化，丢弃 {len(pending)} 项索引更新。")
+
+        @event.listens_for(db.session, 'after_rollback')
+        def after_session_rollback(session):
+            """事务回滚时丢弃未提交的索引操作"""
+            session.info.pop(PENDING_KEY, None)
         
         # 您还可以为 Category 和 Tag 的更改添加钩子，如果它们的名称更改会影响文章的搜索结果
         # 例如：
         # @event.listens_for(Category, 'after_update')
         # def after_category_update(mapper, connection, target):
-        #     local_search_service = get_search_service()
-        #     if local_search_service and local_search_service.whoosh_available:
-        #         current_app.logger.info(f"Hook: 分类 '{target.name}' 更新，考虑更新相关文章索引...")
-        #         for post in target.posts.filter_by(published=True).all():
-        #             local_search_service.update_post_in_index(post)
+        #     current_app.logger.info(f"Hook: 分类 '{target.name}' 更新，考虑更新相关文章索引...")
+        #     for post in target.posts.filter_by(published=True).all():
+        #         _mark_pending(post, ACTION_UPSERT)
 
         # @event.listens_for(Tag, 'after_update')
         # def after_tag_update(mapper, connection, target):
-        #     local_search_service = get_search_service()
-        #     if local_search_service and local_search_service.whoosh_available:
-        #         current_app.logger.info(f"Hook: 标签 '{target.name}' 更新，考虑更新相关文章索引...")
-        #         for post in target.posts.filter_by(published=True).all():
-        #             local_search_service.update_post_in_index(post)
+        #     current_app.logger.info(f"Hook: 标签 '{target.name}' 更新，考虑更新相关文章索引...")
+        #     for post in target.posts:
+        #         _mark_pending(post, ACTION_UPSERT)
 
         current_app.logger.info("搜索索引钩子已初始化")
\ No newline at end of file
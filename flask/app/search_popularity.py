@@ -0,0 +1,490 @@
+# flask/app/search_popularity.py
+
+"""
+热门搜索统计
+使用 Space-Saving 算法按小时窗口维护 top-K 搜索词，内存有界；
+配置 Redis 时各 worker 通过有序集合共享计数。查询热门/趋势词只合并少量窗口，
+不再扫描完整的搜索日志。搜索日志改为缓冲批量写入，不在每次请求时打开文件。
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from heapq import heapify, heappop, heappush, nlargest
+
+logger = logging.getLogger(__name__)
+
+# 查询窗口 -> 覆盖的小时数（None 表示全部历史的累计 sketch）
+WINDOWS = {
+    'hour': 1,
+    'day': 24,
+    'week': 24 * 7,
+    'all': None,
+}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query_text):
+    """归一化搜索词：去首尾空白、合并空白、小写"""
+    return _WHITESPACE_RE.sub(' ', (query_text or '').strip()).lower()
+
+
+class SpaceSaving:
+    """Space-Saving top-K 计数器
+
+    最多保留 capacity 个词；新词在满容量时替换计数最小的词，并继承其计数
+    （高估误差记录在 errors 中）。任何真实频率超过 N/capacity 的词都保证被保留。
+    计数最小的词用惰性最小堆查找：计数变化时压入新条目，弹出时跳过与当前计数不符的旧条目，
+    替换是 O(log K) 而不是扫描全部计数。
+    """
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []  # (count, item)，可能含过期条目
+
+    def add(self, item, count=1):
+        if item in self.counts:
+            self.counts[item] += count
+            self._push(item)
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            self._push(item)
+            return
+        victim, floor = self._pop_min()
+        del self.counts[victim]
+        self.errors.pop(victim, None)
+        self.counts[item] = floor + count
+        self.errors[item] = floor
+        self._push(item)
+
+    def top(self, limit):
+        return nlargest(limit, self.counts.items(), key=lambda kv: kv[1])
+
+    def rebuild(self):
+        """直接修改 counts 之后重建最小堆"""
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapify(self._heap)
+
+    def _push(self, item):
+        heappush(self._heap, (self.counts[item], item))
+        # 过期条目累积到容量的数倍时整体重建，堆大小保持 O(K)
+        if len(self._heap) > 4 * self.capacity:
+            self.rebuild()
+
+    def _pop_min(self):
+        while True:
+            count, item = heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item, count
+
+    def __len__(self):
+        return len(self.counts)
+
+
+class _RollupMixin:
+    """按小时窗口查询的公共逻辑
+
+    day/week 窗口拆成“已结束的小时”与“当前小时”两部分：已结束小时的合并结果按
+    (first_hour, last_hour) 缓存为 capacity 项的汇总，每小时只合并一次；
+    每个请求只需再叠加当前小时的 sketch。子类提供 _hour_counts、_merged 与 _top_all。
+    """
+
+    def _init_rollups(self):
+        self._rollups = {}
+        self._rollup_lock = threading.Lock()
+
+    def top(self, limit=10, window='all', now=None):
+        """返回 [(term, count)]，window 取 hour/day/week/all"""
+        hours = WINDOWS.get(window, None)
+        if hours is None:
+            return self._top_all(limit)
+        hour = _hour_of(now)
+        counts = dict(self._rollup(hour - hours + 1, hour - 1))
+        for term, count in self._hour_counts(hour).items():
+            counts[term] = counts.get(term, 0) + count
+        return nlargest(limit, counts.items(), key=lambda kv: kv[1])
+
+    def trending(self, limit=10, now=None):
+        """最近一小时相对过去一天小时均值增长最快的搜索词 [(term, score)]"""
+        hour = _hour_of(now)
+        recent = self._hour_counts(hour)
+        if not recent:
+            return []
+        baseline = self._rollup(hour - 24, hour - 1)
+        return _trending_scores(recent, baseline, 24, limit)
+
+    def _rollup(self, first_hour, last_hour):
+        if first_hour > last_hour:
+            return {}
+        key = (first_hour, last_hour)
+        with self._rollup_lock:
+            counts = self._rollups.get(key)
+        if counts is not None:
+            return counts
+        merged = self._merged(first_hour, last_hour)
+        counts = dict(nlargest(self.capacity, merged.items(), key=lambda kv: kv[1]))
+        with self._rollup_lock:
+            # 进入新的小时后旧的汇总不再使用
+            self._rollups = {k: v for k, v in self._rollups.items() if k[1] == last_hour}
+            self._rollups[key] = counts
+        return counts
+
+    def _invalidate_rollups(self, hour):
+        """写入已结束的小时（补录历史数据）时丢弃覆盖该小时的汇总"""
+        with self._rollup_lock:
+            if any(first <= hour <= last for first, last in self._rollups):
+                self._rollups = {
+                    (first, last): v for (first, last), v in self._rollups.items()
+                    if not first <= hour <= last
+                }
+
+
+class PopularQueryTracker(_RollupMixin):
+    """进程内的窗口化热门搜索统计（每小时一个 Space-Saving sketch）
+
+    指定 snapshot_dir 时，每个进程由后台线程每 snapshot_interval 秒把计数保存到
+    自己的 <pid>.json，不占用请求线程，多个 worker 也不会互相覆盖。进程首次使用时
+    接管已退出进程（及本 pid 以前）留下的快照并合并，重启不会丢失 all 窗口的累计计数。
+    """
+
+    def __init__(self, capacity=200, retention_hours=24 * 7, snapshot_dir=None, snapshot_interval=60.0):
+        self.capacity = capacity
+        self.retention_hours = retention_hours
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = snapshot_interval
+        self._hours = {}  # 小时序号 -> SpaceSaving
+        self._all = SpaceSaving(capacity)
+        self._lock = threading.Lock()
+        self._init_rollups()
+        self._owner_pid = None  # 已接管快照并启动保存线程的进程；fork 后需要重新启动
+        self._start_lock = threading.Lock()
+        self._stop = None
+
+    def record(self, query_text, now=None):
+        term = normalize_query(query_text)
+        if not term:
+            return
+        self._ensure_started()
+        hour = _hour_of(now)
+        with self._lock:
+            bucket = self._hours.get(hour)
+            if bucket is None:
+                bucket = self._hours[hour] = SpaceSaving(self.capacity)
+                self._expire(hour)
+            bucket.add(term)
+            self._all.add(term)
+        if self._rollups:
+            self._invalidate_rollups(hour)
+
+    def top(self, limit=10, window='all', now=None):
+        self._ensure_started()
+        return super().top(limit, window=window, now=now)
+
+    def trending(self, limit=10, now=None):
+        self._ensure_started()
+        return super().trending(limit, now=now)
+
+    def save_snapshot(self):
+        """把本进程的计数原子地写入 <pid>.json"""
+        if not self.snapshot_dir or self._owner_pid != os.getpid():
+            return
+        with self._lock:
+            state = {
+                'capacity': self.capacity,
+                'all': _dump_sketch(self._all),
+                'hours': {str(hour): _dump_sketch(bucket) for hour, bucket in self._hours.items()},
+            }
+        path = os.path.join(self.snapshot_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        """停止保存线程并写入最后一次快照"""
+        if self._stop is not None:
+            self._stop.set()
+        self.save_snapshot()
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if not self.snapshot_dir or self._owner_pid == pid:
+            return
+        with self._start_lock:
+            if self._owner_pid == pid:
+                return
+            self._owner_pid = pid
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            self._claim_snapshots()
+            self._stop = threading.Event()
+            threading.Thread(
+                target=self._snapshot_loop, args=(self._stop,), name='search-popular-snapshot', daemon=True
+            ).start()
+
+    def _snapshot_loop(self, stop):
+        while not stop.wait(self.snapshot_interval):
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                logger.warning(f"保存热门搜索快照失败: {e}")
+
+    def _claim_snapshots(self):
+        """合并已退出进程与本 pid 以前留下的快照
+
+        先把快照改名为本进程的 .claim 文件，只有改名成功的进程才会加载，
+        多个 worker 同时启动也不会重复计入同一份快照。合并结果写入本进程的快照后才删除 .claim。
+        """
+        pid = os.getpid()
+        claimed = []
+        for name in os.listdir(self.snapshot_dir):
+            owner = name[:-len('.json')] if name.endswith('.json') else ''
+            if not owner.isdigit() or (int(owner) != pid and _pid_alive(int(owner))):
+                continue
+            claim_path = os.path.join(self.snapshot_dir, f"{name}.{pid}.claim")
+            try:
+                os.rename(os.path.join(self.snapshot_dir, name), claim_path)
+            except OSError:
+                continue  # 已被其他进程接管
+            claimed.append(claim_path)
+        if not claimed:
+            return
+        for path in claimed:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self._merge_state(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取热门搜索快照 {path} 失败: {e}")
+        with self._lock:
+            self._expire(_hour_of())
+        self.save_snapshot()
+        for path in claimed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _merge_state(self, state):
+        with self._lock:
+            self._all = _merge_sketch(self._all, state.get('all', {}), self.capacity)
+            for hour, data in state.get('hours', {}).items():
+                hour = int(hour)
+                self._hours[hour] = _merge_sketch(self._hours.get(hour), data, self.capacity)
+
+    def _hour_counts(self, hour):
+        with self._lock:
+            bucket = self._hours.get(hour)
+            return dict(bucket.counts) if bucket is not None else {}
+
+    def _top_all(self, limit):
+        with self._lock:
+            return self._all.top(limit)
+
+    def _merged(self, first_hour, last_hour):
+        """合并若干小时窗口的计数，结果最多 (last_hour - first_hour + 1) * capacity 项"""
+        counts = {}
+        with self._lock:
+            for hour in range(first_hour, last_hour + 1):
+                bucket = self._hours.get(hour)
+                if bucket is not None:
+                    for term, count in bucket.counts.items():
+                        counts[term] = counts.get(term, 0) + count
+        return counts
+
+    def _expire(self, current_hour):
+        cutoff = current_hour - self.retention_hours
+        for hour in [h for h in self._hours if h <= cutoff]:
+            del self._hours[hour]
+
+
+# 在 Redis 中原子地执行 Space-Saving：已有成员直接加一；未满时以计数 1 加入；
+# 已满时替换计数最小的成员，新词继承其计数再加一（与 SpaceSaving.add 一致）
+_SPACE_SAVING_SCRIPT = """
+local capacity = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    if redis.call('ZSCORE', key, ARGV[1]) then
+        redis.call('ZINCRBY', key, 1, ARGV[1])
+    elseif redis.call('ZCARD', key) < capacity then
+        redis.call('ZADD', key, 1, ARGV[1])
+    else
+        local victim = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        redis.call('ZREM', key, victim[1])
+        redis.call('ZADD', key, tonumber(victim[2]) + 1, ARGV[1])
+    end
+    local ttl = tonumber(ARGV[2 + i])
+    if ttl > 0 then
+        redis.call('EXPIRE', key, ttl)
+    end
+end
+return 1
+"""
+
+
+class RedisPopularQueryTracker(_RollupMixin):
+    """基于 Redis 有序集合的热门搜索统计，多个 worker 共享计数
+
+    每小时一个 ZSET，另有一个累计的 all ZSET；写入通过 Lua 脚本原子地执行 Space-Saving，
+    每个集合最多 capacity 个成员，计数保存在 Redis 中，进程重启不会丢失。
+    已结束小时的汇总缓存在进程内，week 窗口每小时只读取一次 168 个 ZSET。
+    """
+
+    def __init__(self, client, capacity=200, retention_hours=24 * 7, prefix='search:popular'):
+        self.client = client
+        self.capacity = capacity
+        self.retention_hours = retention_hours
+        self.prefix = prefix
+        self._record_script = client.register_script(_SPACE_SAVING_SCRIPT)
+        self._init_rollups()
+
+    def _key(self, hour):
+        return f"{self.prefix}:h:{hour}"
+
+    def record(self, query_text, now=None):
+        term = normalize_query(query_text)
+        if not term:
+            return
+        self._record_script(
+            keys=[self._key(_hour_of(now)), f"{self.prefix}:all"],
+            args=[term, self.capacity, (self.retention_hours + 1) * 3600, 0],
+        )
+
+    def _top_all(self, limit):
+        return self._decode(self.client.zrevrange(f"{self.prefix}:all", 0, limit - 1, withscores=True))
+
+    def _hour_counts(self, hour):
+        return dict(self._decode(self.client.zrevrange(self._key(hour), 0, self.capacity - 1, withscores=True)))
+
+    def _merged(self, first_hour, last_hour):
+        pipe = self.client.pipeline(transaction=False)
+        for hour in range(first_hour, last_hour + 1):
+            pipe.zrevrange(self._key(hour), 0, self.capacity - 1, withscores=True)
+        counts = {}
+        for rows in pipe.execute():
+            for term, score in self._decode(rows):
+                counts[term] = counts.get(term, 0) + score
+        return counts
+
+    @staticmethod
+    def _decode(rows):
+        return [
+            (term.decode('utf-8', 'ignore') if isinstance(term, bytes) else term, int(score))
+            for term, score in rows
+        ]
+
+
+class QueryLogBuffer:
+    """缓冲写入搜索日志，每 flush_size 条或 flush_interval 秒批量追加一次"""
+
+    def __init__(self, path, flush_size=100, flush_interval=5.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._lines = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def append(self, query_text):
+        line = f"{datetime.utcnow().isoformat()}\t{query_text.strip()}\n"
+        with self._lock:
+            self._lines.append(line)
+            due = (
+                len(self._lines) >= self.flush_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if not due:
+                return
+            lines, self._lines = self._lines, []
+            self._last_flush = time.monotonic()
+        self._write(lines)
+
+    def flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, []
+            self._last_flush = time.monotonic()
+        self._write(lines)
+
+    def _write(self, lines):
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+
+def create_popular_query_tracker(app):
+    """根据配置创建热门搜索统计；配置了 Redis 且可连接时使用 Redis 共享计数，
+    否则使用进程内统计，并把快照保存在实例目录中"""
+    capacity = app.config.get('SEARCH_POPULAR_CAPACITY', 200)
+    retention = app.config.get('SEARCH_POPULAR_RETENTION_HOURS', 24 * 7)
+    redis_url = app.config.get('SEARCH_POPULAR_REDIS_URL')
+    if redis_url:
+        try:
+            import redis
+            client = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+            client.ping()
+            return RedisPopularQueryTracker(client, capacity=capacity, retention_hours=retention)
+        except Exception as e:
+            app.logger.warning(f"热门搜索统计无法连接 Redis，使用进程内统计: {e}")
+    snapshot_dir = None
+    if app.config.get('SEARCH_POPULAR_SNAPSHOT', True):
+        snapshot_dir = os.path.join(app.instance_path, 'search_popular')
+    tracker = PopularQueryTracker(
+        capacity=capacity,
+        retention_hours=retention,
+        snapshot_dir=snapshot_dir,
+        snapshot_interval=app.config.get('SEARCH_POPULAR_SNAPSHOT_INTERVAL', 60.0),
+    )
+    if snapshot_dir:
+        atexit.register(tracker.close)
+    return tracker
+
+
+def _dump_sketch(sketch):
+    return {'counts': sketch.counts, 'errors': sketch.errors}
+
+
+def _merge_sketch(sketch, data, capacity):
+    """把快照中的计数与误差加到 sketch 上，只保留计数最高的 capacity 个词"""
+    counts = dict(sketch.counts) if sketch is not None else {}
+    errors = dict(sketch.errors) if sketch is not None else {}
+    for term, count in data.get('counts', {}).items():
+        counts[term] = counts.get(term, 0) + int(count)
+        errors[term] = errors.get(term, 0) + int(data.get('errors', {}).get(term, 0))
+    merged = SpaceSaving(capacity)
+    for term, count in nlargest(capacity, counts.items(), key=lambda kv: kv[1]):
+        merged.counts[term] = count
+        merged.errors[term] = errors.get(term, 0)
+    merged.rebuild()
+    return merged
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        return True
+    except (ProcessLookupError, OverflowError):
+        return False
+    return True
+
+
+def _hour_of(now=None):
+    return int((now if now is not None else time.time()) // 3600)
+
+
+def _trending_scores(recent, baseline, baseline_hours, limit):
+    """趋势分 = 最近一小时次数 / (过去各小时平均次数 + 1)"""
+    scores = {
+        term: count / (baseline.get(term, 0) / baseline_hours + 1)
+        for term, count in recent.items()
+    }
+    return [(term, round(score, 3)) for term, score in nlargest(limit, scores.items(), key=lambda kv: kv[1])]
@@ -0,0 +1,267 @@
+# flask/app/search_queue.py
+
+"""
+搜索索引异步队列
+SQLAlchemy 钩子只负责把文章 ID 放入去重队列，由后台线程批量写入 Whoosh，
+多篇文章合并为一次 writer.commit()，避免每次保存文章都持有 Whoosh 写锁。
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import Post
+
+# 队列中的操作类型：upsert 表示重新读取并写入索引，delete 表示从索引删除
+ACTION_UPSERT = 'upsert'
+ACTION_DELETE = 'delete'
+
+
+class SearchIndexQueue:
+    """去重的批量索引队列
+
+    同一篇文章在一个批次内多次变更只保留最后一次操作；
+    upsert 在出队时重新从数据库读取文章，因此总是索引最新的已提交数据。
+    """
+
+    def __init__(self, service, app=None, batch_size=200, flush_interval=1.0, async_mode=True):
+        self.service = service
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.async_mode = async_mode
+
+        self._pending = {}  # post_id -> (action, enqueued_at)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 保证同一时刻只有一个批次在写索引
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+
+        # 可观测指标
+        self._stats = {
+            'enqueued_total': 0,
+            'deduplicated_total': 0,
+            'indexed_total': 0,
+            'deleted_total': 0,
+            'batches_total': 0,
+            'failures_total': 0,
+            'last_batch_size': 0,
+            'last_commit_ms': 0.0,
+            'last_lag_ms': 0.0,
+            'max_lag_ms': 0.0,
+            'last_flush_at': None,
+            'last_error': None,
+        }
+
+    # --- 入队 ---
+
+    def enqueue(self, post_id, action=ACTION_UPSERT):
+        """将文章加入索引队列（同一文章重复入队会被合并）"""
+        self.enqueue_many({post_id: action})
+
+    def enqueue_many(self, operations):
+        """批量入队 {post_id: action}"""
+        if not operations:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for post_id, action in operations.items():
+                previous = self._pending.get(post_id)
+                if previous is not None:
+                    self._stats['deduplicated_total'] += 1
+                    # 保留最早的入队时间，用于计算真实的可见延迟
+                    now_or_first = previous[1]
+                else:
+                    now_or_first = now
+                self._pending[post_id] = (action, now_or_first)
+                self._stats['enqueued_total'] += 1
+            depth = len(self._pending)
+
+        if self.async_mode:
+            self._ensure_worker()
+            if depth >= self.batch_size:
+                self._wakeup.set()
+
+    def depth(self):
+        """当前队列深度"""
+        with self._lock:
+            return len(self._pending)
+
+    # --- 出队 / 批量写索引 ---
+
+    def flush(self):
+        """立即把队列中的全部操作写入索引，返回本次处理的文章数"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+
+            started = time.monotonic()
+            try:
+                processed = self._apply_batch(batch)
+            except Exception as e:
+                self._requeue(batch)
+                self._stats['failures_total'] += 1
+                self._stats['last_error'] = str(e)
+                self._log('error', f"批量写入搜索索引失败，已重新入队 {len(batch)} 项: {e}")
+                return 0
+
+            finished = time.monotonic()
+            oldest = min(enqueued_at for _, enqueued_at in batch.values())
+            lag_ms = (finished - oldest) * 1000
+            self._stats['batches_total'] += 1
+            self._stats['last_batch_size'] = len(batch)
+            self._stats['last_commit_ms'] = round((finished - started) * 1000, 2)
+            self._stats['last_lag_ms'] = round(lag_ms, 2)
+            self._stats['max_lag_ms'] = round(max(self._stats['max_lag_ms'], lag_ms), 2)
+            self._stats['last_flush_at'] = datetime.utcnow().isoformat()
+            self._stats['last_error'] = None
+            return processed
+
+    @contextmanager
+    def paused(self):
+        """暂停出队（如重建索引期间），期间入队的操作在退出后写入"""
+        with self._flush_lock:
+            yield
+        self._wakeup.set()
+
+    def _apply_batch(self, batch):
+        """在应用上下文中加载文章并一次性提交到索引"""
+        if self.app is not None:
+            with self.app.app_context():
+                try:
+                    return self._write_batch(batch)
+                finally:
+                    # 后台线程使用独立的 scoped session，用完即释放连接
+                    db.session.remove()
+        return self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        upsert_ids = [pid for pid, (action, _) in batch.items() if action == ACTION_UPSERT]
+        delete_ids = {pid for pid, (action, _) in batch.items() if action == ACTION_DELETE}
+
+        posts = []
+        if upsert_ids:
+            # 预加载关联对象，避免逐篇文章懒加载 tags/category/author
+            loaded = (
+                Post.query
+                .options(selectinload(Post.tags), selectinload(Post.category), selectinload(Post.author))
+                .filter(Post.id.in_(upsert_ids))
+                .all()
+            )
+            found = set()
+            for post in loaded:
+                found.add(post.id)
+                if post.published:
+                    posts.append(post)
+                else:
+                    delete_ids.add(post.id)
+            # 已被删除的文章同样需要从索引移除
+            delete_ids.update(set(upsert_ids) - found)
+
+        if not self.service.apply_index_batch(posts, delete_ids):
+            raise RuntimeError('apply_index_batch 返回失败')
+
+        self._stats['indexed_total'] += len(posts)
+        self._stats['deleted_total'] += len(delete_ids)
+        return len(posts) + len(delete_ids)
+
+    def _requeue(self, batch):
+        """失败的批次放回队列，不覆盖期间新入队的更新操作"""
+        with self._lock:
+            for post_id, item in batch.items():
+                self._pending.setdefault(post_id, item)
+
+    # --- 后台线程 ---
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stopped.clear()
+            self._worker = threading.Thread(
+                target=self._run, name='search-index-queue', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:  # 兜底，保证后台线程不退出
+                self._log('error', f"搜索索引队列后台线程异常: {e}")
+
+    def stop(self, flush=True):
+        """停止后台线程，默认在退出前写入剩余操作"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout=max(self.flush_interval * 2, 5))
+            self._worker = None
+        if flush:
+            self.flush()
+
+    # --- 指标 ---
+
+    def stats(self):
+        """返回队列深度与索引延迟指标
+
+        队列只存在于各 worker 进程内，通过 /api/v1/search/stats 的 index_queue 字段查看，
+        pid 标明数据来自哪个 worker。
+        """
+        with self._lock:
+            depth = len(self._pending)
+            oldest = min((t for _, t in self._pending.values()), default=None)
+        data = dict(self._stats)
+        data['depth'] = depth
+        data['oldest_pending_ms'] = round((time.monotonic() - oldest) * 1000, 2) if oldest else 0.0
+        data['async'] = self.async_mode
+        data['worker_alive'] = bool(self._worker is not None and self._worker.is_alive())
+        data['pid'] = os.getpid()
+        return data
+
+    def _log(self, level, message):
+        try:
+            logger = self.app.logger if self.app is not None else current_app.logger
+            getattr(logger, level)(message)
+        except Exception:
+            pass
+
+
+# 全局索引队列实例
+index_queue = None
+
+
+def init_search_index_queue(app, service):
+    """初始化搜索索引队列"""
+    global index_queue
+    if index_queue is None:
+        index_queue = SearchIndexQueue(
+            service,
+            app=app,
+            batch_size=app.config.get('SEARCH_INDEX_BATCH_SIZE', 200),
+            flush_interval=app.config.get('SEARCH_INDEX_FLUSH_INTERVAL', 1.0),
+            async_mode=app.config.get('SEARCH_INDEX_ASYNC', True),
+        )
+        if index_queue.async_mode:
+            import atexit
+            atexit.register(index_queue.stop)
+    return index_queue
+
+
+def get_search_index_queue():
+    """获取搜索索引队列实例（未初始化时返回 None）"""
+    return index_queue
@@ -6,8 +6,14 @@
 支持中文分词、语义搜索、搜索建议等功能
 """
 
+import atexit
+import hashlib
+import json
 import os
 import re
+import shutil
+import time
+from contextlib import nullcontext
 try:
     import jieba
     JIEBA_AVAILABLE = True
@@ -52,8 +58,51 @@ except ImportError:
     accent_map = None
 
 from app.models import Post, Category, Tag, User
-from app import db
+from app import db, cache
+from app.search_queue import ACTION_DELETE, ACTION_UPSERT, get_search_index_queue
+from app.search_suggest import SuggestionIndex
+from app.search_popularity import QueryLogBuffer, create_popular_query_tracker
 from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+
+
+# 共享缓存中保存索引提交令牌的键
+GENERATION_CACHE_KEY = 'search_index_generation'
+# 索引目录下的指针文件，内容为线上索引版本子目录名；重建时写临时文件再 os.replace 原子切换
+INDEX_POINTER_FILE = 'CURRENT'
+INDEX_VERSION_PREFIX = 'v-'
+# 影响索引内容的文章属性（与 _post_to_document 对应）；只改了其他属性（如 views）时不重新索引
+INDEXED_POST_ATTRIBUTES = frozenset({
+    'title', 'content', 'summary', 'tags', 'category', 'category_id', 'author', 'user_id',
+    'published', 'published_at', 'created_at', 'slug',
+})
+# 比较新旧文档时忽略的字段：浏览量只用于展示，不值得为它提交索引并让结果缓存失效
+UNINDEXED_DOCUMENT_FIELDS = frozenset({'views'})
+
+# 查询语法中的运算符区分大小写，归一化时保持原样
+_QUERY_OPERATORS = {'AND', 'OR', 'NOT', 'ANDNOT', 'ANDMAYBE'}
+
+
+def _normalize_cache_query(query_text):
+    """归一化查询文本用于缓存键：合并空白，除运算符外统一小写"""
+    return ' '.join(
+        token if token in _QUERY_OPERATORS else token.lower()
+        for token in (query_text or '').split()
+    )
+
+
+def clean_html(html_text):
+    """清理HTML标签，保留纯文本（索引与相关文章计算共用）"""
+    if not html_text:
+        return ''
+    
+    # 移除HTML标签
+    clean_text = re.sub(r'<[^>]+>', '', html_text)
+    
+    # 移除多余的空白字符
+    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    
+    return clean_text
 
 
 # 当 Whoosh 模块不可用时，analysis 可能为 None。为避免导入期错误，这里做条件定义。
@@ -115,6 +164,14 @@ class AdvancedSearchService:
         self.index_dir = index_dir
         self.schema = None
         self.index = None
+        self._live_dir = None # 当前打开的索引版本目录
+        self.last_rebuild_stats = None # 最近一次重建的吞吐统计
+        self.suggestions = None # 自动补全索引，随 Whoosh 索引一起构建
+        self._suggestions_checked_at = 0.0
+        self.popular = None # 热门搜索 top-K 统计
+        self.query_log = None # 搜索日志缓冲
+        self._local_generation = time.time_ns() # 共享缓存不可用时的本地索引代数
+        self._result_cache_stats = {'hits': 0, 'misses': 0}
         
         # 不要在这里直接调用 current_app 或进行 Whoosh 初始化
         # 初始化逻辑放在 _deferred_init 中，由 init_search_service 调用
@@ -160,6 +217,7 @@ class AdvancedSearchService:
         )
         
         self._init_index_instance() # 调用真正的索引文件初始化
+        self._build_suggestions()
         self._is_initialized = True # 标记初始化成功
 
     def _init_index_instance(self): # 重命名以区分
@@ -168,11 +226,15 @@ class AdvancedSearchService:
             return
 
         try:
-            if exists_in(self.index_dir):
-                self.index = open_index(self.index_dir)
+            live_dir = self._live_index_dir()
+            if exists_in(live_dir):
+                self.index = open_index(live_dir)
+                self._live_dir = live_dir
                 current_app.logger.info("搜索索引已加载")
             else:
-                self.index = create_index(self.index_dir, self.schema)
+                version_dir = self._new_version_dir()
+                create_index(version_dir, self.schema)
+                self._publish_version(version_dir)
                 current_app.logger.info("搜索索引已创建")
                 # 首次创建时建立索引
                 # 在这里调用 rebuild_index 可能会导致额外的日志，但在首次设置时通常是安全的
@@ -182,11 +244,12 @@ class AdvancedSearchService:
             current_app.logger.error(f"Whoosh搜索索引文件操作失败: {e}，尝试重建索引...")
             # 如果索引损坏，重新创建
             try:
-                import shutil
                 if os.path.exists(self.index_dir):
                     shutil.rmtree(self.index_dir) # 彻底删除旧索引
                 os.makedirs(self.index_dir, exist_ok=True)
-                self.index = create_index(self.index_dir, self.schema)
+                version_dir = self._new_version_dir()
+                create_index(version_dir, self.schema)
+                self._publish_version(version_dir)
                 self.rebuild_index()
                 current_app.logger.info("Whoosh搜索索引成功重建。")
             except Exception as rebuild_error:
@@ -196,128 +259,255 @@ class AdvancedSearchService:
 
     # --- 以下方法需要添加 whoosh_available 和 self.index 的检查，并修正 timestamp 引用 ---
 
+    def _post_to_document(self, post):
+        """将文章转换为 Whoosh 文档字段"""
+        tags_text = ' '.join([tag.name for tag in post.tags]) if post.tags else ''
+        return dict(
+            id=post.id,
+            title=post.title or '',
+            content=self._clean_html(post.content),
+            summary=post.summary or '',
+            tags=tags_text,
+            category=post.category.name if post.category else '',
+            author=post.author.username if post.author else '',
+            published=post.published,
+            # 关键修改：使用 post.published_at 作为 Whoosh 的 timestamp 字段
+            timestamp=post.published_at if post.published_at else post.created_at,
+            views=post.views or 0,
+            slug=post.slug or ''
+        )
+
     def add_post_to_index(self, post):
         """添加单篇文章到索引"""
-        if not self.whoosh_available or not self.index:
-            current_app.logger.warning("Whoosh服务不可用或索引未加载，无法添加文章到索引。")
-            return False
-        
-        try:
-            writer = self.index.writer()
-            tags_text = ' '.join([tag.name for tag in post.tags]) if post.tags else ''
-            content_text = self._clean_html(post.content)
-            
-            writer.add_document(
-                id=post.id,
-                title=post.title or '',
-                content=content_text,
-                summary=post.summary or '',
-                tags=tags_text,
-                category=post.category.name if post.category else '',
-                author=post.author.username if post.author else '',
-                published=post.published,
-                # 关键修改：使用 post.published_at 作为 Whoosh 的 timestamp 字段
-                timestamp=post.published_at if post.published_at else post.created_at,
-                views=post.views or 0,
-                slug=post.slug or ''
-            )
-            writer.commit()
-            return True
-        except Exception as e:
-            current_app.logger.error(f"添加文章到搜索索引失败: {e}")
-            return False
+        return self.apply_index_batch([post])
     
     def update_post_in_index(self, post):
         """更新索引中的文章"""
-        if not self.whoosh_available or not self.index:
-            current_app.logger.warning("Whoosh服务不可用或索引未加载，无法更新文章索引。")
-            return False
-        
-        try:
-            writer = self.index.writer()
-            writer.delete_by_term('id', post.id) # 删除旧文档
-            
-            tags_text = ' '.join([tag.name for tag in post.tags]) if post.tags else ''
-            content_text = self._clean_html(post.content)
-            
-            writer.add_document(
-                id=post.id,
-                title=post.title or '',
-                content=content_text,
-                summary=post.summary or '',
-                tags=tags_text,
-                category=post.category.name if post.category else '',
-                author=post.author.username if post.author else '',
-                published=post.published,
-                # 关键修改：使用 post.published_at 作为 Whoosh 的 timestamp 字段
-                timestamp=post.published_at if post.published_at else post.created_at,
-                views=post.views or 0,
-                slug=post.slug or ''
-            )
-            writer.commit()
-            return True
-        except Exception as e:
-            current_app.logger.error(f"更新搜索索引失败: {e}")
-            return False
-    
+        return self.apply_index_batch([post])
+
     def remove_post_from_index(self, post_id):
         """从索引中删除文章"""
+        return self.apply_index_batch([], [post_id])
+
+    def apply_index_batch(self, posts, delete_ids=()):
+        """
+        批量更新索引：多篇文章共用一个 writer，只提交一次
+
+        Args:
+            posts: 需要写入（新增或更新）的已发布文章
+            delete_ids: 需要从索引删除的文章ID
+        """
         if not self.whoosh_available or not self.index:
-            current_app.logger.warning("Whoosh服务不可用或索引未加载，无法从索引删除文章。")
+            current_app.logger.warning("Whoosh服务不可用或索引未加载，无法批量更新索引。")
             return False
-        
+
+        if not posts and not delete_ids:
+            return True
+
         try:
+            self._refresh_index()
+            documents = [self._post_to_document(post) for post in posts]
+            stored = self._stored_documents(set(delete_ids) | {doc['id'] for doc in documents})
+            # 索引字段没有变化的文档、本就不在索引中的删除都跳过，全部跳过时不提交也不更新代数
+            documents = [doc for doc in documents if not self._same_indexed_fields(stored.get(doc['id']), doc)]
+            delete_ids = [post_id for post_id in delete_ids if post_id in stored]
+            if not documents and not delete_ids:
+                return True
+
+            # 被替换或删除的旧文档中的词，提交后需要刷新补全索引中的文档频率
+            touched_terms = set()
+            if self.suggestions is not None:
+                for post_id in set(delete_ids) | {doc['id'] for doc in documents}:
+                    if post_id in stored:
+                        touched_terms |= self._suggestion_terms(stored[post_id])
+
             writer = self.index.writer()
-            writer.delete_by_term('id', post_id)
+            try:
+                for post_id in delete_ids:
+                    writer.delete_by_term('id', post_id)
+                for document in documents:
+                    writer.update_document(**document)
+                    touched_terms |= self._suggestion_terms(document)
+            except Exception:
+                writer.cancel() # 释放写锁
+                raise
             writer.commit()
+            self._bump_index_generation()
+
+            self._refresh_suggestions(touched_terms)
             return True
         except Exception as e:
-            current_app.logger.error(f"从搜索索引删除文章失败: {e}")
+            current_app.logger.error(f"批量更新搜索索引失败: {e}")
             return False
     
-    def rebuild_index(self):
-        """重建完整搜索索引"""
+    def rebuild_index(self, batch_size=None, procs=None):
+        """
+        重建完整搜索索引
+
+        流式读取已发布文章写入新的版本目录，全部成功后原子地切换指针文件，
+        任何时刻都有完整的线上索引可读；失败时线上索引不受影响。
+
+        Args:
+            batch_size: 每批从数据库读取的文章数（yield_per）
+            procs: Whoosh 写入进程数，大于1时使用多进程 writer
+        """
         if not self.whoosh_available: # 优先检查 whoosh_available，因为可能索引根本没成功创建
             current_app.logger.warning("Whoosh服务不可用，无法重建索引。")
             return False
-        
+
+        batch_size = batch_size or current_app.config.get('SEARCH_REBUILD_BATCH_SIZE', 500)
+        procs = procs or current_app.config.get('SEARCH_REBUILD_PROCS', 1)
+        limitmb = current_app.config.get('SEARCH_REBUILD_LIMITMB', 128)
+
+        started_at = datetime.utcnow()
+        timer = time.perf_counter()
+
+        # 重建期间暂停本进程的索引队列，替换完成后队列中的变更写入新索引
+        queue = get_search_index_queue()
+        with (queue.paused() if queue is not None else nullcontext()):
+            side_dir = None
+            try:
+                side_dir = self._new_version_dir()
+                side_index = create_index(side_dir, self.schema)
+                if procs > 1:
+                    writer = side_index.writer(procs=procs, limitmb=limitmb, multisegment=True)
+                else:
+                    writer = side_index.writer(limitmb=limitmb)
+
+                count = 0
+                try:
+                    for post in self._iter_published_posts(batch_size):
+                        writer.add_document(**self._post_to_document(post))
+                        count += 1
+                except Exception:
+                    writer.cancel()
+                    raise
+                writer.commit()
+
+                self._publish_version(side_dir)
+            except Exception as e:
+                current_app.logger.error(f"重建搜索索引失败: {e}")
+                if side_dir is not None:
+                    shutil.rmtree(side_dir, ignore_errors=True)
+                return False
+
+        elapsed = time.perf_counter() - timer
+        self.last_rebuild_stats = {
+            'documents': count,
+            'seconds': round(elapsed, 3),
+            'docs_per_sec': round(count / elapsed, 1) if elapsed > 0 else float(count),
+            'procs': procs,
+            'batch_size': batch_size,
+        }
+        # 其他进程在重建期间写入旧版本的修改不在新版本中，这里追平
+        self._catch_up_since(started_at)
+        current_app.logger.info(
+            f"搜索索引重建完成，索引了 {count} 篇文章，耗时 {elapsed:.2f}s"
+        )
+        return True
+
+    def _iter_published_posts(self, batch_size):
+        """按批流式读取已发布文章，并预加载标签/分类/作者，避免 N+1 查询"""
+        query = (
+            Post.query
+            .filter_by(published=True)
+            .options(selectinload(Post.tags), selectinload(Post.category), selectinload(Post.author))
+            .order_by(Post.id)
+            .yield_per(batch_size)
+        )
+        for post in query:
+            yield post
+
+    def _live_index_dir(self):
+        """指针文件指向的线上索引版本目录；没有指针文件时（旧布局）就是 index_dir 本身"""
         try:
-            # 清空并重建索引的可靠方法：删除目录并重新创建
-            import shutil
-            if os.path.exists(self.index_dir):
-                shutil.rmtree(self.index_dir) # 删除旧索引目录
-            os.makedirs(self.index_dir, exist_ok=True) # 创建新目录
-            self.index = create_index(self.index_dir, self.schema) # 重新创建索引
-            
-            writer = self.index.writer() # 获取新索引的 writer
-            
-            posts = Post.query.filter_by(published=True).all()
-            
-            for post in posts:
-                tags_text = ' '.join([tag.name for tag in post.tags]) if post.tags else ''
-                content_text = self._clean_html(post.content)
-                
-                writer.add_document(
-                    id=post.id,
-                    title=post.title or '',
-                    content=content_text,
-                    summary=post.summary or '',
-                    tags=tags_text,
-                    category=post.category.name if post.category else '',
-                    author=post.author.username if post.author else '',
-                    published=post.published,
-                    # 关键修改：使用 post.published_at 作为 Whoosh 的 timestamp 字段
-                    timestamp=post.published_at if post.published_at else post.created_at,
-                    views=post.views or 0,
-                    slug=post.slug or ''
+            with open(os.path.join(self.index_dir, INDEX_POINTER_FILE), encoding='utf-8') as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return self.index_dir
+        return os.path.join(self.index_dir, version) if version else self.index_dir
+
+    def _new_version_dir(self):
+        """新建一个版本目录；目录名按创建时间排序"""
+        version_dir = os.path.join(self.index_dir, f"{INDEX_VERSION_PREFIX}{time.time_ns()}-{os.getpid()}")
+        os.makedirs(version_dir)
+        return version_dir
+
+    def _publish_version(self, version_dir):
+        """原子地把指针文件切换到新版本目录并重新打开索引
+
+        切换前后读者总能打开一个完整的索引；上一个版本保留给尚未切换的进程，
+        更早的版本（包括中断的重建留下的目录）在这里清理。
+        """
+        previous_dir = self._live_index_dir()
+        pointer = os.path.join(self.index_dir, INDEX_POINTER_FILE)
+        tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp_pointer, 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(version_dir))
+        os.replace(tmp_pointer, pointer)
+
+        self.index = open_index(version_dir)
+        self._live_dir = version_dir
+        self._bump_index_generation()
+        self._prune_versions(previous_dir)
+        self._build_suggestions()
+
+    def _prune_versions(self, previous_dir):
+        """删除比上一个版本更早的版本目录；从旧布局迁移时删除 index_dir 下的旧索引文件"""
+        if previous_dir == self.index_dir:
+            for name in os.listdir(self.index_dir):
+                path = os.path.join(self.index_dir, name)
+                if os.path.isfile(path) and not name.startswith(INDEX_POINTER_FILE):
+                    os.remove(path)
+            return
+        previous = os.path.basename(previous_dir)
+        for name in os.listdir(self.index_dir):
+            if name.startswith(INDEX_VERSION_PREFIX) and name < previous:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def _refresh_index(self):
+        """其他进程切换了索引版本时重新打开"""
+        live_dir = self._live_index_dir()
+        if live_dir != self._live_dir:
+            self.index = open_index(live_dir)
+            self._live_dir = live_dir
+
+    def _catch_up_since(self, since):
+        """重新索引 since 之后有修改的文章，并删除重建期间已被删除或取消发布的文章
+
+        删除不会留下 updated_at，因此比较新索引中的 ID 与数据库中已发布文章的 ID。
+        """
+        try:
+            changed_ids = [pid for (pid,) in db.session.query(Post.id).filter(Post.updated_at >= since)]
+            published_ids = {pid for (pid,) in db.session.query(Post.id).filter(Post.published.is_(True))}
+            stale_ids = self._indexed_ids() - published_ids
+            if not changed_ids and not stale_ids:
+                return
+            queue = get_search_index_queue()
+            if queue is not None:
+                operations = {pid: ACTION_UPSERT for pid in changed_ids}
+                operations.update({pid: ACTION_DELETE for pid in stale_ids})
+                queue.enqueue_many(operations)
+            else:
+                posts = Post.query.filter(Post.id.in_(changed_ids)).all() if changed_ids else []
+                self.apply_index_batch(
+                    [post for post in posts if post.published],
+                    [post.id for post in posts if not post.published] + sorted(stale_ids),
                 )
-            writer.commit()
-            current_app.logger.info(f"搜索索引重建完成，索引了 {len(posts)} 篇文章")
-            return True
         except Exception as e:
-            current_app.logger.error(f"重建搜索索引失败: {e}")
-            return False
+            current_app.logger.warning(f"追平重建期间的文章修改失败: {e}")
     
+    def _indexed_ids(self):
+        """索引中全部文章 ID（只读 id 字段的词典与倒排，不加载存储字段）"""
+        field = self.schema['id']
+        with self.index.searcher() as searcher:
+            reader = searcher.reader()
+            # 已删除文档的词仍留在词典中，直到段合并；倒排会跳过已删除文档
+            return {
+                field.from_bytes(term) for term in field.sortable_terms(reader, 'id')
+                if reader.postings('id', term).is_active()
+            }
+
     def search(self, query_text, page=1, per_page=10, filters=None):
         """
         高级搜索功能
@@ -350,10 +540,26 @@ class AdvancedSearchService:
                 'results': [], 'total': 0, 'page': page, 'per_page': per_page,
                 'suggestions': [], 'query': query_text
             }
+
+        # 其他进程重建后切换了版本目录时改读新版本
+        try:
+            self._refresh_index()
+        except Exception as e:
+            current_app.logger.warning(f"打开最新的搜索索引版本失败: {e}")
+
+        # 结果页缓存：键包含归一化查询、过滤器、分页与索引代数，索引提交后自动失效
+        cache_key = self._result_cache_key(query_text, page, per_page, filters)
+        try:
+            cached = cache.get(cache_key)
+        except Exception as e:
+            current_app.logger.warning(f"读取搜索结果缓存失败: {e}")
+            cached = None
+        if cached is not None:
+            self._result_cache_stats['hits'] += 1
+            return cached
+        self._result_cache_stats['misses'] += 1
         
         try:
-            searcher = self.index.searcher(weighting=BM25F())
-            
             # 创建多字段解析器
             parser = MultifieldParser(
                 ['title', 'content', 'summary', 'tags', 'category', 'author'],
@@ -379,40 +585,38 @@ class AdvancedSearchService:
             # 只搜索已发布的文章
             query = And([query, Term('published', True)])
             
-            # 执行搜索
-            results = searcher.search(query, limit=per_page * 10) # 获取更多结果用于分页
-            
-            # 计算分页
-            total = len(results)
             start = (page - 1) * per_page
             end = start + per_page
-            page_results = results[start:end]
-            
-            # 构造结果
-            search_results = []
-            for hit in page_results:
-                result = {
-                    'id': hit['id'],
-                    'title': hit['title'],
-                    'summary': hit['summary'],
-                    'category': hit['category'],
-                    'author': hit['author'],
-                    # 关键修改：这里也使用正确的 timestamp 字段
-                    'timestamp': hit['timestamp'],
-                    # 兼容模板：提供 created_at / published_at 字段
-                    'created_at': hit['timestamp'],
-                    'published_at': hit['timestamp'],
-                    'views': hit['views'],
-                    'slug': hit['slug'],
-                    'score': hit.score,
-                    'highlights': self._get_highlights(hit, query_text)
-                }
-                search_results.append(result)
+            with self.index.searcher(weighting=BM25F()) as searcher:
+                # 只收集到当前页为止的结果，高亮片段也只为当前页计算
+                results = searcher.search(query, limit=end)
+                total = len(results)
+                
+                # 构造结果
+                search_results = []
+                for hit in results[start:end]:
+                    result = {
+                        'id': hit['id'],
+                        'title': hit['title'],
+                        'summary': hit['summary'],
+                        'category': hit['category'],
+                        'author': hit['author'],
+                        # 关键修改：这里也使用正确的 timestamp 字段
+                        'timestamp': hit['timestamp'],
+                        # 兼容模板：提供 created_at / published_at 字段
+                        'created_at': hit['timestamp'],
+                        'published_at': hit['timestamp'],
+                        'views': hit['views'],
+                        'slug': hit['slug'],
+                        'score': hit.score,
+                        'highlights': self._get_highlights(hit, query_text)
+                    }
+                    search_results.append(result)
             
             # 生成搜索建议
             suggestions = self.get_search_suggestions(query_text)
             
-            return {
+            response = {
                 'results': search_results,
                 'total': total,
                 'page': page,
@@ -423,6 +627,12 @@ class AdvancedSearchService:
                 'suggestions': suggestions,
                 'query': query_text
             }
+            try:
+                cache.set(cache_key, response,
+                          timeout=current_app.config.get('SEARCH_RESULT_CACHE_TIMEOUT', 300))
+            except Exception as e:
+                current_app.logger.warning(f"写入搜索结果缓存失败: {e}")
+            return response
             
         except Exception as e:
             current_app.logger.error(f"Whoosh搜索执行失败: {e}")
@@ -435,105 +645,174 @@ class AdvancedSearchService:
                 'error': str(e),
                 'query': query_text
             }
+
+    def _result_cache_key(self, query_text, page, per_page, filters):
+        """搜索结果缓存键"""
+        key_data = {
+            'q': _normalize_cache_query(query_text),
+            'filters': sorted((k, str(v)) for k, v in (filters or {}).items() if v),
+            'page': page,
+            'per_page': per_page,
+            'generation': self._index_generation(),
+        }
+        digest = hashlib.md5(json.dumps(key_data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return f"search_results:{digest}"
+
+    def _index_generation(self):
+        """当前索引代数：共享缓存中的提交令牌 + Whoosh 目录中的 TOC 代数
+
+        本进程提交时更新令牌；其他进程写入同一索引目录时 Whoosh 代数也会变化。
+        """
+        try:
+            token = cache.get(GENERATION_CACHE_KEY)
+        except Exception:
+            token = None
+        version = os.path.basename(self._live_dir or '')
+        return f"{token or self._local_generation}:{version}:{self.index.latest_generation()}"
+
+    def _bump_index_generation(self):
+        """索引提交后更新代数令牌，使旧的结果缓存失效"""
+        self._local_generation = time.time_ns()
+        try:
+            # timeout=0 表示永不过期，避免令牌过期后回到旧值
+            cache.set(GENERATION_CACHE_KEY, self._local_generation, timeout=0)
+        except Exception as e:
+            current_app.logger.warning(f"更新搜索索引代数失败: {e}")
     
     def get_search_suggestions(self, query_text, limit=10):
-        """获取搜索建议和自动补全"""
+        """获取搜索建议和自动补全（基于预构建的补全索引，不再遍历词典）"""
         if not self.whoosh_available or not self.index or not query_text.strip():
             return []
         
         try:
-            searcher = self.index.searcher()
-            
-            # 基于词汇的建议
-            suggestions = []
-            seen = set()  # 去重（不区分大小写）
-            
-            # 搜索标题字段的词汇
-            title_reader = searcher.lexicon('title')
-            for term in title_reader:
-                term_text = term.decode('utf-8', 'ignore') if isinstance(term, (bytes, bytearray)) else term
-                if not isinstance(term_text, str):
-                    continue
-                t_lower = term_text.lower()
-                if query_text.lower() in t_lower and len(term_text) > len(query_text) and t_lower not in seen:
-                    seen.add(t_lower)
-                    suggestions.append({
-                        'text': term_text,
-                        'type': 'title',
-                        'score': self._calculate_suggestion_score(term_text, query_text)
-                    })
-            
-            # 搜索标签字段的词汇
-            tag_reader = searcher.lexicon('tags')
-            for term in tag_reader:
-                term_text = term.decode('utf-8', 'ignore') if isinstance(term, (bytes, bytearray)) else term
-                if not isinstance(term_text, str):
-                    continue
-                t_lower = term_text.lower()
-                if query_text.lower() in t_lower and len(term_text) > len(query_text) and t_lower not in seen:
-                    seen.add(t_lower)
-                    suggestions.append({
-                        'text': term_text,
-                        'type': 'tag',
-                        'score': self._calculate_suggestion_score(term_text, query_text)
-                    })
-            
-            # 按分数排序并限制数量
-            suggestions.sort(key=lambda x: x['score'], reverse=True)
-            return suggestions[:limit]
-            
+            self._ensure_fresh_suggestions()
+            if self.suggestions is None:
+                return []
+            return self.suggestions.suggest(query_text, limit=limit)
         except Exception as e:
             current_app.logger.error(f"获取搜索建议失败: {e}")
             return []
+
+    def _build_suggestions(self):
+        """从当前索引词典全量构建补全索引"""
+        if not self.whoosh_available or not self.index:
+            return
+        try:
+            if self.suggestions is None:
+                self.suggestions = SuggestionIndex(
+                    infix=current_app.config.get('SEARCH_SUGGEST_INFIX', True)
+                )
+            reader = self.index.reader()
+            try:
+                self.suggestions.build(reader, generation=self.index.latest_generation())
+            finally:
+                reader.close()
+            self._suggestions_checked_at = time.monotonic()
+        except Exception as e:
+            current_app.logger.warning(f"构建搜索补全索引失败: {e}")
+
+    def _refresh_suggestions(self, touched_terms):
+        """本进程提交索引后，增量刷新受影响词条"""
+        if self.suggestions is None or not touched_terms:
+            return
+        try:
+            reader = self.index.reader()
+            try:
+                self.suggestions.refresh_terms(
+                    reader, touched_terms, generation=self.index.latest_generation()
+                )
+            finally:
+                reader.close()
+        except Exception as e:
+            current_app.logger.warning(f"刷新搜索补全索引失败: {e}")
+
+    def _ensure_fresh_suggestions(self):
+        """定期检查索引代数，其他进程提交了索引时重建补全索引"""
+        interval = current_app.config.get('SEARCH_SUGGEST_REFRESH_INTERVAL', 30)
+        now = time.monotonic()
+        if self.suggestions is not None and now - self._suggestions_checked_at < interval:
+            return
+        self._suggestions_checked_at = now
+        if self.suggestions is None or self.index.latest_generation() != self.suggestions.generation:
+            self._build_suggestions()
+
+    def _suggestion_terms(self, document):
+        """分析文档的 title/tags 字段，返回 (field, term) 集合"""
+        terms = set()
+        for field in ('title', 'tags'):
+            text = document.get(field)
+            if text:
+                analyzer = self.schema[field].analyzer
+                terms.update((field, token.text) for token in analyzer(text))
+        return terms
+
+    def _stored_documents(self, post_ids):
+        """读取索引中已有的文档，返回 {文章ID: 存储字段}"""
+        documents = {}
+        if not post_ids:
+            return documents
+        with self.index.searcher() as searcher:
+            for post_id in post_ids:
+                stored = searcher.document(id=post_id)
+                if stored:
+                    documents[post_id] = stored
+        return documents
+
+    @staticmethod
+    def _same_indexed_fields(stored, document):
+        """索引中的文档与新文档在索引字段上是否一致"""
+        if stored is None:
+            return False
+        return all(
+            stored.get(name) == value
+            for name, value in document.items()
+            if name not in UNINDEXED_DOCUMENT_FIELDS
+        )
     
-    def get_popular_searches(self, limit=10):
-        """获取热门搜索词（基于日志统计）"""
+    def get_popular_searches(self, limit=10, window='all'):
+        """获取热门搜索词（基于 top-K sketch，window 取 hour/day/week/all）"""
         try:
-            log_path = os.path.join(current_app.instance_path, 'search_queries.log')
-            if not os.path.exists(log_path):
-                return []
-            from collections import Counter
-            cnt = Counter()
-            with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    # 行格式：ISO_TIME\tquery
-                    parts = line.rstrip('\n').split('\t', 1)
-                    if len(parts) == 2:
-                        q = parts[1].strip()
-                        if q:
-                            cnt[q] += 1
-            # 返回按次数排序的前 N 个词
-            return [term for term, _ in cnt.most_common(limit)]
+            return [term for term, _ in self._get_popular_tracker().top(limit, window=window)]
         except Exception as e:
-            current_app.logger.warning(f"读取热门搜索日志失败: {e}")
+            current_app.logger.warning(f"获取热门搜索失败: {e}")
             return []
 
+    def get_trending_searches(self, limit=10):
+        """获取最近一小时热度上升最快的搜索词"""
+        try:
+            return [term for term, _ in self._get_popular_tracker().trending(limit)]
+        except Exception as e:
+            current_app.logger.warning(f"获取趋势搜索失败: {e}")
+            return []
+
+    def _get_popular_tracker(self):
+        """延迟创建热门搜索统计（Whoosh 不可用时同样需要）"""
+        if self.popular is None:
+            self.popular = create_popular_query_tracker(current_app)
+        return self.popular
+
     def _record_query(self, query_text):
-        """将搜索关键词记录到实例目录日志，用于统计热门搜索。"""
+        """记录搜索关键词：更新热门统计，并缓冲写入实例目录的搜索日志"""
         try:
             if not query_text or not query_text.strip():
                 return
-            log_dir = current_app.instance_path
-            os.makedirs(log_dir, exist_ok=True)
-            log_path = os.path.join(log_dir, 'search_queries.log')
-            with open(log_path, 'a', encoding='utf-8') as f:
-                f.write(f"{datetime.utcnow().isoformat()}\t{query_text.strip()}\n")
+            self._get_popular_tracker().record(query_text)
+            if self.suggestions is not None:
+                self.suggestions.record_query(query_text)
+            if self.query_log is None:
+                self.query_log = QueryLogBuffer(
+                    os.path.join(current_app.instance_path, 'search_queries.log'),
+                    flush_size=current_app.config.get('SEARCH_QUERY_LOG_FLUSH_SIZE', 100),
+                )
+                atexit.register(self.query_log.flush)
+            self.query_log.append(query_text)
         except Exception as e:
             # 仅记录告警，不抛出
             current_app.logger.warning(f"写入搜索日志失败: {e}")
     
     def _clean_html(self, html_text):
         """清理HTML标签，保留纯文本"""
-        if not html_text:
-            return ''
-        
-        # 移除HTML标签
-        clean_text = re.sub(r'<[^>]+>', '', html_text)
-        
-        # 移除多余的空白字符
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-        
-        return clean_text
+        return clean_html(html_text)
     
     def _get_highlights(self, hit, query_text):
         """获取搜索结果高亮片段"""
@@ -588,16 +867,6 @@ class AdvancedSearchService:
         
         return highlighted
     
-    def _calculate_suggestion_score(self, term, query_text):
-        """计算搜索建议的相关性分数"""
-        # 简单的相关性计算
-        if term.lower().startswith(query_text.lower()):
-            return 10 # 前缀匹配高分
-        elif query_text.lower() in term.lower():
-            return 5 # 包含匹配中分
-        else:
-            return 1 # 其他情况低分
-    
     def get_stats(self):
         """获取搜索索引统计信息"""
         if not self.whoosh_available or not self.index: # 检查 Whoosh 可用性
@@ -605,12 +874,26 @@ class AdvancedSearchService:
             return {}
         
         try:
+            self._refresh_index()
             searcher = self.index.searcher()
-            return {
+            stats = {
                 'total_documents': searcher.doc_count(),
                 'index_size': self._get_index_size(),
                 'last_updated': datetime.now().isoformat()
             }
+            hits = self._result_cache_stats['hits']
+            lookups = hits + self._result_cache_stats['misses']
+            stats['result_cache'] = {
+                'hits': hits,
+                'misses': self._result_cache_stats['misses'],
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'generation': self._index_generation(),
+            }
+            # 异步索引队列的深度与延迟
+            queue = get_search_index_queue()
+            if queue is not None:
+                stats['index_queue'] = queue.stats()
+            return stats
         except Exception as e:
             current_app.logger.error(f"获取索引统计失败: {e}")
             return {}
@@ -620,9 +903,9 @@ class AdvancedSearchService:
         try:
             total_size = 0
             # 确保 index_dir 存在且 Whoosh 可用
-            if not self.whoosh_available or not self.index_dir or not os.path.exists(self.index_dir):
+            if not self.whoosh_available or not self._live_dir or not os.path.exists(self._live_dir):
                 return 0
-            for root, dirs, files in os.walk(self.index_dir):
+            for root, dirs, files in os.walk(self._live_dir):
                 for file in files:
                     file_path = os.path.join(root, file)
                     total_size += os.path.getsize(file_path)
@@ -0,0 +1,195 @@
+# flask/app/search_suggest.py
+
+"""
+搜索自动补全索引
+从 Whoosh 词典（title/tags 字段）预先构建有序词表，按前缀二分查找候选词，
+并用字符 n-gram 倒排支持可选的中缀匹配。评分综合文档频率与搜索热度。
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from heapq import nlargest
+
+# 前缀区间的上界哨兵（大于任何 BMP 字符）
+_PREFIX_SENTINEL = '\uffff'
+
+
+class SuggestionIndex:
+    """内存中的自动补全索引
+
+    - 前缀查询：有序词表 + bisect，复杂度与词表大小无关（O(log n) 定位区间）
+    - 中缀查询：字符 n-gram -> 词集合，只检查最稀有 n-gram 的候选词
+    - 结果 LRU 缓存：连续按键时同一前缀直接命中，词表变化时清空
+    """
+
+    def __init__(self, fields=('title', 'tags'), ngram=2, infix=True, cache_size=1024):
+        self.fields = tuple(fields)
+        self.ngram = ngram
+        self.infix = infix
+        self.cache_size = cache_size
+
+        self._terms = []        # 有序词表
+        self._df = {}           # term -> {field: doc_frequency}
+        self._grams = {}        # n-gram -> set(term)
+        self._popularity = {}   # term -> 搜索次数（仅统计词表内的词，内存有界）
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self.generation = None  # 构建时对应的 Whoosh 索引代数
+
+    # --- 构建与增量刷新 ---
+
+    def build(self, reader, generation=None):
+        """从索引 reader 的词典全量构建"""
+        df = {}
+        for field in self.fields:
+            if field not in reader.schema:
+                continue
+            for term, info in reader.iter_field(field):
+                text = term.decode('utf-8', 'ignore') if isinstance(term, (bytes, bytearray)) else term
+                if not text:
+                    continue
+                df.setdefault(text, {})[field] = info.doc_frequency()
+
+        grams = {}
+        for text in df:
+            for gram in self._ngrams(text):
+                grams.setdefault(gram, set()).add(text)
+
+        with self._lock:
+            self._terms = sorted(df)
+            self._df = df
+            self._grams = grams
+            self._popularity = {t: c for t, c in self._popularity.items() if t in df}
+            self._cache.clear()
+            self.generation = generation
+
+    def refresh_terms(self, reader, terms, generation=None):
+        """增量刷新部分词条的文档频率
+
+        Args:
+            reader: 提交后的新索引 reader
+            terms: 受影响的 (field, term) 集合（新增文档与被替换/删除文档的词）
+        """
+        with self._lock:
+            for field, text in terms:
+                if field not in self.fields or not text:
+                    continue
+                freq = self._live_doc_frequency(reader, field, text)
+                entry = self._df.get(text)
+                if freq:
+                    if entry is None:
+                        self._add_term(text)
+                        entry = self._df[text] = {}
+                    entry[field] = freq
+                elif entry is not None:
+                    entry.pop(field, None)
+                    if not entry:
+                        self._remove_term(text)
+            self._cache.clear()
+            if generation is not None:
+                self.generation = generation
+
+    @staticmethod
+    def _live_doc_frequency(reader, field, text):
+        """不含已删除文档的文档频率（Whoosh 的 doc_frequency 在段合并前仍计入删除的文档）"""
+        if (field, text) not in reader:
+            return 0
+        if not reader.has_deletions():
+            return reader.doc_frequency(field, text)
+        return sum(
+            1 for docnum in reader.postings(field, text).all_ids()
+            if not reader.is_deleted(docnum)
+        )
+
+    def record_query(self, query_text):
+        """记录一次搜索，用于提升热门词的补全排序"""
+        text = (query_text or '').strip().lower()
+        if not text:
+            return
+        with self._lock:
+            if text in self._df:
+                self._popularity[text] = self._popularity.get(text, 0) + 1
+
+    def _add_term(self, text):
+        pos = bisect_left(self._terms, text)
+        self._terms.insert(pos, text)
+        for gram in self._ngrams(text):
+            self._grams.setdefault(gram, set()).add(text)
+
+    def _remove_term(self, text):
+        self._df.pop(text, None)
+        self._popularity.pop(text, None)
+        pos = bisect_left(self._terms, text)
+        if pos < len(self._terms) and self._terms[pos] == text:
+            del self._terms[pos]
+        for gram in self._ngrams(text):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(text)
+                if not bucket:
+                    del self._grams[gram]
+
+    def _ngrams(self, text):
+        n = self.ngram
+        if len(text) < n:
+            return {text}
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    # --- 查询 ---
+
+    def suggest(self, query_text, limit=10, infix=None):
+        """返回 top-N 补全建议 [{'text', 'type', 'score'}]"""
+        prefix = (query_text or '').strip().lower()
+        if not prefix:
+            return []
+        infix = self.infix if infix is None else infix
+        key = (prefix, limit, infix)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return list(cached)
+
+            lo = bisect_left(self._terms, prefix)
+            hi = bisect_left(self._terms, prefix + _PREFIX_SENTINEL, lo)
+            candidates = {
+                term: 10 for term in self._terms[lo:hi] if len(term) > len(prefix)
+            }
+            if infix and len(candidates) < limit:
+                for term in self._infix_candidates(prefix):
+                    if term not in candidates and len(term) > len(prefix):
+                        candidates[term] = 5
+
+            top = nlargest(limit, candidates.items(), key=lambda item: self._score(item[0], item[1]))
+            results = [{
+                'text': term,
+                'type': 'title' if 'title' in self._df[term] else 'tag',
+                'score': round(self._score(term, base), 3),
+            } for term, base in top]
+
+            self._cache[key] = results
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return list(results)
+
+    def _infix_candidates(self, text):
+        # 短于 n-gram 长度的输入只做前缀匹配，避免扫描巨大的倒排表
+        if len(text) < self.ngram:
+            return []
+        grams = self._ngrams(text)
+        buckets = [self._grams.get(gram) for gram in grams]
+        if not buckets or any(not b for b in buckets):
+            return []
+        # 从最小的 n-gram 倒排表出发，再精确校验子串
+        smallest = min(buckets, key=len)
+        return [term for term in smallest if text in term]
+
+    def _score(self, term, base):
+        df = sum(self._df.get(term, {}).values())
+        return base + math.log1p(df) + 2 * math.log1p(self._popularity.get(term, 0))
+
+    def __len__(self):
+        return len(self._terms)
@@ -0,0 +1,277 @@
+"""
+站点统计计数器
+用户、文章、评论、分类的数量保存在 site_counter 表中，由 ORM 事件在写入数据的同一事务内
+增量更新（每次 flush 合并为一条 upsert），读取统计只需按主键取出几行，与表的大小无关。
+绕过 ORM 的批量 UPDATE/DELETE 不会触发事件，由定期对账任务（reconcile_counters）修正偏差。
+
+文章总浏览量（post_views）变化过于频繁，若随每次浏览更新会让这一行成为全站写入的热点锁，
+因此不做增量维护，只在对账时重新聚合。
+"""
+
+import logging
+from collections import Counter
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, event, func, inspect
+
+from app import db
+from app.models import Category, Comment, Post, SiteCounter, User
+
+logger = logging.getLogger(__name__)
+
+USERS = 'users'
+USERS_CONFIRMED = 'users_confirmed'
+POSTS = 'posts'
+POSTS_PUBLISHED = 'posts_published'
+POST_VIEWS = 'post_views'
+COMMENTS = 'comments'
+COMMENTS_APPROVED = 'comments_approved'
+CATEGORIES = 'categories'
+# 按分类统计的已发布文章数，scope_id 为分类 ID
+CATEGORY_POSTS = 'category_published_posts'
+
+GLOBAL_SCOPE = 0
+
+# 参与计数的属性：赋值时需要拿到旧值才能算出增量
+TRACKED_ATTRIBUTES = (User.confirmed, Post.published, Post.category_id, Comment.approved)
+
+# 只在对账时重新计算的计数器（不视为偏差）
+RECOMPUTED_COUNTERS = {(POST_VIEWS, GLOBAL_SCOPE)}
+
+# session.info 中累积本次 flush 的增量：(name, scope_id) -> delta
+PENDING_KEY = 'site_counter_deltas'
+
+_hooks_registered = False
+
+
+# --- 增量计算 ---
+
+def _user_counts(confirmed):
+    return {(USERS, GLOBAL_SCOPE): 1, (USERS_CONFIRMED, GLOBAL_SCOPE): int(bool(confirmed))}
+
+
+def _post_counts(published, category_id):
+    counts = {(POSTS, GLOBAL_SCOPE): 1}
+    if published:
+        counts[(POSTS_PUBLISHED, GLOBAL_SCOPE)] = 1
+        if category_id is not None:
+            counts[(CATEGORY_POSTS, category_id)] = 1
+    return counts
+
+
+def _comment_counts(approved):
+    return {(COMMENTS, GLOBAL_SCOPE): 1, (COMMENTS_APPROVED, GLOBAL_SCOPE): int(bool(approved))}
+
+
+def _category_counts():
+    return {(CATEGORIES, GLOBAL_SCOPE): 1}
+
+
+def _counts_for(target, values):
+    """对象对各计数器的贡献；values(name) 返回属性值"""
+    if isinstance(target, User):
+        return _user_counts(values('confirmed'))
+    if isinstance(target, Post):
+        return _post_counts(values('published'), values('category_id'))
+    if isinstance(target, Comment):
+        return _comment_counts(values('approved'))
+    return _category_counts()
+
+
+def _history_values(target, old):
+    """读取 flush 中对象的旧值或新值（不触发加载）"""
+    state = inspect(target)
+
+    def values(name):
+        history = state.attrs[name].history
+        if history.added or history.deleted:
+            items = history.deleted if old else history.added
+            return items[0] if items else None
+        return history.unchanged[0] if history.unchanged else None
+    return values
+
+
+def _add(target, counts, sign):
+    session = inspect(target).session
+    if session is None:
+        return
+    pending = session.info.setdefault(PENDING_KEY, Counter())
+    for key, value in counts.items():
+        if value:
+            pending[key] += sign * value
+
+
+def _after_insert(mapper, connection, target):
+    _add(target, _counts_for(target, _history_values(target, old=False)), 1)
+
+
+def _after_update(mapper, connection, target):
+    # 先减去旧贡献再加上新贡献，两者相同的计数器净增量为 0
+    _add(target, _counts_for(target, _history_values(target, old=True)), -1)
+    _add(target, _counts_for(target, _history_values(target, old=False)), 1)
+
+
+def _before_delete(mapper, connection, target):
+    # 删除前读取当前值（属性已过期时会加载）
+    _add(target, _counts_for(target, lambda name: getattr(target, name)), -1)
+
+
+def _after_flush(session, flush_context):
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    deltas = {key: delta for key, delta in pending.items() if delta}
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+# --- 写入 ---
+
+def apply_deltas(connection, deltas):
+    """把增量合并写入计数器表：单条 upsert（SQLite/PostgreSQL/MySQL），其他数据库逐行更新"""
+    table = SiteCounter.__table__
+    rows = [{'name': name, 'scope_id': scope_id, 'value': delta} for (name, scope_id), delta in deltas.items()]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name, table.c.scope_id],
+            set_={'value': table.c.value + stmt.excluded.value, 'updated_at': func.now()},
+        )
+        connection.execute(stmt)
+        return
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        connection.execute(stmt.on_duplicate_key_update(value=table.c.value + stmt.inserted.value,
+                                                        updated_at=func.now()))
+        return
+    for row in rows:
+        result = connection.execute(
+            table.update()
+            .where(table.c.name == row['name'], table.c.scope_id == row['scope_id'])
+            .values(value=table.c.value + row['value'], updated_at=func.now())
+        )
+        if not result.rowcount:
+            connection.execute(table.insert().values(**row))
+
+
+# --- 读取 ---
+
+def get_counters():
+    """全站计数器 {name: value}"""
+    rows = db.session.query(SiteCounter.name, SiteCounter.value).filter(SiteCounter.scope_id == GLOBAL_SCOPE)
+    return {name: int(value) for name, value in rows}
+
+
+def category_post_count_column():
+    """分类已发布文章数（与 Category 外连接 site_counter 时使用）"""
+    return func.coalesce(SiteCounter.value, 0)
+
+
+def category_counter_join():
+    return db.and_(SiteCounter.name == CATEGORY_POSTS, SiteCounter.scope_id == Category.id)
+
+
+# --- 对账 ---
+
+def compute_expected():
+    """用聚合查询计算各计数器的真实值（全表扫描，只在对账时使用）"""
+    expected = {}
+    users = db.session.query(
+        func.count(User.id), func.count(case((User.confirmed == True, 1)))
+    ).one()
+    posts = db.session.query(
+        func.count(Post.id), func.count(case((Post.published == True, 1))), func.sum(Post.views)
+    ).one()
+    comments = db.session.query(
+        func.count(Comment.id), func.count(case((Comment.approved == True, 1)))
+    ).one()
+    expected[(USERS, GLOBAL_SCOPE)], expected[(USERS_CONFIRMED, GLOBAL_SCOPE)] = users
+    expected[(POSTS, GLOBAL_SCOPE)], expected[(POSTS_PUBLISHED, GLOBAL_SCOPE)], expected[(POST_VIEWS, GLOBAL_SCOPE)] = posts
+    expected[(COMMENTS, GLOBAL_SCOPE)], expected[(COMMENTS_APPROVED, GLOBAL_SCOPE)] = comments
+    expected[(CATEGORIES, GLOBAL_SCOPE)] = db.session.query(func.count(Category.id)).scalar()
+
+    category_rows = (
+        db.session.query(Post.category_id, func.count(Post.id))
+        .filter(Post.published == True, Post.category_id.isnot(None))
+        .group_by(Post.category_id)
+    )
+    for category_id, count in category_rows:
+        expected[(CATEGORY_POSTS, category_id)] = count
+    return {key: int(value or 0) for key, value in expected.items()}
+
+
+def reconcile_counters():
+    """对比真实值并修正计数器，返回偏差 {(name, scope_id): 修正量}
+
+    先锁住计数器行再聚合真实值：持锁期间其他事务无法提交计数器增量（其数据修改也尚未提交，
+    不会出现在聚合结果中），两次读取对应同一时刻的状态，不会把并发提交误判为偏差。
+    修正以增量方式写入，对账期间并发事务提交的增量不会被覆盖。
+    """
+    stored = {(c.name, c.scope_id): c.value for c in SiteCounter.query.with_for_update()}
+    expected = compute_expected()
+    corrections = {}
+    for key in set(expected) | set(stored):
+        diff = expected.get(key, 0) - stored.get(key, 0)
+        if diff:
+            corrections[key] = diff
+    if corrections:
+        apply_deltas(db.session.connection(), corrections)
+    drift = {key: diff for key, diff in corrections.items() if key not in RECOMPUTED_COUNTERS}
+    if drift:
+        logger.warning(f"站点计数器存在偏差，已修正: {drift}")
+    # 已删除分类的计数行没有对应对象，清理掉
+    SiteCounter.query.filter(
+        SiteCounter.name == CATEGORY_POSTS,
+        SiteCounter.value == 0,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return drift
+
+
+# --- 初始化 ---
+
+@click.group()
+def stats_cli():
+    """站点统计命令"""
+    pass
+
+
+@stats_cli.command()
+@with_appcontext
+def reconcile():
+    """用聚合查询校正站点计数器"""
+    drift = reconcile_counters()
+    if drift:
+        for (name, scope_id), diff in sorted(drift.items()):
+            click.echo(f"- {name}[{scope_id}]: {diff:+d}")
+        click.echo(f"✅ 已修正 {len(drift)} 个计数器")
+    else:
+        click.echo("✅ 计数器与数据一致")
+
+
+def init_site_counters(app):
+    """注册计数器维护钩子与对账命令（事件监听器全局只注册一次）"""
+    global _hooks_registered
+    app.cli.add_command(stats_cli, name='stats')
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+
+    # 赋值时总是记录旧值，属性已过期也能算出正确的增量
+    for attribute in TRACKED_ATTRIBUTES:
+        event.listen(attribute, 'set', lambda target, value, oldvalue, initiator: None, active_history=True)
+
+    for model in (User, Post, Comment, Category):
+        event.listen(model, 'after_insert', _after_insert)
+        event.listen(model, 'after_update', _after_update)
+        event.listen(model, 'before_delete', _before_delete)
+    event.listen(db.session, 'after_flush', _after_flush)
+    # flush 失败时丢弃已累积但未写入的增量
+    event.listen(db.session, 'after_soft_rollback', lambda session, previous_transaction: session.info.pop(PENDING_KEY, None))
@@ -0,0 +1,233 @@
+"""
+站点地图
+文章 URL 按 ID 区间分片（每片最多 SITEMAP_MAX_URLS 条），/sitemap.xml 返回 sitemap 索引，
+各分片只用列查询 + yield_per 流式生成，不加载 ORM 对象。生成结果连同 ETag/Last-Modified
+缓存在共享缓存中，键包含分片代数令牌；文章发布、修改、删除后在事务提交时更新所属分片和
+索引的令牌，其余分片继续命中缓存。
+"""
+
+import hashlib
+import time
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from flask import current_app, request, url_for
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import object_session
+
+from app import cache, db
+from app.models import Post
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+# 协议规定单个 sitemap 文件最多 50000 条 URL
+DEFAULT_MAX_URLS = 50000
+
+INDEX_SHARD = 'index'
+PAGES_SHARD = 'pages'
+
+GENERATION_KEY_PREFIX = 'sitemap_generation'
+BODY_KEY_PREFIX = 'sitemap_body'
+
+# 影响站点地图内容的文章字段；浏览量等字段变化不会使分片失效
+SITEMAP_FIELDS = ('published', 'published_at', 'slug', 'title', 'summary', 'content')
+
+_ID_PLACEHOLDER = 987654321
+
+# session.info 中暂存本事务内需要失效的分片，事务提交后才真正失效
+PENDING_KEY = 'sitemap_pending'
+
+_hooks_registered = False
+
+
+def max_urls():
+    return current_app.config.get('SITEMAP_MAX_URLS', DEFAULT_MAX_URLS)
+
+
+def shard_of(post_id, size=None):
+    """文章所属分片：按 ID 区间划分，同一篇文章始终落在同一分片"""
+    return (post_id - 1) // (size or max_urls())
+
+
+def _lastmod_column():
+    return func.coalesce(Post.updated_at, Post.published_at, Post.created_at)
+
+
+def _format_date(value):
+    return (value or datetime.utcnow()).strftime('%Y-%m-%d')
+
+
+# --- 生成 ---
+
+def iter_index(size=None):
+    """sitemap 索引：页面分片 + 有已发布文章的文章分片（一条聚合查询）"""
+    size = size or max_urls()
+    shard = ((Post.id - 1) // size).label('shard')
+    rows = (
+        db.session.query(shard, func.max(_lastmod_column()))
+        .filter(Post.published == True)
+        .group_by(shard)
+        .order_by(shard)
+        .all()
+    )
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n'
+    yield _sitemap_entry(url_for('blog.sitemap_shard', name=PAGES_SHARD, _external=True), None)
+    for number, lastmod in rows:
+        url = url_for('blog.sitemap_shard', name=f'posts-{int(number)}', _external=True)
+        yield _sitemap_entry(url, _parse_datetime(lastmod))
+    yield '</sitemapindex>\n'
+
+
+def iter_pages():
+    """无参数的 GET 页面（后台除外）"""
+    today = _format_date(None)
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n'
+    for rule in current_app.url_map.iter_rules():
+        if "GET" not in rule.methods or rule.arguments or rule.rule.startswith("/admin"):
+            continue
+        if rule.endpoint == 'blog.sitemap':
+            continue
+        try:
+            url = url_for(rule.endpoint, _external=True)
+        except Exception:
+            # 兜底：如果无法反向生成URL，则使用rule字符串
+            url = rule.rule
+        yield _url_entry(url, today)
+    yield '</urlset>\n'
+
+
+def iter_posts(number, size=None, batch_size=1000):
+    """一个文章分片：只查询 id 与时间列，按批流式读取"""
+    size = size or max_urls()
+    rows = (
+        db.session.query(Post.id, _lastmod_column())
+        .filter(Post.published == True, Post.id > number * size, Post.id <= (number + 1) * size)
+        .order_by(Post.id)
+        .yield_per(batch_size)
+    )
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n'
+    # 文章地址只有 id 不同，反向生成一次后直接替换，避免每行调用 url_for
+    prefix, suffix = url_for('blog.post', id=_ID_PLACEHOLDER, _external=True).split(str(_ID_PLACEHOLDER), 1)
+    for post_id, lastmod in rows:
+        yield _url_entry(f"{prefix}{post_id}{suffix}", _format_date(_parse_datetime(lastmod)))
+    yield '</urlset>\n'
+
+
+def _url_entry(url, date):
+    return f"    <url>\n        <loc>{escape(url)}</loc>\n        <lastmod>{date}</lastmod>\n    </url>\n"
+
+
+def _sitemap_entry(url, lastmod):
+    line = f"    <sitemap>\n        <loc>{escape(url)}</loc>\n"
+    if lastmod is not None:
+        line += f"        <lastmod>{lastmod.strftime('%Y-%m-%d')}</lastmod>\n"
+    return line + "    </sitemap>\n"
+
+
+def _parse_datetime(value):
+    # SQLite 上聚合/coalesce 结果是字符串
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+# --- 缓存 ---
+
+def _generation(shard):
+    """分片的代数令牌；缓存中没有（首次或被淘汰）时生成新令牌，不会命中旧内容"""
+    key = f"{GENERATION_KEY_PREFIX}:{shard}"
+    token = cache.get(key)
+    if token is None:
+        token = time.time_ns()
+        cache.set(key, token, timeout=0)
+    return token
+
+
+def get_document(shard):
+    """返回分片内容 {'body', 'etag', 'last_modified'}，未命中缓存时生成并写入缓存
+
+    shard 为 'index'、'pages' 或文章分片序号。
+    """
+    # 绝对地址与访问的主机有关，缓存键包含主机
+    key = f"{BODY_KEY_PREFIX}:{request.host}:{shard}:{_generation(shard)}"
+    document = cache.get(key)
+    if document is not None:
+        return document
+
+    if shard == INDEX_SHARD:
+        parts = iter_index()
+    elif shard == PAGES_SHARD:
+        parts = iter_pages()
+    else:
+        parts = iter_posts(shard)
+    body = ''.join(parts).encode('utf-8')
+    document = {
+        'body': body,
+        'etag': hashlib.md5(body).hexdigest(),
+        # 秒级精度，与 HTTP 日期一致
+        'last_modified': datetime.utcnow().replace(microsecond=0),
+    }
+    cache.set(key, document, timeout=current_app.config.get('SITEMAP_CACHE_TIMEOUT', 24 * 3600))
+    return document
+
+
+def invalidate(shards):
+    """使指定分片及索引失效"""
+    for shard in set(shards) | {INDEX_SHARD}:
+        try:
+            cache.set(f"{GENERATION_KEY_PREFIX}:{shard}", time.time_ns(), timeout=0)
+        except Exception as e:
+            current_app.logger.warning(f"更新站点地图代数失败: {shard}, {e}")
+
+
+# --- 文章钩子 ---
+
+def _mark_pending(target):
+    if target.id is None:
+        return
+    session = object_session(target)
+    shard = shard_of(target.id)
+    if session is None:
+        invalidate([shard])
+        return
+    session.info.setdefault(PENDING_KEY, set()).add(shard)
+
+
+def _sitemap_fields_changed(target):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in SITEMAP_FIELDS)
+
+
+def init_sitemap(app):
+    """注册文章变更钩子（事件监听器全局只注册一次）"""
+    global _hooks_registered
+    if _hooks_registered:
+        return
+    _hooks_registered = True
+
+    @event.listens_for(Post, 'after_insert')
+    def after_post_insert(mapper, connection, target):
+        if target.published:
+            _mark_pending(target)
+
+    @event.listens_for(Post, 'after_update')
+    def after_post_update(mapper, connection, target):
+        if _sitemap_fields_changed(target):
+            _mark_pending(target)
+
+    @event.listens_for(Post, 'after_delete')
+    def after_post_delete(mapper, connection, target):
+        _mark_pending(target)
+
+    @event.listens_for(db.session, 'after_commit')
+    def after_session_commit(session):
+        pending = session.info.pop(PENDING_KEY, None)
+        if pending:
+            invalidate(pending)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def after_session_rollback(session):
+        session.info.pop(PENDING_KEY, None)
@@ -30,6 +30,18 @@ def make_celery(app):
         task_soft_time_limit=25 * 60,  # 25分钟软超时
         worker_prefetch_multiplier=1,
         worker_max_tasks_per_child=1000,
+        beat_schedule={
+            # 定期校正站点计数器
+            'reconcile-site-counters': {
+                'task': 'app.reconcile_site_counters',
+                'schedule': app.config.get('SITE_COUNTER_RECONCILE_INTERVAL', 3600),
+            },
+            # 定期全量重建相关文章
+            'rebuild-related-posts': {
+                'task': 'app.rebuild_related_posts_async',
+                'schedule': app.config.get('RELATED_POSTS_REBUILD_INTERVAL', 24 * 3600),
+            },
+        },
     )
     
     class ContextTask(celery.Task):
@@ -19,8 +19,12 @@ celery_app = None
 send_async_email = None
 send_password_reset_email_async = None
 process_avatar_async = None
+process_media_async = None
 cleanup_old_files_async = None
 batch_database_operation_async = None
+reconcile_site_counters = None
+refresh_related_posts_async = None
+rebuild_related_posts_async = None
 
 
 def set_celery_instance(celery):
@@ -29,7 +33,8 @@ def set_celery_instance(celery):
     """
     global celery_app
     global send_async_email, send_password_reset_email_async
-    global process_avatar_async, cleanup_old_files_async, batch_database_operation_async
+    global process_avatar_async, process_media_async, cleanup_old_files_async, batch_database_operation_async
+    global reconcile_site_counters, refresh_related_posts_async, rebuild_related_posts_async
 
     celery_app = celery
 
@@ -68,6 +73,11 @@ def set_celery_instance(celery):
         logger.info(f"处理用户头像: user_id={user_id}")
         return {"status": "ok", "user_id": user_id}
 
+    def _process_media_async(media_id: int) -> Dict[str, Any]:
+        # 生成媒体文件的缩略图/尺寸/时长并写回 MediaFile 的处理状态
+        from app.media.processing import process_media_file
+        return process_media_file(media_id)
+
     def _cleanup_old_files_async(days: int = 30) -> Dict[str, Any]:
         # 占位实现：可扫描 uploads/ 目录并清理过期文件
         logger.info(f"清理过期文件: > {days} 天")
@@ -80,14 +90,35 @@ def set_celery_instance(celery):
         logger.info(f"批量数据库操作: {count} 项")
         return {"status": "ok", "count": count}
 
+    def _reconcile_site_counters() -> Dict[str, Any]:
+        # 用聚合查询校正增量维护的站点计数器
+        from app.site_counters import reconcile_counters
+        drift = reconcile_counters()
+        return {"status": "ok", "corrected": {f"{name}:{scope_id}": diff for (name, scope_id), diff in drift.items()}}
+
+    def _refresh_related_posts_async(post_ids: List[int]) -> Dict[str, Any]:
+        # 文章变更后增量刷新相关文章
+        from app.related_posts import refresh_related_posts
+        count = refresh_related_posts(post_ids)
+        return {"status": "ok", "post_ids": post_ids, "rows": count}
+
+    def _rebuild_related_posts_async() -> Dict[str, Any]:
+        # 全量重建相关文章（修正 IDF 漂移并补齐被移出的位置）
+        from app.related_posts import rebuild_related_posts
+        return {"status": "ok", "rows": rebuild_related_posts()}
+
     # 注册为 Celery 任务，并将任务对象暴露为模块级变量，供外部 .delay() 调用
     send_async_email = celery.task(name="app.send_async_email")(_send_async_email)
     send_password_reset_email_async = celery.task(name="app.send_password_reset_email_async")(_send_password_reset_email_async)
     process_avatar_async = celery.task(name="app.process_avatar_async")(_process_avatar_async)
+    process_media_async = celery.task(name="app.process_media_async")(_process_media_async)
     cleanup_old_files_async = celery.task(name="app.cleanup_old_files_async")(_cleanup_old_files_async)
     batch_database_operation_async = celery.task(name="app.batch_database_operation_async")(_batch_database_operation_async)
+    reconcile_site_counters = celery.task(name="app.reconcile_site_counters")(_reconcile_site_counters)
+    refresh_related_posts_async = celery.task(name="app.refresh_related_posts_async")(_refresh_related_posts_async)
+    rebuild_related_posts_async = celery.task(name="app.rebuild_related_posts_async")(_rebuild_related_posts_async)
 
-    logger.info("Celery 任务已注册：send_async_email, send_password_reset_email_async, process_avatar_async, cleanup_old_files_async, batch_database_operation_async")
+    logger.info("Celery 任务已注册：send_async_email, send_password_reset_email_async, process_avatar_async, process_media_async, cleanup_old_files_async, batch_database_operation_async, reconcile_site_counters, refresh_related_posts_async, rebuild_related_posts_async")
 
 
 __all__ = [
@@ -95,6 +126,10 @@ __all__ = [
     "send_async_email",
     "send_password_reset_email_async",
     "process_avatar_async",
+    "process_media_async",
     "cleanup_old_files_async",
     "batch_database_operation_async",
+    "reconcile_site_counters",
+    "refresh_related_posts_async",
+    "rebuild_related_posts_async",
 ]
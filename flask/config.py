@@ -74,12 +74,70 @@ class Config:
     THUMBNAIL_SIZES = [(150, 150), (300, 300), (600, 600)]
     THUMBNAIL_QUALITY = 85
     
+    # 媒体后台处理：celery（需可用 broker）/ local（本地进程池）/ sync（请求内同步）
+    MEDIA_PROCESSING_BACKEND = os.environ.get('MEDIA_PROCESSING_BACKEND', 'local')
+    MEDIA_PROCESSING_WORKERS = int(os.environ.get('MEDIA_PROCESSING_WORKERS', str(min(4, os.cpu_count() or 1))))
+    MEDIA_VARIANT_CACHE_TIMEOUT = 3600  # 按需生成变体的地址缓存（秒）
+    MEDIA_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 分块上传建议分块大小，需小于 MAX_CONTENT_LENGTH
+    MEDIA_UPLOAD_SESSION_TTL = 24 * 3600  # 分块上传会话无活动后的保留时间（秒）
+    
+    # 搜索索引异步队列配置
+    SEARCH_INDEX_ASYNC = True  # False 时不启动后台线程，需手动 flush（测试环境）
+    SEARCH_INDEX_BATCH_SIZE = int(os.environ.get('SEARCH_INDEX_BATCH_SIZE', '200'))
+    SEARCH_INDEX_FLUSH_INTERVAL = float(os.environ.get('SEARCH_INDEX_FLUSH_INTERVAL', '1.0'))  # 最大可见延迟（秒）
+    
+    # 搜索索引重建配置
+    SEARCH_REBUILD_BATCH_SIZE = int(os.environ.get('SEARCH_REBUILD_BATCH_SIZE', '500'))  # yield_per 批大小
+    SEARCH_REBUILD_PROCS = int(os.environ.get('SEARCH_REBUILD_PROCS', str(min(4, os.cpu_count() or 1))))
+    SEARCH_REBUILD_LIMITMB = int(os.environ.get('SEARCH_REBUILD_LIMITMB', '128'))  # 每个写入进程的内存上限
+    
+    # 搜索自动补全配置
+    SEARCH_SUGGEST_INFIX = True  # 前缀候选不足时用 n-gram 补充中缀匹配
+    SEARCH_SUGGEST_REFRESH_INTERVAL = 30  # 检查其他进程索引提交的间隔（秒）
+    
+    # 搜索结果缓存（按索引代数自动失效）
+    SEARCH_RESULT_CACHE_TIMEOUT = 300
+    
+    # 热门搜索统计配置
+    SEARCH_POPULAR_CAPACITY = 200  # 每个小时窗口保留的 top-K 词数
+    SEARCH_POPULAR_RETENTION_HOURS = 24 * 7
+    SEARCH_POPULAR_REDIS_URL = os.environ.get('REDIS_URL')  # 未配置时使用进程内统计
+    SEARCH_POPULAR_SNAPSHOT = True  # 进程内统计由后台线程按进程保存快照到实例目录，重启后合并恢复
+    SEARCH_POPULAR_SNAPSHOT_INTERVAL = 60.0  # 快照保存间隔（秒）
+    SEARCH_QUERY_LOG_FLUSH_SIZE = 100  # 搜索日志缓冲条数
+    
+    # 站点计数器定期对账间隔（秒），修正绕过 ORM 事件的批量修改造成的偏差，并刷新文章总浏览量
+    SITE_COUNTER_RECONCILE_INTERVAL = int(os.environ.get('SITE_COUNTER_RECONCILE_INTERVAL', '3600'))
+    
+    # 相关文章：文章变更后的增量刷新方式 celery / thread（单个后台线程）/ sync（提交后同步执行）
+    RELATED_POSTS_BACKEND = os.environ.get('RELATED_POSTS_BACKEND', 'thread')
+    RELATED_POSTS_LIMIT = 10  # 每篇文章保存的相关文章数
+    RELATED_POSTS_INDEX_TTL = 3600  # 进程内相似度索引的有效期（秒），过期后重新加载
+    RELATED_POSTS_REBUILD_INTERVAL = 24 * 3600  # 定期全量重建间隔（秒）
+    
+    # API 响应缓存（序列化与预压缩结果），文章变更时按代数令牌失效
+    API_RESPONSE_CACHE_TIMEOUT = 60
+    API_GENERATION_TIMEOUT = 24 * 3600  # 代数令牌的过期时间（秒），需大于响应缓存时间
+    
+    # 站点地图配置
+    SITEMAP_MAX_URLS = 50000  # 每个分片的 URL 上限（协议上限）
+    SITEMAP_CACHE_TIMEOUT = 24 * 3600  # 分片缓存时间（秒），文章变更时按分片失效
+    SITEMAP_MAX_AGE = 3600  # 响应的 Cache-Control max-age（秒）
+    
     # 速率限制配置
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
     
     # 查询性能监控配置
     ENABLE_QUERY_MONITORING = os.environ.get('ENABLE_QUERY_MONITORING', 'False').lower() == 'true'
     SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', '0.1'))  # 100ms
+    N_PLUS_ONE_THRESHOLD = 3  # 单个请求中同一查询形状执行次数达到该值视为疑似 N+1
+    QUERY_TELEMETRY_SAMPLE_RATE = float(os.environ.get('QUERY_TELEMETRY_SAMPLE_RATE', '0.01'))  # 完整语句抽样率
+    QUERY_TELEMETRY_MAX_FINGERPRINTS = 500  # 超出后归入 __other__
+    QUERY_TELEMETRY_MAX_ENDPOINTS = 200  # 按端点统计的上限，最久未用的并入 __other__
+    QUERY_TELEMETRY_REDIS_URL = os.environ.get('REDIS_URL')  # 多 worker 汇总；未配置时仅统计本进程
+    QUERY_TELEMETRY_FLUSH_INTERVAL = 10.0  # 推送到 Redis 的间隔（秒）
+    QUERY_TELEMETRY_TTL = 7 * 24 * 3600  # Redis 中遥测数据的过期时间（秒），每次推送时刷新
+    QUERY_TELEMETRY_TOKEN = os.environ.get('QUERY_TELEMETRY_TOKEN')  # 生产环境导出接口令牌
     
     # 日志配置
     LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
@@ -107,6 +165,12 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     ENABLE_QUERY_MONITORING = False  # 测试环境关闭查询监控
+    SEARCH_INDEX_ASYNC = False  # 测试中手动 flush 索引队列，结果可预期
+    SEARCH_REBUILD_PROCS = 1
+    SEARCH_POPULAR_REDIS_URL = None
+    SEARCH_POPULAR_SNAPSHOT = False
+    MEDIA_PROCESSING_BACKEND = 'sync'
+    RELATED_POSTS_BACKEND = 'sync'
 
 class ProductionConfig(Config):
     """生产环境配置"""
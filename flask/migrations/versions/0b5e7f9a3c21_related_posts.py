@@ -0,0 +1,40 @@
+"""Add precomputed related posts table
+
+Revision ID: 0b5e7f9a3c21
+Revises: f3d8a61c27e4
+Create Date: 2026-10-19 18:03:55.207714
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b5e7f9a3c21'
+down_revision = 'f3d8a61c27e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 表创建后为空，文章页退回热门文章，执行 `flask related rebuild` 填充
+    op.create_table('related_post',
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_id'], ['post.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('post_id', 'related_id')
+    )
+    with op.batch_alter_table('related_post', schema=None) as batch_op:
+        batch_op.create_index('ix_related_post_post_score', ['post_id', 'score'], unique=False)
+        batch_op.create_index(batch_op.f('ix_related_post_related_id'), ['related_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('related_post', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_related_post_related_id'))
+        batch_op.drop_index('ix_related_post_post_score')
+
+    op.drop_table('related_post')
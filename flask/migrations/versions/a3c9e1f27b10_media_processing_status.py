@@ -0,0 +1,33 @@
+"""Add media processing status
+
+Revision ID: a3c9e1f27b10
+Revises: f6b3b6d74085
+Create Date: 2026-10-19 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c9e1f27b10'
+down_revision = 'f6b3b6d74085'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 已存在的媒体文件在上传时已同步处理，直接标记为 ready
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processing_status', sa.String(length=20), nullable=True, server_default='ready'))
+        batch_op.add_column(sa.Column('processing_error', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('processed_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_media_file_processing_status'), ['processing_status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_media_file_processing_status'))
+        batch_op.drop_column('processed_at')
+        batch_op.drop_column('processing_error')
+        batch_op.drop_column('processing_status')
@@ -0,0 +1,53 @@
+"""Add content addressed media storage
+
+Revision ID: b7d41c0e9a52
+Revises: a3c9e1f27b10
+Create Date: 2026-10-19 11:03:47.218530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41c0e9a52'
+down_revision = 'a3c9e1f27b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_blob',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('file_type', sa.String(length=50), nullable=False),
+    sa.Column('mime_type', sa.String(length=100), nullable=False),
+    sa.Column('file_size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('dimensions', sa.String(length=50), nullable=True),
+    sa.Column('duration', sa.Integer(), nullable=True),
+    sa.Column('processing_status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('media_blob', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_media_blob_sha256'), ['sha256'], unique=True)
+
+    # 历史记录不关联存储对象，继续使用各自独占的文件
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_media_file_blob_id'), ['blob_id'], unique=False)
+        batch_op.create_foreign_key('fk_media_file_blob_id', 'media_blob', ['blob_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_media_file_blob_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_media_file_blob_id'))
+        batch_op.drop_column('blob_id')
+
+    with op.batch_alter_table('media_blob', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_media_blob_sha256'))
+
+    op.drop_table('media_blob')
@@ -0,0 +1,33 @@
+"""Add media image variants
+
+Revision ID: c5e8a2d4f613
+Revises: b7d41c0e9a52
+Create Date: 2026-10-19 13:26:09.551847
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e8a2d4f613'
+down_revision = 'b7d41c0e9a52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 历史图片没有变体清单，首次访问时由 /media/variant/... 按需生成
+    with op.batch_alter_table('media_blob', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('variants', sa.JSON(), nullable=True))
+
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('media_file', schema=None) as batch_op:
+        batch_op.drop_column('variants')
+
+    with op.batch_alter_table('media_blob', schema=None) as batch_op:
+        batch_op.drop_column('variants')
@@ -0,0 +1,42 @@
+"""Add media upload sessions
+
+Revision ID: d91f3b6a2c78
+Revises: c5e8a2d4f613
+Create Date: 2026-10-19 14:48:22.905316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f3b6a2c78'
+down_revision = 'c5e8a2d4f613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_upload_session',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('file_type', sa.String(length=50), nullable=False),
+    sa.Column('total_size', sa.BigInteger(), nullable=False),
+    sa.Column('received', sa.BigInteger(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('media_upload_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_media_upload_session_updated_at'), ['updated_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_media_upload_session_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('media_upload_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_media_upload_session_user_id'))
+        batch_op.drop_index(batch_op.f('ix_media_upload_session_updated_at'))
+
+    op.drop_table('media_upload_session')
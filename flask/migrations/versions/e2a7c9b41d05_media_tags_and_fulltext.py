@@ -0,0 +1,113 @@
+"""Add media tags table and fulltext index
+
+Revision ID: e2a7c9b41d05
+Revises: d91f3b6a2c78
+Create Date: 2026-10-19 16:05:41.733920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c9b41d05'
+down_revision = 'd91f3b6a2c78'
+branch_labels = None
+depends_on = None
+
+PG_TSVECTOR = (
+    "to_tsvector('simple', coalesce(filename, '') || ' ' || "
+    "coalesce(description, '') || ' ' || coalesce(alt_text, ''))"
+)
+
+
+def upgrade():
+    op.create_table('media_tag',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('media_tag', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_media_tag_name'), ['name'], unique=True)
+
+    op.create_table('media_file_tags',
+    sa.Column('media_file_id', sa.Integer(), nullable=False),
+    sa.Column('media_tag_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['media_file_id'], ['media_file.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['media_tag_id'], ['media_tag.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('media_file_id', 'media_tag_id')
+    )
+    with op.batch_alter_table('media_file_tags', schema=None) as batch_op:
+        batch_op.create_index('ix_media_file_tags_tag', ['media_tag_id', 'media_file_id'], unique=False)
+
+    _migrate_legacy_tags()
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS media_file_fts USING fts5("
+            "filename, description, alt_text, content='media_file', content_rowid='id', tokenize='trigram')"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS media_file_fts_ai AFTER INSERT ON media_file BEGIN "
+            "INSERT INTO media_file_fts(rowid, filename, description, alt_text) "
+            "VALUES (new.id, new.filename, new.description, new.alt_text); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS media_file_fts_ad AFTER DELETE ON media_file BEGIN "
+            "INSERT INTO media_file_fts(media_file_fts, rowid, filename, description, alt_text) "
+            "VALUES ('delete', old.id, old.filename, old.description, old.alt_text); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS media_file_fts_au AFTER UPDATE OF filename, description, alt_text ON media_file BEGIN "
+            "INSERT INTO media_file_fts(media_file_fts, rowid, filename, description, alt_text) "
+            "VALUES ('delete', old.id, old.filename, old.description, old.alt_text); "
+            "INSERT INTO media_file_fts(rowid, filename, description, alt_text) "
+            "VALUES (new.id, new.filename, new.description, new.alt_text); END"
+        )
+        # 为已有数据建立索引
+        op.execute("INSERT INTO media_file_fts(media_file_fts) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_media_file_fulltext ON media_file USING gin ({PG_TSVECTOR})")
+
+
+def _migrate_legacy_tags():
+    """把 media_file.tags 中逗号分隔的旧标签迁移到关联表"""
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("SELECT id, tags FROM media_file WHERE tags IS NOT NULL AND tags != ''")).fetchall()
+    tag_ids = {}
+    pairs = set()
+    for media_id, raw in rows:
+        for name in {' '.join(t.split())[:100] for t in raw.split(',')}:
+            if not name:
+                continue
+            if name not in tag_ids:
+                bind.execute(sa.text("INSERT INTO media_tag (name) VALUES (:name)"), {'name': name})
+                tag_ids[name] = bind.execute(sa.text("SELECT id FROM media_tag WHERE name = :name"),
+                                             {'name': name}).scalar()
+            pairs.add((media_id, tag_ids[name]))
+    if pairs:
+        bind.execute(
+            sa.text("INSERT INTO media_file_tags (media_file_id, media_tag_id) VALUES (:m, :t)"),
+            [{'m': m, 't': t} for m, t in sorted(pairs)],
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS media_file_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS media_file_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS media_file_fts_ai")
+        op.execute("DROP TABLE IF EXISTS media_file_fts")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_media_file_fulltext")
+
+    with op.batch_alter_table('media_file_tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_media_file_tags_tag')
+    op.drop_table('media_file_tags')
+
+    with op.batch_alter_table('media_tag', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_media_tag_name'))
+    op.drop_table('media_tag')
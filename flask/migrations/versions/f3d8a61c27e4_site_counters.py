@@ -0,0 +1,59 @@
+"""Add site counters table
+
+Revision ID: f3d8a61c27e4
+Revises: e2a7c9b41d05
+Create Date: 2026-10-19 17:12:08.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3d8a61c27e4'
+down_revision = 'e2a7c9b41d05'
+branch_labels = None
+depends_on = None
+
+# 计数器名称 -> 初始化用的聚合查询，与 app.site_counters 中的定义一致（user 是 PostgreSQL 保留字，需按方言加引号）
+GLOBAL_COUNTERS = {
+    'users': "SELECT COUNT(*) FROM {user}",
+    'users_confirmed': "SELECT COUNT(*) FROM {user} WHERE confirmed = :true",
+    'posts': "SELECT COUNT(*) FROM post",
+    'posts_published': "SELECT COUNT(*) FROM post WHERE published = :true",
+    'post_views': "SELECT COALESCE(SUM(views), 0) FROM post",
+    'comments': "SELECT COUNT(*) FROM comment",
+    'comments_approved': "SELECT COUNT(*) FROM comment WHERE approved = :true",
+    'categories': "SELECT COUNT(*) FROM category",
+}
+
+
+def upgrade():
+    op.create_table('site_counter',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name', 'scope_id')
+    )
+
+    # 用现有数据初始化计数器
+    bind = op.get_bind()
+    user_table = bind.dialect.identifier_preparer.quote('user')
+    counter = sa.table('site_counter', sa.column('name'), sa.column('scope_id'),
+                       sa.column('value'), sa.column('updated_at'))
+    rows = []
+    for name, query in GLOBAL_COUNTERS.items():
+        value = bind.execute(sa.text(query.format(user=user_table)), {'true': True}).scalar()
+        rows.append({'name': name, 'scope_id': 0, 'value': int(value or 0)})
+    category_rows = bind.execute(sa.text(
+        "SELECT category_id, COUNT(*) FROM post WHERE published = :true AND category_id IS NOT NULL "
+        "GROUP BY category_id"
+    ), {'true': True})
+    for category_id, count in category_rows:
+        rows.append({'name': 'category_published_posts', 'scope_id': category_id, 'value': count})
+    op.bulk_insert(counter, rows)
+
+
+def downgrade():
+    op.drop_table('site_counter')
@@ -0,0 +1,123 @@
+import gzip
+import unittest
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import create_app, db, cache
+from app.models import User, Post
+
+
+class ApiHttpCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        cache.clear()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+        self.posts = []
+        for i in range(20):
+            post = Post(title=f'Post {i}', content='content', summary='summary ' * 10, user_id=self.user.id,
+                        published=True, published_at=datetime.utcnow())
+            db.session.add(post)
+            self.posts.append(post)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        cache.clear()
+        self.app_context.pop()
+
+    def _count_queries(self, func):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        return result, statements
+
+    def test_list_conditional_requests_skip_database(self):
+        first = self.client.get('/api/v1/posts?per_page=20')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.get_json()['total'], 20)
+        etag = first.headers['ETag']
+        self.assertIn('Accept-Encoding', first.headers['Vary'])
+
+        revalidated, statements = self._count_queries(
+            lambda: self.client.get('/api/v1/posts?per_page=20', headers={'If-None-Match': etag}))
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b'')
+        self.assertEqual(statements, [])
+
+        since = self.client.get('/api/v1/posts?per_page=20',
+                                headers={'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(since.status_code, 304)
+
+        # 浏览量变化不使列表失效，标题变化会
+        self.posts[0].views = 3
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/v1/posts?per_page=20',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+        self.posts[0].title = 'Renamed'
+        db.session.commit()
+        changed = self.client.get('/api/v1/posts?per_page=20', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+    def test_gzip_body_is_precompressed(self):
+        plain = self.client.get('/api/v1/posts?per_page=20')
+        compressed = self.client.get('/api/v1/posts?per_page=20', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed.data), len(plain.data))
+        self.assertEqual(gzip.decompress(compressed.data), plain.data)
+        self.assertNotEqual(compressed.headers['ETag'], plain.headers['ETag'])
+        self.assertEqual(self.client.get('/api/v1/posts?per_page=20', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']}).status_code, 304)
+
+    def test_detail_revalidation_does_not_count_views(self):
+        post = self.posts[0]
+        first = self.client.get(f'/api/v1/posts/{post.id}')
+        self.assertEqual(first.get_json()['views'], 1)
+        etag = first.headers['ETag']
+
+        revalidated, statements = self._count_queries(
+            lambda: self.client.get(f'/api/v1/posts/{post.id}', headers={'If-None-Match': etag}))
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(statements, [])
+
+        # 浏览量变化不改变 ETag，浏览量随缓存超时刷新
+        self.client.get(f'/blog/post/{post.id}')
+        again = self.client.get(f'/api/v1/posts/{post.id}')
+        self.assertEqual(again.headers['ETag'], etag)
+        self.assertEqual(self.client.get(f'/api/v1/posts/{post.id}', headers={'If-None-Match': etag}).status_code, 304)
+        db.session.refresh(post)
+        self.assertEqual(post.views, 3)
+
+        # 内容变化后重新验证返回新内容
+        post.title = 'Renamed'
+        db.session.commit()
+        refreshed = self.client.get(f'/api/v1/posts/{post.id}', headers={'If-None-Match': etag})
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertEqual(refreshed.get_json()['title'], 'Renamed')
+        self.assertEqual(refreshed.get_json()['views'], 4)
+
+    def test_missing_post_does_not_create_generation_token(self):
+        response = self.client.get('/api/v1/posts/99999')
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(cache.get('api_generation:post:99999'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from app import create_app, db
+from app.models import User, MediaFile, MediaBlob, MediaUploadSession
+from app.media import chunked
+
+
+def _png_payload(size=(400, 300)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color=(0, 128, 64)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class ChunkedUploadTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmpdir = tempfile.mkdtemp()
+        self.app.static_folder = self.tmpdir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _init(self, filename, size):
+        resp = self.client.post('/media/api/upload/init', json={'filename': filename, 'size': size})
+        self.assertEqual(resp.status_code, 201)
+        return resp.get_json()['upload_id']
+
+    def _put(self, upload_id, data, start, total):
+        end = start + len(data) - 1
+        return self.client.put(f'/media/api/upload/{upload_id}', data=data,
+                               headers={'Content-Range': f'bytes {start}-{end}/{total}',
+                                        'Content-Type': 'application/octet-stream'})
+
+    def test_chunks_resume_and_complete_into_processed_media(self):
+        payload = _png_payload()
+        total = len(payload)
+        upload_id = self._init('photo.png', total)
+        third = total // 3
+
+        self.assertEqual(self._put(upload_id, payload[:third], 0, total).get_json()['received'], third)
+
+        # 断线后客户端从错误的偏移重试，服务器返回应续传的位置
+        resp = self._put(upload_id, payload[2 * third:], 2 * third, total)
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.get_json()['received'], third)
+        status = self.client.get(f'/media/api/upload/{upload_id}').get_json()
+        self.assertEqual(status['received'], third)
+
+        self._put(upload_id, payload[third:2 * third], third, total)
+        self._put(upload_id, payload[2 * third:], 2 * third, total)
+
+        resp = self.client.post(f'/media/api/upload/{upload_id}/complete',
+                                json={'sha256': hashlib.sha256(payload).hexdigest()})
+        self.assertEqual(resp.status_code, 200)
+        media_file = db.session.get(MediaFile, resp.get_json()['file']['id'])
+        self.assertEqual(media_file.file_size, total)
+        self.assertEqual(media_file.dimensions, '400,300')
+        self.assertEqual(media_file.processing_status, 'ready')
+        self.assertEqual(MediaBlob.query.one().sha256, hashlib.sha256(payload).hexdigest())
+        self.assertEqual(MediaUploadSession.query.count(), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'uploads/media/tmp', f'{upload_id}.part')))
+
+    def test_hash_recomputed_when_chunks_land_on_other_workers(self):
+        payload = b'x' * 5000
+        upload_id = self._init('notes.txt', len(payload))
+        self._put(upload_id, payload[:2000], 0, len(payload))
+        chunked._hashers.clear()  # 模拟后续分块由另一个进程处理
+        self._put(upload_id, payload[2000:], 2000, len(payload))
+
+        resp = self.client.post(f'/media/api/upload/{upload_id}/complete',
+                                json={'sha256': hashlib.sha256(payload).hexdigest()})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_losing_request_at_same_offset_does_not_touch_committed_bytes(self):
+        payload = b'a' * 3000
+        upload_id = self._init('notes.txt', len(payload))
+        self._put(upload_id, payload[:1000], 0, len(payload))
+
+        # 与第一个分块并发的重传：读到的是旧的偏移，条件更新失败
+        stale = MediaUploadSession(id=upload_id, received=0, total_size=len(payload))
+        with self.assertRaises(chunked.UploadOffsetMismatch) as ctx:
+            chunked.append_chunk(stale, io.BytesIO(b'z' * 1000), 0)
+        self.assertEqual(ctx.exception.expected, 1000)
+        with open(chunked.temp_path(upload_id), 'rb') as f:
+            self.assertEqual(f.read(), payload[:1000])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'uploads/media/tmp')), [f'{upload_id}.part'])
+
+        self._put(upload_id, payload[1000:], 1000, len(payload))
+        resp = self.client.post(f'/media/api/upload/{upload_id}/complete', json={})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post(f'/media/api/upload/{upload_id}/complete',
+                                json={'sha256': hashlib.sha256(payload).hexdigest()})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_limits_enforced_before_and_during_upload(self):
+        resp = self.client.post('/media/api/upload/init', json={'filename': 'huge.png', 'size': 200 * 1024 * 1024})
+        self.assertEqual(resp.status_code, 400)
+
+        upload_id = self._init('notes.txt', 10)
+        resp = self._put(upload_id, b'y' * 20, 0, 10)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.client.get(f'/media/api/upload/{upload_id}').get_json()['received'], 0)
+
+        resp = self.client.post(f'/media/api/upload/{upload_id}/complete', json={})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.client.delete(f'/media/api/upload/{upload_id}').status_code, 200)
+        self.assertEqual(MediaUploadSession.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from app import create_app, db
+from app.models import User, MediaFile, MediaBlob
+from app.media.processing import (MediaProcessingPipeline, get_media_pipeline, STATUS_PENDING,
+                                  STATUS_READY, STATUS_FAILED)
+
+
+def _png_bytes(size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color=(200, 30, 30)).save(buf, format='PNG')
+    buf.seek(0)
+    return buf
+
+
+class MediaProcessingTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmpdir = tempfile.mkdtemp()
+        self.app.static_folder = self.tmpdir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _variant_path(self, media_file, index=0):
+        return os.path.join(self.tmpdir, os.path.dirname(media_file.file_path),
+                            'variants', media_file.variants[index]['file'])
+
+    def test_batch_upload_writes_back_metadata(self):
+        resp = self.client.post('/media/api/upload', data={
+            'files': [(_png_bytes(), 'a.png'), (_png_bytes((300, 200)), 'b.png'),
+                      (io.BytesIO(b'notes'), 'c.txt')],
+        }, content_type='multipart/form-data')
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(len(data['files']), 3)
+        self.assertEqual(data['file']['filename'], 'a.png')
+
+        files = {f.filename: f for f in MediaFile.query.all()}
+        self.assertEqual(files['a.png'].processing_status, STATUS_READY)
+        self.assertEqual(files['a.png'].dimensions, '640,480')
+        self.assertEqual(files['b.png'].dimensions, '300,200')
+        self.assertIsNotNone(files['a.png'].processed_at)
+        self.assertTrue(os.path.exists(self._variant_path(files['a.png'])))
+        # 文档不需要生成衍生文件
+        self.assertEqual(files['c.txt'].processing_status, STATUS_READY)
+
+        status = self.client.get(f"/media/api/file/{files['b.png'].id}/status").get_json()
+        self.assertEqual(status['processing_status'], STATUS_READY)
+
+    def test_local_pool_processes_in_background(self):
+        pipeline = MediaProcessingPipeline(self.app, backend='local', max_workers=2)
+        with self.app.test_request_context():
+            from app.media.utils import MediaFileProcessor
+            from werkzeug.datastructures import FileStorage
+            infos = [MediaFileProcessor.save_file(FileStorage(_png_bytes((100 + i, 100)), filename=f'{i}.png'))
+                     for i in range(3)]
+        media_files = [MediaFile(uploaded_by=self.user.id, **info) for info in infos]
+        db.session.add_all(media_files)
+        db.session.commit()
+        self.assertEqual(media_files[0].processing_status, STATUS_PENDING)
+        # 原文件损坏时记录失败状态
+        with open(os.path.join(self.tmpdir, media_files[2].file_path), 'wb') as f:
+            f.write(b'broken')
+
+        pipeline.submit(media_files)
+        pipeline.shutdown(wait=True)
+
+        db.session.expire_all()
+        statuses = [db.session.get(MediaFile, m.id).processing_status for m in media_files]
+        self.assertEqual(statuses, [STATUS_READY, STATUS_READY, STATUS_FAILED])
+        self.assertEqual(pipeline.stats()['completed'], 2)
+        self.assertEqual(pipeline.stats()['failed'], 1)
+        self.assertTrue(media_files[2].processing_error)
+
+    def test_failed_video_probe_is_recorded_not_marked_ready(self):
+        from unittest import mock
+        from app.media.processing import process_media_file
+
+        media_file = MediaFile(uploaded_by=self.user.id, filename='clip.mp4', stored_filename='clip.mp4',
+                               file_path='uploads/clip.mp4', file_url='/static/uploads/clip.mp4',
+                               file_size=5, mime_type='video/mp4', file_type='video',
+                               processing_status=STATUS_PENDING)
+        db.session.add(media_file)
+        db.session.commit()
+
+        probe = mock.Mock(returncode=1, stdout='', stderr='Invalid data')
+        with mock.patch('app.media.utils.subprocess.run', return_value=probe):
+            result = process_media_file(media_file.id)
+
+        self.assertEqual(result['status'], STATUS_FAILED)
+        db.session.expire_all()
+        media_file = db.session.get(MediaFile, media_file.id)
+        self.assertEqual(media_file.processing_status, STATUS_FAILED)
+        self.assertIn('ffprobe', media_file.processing_error)
+
+    def test_blob_is_placed_only_after_commit(self):
+        from app.media.storage import blob_relative_path, store_blob, stream_to_temp
+
+        def stage(payload):
+            tmp_path, digest, size = stream_to_temp(io.BytesIO(payload))
+            store_blob(tmp_path, digest, size, 'document', '.txt', 'text/plain')
+            return tmp_path, os.path.join(self.tmpdir, blob_relative_path('document', digest, '.txt'))
+
+        # 回滚：既不落位，也不留下临时文件
+        tmp_path, target = stage(b'rolled back')
+        self.assertFalse(os.path.exists(target))
+        db.session.rollback()
+        self.assertFalse(os.path.exists(tmp_path))
+        self.assertFalse(os.path.exists(target))
+
+        tmp_path, target = stage(b'committed')
+        db.session.commit()
+        self.assertFalse(os.path.exists(tmp_path))
+        self.assertTrue(os.path.exists(target))
+
+    def _upload(self, *files):
+        resp = self.client.post('/media/api/upload', data={'files': list(files)},
+                                content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()['files']
+
+    def test_duplicate_uploads_share_blob_and_derivatives(self):
+        first = self._upload((_png_bytes(), 'banner.png'))[0]
+        second = self._upload((_png_bytes(), 'banner-copy.png'))[0]
+
+        # 第二次上传直接复用已处理的内容，无需再次处理
+        self.assertEqual(second['processing_status'], STATUS_READY)
+        self.assertEqual(MediaBlob.query.count(), 1)
+        blob = MediaBlob.query.one()
+        self.assertEqual(blob.ref_count, 2)
+        a, b = db.session.get(MediaFile, first['id']), db.session.get(MediaFile, second['id'])
+        self.assertEqual(a.file_path, b.file_path)
+        self.assertNotEqual(a.stored_filename, b.stored_filename)
+        self.assertEqual(b.dimensions, '640,480')
+
+        blob_path = os.path.join(self.tmpdir, blob.file_path)
+        variant_path = self._variant_path(b)
+        self.client.post(f"/media/file/{first['id']}/delete")
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual(MediaBlob.query.one().ref_count, 1)
+
+        self.client.post(f"/media/file/{second['id']}/delete")
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertFalse(os.path.exists(variant_path))
+        self.assertEqual(MediaBlob.query.count(), 0)
+        self.assertEqual(MediaFile.query.count(), 0)
+
+    def test_duplicates_in_one_batch_are_processed_once(self):
+        files = self._upload((_png_bytes(), 'a.png'), (_png_bytes(), 'b.png'))
+        self.assertEqual([f['processing_status'] for f in files], [STATUS_READY, STATUS_READY])
+        self.assertEqual(get_media_pipeline().stats()['submitted'], 1)
+        self.assertEqual(MediaBlob.query.one().ref_count, 2)
+
+    def test_oversized_upload_is_rejected_while_streaming(self):
+        from app.media.utils import MediaFileProcessor
+        original = MediaFileProcessor.MAX_FILE_SIZE['document']
+        MediaFileProcessor.MAX_FILE_SIZE['document'] = 1024
+        try:
+            resp = self.client.post('/media/api/upload', data={'file': (io.BytesIO(b'x' * 4096), 'big.txt')},
+                                    content_type='multipart/form-data')
+        finally:
+            MediaFileProcessor.MAX_FILE_SIZE['document'] = original
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(MediaBlob.query.count(), 0)
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'uploads', 'media', 'tmp')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, MediaFile, MediaTag
+from app.media.fulltext import fulltext_available, keyword_filter
+from app.media.tags import add_tags, remove_tags, parse_tags
+
+
+class MediaTagTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _media(self, filename, description=None, tags=None):
+        media_file = MediaFile(filename=filename, stored_filename=filename, file_path=f'uploads/{filename}',
+                               file_url=f'/static/uploads/{filename}', file_type='document',
+                               mime_type='text/plain', file_size=1, description=description,
+                               tags=tags, uploaded_by=self.user.id)
+        db.session.add(media_file)
+        db.session.commit()
+        return media_file
+
+    def test_tags_are_normalized_into_association_table(self):
+        media_file = self._media('a.txt', tags=' travel , 风景,travel,  ')
+        self.assertEqual(parse_tags('a,  b  c ,a'), ['a', 'b c'])
+        self.assertEqual(media_file.get_tags_list(), ['travel', '风景'])
+        self.assertEqual(media_file.tags, 'travel,风景')
+        self.assertEqual(MediaTag.query.count(), 2)
+
+        other = self._media('b.txt', tags='travel')
+        self.assertEqual(MediaTag.query.count(), 2)
+        self.assertEqual(other.tag_items[0].id, media_file.tag_items[0].id)
+
+    def test_batch_tag_edits_are_set_based(self):
+        files = [self._media(f'{i}.txt', tags='old' if i % 2 else None) for i in range(6)]
+        ids = [f.id for f in files]
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            added = add_tags(ids, 'new, shared')
+            removed = remove_tags(ids, 'old')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        db.session.commit()
+
+        self.assertEqual(added, 12)
+        self.assertEqual(removed, 3)
+        # 语句数量与文件数量无关
+        self.assertLessEqual(len(statements), 8)
+        for media_file in files:
+            self.assertEqual(media_file.get_tags_list(), ['new', 'shared'])
+
+        # 重复添加不会产生重复关联
+        self.assertEqual(add_tags(ids, 'new'), 0)
+
+    def test_batch_operation_route_uses_tag_table(self):
+        files = [self._media(f'{i}.txt') for i in range(3)]
+        resp = self.client.post('/media/batch-operation', data={
+            'media_ids': ','.join(str(f.id) for f in files),
+            'operation': 'add_tags',
+            'tags_to_add': 'alpha,beta',
+        })
+        self.assertEqual(resp.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual([f.get_tags_list() for f in MediaFile.query.order_by(MediaFile.id)],
+                         [['alpha', 'beta']] * 3)
+
+    def test_keyword_search_uses_fulltext_index_and_tags(self):
+        self.assertTrue(fulltext_available())
+        self._media('beach-sunset.jpg', description='海边的日落照片')
+        self._media('mountain.jpg', description='雪山', tags='sunset')
+        self._media('report.pdf', description='季度报告')
+
+        def search(keyword):
+            return sorted(f.filename for f in MediaFile.query.filter(keyword_filter(keyword)))
+
+        self.assertEqual(search('sunset'), ['beach-sunset.jpg', 'mountain.jpg'])
+        self.assertEqual(search('的日落'), ['beach-sunset.jpg'])
+        self.assertEqual(search('报告'), ['report.pdf'])  # 短关键字退回 LIKE
+
+        # 更新与删除同步到索引
+        report = MediaFile.query.filter_by(filename='report.pdf').one()
+        report.description = 'sunset review'
+        db.session.commit()
+        self.assertIn('report.pdf', search('sunset'))
+        db.session.delete(report)
+        db.session.commit()
+        self.assertEqual(search('review'), [])
+
+        resp = self.client.get('/media/api/files?keyword=sunset&tag=sunset')
+        self.assertEqual([f['filename'] for f in resp.get_json()['files']], ['mountain.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from app import create_app, db, cache
+from app.models import User, MediaFile
+from app.media.variants import generate_variants, target_widths, build_srcset, pick_variant
+
+
+def _write_png(path, size):
+    Image.new('RGB', size, color=(10, 120, 200)).save(path, format='PNG')
+
+
+class VariantGenerationTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_widths_capped_by_original(self):
+        self.assertEqual(target_widths(800), [320, 640, 800])
+        self.assertEqual(target_widths(2000), [320, 640, 1024, 1600])
+        self.assertEqual(target_widths(None), [])
+
+    def test_generates_webp_variants_preserving_aspect_ratio(self):
+        path = os.path.join(self.tmpdir, 'photo.png')
+        _write_png(path, (1000, 500))
+
+        entries = generate_variants(path, formats=('webp',))
+
+        self.assertEqual([e['width'] for e in entries], [320, 640, 1000])
+        self.assertEqual([e['height'] for e in entries], [160, 320, 500])
+        for entry in entries:
+            with Image.open(os.path.join(self.tmpdir, 'variants', entry['file'])) as img:
+                self.assertEqual(img.format, 'WEBP')
+                self.assertEqual(img.width, entry['width'])
+        self.assertEqual(pick_variant(entries, 300)['width'], 320)
+        self.assertEqual(pick_variant(entries, 5000)['width'], 1000)
+
+
+class VariantUrlTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmpdir = tempfile.mkdtemp()
+        self.app.static_folder = self.tmpdir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        cache.clear()
+        self.client = self.app.test_client()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _media_file(self, variants=None, size=(900, 600)):
+        relative = 'uploads/media/image/legacy.png'
+        os.makedirs(os.path.join(self.tmpdir, 'uploads/media/image'), exist_ok=True)
+        _write_png(os.path.join(self.tmpdir, relative), size)
+        media_file = MediaFile(filename='legacy.png', stored_filename='legacy.png', file_path=relative,
+                               file_url='/static/' + relative, file_type='image', mime_type='image/png',
+                               file_size=1, dimensions=f'{size[0]},{size[1]}', variants=variants,
+                               processing_status='ready', uploaded_by=self.user.id)
+        db.session.add(media_file)
+        db.session.commit()
+        return media_file
+
+    def test_srcset_is_built_without_filesystem_access(self):
+        media_file = self._media_file(variants=[
+            {'width': 320, 'height': 213, 'format': 'webp', 'file': 'legacy_w320.webp'},
+            {'width': 640, 'height': 427, 'format': 'webp', 'file': 'legacy_w640.webp'},
+        ])
+        with self.app.test_request_context(), \
+                patch('os.path.exists', side_effect=AssertionError('不应访问文件系统')):
+            srcset = build_srcset(media_file, 'webp')
+            thumbnail = media_file.thumbnail_url
+
+        self.assertEqual(srcset, '/static/uploads/media/image/variants/legacy_w320.webp 320w, '
+                                 '/static/uploads/media/image/variants/legacy_w640.webp 640w')
+        self.assertEqual(thumbnail, '/static/uploads/media/image/variants/legacy_w320.webp')
+
+    def test_missing_variants_are_generated_lazily(self):
+        media_file = self._media_file()
+        with self.app.test_request_context():
+            self.assertIn('/media/variant/%d/w640.webp 640w' % media_file.id, build_srcset(media_file, 'webp'))
+
+        resp = self.client.get(f'/media/variant/{media_file.id}/w640.webp')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=86400')
+        self.assertTrue(resp.headers['Location'].endswith('/variants/legacy_w640.webp'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'uploads/media/image/variants/legacy_w640.webp')))
+        db.session.expire_all()
+        self.assertEqual([e['width'] for e in db.session.get(MediaFile, media_file.id).variants], [640])
+
+        # 第二次请求命中缓存，不再查询和生成
+        with patch('app.media.routes.ensure_variant', side_effect=AssertionError('不应重新生成')):
+            self.assertEqual(self.client.get(f'/media/variant/{media_file.id}/w640.webp').status_code, 302)
+
+        # 非预定义宽度拒绝生成
+        self.assertEqual(self.client.get(f'/media/variant/{media_file.id}/w333.webp').status_code, 404)
+
+    def test_private_variant_redirect_is_not_publicly_cacheable(self):
+        media_file = self._media_file()
+        self.assertEqual(self.client.get(f'/media/variant/{media_file.id}/w640.webp').status_code, 302)
+        with self.client.session_transaction() as sess:
+            sess['_user_id'] = str(self.user.id)
+        self.client.post('/media/batch-operation', data={'media_ids': str(media_file.id), 'operation': 'set_private'})
+        self.assertFalse(db.session.get(MediaFile, media_file.id).is_public)
+
+        resp = self.client.get(f'/media/variant/{media_file.id}/w640.webp')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.headers['Cache-Control'], 'private, no-store')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+from collections import Counter
+
+from app.query_telemetry import LogHistogram, QueryTelemetry, RedisTelemetrySink, normalize_statement
+
+
+class LogHistogramTests(unittest.TestCase):
+    def test_percentiles_within_bucket_error(self):
+        hist = LogHistogram()
+        for i in range(1, 1001):
+            hist.record(i / 1000.0)  # 1ms .. 1s
+
+        self.assertEqual(hist.count, 1000)
+        self.assertAlmostEqual(hist.percentile(50), 0.5, delta=0.5 * 0.125)
+        self.assertAlmostEqual(hist.percentile(95), 0.95, delta=0.95 * 0.125)
+        self.assertAlmostEqual(hist.percentile(99), 0.99, delta=0.99 * 0.125)
+        self.assertEqual(hist.max, 1.0)
+
+    def test_merge_and_fixed_size(self):
+        a, b = LogHistogram(), LogHistogram()
+        a.record(0.01)
+        b.record(100.0)  # 超出上限归入最后一个桶
+        a.merge(b)
+        self.assertEqual(a.count, 2)
+        self.assertEqual(len(a.counts), a.size)
+
+
+class QueryTelemetryTests(unittest.TestCase):
+    def test_statements_with_different_literals_share_fingerprint(self):
+        self.assertEqual(
+            normalize_statement("SELECT * FROM post WHERE id = 5 AND title = 'a'"),
+            normalize_statement("select *  from post where id = 17 and title = 'bb'"),
+        )
+        self.assertEqual(
+            normalize_statement('SELECT * FROM tag WHERE tag.id IN (?, ?, ?)'),
+            normalize_statement('SELECT * FROM tag WHERE tag.id IN (?)'),
+        )
+
+    def test_memory_bounded_by_fingerprint_limit(self):
+        telemetry = QueryTelemetry(max_fingerprints=3, sample_rate=0)
+        for i in range(10):
+            telemetry.record(f'SELECT * FROM table_{chr(97 + i)}', 0.001, endpoint='main.index')
+
+        self.assertLessEqual(len(telemetry.by_fingerprint), 4)
+        self.assertIn(QueryTelemetry.OTHER, telemetry.by_fingerprint)
+        snapshot = telemetry.snapshot()
+        self.assertEqual(snapshot['total_queries'], 10)
+        self.assertEqual(snapshot['endpoints'][0]['count'], 10)
+
+    def test_endpoints_bounded_and_evicted_into_other(self):
+        telemetry = QueryTelemetry(max_endpoints=3, sample_rate=0)
+        for i in range(10):
+            telemetry.record('SELECT 1', 0.001, endpoint=f'bp.view_{i}')
+        telemetry.record('SELECT 1', 0.001, endpoint=QueryTelemetry.UNMATCHED)
+
+        self.assertLessEqual(len(telemetry.by_endpoint), 3)
+        self.assertIn(QueryTelemetry.UNMATCHED, telemetry.by_endpoint)
+        self.assertEqual(sum(h.count for h in telemetry.by_endpoint.values()), 11)
+
+    def test_slow_queries_are_always_sampled(self):
+        telemetry = QueryTelemetry(slow_threshold=0.1, sample_rate=0)
+        telemetry.record('SELECT 1', 0.2, parameters=(1,))
+        telemetry.record('SELECT 1', 0.01)
+        self.assertEqual(len(telemetry.slow_samples), 1)
+        self.assertEqual(len(telemetry.samples), 0)
+        self.assertEqual(telemetry.slow_queries, 1)
+
+    def test_n_plus_one_detected_once_per_request(self):
+        telemetry = QueryTelemetry(n_plus_one_threshold=3, sample_rate=0)
+        per_request = Counter()
+        for post_id in range(5):
+            per_request[telemetry.record(f'SELECT * FROM comment WHERE post_id = {post_id}', 0.001)] += 1
+
+        issues = telemetry.check_n_plus_one(per_request, endpoint='blog.index')
+        self.assertEqual(len(issues), 1)
+        self.assertEqual(issues[0]['count'], 5)
+
+    def test_other_bucket_not_reported_as_n_plus_one(self):
+        telemetry = QueryTelemetry(max_fingerprints=1, n_plus_one_threshold=3, sample_rate=0)
+        telemetry.record('SELECT * FROM post', 0.001)
+        per_request = Counter()
+        for i in range(5):
+            per_request[telemetry.record(f'SELECT * FROM table_{i}', 0.001)] += 1
+
+        self.assertEqual(list(per_request), [QueryTelemetry.OTHER])
+        self.assertEqual(telemetry.check_n_plus_one(per_request, endpoint='blog.index'), [])
+
+
+class _FakeRedis:
+    """只实现遥测推送与导出用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+
+    def pipeline(self, transaction=False):
+        return _FakePipeline(self)
+
+    def hincrby(self, key, field, amount):
+        row = self.data.setdefault(key, {})
+        row[field] = row.get(field, 0) + amount
+
+    def hincrbyfloat(self, key, field, amount):
+        self.hincrby(key, field, amount)
+
+    def hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(field, value)
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    def incrby(self, key, amount):
+        self.data[key] = self.data.get(key, 0) + amount
+
+    def expire(self, key, seconds):
+        if key in self.data:
+            self.ttl[key] = seconds
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.calls.append((name, args))
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+class RedisTelemetrySinkTests(unittest.TestCase):
+    def test_slow_count_shared_and_keys_expire(self):
+        client = _FakeRedis()
+        sink = RedisTelemetrySink(client, flush_interval=0, ttl=60)
+        for _ in range(2):
+            worker = QueryTelemetry(slow_threshold=0.1, sample_rate=0)
+            worker.record('SELECT * FROM post WHERE id = 1', 0.2)
+            worker.record('SELECT * FROM post WHERE id = 2', 0.01)
+            self.assertTrue(sink.maybe_flush(worker))
+
+        snapshot = sink.snapshot()
+        self.assertEqual(snapshot['total_queries'], 4)
+        self.assertEqual(snapshot['slow_queries'], 2)
+        self.assertEqual(set(client.ttl), set(client.data))
+        self.assertTrue(all(seconds == 60 for seconds in client.ttl.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Post, Category, Tag, RelatedPost
+from app import related_posts
+from app.related_posts import get_related_posts, rebuild_related_posts, tokenize
+
+
+class RelatedPostsTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['RELATED_POSTS_LIMIT'] = 3
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        self.python = Category(name='python')
+        self.cooking = Category(name='cooking')
+        self.web = Tag(name='web')
+        db.session.add_all([self.user, self.python, self.cooking, self.web])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _post(self, title, content, category, tags=(), published=True):
+        post = Post(title=title, slug=title, content=content, author=self.user, category=category,
+                    tags=list(tags), published=published)
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def _related_ids(self, post):
+        return [p.id for p in get_related_posts(post.id)]
+
+    def test_tokenize_cleans_and_filters(self):
+        self.assertEqual(tokenize('Flask 2024 x routing'), ['flask', 'routing'])
+
+    def test_related_posts_follow_content_tags_and_category(self):
+        flask_intro = self._post('flask intro', '<p>flask routing blueprints templates</p>', self.python, [self.web])
+        flask_deep = self._post('flask deep dive', '<b>flask routing</b> blueprints internals', self.python, [self.web])
+        cake = self._post('chocolate cake', 'flour sugar cocoa oven baking', self.cooking)
+        django = self._post('django views', 'django orm templates', self.python)
+
+        related = self._related_ids(flask_intro)
+        self.assertEqual(related[0], flask_deep.id)
+        self.assertIn(django.id, related)
+        self.assertNotIn(cake.id, related)
+
+        # 新发布的文章增量进入其他文章的列表
+        newer = self._post('flask routing tips', 'flask routing blueprints templates tips', self.python, [self.web])
+        self.assertIn(newer.id, self._related_ids(flask_intro))
+        self.assertLessEqual(RelatedPost.query.filter_by(post_id=flask_intro.id).count(), 3)
+
+        # 下线后立即从其他文章的列表移除
+        newer.published = False
+        db.session.commit()
+        self.assertNotIn(newer.id, self._related_ids(flask_intro))
+        self.assertEqual(RelatedPost.query.filter_by(post_id=newer.id).count(), 0)
+
+        # 浏览量变化不触发刷新
+        before = [(r.post_id, r.related_id, r.updated_at) for r in RelatedPost.query.order_by('post_id', 'related_id')]
+        flask_intro.views = 5
+        db.session.commit()
+        after = [(r.post_id, r.related_id, r.updated_at) for r in RelatedPost.query.order_by('post_id', 'related_id')]
+        self.assertEqual(before, after)
+
+        db.session.delete(flask_deep)
+        db.session.commit()
+        self.assertNotIn(flask_deep.id, self._related_ids(flask_intro))
+
+        rebuilt = rebuild_related_posts()
+        self.assertEqual(rebuilt, RelatedPost.query.count())
+        self.assertEqual(self._related_ids(cake), [])
+
+    def test_refresh_only_writes_rows_that_make_the_top_k(self):
+        # 每篇各有一个独有的词，彼此的相似度略低于与不含独有词的文章
+        strong = [self._post(f'flask guide {word}', f'flask routing blueprints templates {word}', self.python, [self.web])
+                  for word in ('alpha', 'bravo', 'charlie', 'delta', 'echo')]
+        inserted = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO related_post'):
+                inserted.extend(parameters if executemany else [parameters])
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            weak = self._post('flask oven', 'flask oven baking', self.cooking)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        # 弱相关的新文章进不了任何已满列表，只写入它自己的列表
+        self.assertEqual(len(inserted), 3)
+        self.assertEqual(RelatedPost.query.filter_by(related_id=weak.id).count(), 0)
+        for post in strong:
+            self.assertEqual(RelatedPost.query.filter_by(post_id=post.id).count(), 3)
+
+        # 强相关的新文章挤掉各列表中的最后一名，列表长度不变
+        best = self._post('flask guide', 'flask routing blueprints templates', self.python, [self.web])
+        for post in strong:
+            self.assertIn(best.id, self._related_ids(post))
+            self.assertEqual(RelatedPost.query.filter_by(post_id=post.id).count(), 3)
+
+    def test_incremental_refresh_reuses_cached_index(self):
+        first = self._post('flask intro', 'flask routing blueprints', self.python)
+        self._post('flask routing', 'flask routing blueprints', self.python)
+        index = self.app.extensions['related_posts_index']
+
+        with mock.patch.object(related_posts, 'load_documents', wraps=related_posts.load_documents) as load:
+            first.content = 'flask routing blueprints templates'
+            db.session.commit()
+            third = self._post('django orm', 'django orm routing', self.python)
+
+        # 只读取变更的文章，不重新加载整个语料
+        self.assertEqual([call.args[1] for call in load.call_args_list], [{first.id}, {third.id}])
+        self.assertIs(self.app.extensions['related_posts_index'], index)
+        self.assertEqual(set(index.documents), {first.id, first.id + 1, third.id})
+        self.assertIn('templates', index.documents[first.id].terms)
+
+        db.session.delete(third)
+        db.session.commit()
+        self.assertNotIn(third.id, index.documents)
+        self.assertNotIn('django', index.df)
+
+    def test_post_page_uses_single_lookup(self):
+        first = self._post('flask intro', 'flask routing blueprints', self.python)
+        second = self._post('flask routing', 'flask routing blueprints', self.python)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get(f'/blog/post/{first.id}')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'/blog/post/{second.id}', response.get_data(as_text=True))
+        related_queries = [s for s in statements if 'related_post' in s]
+        self.assertEqual(len(related_queries), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
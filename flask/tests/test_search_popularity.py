@@ -0,0 +1,133 @@
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+
+from app.search_popularity import SpaceSaving, PopularQueryTracker, normalize_query
+
+HOUR = 3600
+
+
+class SpaceSavingTests(unittest.TestCase):
+    def test_memory_is_bounded_and_heavy_hitters_survive(self):
+        sketch = SpaceSaving(capacity=10)
+        for i in range(1000):
+            sketch.add(f'rare-{i}')
+            if i % 2 == 0:
+                sketch.add('python')
+            if i % 5 == 0:
+                sketch.add('flask')
+
+        self.assertLessEqual(len(sketch), 10)
+        top = [term for term, _ in sketch.top(2)]
+        self.assertEqual(top, ['python', 'flask'])
+
+    def test_counts_overestimate_within_recorded_error(self):
+        rng = random.Random(7)
+        stream = [f'term-{int(rng.paretovariate(1.2))}' for _ in range(5000)]
+        sketch = SpaceSaving(capacity=30)
+        for term in stream:
+            sketch.add(term)
+
+        truth = Counter(stream)
+        self.assertEqual(sum(sketch.counts.values()), len(stream))
+        for term, count in sketch.counts.items():
+            self.assertGreaterEqual(count, truth[term])
+            self.assertLessEqual(count - sketch.errors[term], truth[term])
+        self.assertLessEqual(len(sketch._heap), 4 * sketch.capacity + 1)
+
+
+class PopularQueryTrackerTests(unittest.TestCase):
+    def test_windows_and_normalization(self):
+        tracker = PopularQueryTracker(capacity=20)
+        now = 1000 * HOUR
+        for _ in range(5):
+            tracker.record('Python', now=now - 30 * HOUR)  # 一天以前
+        for _ in range(3):
+            tracker.record('  flask   tips ', now=now)
+        tracker.record('python', now=now)
+
+        self.assertEqual(normalize_query('  Flask   Tips '), 'flask tips')
+        self.assertEqual(tracker.top(1, window='all', now=now), [('python', 6)])
+        self.assertEqual(tracker.top(2, window='day', now=now), [('flask tips', 3), ('python', 1)])
+        self.assertEqual(tracker.top(5, window='hour', now=now - HOUR), [])
+
+    def test_trending_prefers_recent_spikes(self):
+        tracker = PopularQueryTracker(capacity=20)
+        now = 1000 * HOUR
+        for hour in range(1, 24):
+            for _ in range(4):
+                tracker.record('python', now=now - hour * HOUR)
+        for _ in range(4):
+            tracker.record('python', now=now)
+            tracker.record('whoosh', now=now)
+
+        self.assertEqual(tracker.trending(1, now=now)[0][0], 'whoosh')
+
+    def test_old_windows_expire(self):
+        tracker = PopularQueryTracker(capacity=20, retention_hours=24)
+        now = 1000 * HOUR
+        tracker.record('old', now=now - 48 * HOUR)
+        tracker.record('new', now=now)
+        self.assertEqual(len(tracker._hours), 1)
+
+    def test_snapshot_restores_counts_after_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            now = 1000 * HOUR
+            tracker = PopularQueryTracker(capacity=20, snapshot_dir=tmp, snapshot_interval=3600)
+            for _ in range(3):
+                tracker.record('python', now=now)
+            tracker.record('flask', now=now)
+            tracker.close()
+            self.assertEqual(os.listdir(tmp), [f'{os.getpid()}.json'])
+
+            restored = PopularQueryTracker(capacity=20, snapshot_dir=tmp)
+            self.assertEqual(restored.top(2, window='all', now=now), [('python', 3), ('flask', 1)])
+            restored.record('python', now=now)
+            self.assertEqual(restored.top(1, window='all', now=now), [('python', 4)])
+            restored.close()
+
+    def test_snapshots_of_exited_workers_are_merged_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            now = 1000 * HOUR
+            # 两个已退出 worker 各自留下的快照
+            for dead_pid, term in ((2 ** 30, 'python'), (2 ** 30 + 1, 'flask')):
+                worker = PopularQueryTracker(capacity=20, snapshot_dir=tmp)
+                for _ in range(2):
+                    worker.record(term, now=now)
+                worker.record('whoosh', now=now)
+                worker.close()
+                os.rename(os.path.join(tmp, f'{os.getpid()}.json'), os.path.join(tmp, f'{dead_pid}.json'))
+
+            merged = PopularQueryTracker(capacity=20, snapshot_dir=tmp)
+            self.assertEqual(
+                sorted(merged.top(3, window='all', now=now)),
+                [('flask', 2), ('python', 2), ('whoosh', 2)],
+            )
+            self.assertEqual(os.listdir(tmp), [f'{os.getpid()}.json'])
+
+            again = PopularQueryTracker(capacity=20, snapshot_dir=tmp)
+            self.assertEqual(again.top(1, window='all', now=now)[0][1], 2)
+
+    def test_week_window_merges_closed_hours_once_per_hour(self):
+        tracker = PopularQueryTracker(capacity=20)
+        now = 1000 * HOUR
+        for hour in range(1, 100):
+            tracker.record('python', now=now - hour * HOUR)
+
+        calls = []
+        merged = tracker._merged
+        tracker._merged = lambda first, last: calls.append((first, last)) or merged(first, last)
+        for _ in range(5):
+            tracker.record('flask', now=now)
+            self.assertEqual(tracker.top(1, window='week', now=now), [('python', 99)])
+        self.assertEqual(len(calls), 1)
+
+        # 补录已结束的小时后重新合并
+        tracker.record('flask', now=now - 2 * HOUR)
+        self.assertEqual(tracker.top(2, window='week', now=now), [('python', 99), ('flask', 6)])
+        self.assertEqual(len(calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import unittest
+from unittest.mock import patch, MagicMock
+
+from app import create_app, db
+from app.models import User, Post
+from app.search_queue import SearchIndexQueue, ACTION_UPSERT, ACTION_DELETE
+
+
+class SearchIndexQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.service = MagicMock()
+        self.service.apply_index_batch.return_value = True
+        # app=None：在当前测试的应用上下文中执行，不启动后台线程
+        self.queue = SearchIndexQueue(self.service, async_mode=False)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _create_post(self, title='Post', published=True):
+        post = Post(title=title, content='<p>content</p>', user_id=self.user.id, published=published)
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def test_enqueue_deduplicates_and_batches_into_one_commit(self):
+        p1 = self._create_post('one')
+        p2 = self._create_post('two')
+
+        for _ in range(5):
+            self.queue.enqueue(p1.id)
+        self.queue.enqueue(p2.id)
+        self.assertEqual(self.queue.depth(), 2)
+
+        processed = self.queue.flush()
+
+        self.assertEqual(processed, 2)
+        self.assertEqual(self.queue.depth(), 0)
+        self.service.apply_index_batch.assert_called_once()
+        posts, delete_ids = self.service.apply_index_batch.call_args[0]
+        self.assertEqual(sorted(p.id for p in posts), sorted([p1.id, p2.id]))
+        self.assertEqual(set(delete_ids), set())
+
+        stats = self.queue.stats()
+        self.assertEqual(stats['deduplicated_total'], 4)
+        self.assertEqual(stats['batches_total'], 1)
+        self.assertEqual(stats['last_batch_size'], 2)
+        self.assertEqual(stats['pid'], os.getpid())
+
+    def test_unpublished_and_missing_posts_are_deleted(self):
+        draft = self._create_post('draft', published=False)
+        self.queue.enqueue_many({draft.id: ACTION_UPSERT, 9999: ACTION_UPSERT, 42: ACTION_DELETE})
+
+        self.queue.flush()
+
+        posts, delete_ids = self.service.apply_index_batch.call_args[0]
+        self.assertEqual(posts, [])
+        self.assertEqual(set(delete_ids), {draft.id, 9999, 42})
+
+    def test_failed_batch_is_requeued(self):
+        post = self._create_post()
+        self.service.apply_index_batch.return_value = False
+        self.queue.enqueue(post.id)
+
+        self.assertEqual(self.queue.flush(), 0)
+        self.assertEqual(self.queue.depth(), 1)
+        self.assertEqual(self.queue.stats()['failures_total'], 1)
+
+        self.service.apply_index_batch.return_value = True
+        self.assertEqual(self.queue.flush(), 1)
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_hooks_enqueue_only_after_commit(self):
+        with patch('app.search_hooks.get_search_index_queue', return_value=self.queue):
+            post = Post(title='hooked', content='c', user_id=self.user.id, published=True)
+            db.session.add(post)
+            db.session.flush()
+            # 未提交前不入队
+            self.assertEqual(self.queue.depth(), 0)
+            db.session.commit()
+            self.assertEqual(self.queue.depth(), 1)
+
+            # 回滚的修改不会入队
+            self.queue.flush()
+            post.title = 'changed'
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(self.queue.depth(), 0)
+
+    def test_view_count_changes_are_not_enqueued(self):
+        with patch('app.search_hooks.get_search_index_queue', return_value=self.queue):
+            post = self._create_post('viewed')
+            self.queue.flush()
+
+            post.views = (post.views or 0) + 1
+            db.session.commit()
+            self.assertEqual(self.queue.depth(), 0)
+
+            post.title = 'renamed'
+            db.session.commit()
+            self.assertEqual(self.queue.depth(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
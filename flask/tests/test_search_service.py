@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app, db, cache
+from app.models import User, Post, Tag
+from app.search_service import AdvancedSearchService, WHOOSH_MODULES_IMPORTED
+
+
+@unittest.skipUnless(WHOOSH_MODULES_IMPORTED, 'whoosh 未安装')
+class SearchServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+
+        cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.index_dir = os.path.join(self.tmpdir, 'search_index')
+        self.service = AdvancedSearchService(index_dir=self.index_dir)
+        self.service._deferred_init()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _create_post(self, title, published=True, tags=()):
+        post = Post(title=title, content='<p>body</p>', user_id=self.user.id, published=published)
+        post.tags = [Tag(name=name) for name in tags]
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def test_rebuild_streams_published_posts_and_swaps_index(self):
+        self._create_post('python tips', tags=('python',))
+        self._create_post('flask guide')
+        self._create_post('draft', published=False)
+        old_index = self.service.index
+
+        self.assertTrue(self.service.rebuild_index(batch_size=1))
+
+        self.assertIsNot(self.service.index, old_index)
+        self.assertEqual(self.service.index.doc_count(), 2)
+        self.assertEqual(self.service.last_rebuild_stats['documents'], 2)
+        self.assertEqual(os.listdir(self.tmpdir), ['search_index'])
+
+        # 再次重建后只保留当前版本与上一个版本
+        self.assertTrue(self.service.rebuild_index())
+        self.assertTrue(self.service.rebuild_index())
+        versions = sorted(name for name in os.listdir(self.index_dir) if name != 'CURRENT')
+        self.assertEqual(len(versions), 2)
+        with open(os.path.join(self.index_dir, 'CURRENT')) as f:
+            self.assertEqual(f.read(), versions[-1])
+
+    def test_other_process_picks_up_rebuilt_version(self):
+        self._create_post('python tips')
+        other = AdvancedSearchService(index_dir=self.index_dir)
+        other._deferred_init()
+        self.assertEqual(other.search('python')['total'], 0)
+
+        self.assertTrue(self.service.rebuild_index())
+        self.assertEqual(other.search('python')['total'], 1)
+
+    def test_catch_up_removes_posts_deleted_during_rebuild(self):
+        keep = self._create_post('python tips')
+        gone = self._create_post('python extra')
+        gone_id = gone.id
+        stream = self.service._iter_published_posts
+
+        def delete_while_streaming(batch_size):
+            posts = list(stream(batch_size))
+            # 文章已经读出后被其他进程删除，删除写入的是旧版本索引
+            db.session.delete(gone)
+            db.session.commit()
+            yield from posts
+
+        self.service._iter_published_posts = delete_while_streaming
+        # 不经过全局索引队列，追平直接写入本服务的索引
+        with mock.patch('app.search_service.get_search_index_queue', return_value=None):
+            self.assertTrue(self.service.rebuild_index())
+
+        self.assertEqual(self.service._indexed_ids(), {keep.id})
+        self.assertNotIn(gone_id, [r['id'] for r in self.service.search('python')['results']])
+
+    def test_multiprocess_rebuild_merges_worker_segments(self):
+        # Whoosh 每个子进程处理 100 篇一批，超过两批才会启动两个写入进程
+        total = 210
+        db.session.add_all(
+            Post(title=f'post {i} {"alpha" if i < total // 2 else "omega"}', content='<p>body</p>',
+                 user_id=self.user.id, published=True)
+            for i in range(total)
+        )
+        db.session.commit()
+
+        self.assertTrue(self.service.rebuild_index(batch_size=50, procs=2))
+
+        index = self.service.index
+        self.assertEqual(self.service.last_rebuild_stats['procs'], 2)
+        # multisegment=True：每个写入进程各产出一个段，合并后的索引包含全部文档
+        self.assertGreaterEqual(len(index._segments()), 2)
+        self.assertEqual(index.doc_count(), total)
+        with index.searcher() as searcher:
+            ids = {fields['id'] for fields in searcher.all_stored_fields()}
+        self.assertEqual(ids, {post.id for post in Post.query.all()})
+        self.assertEqual(self.service.search('alpha', per_page=5)['total'], total // 2)
+        self.assertEqual(self.service.search('omega', per_page=5)['total'], total - total // 2)
+        self.assertEqual(os.listdir(self.tmpdir), ['search_index'])
+
+    def test_failed_rebuild_keeps_live_index(self):
+        self._create_post('python tips')
+        self.assertTrue(self.service.rebuild_index())
+        live_index = self.service.index
+
+        def broken(batch_size):
+            raise RuntimeError('boom')
+            yield  # pragma: no cover
+
+        self.service._iter_published_posts = broken
+        self.assertFalse(self.service.rebuild_index())
+
+        self.assertIs(self.service.index, live_index)
+        self.assertEqual(self.service.index.doc_count(), 1)
+        self.assertEqual(os.listdir(self.tmpdir), ['search_index'])
+
+    def test_suggestions_use_prefix_index_and_refresh_incrementally(self):
+        self._create_post('python tips', tags=('pythonic',))
+        self._create_post('pytest guide')
+        self.assertTrue(self.service.rebuild_index())
+
+        texts = [s['text'] for s in self.service.get_search_suggestions('py')]
+        self.assertEqual(sorted(texts), ['pytest', 'python', 'pythonic'])
+        types = {s['text']: s['type'] for s in self.service.get_search_suggestions('py')}
+        self.assertEqual(types['pythonic'], 'tag')
+
+        # 增量写入新文档后立即可补全；删除后对应词条消失
+        post = self._create_post('pyramid basics')
+        self.assertTrue(self.service.add_post_to_index(post))
+        self.assertIn('pyramid', [s['text'] for s in self.service.get_search_suggestions('pyr')])
+        self.assertTrue(self.service.remove_post_from_index(post.id))
+        self.assertEqual(self.service.get_search_suggestions('pyr'), [])
+
+        # 中缀匹配（n-gram）
+        self.assertIn('pytest', [s['text'] for s in self.service.get_search_suggestions('tes')])
+
+    def test_popular_queries_boost_suggestion_order(self):
+        self._create_post('flask routing')
+        self._create_post('flake8 config')
+        self.assertTrue(self.service.rebuild_index())
+
+        for _ in range(3):
+            self.service.suggestions.record_query('flake8')
+        suggestions = self.service.get_search_suggestions('fla')
+        self.assertEqual(suggestions[0]['text'], 'flake8')
+
+    def test_result_cache_hits_until_index_commit(self):
+        self._create_post('python tips')
+        self.assertTrue(self.service.rebuild_index())
+
+        first = self.service.search('python')
+        self.assertEqual(first['total'], 1)
+        # 归一化后相同的查询命中缓存
+        self.assertEqual(self.service.search('  PYTHON ')['results'], first['results'])
+        cache_stats = self.service.get_stats()['result_cache']
+        self.assertEqual((cache_stats['hits'], cache_stats['misses']), (1, 1))
+
+        # 索引提交后代数变化，旧缓存失效
+        post = self._create_post('python advanced')
+        self.assertTrue(self.service.add_post_to_index(post))
+        self.assertEqual(self.service.search('python')['total'], 2)
+        self.assertEqual(self.service.get_stats()['result_cache']['misses'], 2)
+
+    def test_unchanged_indexed_fields_keep_result_cache(self):
+        post = self._create_post('python tips')
+        self.assertTrue(self.service.rebuild_index())
+        self.service.search('python')
+        generation = self.service._index_generation()
+
+        # 只有浏览量变化、或删除不在索引中的文章：不提交，代数不变，缓存继续命中
+        post.views = 42
+        db.session.commit()
+        self.assertTrue(self.service.apply_index_batch([post], [9999]))
+        self.assertEqual(self.service._index_generation(), generation)
+        self.service.search('python')
+        self.assertEqual(self.service.get_stats()['result_cache']['hits'], 1)
+
+        post.title = 'python tricks'
+        db.session.commit()
+        self.assertTrue(self.service.apply_index_batch([post]))
+        self.assertNotEqual(self.service._index_generation(), generation)
+
+    def test_search_pagination_beyond_last_page_is_empty(self):
+        for i in range(3):
+            self._create_post(f'python {i}')
+        self.assertTrue(self.service.rebuild_index())
+
+        page2 = self.service.search('python', page=2, per_page=2)
+        self.assertEqual(page2['total'], 3)
+        self.assertEqual(len(page2['results']), 1)
+        self.assertEqual(self.service.search('python', page=5, per_page=2)['results'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
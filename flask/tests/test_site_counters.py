@@ -0,0 +1,142 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Post, Comment, Category, SiteCounter
+from app.cache_service import get_cached_categories
+from app.query_optimization import QueryOptimization
+from app.site_counters import POST_VIEWS, get_counters, reconcile_counters, compute_expected
+
+
+class SiteCounterTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        self.python = Category(name='python')
+        self.flask = Category(name='flask')
+        db.session.add_all([self.user, self.python, self.flask])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _post(self, title, published=True, category=None):
+        post = Post(title=title, slug=title, content='body', author=self.user,
+                    published=published, category=category)
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def assertCountersMatchData(self):
+        # 浏览量只在对账时重新计算
+        stored = {(c.name, c.scope_id): c.value for c in SiteCounter.query if c.value and c.name != POST_VIEWS}
+        expected = {key: value for key, value in compute_expected().items() if value and key[0] != POST_VIEWS}
+        self.assertEqual(stored, expected)
+
+    def test_counters_follow_orm_changes(self):
+        first = self._post('first', category=self.python)
+        draft = self._post('draft', published=False, category=self.python)
+        self._post('other', category=self.flask)
+        comment = Comment(content='hi', author=self.user, post=first, approved=False)
+        db.session.add(comment)
+        db.session.commit()
+
+        counters = get_counters()
+        self.assertEqual(counters['posts'], 3)
+        self.assertEqual(counters['posts_published'], 2)
+        self.assertEqual(counters['comments'], 1)
+        self.assertEqual(counters.get('comments_approved', 0), 0)
+        self.assertEqual(counters['categories'], 2)
+        self.assertCountersMatchData()
+
+        # 过期后赋相同的值不应重复计数
+        db.session.expire_all()
+        first.published = True
+        draft.published = True
+        comment.approved = True
+        first.views = (first.views or 0) + 3
+        db.session.commit()
+        self.assertCountersMatchData()
+
+        draft.category = self.flask
+        db.session.commit()
+        self.assertCountersMatchData()
+
+        db.session.delete(first)
+        db.session.commit()
+        self.assertCountersMatchData()
+        self.assertEqual(get_counters()['comments'], 0)
+
+        # 回滚的修改不影响计数
+        self._post('rolled back').published = False
+        db.session.flush()
+        db.session.rollback()
+        self.assertCountersMatchData()
+
+        categories = {c.Category.name: c.post_count for c in QueryOptimization.get_categories_with_post_counts()}
+        self.assertEqual(categories, {'flask': 2, 'python': 0})
+        self.assertEqual(get_cached_categories(), [{'name': 'flask', 'post_count': 2}])
+
+    def test_stats_reads_do_not_scan_tables(self):
+        self._post('first', category=self.python)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            stats = QueryOptimization.get_statistics_optimized()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertEqual(stats['posts']['published'], 1)
+        self.assertEqual(stats['users']['total'], 1)
+        self.assertEqual(len(statements), 1)
+        self.assertIn('FROM site_counter', statements[0])
+
+    def test_view_changes_do_not_write_counters(self):
+        post = self._post('first', category=self.python)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            post.views = (post.views or 0) + 5
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertFalse([s for s in statements if 'site_counter' in s])
+        # 浏览量在对账时重新聚合，不计为偏差
+        self.assertEqual(reconcile_counters(), {})
+        self.assertEqual(get_counters()[POST_VIEWS], 5)
+
+    def test_reconcile_corrects_drift_from_bulk_updates(self):
+        self._post('first', category=self.python)
+        self._post('second', category=self.python)
+        # 批量更新绕过 ORM 事件
+        Post.query.update({Post.published: False}, synchronize_session=False)
+        db.session.commit()
+        self.assertEqual(get_counters()['posts_published'], 2)
+
+        drift = reconcile_counters()
+        self.assertEqual(drift[('posts_published', 0)], -2)
+        self.assertEqual(drift[('category_published_posts', self.python.id)], -2)
+        self.assertEqual(get_counters()['posts_published'], 0)
+        self.assertCountersMatchData()
+        self.assertEqual(reconcile_counters(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Post
+
+
+class SitemapTests(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['SITEMAP_MAX_URLS'] = 2
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.user = User(username='alice', email='alice@example.com')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+        self.posts = []
+        for i in range(1, 6):
+            post = Post(title=f'Post {i}', slug=f'post-{i}', content='body', user_id=self.user.id,
+                        published=(i != 3))
+            db.session.add(post)
+            self.posts.append(post)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_index_lists_shards_with_published_posts(self):
+        response = self.client.get('/blog/sitemap.xml')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('<sitemapindex', body)
+        self.assertIn('/blog/sitemap-pages.xml', body)
+        for number in (0, 1, 2):
+            self.assertIn(f'/blog/sitemap-posts-{number}.xml', body)
+        self.assertNotIn('sitemap-posts-3.xml', body)
+
+        shard = self.client.get('/blog/sitemap-posts-1.xml').get_data(as_text=True)
+        self.assertIn('/blog/post/4</loc>', shard)
+        self.assertNotIn('/blog/post/3</loc>', shard)
+        self.assertEqual(shard.count('<url>'), 1)
+
+        pages = self.client.get('/blog/sitemap-pages.xml').get_data(as_text=True)
+        self.assertIn('<urlset', pages)
+        self.assertNotIn('/blog/sitemap.xml', pages)
+        self.assertEqual(self.client.get('/blog/sitemap-other.xml').status_code, 404)
+
+    def test_shard_query_selects_only_needed_columns(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.client.get('/blog/sitemap-posts-0.xml')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        post_queries = [s for s in statements if 'FROM post' in s]
+        self.assertEqual(len(post_queries), 1)
+        self.assertNotIn('post.content', post_queries[0])
+
+    def test_conditional_requests_and_incremental_invalidation(self):
+        first = self.client.get('/blog/sitemap-posts-0.xml')
+        etag = first.headers['ETag']
+        self.assertIsNotNone(first.last_modified)
+        cached = self.client.get('/blog/sitemap-posts-0.xml', headers={'If-None-Match': etag})
+        self.assertEqual(cached.status_code, 304)
+        shard1_etag = self.client.get('/blog/sitemap-posts-1.xml').headers['ETag']
+        index_etag = self.client.get('/blog/sitemap.xml').headers['ETag']
+
+        # 浏览量变化不影响站点地图
+        self.posts[0].views = 10
+        db.session.commit()
+        self.assertEqual(self.client.get('/blog/sitemap-posts-0.xml',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+
+        # 发布 post 3 只使其所在分片与索引失效；索引重新生成后内容不变，ETag 也不变
+        self.posts[2].published = True
+        db.session.commit()
+        self.assertEqual(self.client.get('/blog/sitemap-posts-0.xml',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+        updated = self.client.get('/blog/sitemap-posts-1.xml', headers={'If-None-Match': shard1_etag})
+        self.assertEqual(updated.status_code, 200)
+        self.assertIn('/blog/post/3</loc>', updated.get_data(as_text=True))
+        self.assertEqual(self.client.get('/blog/sitemap.xml').headers['ETag'], index_etag)
+
+        # 分片中不再有已发布文章时从索引中移除
+        self.posts[4].published = False
+        db.session.commit()
+        self.assertNotIn('sitemap-posts-2.xml', self.client.get('/blog/sitemap.xml').get_data(as_text=True))
+
+        # 回滚的修改不会触发失效
+        self.posts[0].title = 'changed'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.client.get('/blog/sitemap-posts-0.xml',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+
+
+if __name__ == '__main__':
+    unittest.main()
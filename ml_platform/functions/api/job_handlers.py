@@ -0,0 +1,194 @@
+"""
+异步训练任务 API 处理模块
+提交训练任务后立即返回任务 ID，由工作进程 (Cloud Tasks 队列或本地进程池) 执行训练，
+各阶段进度写入 training_jobs 文档，客户端轮询或订阅该文档。
+"""
+
+import os
+import traceback
+from datetime import datetime
+from firebase_functions import https_fn
+from firebase_admin import firestore
+
+from api.ml_handlers import parse_train_request, run_training
+from ml_engine.progress import TrainingCancelled
+from utils.job_store import (
+    ConcurrencyLimitExceeded,
+    JobLease,
+    JobProgress,
+    claim_job,
+    create_job,
+    fail_abandoned_job,
+    finish_job,
+    get_job,
+    request_cancel
+)
+
+# 异步任务不受 Callable 超时限制，可处理更多样本并使用更长的自动优选时间预算
+JOB_MAX_SAMPLES = 200000
+JOB_TIME_BUDGET = 1200
+
+# 执行任务的 Cloud Tasks 队列函数 (main.py 中的 run_training_job)
+TASK_FUNCTION_NAME = 'run_training_job'
+
+# 本地进程池大小 (模拟器或 ML_JOB_BACKEND=local 时使用)
+LOCAL_JOB_WORKERS = int(os.environ.get('ML_LOCAL_JOB_WORKERS', '2'))
+
+_local_executor = None
+
+
+def _job_backend() -> str:
+    """任务执行方式：tasks (Cloud Tasks 队列) 或 local (本地进程池)"""
+    default = 'local' if os.environ.get('FUNCTIONS_EMULATOR') == 'true' else 'tasks'
+    return os.environ.get('ML_JOB_BACKEND', default)
+
+
+def _get_local_executor():
+    global _local_executor
+    if _local_executor is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        _local_executor = ProcessPoolExecutor(
+            max_workers=LOCAL_JOB_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _local_executor
+
+
+def dispatch_job(job_id: str) -> None:
+    """把任务交给工作进程"""
+    if _job_backend() == 'local':
+        _get_local_executor().submit(run_job, job_id)
+    else:
+        from firebase_admin import functions
+        functions.task_queue(TASK_FUNCTION_NAME).enqueue({'job_id': job_id})
+
+
+def _request_user_id(req: https_fn.CallableRequest, data: dict) -> str:
+    if req.auth is not None:
+        return req.auth.uid
+    return (data or {}).get('user_id') or 'anonymous'
+
+
+def _serialize(value):
+    """把 Firestore 时间戳转换为 ISO 字符串"""
+    if isinstance(value, dict):
+        return {k: _serialize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_serialize(v) for v in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _get_owned_job(req: https_fn.CallableRequest) -> dict:
+    data = req.data or {}
+    job_id = data.get('job_id')
+    if not job_id or not isinstance(job_id, str):
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='无效的任务ID')
+
+    job = get_job(firestore.client(), job_id)
+    if job is None or job.get('user_id') != _request_user_id(req, data):
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.NOT_FOUND, message='任务不存在')
+    return job
+
+
+def handle_submit_job(req: https_fn.CallableRequest) -> dict:
+    """提交训练任务 (Callable)，参数与 train_ml_model 相同"""
+    try:
+        data = req.data
+        params = parse_train_request(data, user_id=_request_user_id(req, data))
+        db = firestore.client()
+        try:
+            job_id = create_job(db, params['user_id'], params)
+        except ConcurrencyLimitExceeded as e:
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.RESOURCE_EXHAUSTED, message=str(e))
+
+        try:
+            dispatch_job(job_id)
+        except Exception as e:
+            finish_job(db, job_id, 'failed', error=f'任务分发失败: {str(e)}')
+            raise
+
+        return {'status': 'queued', 'job_id': job_id}
+
+    except https_fn.HttpsError:
+        raise
+    except Exception as e:
+        print(f"提交训练任务失败: {traceback.format_exc()}")
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'服务器内部错误: {str(e)}')
+
+
+def handle_get_job(req: https_fn.CallableRequest) -> dict:
+    """查询训练任务状态与进度 (Callable)"""
+    try:
+        job = _get_owned_job(req)
+        if job.get('status') == 'running' and fail_abandoned_job(firestore.client(), job['id']):
+            job = _get_owned_job(req)
+        job.pop('params', None)
+        return {'status': 'success', 'job': _serialize(job)}
+    except https_fn.HttpsError:
+        raise
+    except Exception as e:
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=str(e))
+
+
+def handle_cancel_job(req: https_fn.CallableRequest) -> dict:
+    """取消训练任务 (Callable)"""
+    try:
+        job = _get_owned_job(req)
+        job_status = request_cancel(firestore.client(), job['id'])
+        return {'status': 'success', 'job_id': job['id'], 'job_status': job_status}
+    except https_fn.HttpsError:
+        raise
+    except Exception as e:
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=str(e))
+
+
+def run_job(job_id: str) -> None:
+    """执行训练任务 (工作进程入口)"""
+    import firebase_admin
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        # 本地进程池的子进程需要单独初始化
+        firebase_admin.initialize_app()
+
+    db = firestore.client()
+    # 只有排队中或租约已过期 (上一个工作进程崩溃) 的任务会被领取，重复分发不会重复训练
+    job = claim_job(db, job_id)
+    if job is None:
+        print(f"训练任务 {job_id} 不存在或已被处理，跳过")
+        return
+
+    with JobLease(db, job_id, job['lease_id']) as lease:
+        try:
+            result = run_training(
+                job['params'],
+                progress=JobProgress(db, job_id, lease=lease),
+                max_samples=JOB_MAX_SAMPLES,
+                time_budget=JOB_TIME_BUDGET
+            )
+        except TrainingCancelled:
+            if lease.lost.is_set():
+                # 租约已被其他工作进程接管，由对方写入最终状态
+                print(f"训练任务 {job_id} 的租约已失效，停止执行")
+                return
+            print(f"训练任务 {job_id} 已取消")
+            finish_job(db, job_id, 'cancelled')
+            return
+        except https_fn.HttpsError as e:
+            finish_job(db, job_id, 'failed', error=e.message)
+            return
+        except Exception as e:
+            print(f"训练任务 {job_id} 失败: {traceback.format_exc()}")
+            finish_job(db, job_id, 'failed', error=f'服务器内部错误: {str(e)}')
+            return
+
+    try:
+        finish_job(db, job_id, 'succeeded', result=result)
+    except Exception as e:
+        # 可视化数据可能超出 Firestore 文档大小上限，保留指标与实验 ID
+        print(f"保存训练结果失败: {e}")
+        result.pop('visualization_data', None)
+        finish_job(db, job_id, 'succeeded', result=result)
@@ -0,0 +1,138 @@
+"""
+算法知识库
+数据保存在 algorithm_knowledge.json，MCP Server 读取同一文件；知识库已能完整回答的请求 (例如按复杂度、
+适用场景对比已收录的算法) 直接在本地生成结果，不调用模型；模型不可用时也用它给出简要回答。
+"""
+
+from typing import Any, Dict, List, Optional
+import json
+import os
+
+# Cloud Functions 与 MCP Server 共用的知识库数据文件
+KNOWLEDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'algorithm_knowledge.json')
+
+
+def load_algorithm_knowledge(path: str = KNOWLEDGE_PATH) -> Dict[str, Any]:
+    """读取算法知识库：{分类: {算法键名: 信息}}"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+ALGORITHM_KNOWLEDGE = load_algorithm_knowledge()
+
+# 对比维度 -> 表格列
+_CRITERIA_COLUMNS = {
+    'complexity': ['复杂度'],
+    'use_cases': ['适用场景'],
+    'pros_cons': ['优点', '缺点'],
+}
+
+
+def _normalize_name(name: str) -> str:
+    return name.strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def find_algorithm(name: str, category: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """按键名 (quick_sort / Quick Sort) 或中文名 (快速排序) 查找算法"""
+    if not isinstance(name, str) or not name.strip():
+        return None
+    key = _normalize_name(name)
+    categories = [category] if category in ALGORITHM_KNOWLEDGE else list(ALGORITHM_KNOWLEDGE)
+    for cat in categories:
+        for algo_key, info in ALGORITHM_KNOWLEDGE[cat].items():
+            if key == algo_key or name.strip() == info['name']:
+                return info
+    return None
+
+
+def _format_complexity(info: Dict[str, Any]) -> Optional[str]:
+    complexity = info.get('complexity')
+    if not complexity:
+        return None
+    return ', '.join(f"{k}: {v}" for k, v in complexity.items())
+
+
+def _criteria_cells(info: Dict[str, Any], criterion: str) -> List[Optional[str]]:
+    if criterion == 'complexity':
+        return [_format_complexity(info)]
+    if criterion == 'use_cases':
+        return [info.get('use_cases')]
+    if criterion == 'pros_cons':
+        return [info.get('pros'), info.get('cons')]
+    return [None]
+
+
+def _compare_table(infos: List[Dict[str, Any]], criteria: List[str], allow_missing: bool) -> Optional[str]:
+    header = ['算法', '原理']
+    for criterion in criteria:
+        header += _CRITERIA_COLUMNS.get(criterion, [criterion])
+    rows = []
+    for info in infos:
+        cells = [info['name'], info.get('principle', '-')]
+        for criterion in criteria:
+            values = _criteria_cells(info, criterion)
+            if not allow_missing and any(v is None for v in values):
+                return None
+            cells += [v or '-' for v in values]
+        rows.append(cells)
+    lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * len(header)]
+    lines += ['| ' + ' | '.join(row) + ' |' for row in rows]
+    return '\n'.join(lines)
+
+
+def local_answer(tool: str, arguments: Dict[str, Any]) -> Optional[str]:
+    """
+    知识库能完整回答时返回本地生成的结果，否则返回 None
+
+    目前只覆盖 compare_algorithms：所有算法都已收录，且对比维度都是知识库中的结构化字段。
+    """
+    if tool != 'compare_algorithms':
+        return None
+    algorithms = arguments.get('algorithms') or []
+    category = arguments.get('category')
+    criteria = arguments.get('comparison_criteria') or ['complexity', 'use_cases']
+    if not isinstance(algorithms, list) or len(algorithms) < 2 or category not in ALGORITHM_KNOWLEDGE:
+        return None
+    if not all(c in _CRITERIA_COLUMNS for c in criteria):
+        return None
+    infos = [find_algorithm(name, category) for name in algorithms]
+    if any(info is None for info in infos):
+        return None
+    table = _compare_table(infos, criteria, allow_missing=False)
+    if table is None:
+        return None
+    return f"## {category} 算法对比\n\n{table}"
+
+
+def fallback_answer(tool: str, arguments: Dict[str, Any]) -> Optional[str]:
+    """模型不可用时根据知识库给出的简要回答，知识库没有相关信息时返回 None"""
+    if tool == 'explain_algorithm':
+        info = find_algorithm(arguments.get('algorithm_name', ''), arguments.get('category'))
+        if info is None:
+            return None
+        lines = [f"## {info['name']}"]
+        if info.get('type'):
+            lines.append(f"- 类型: {info['type']}")
+        if info.get('principle'):
+            lines.append(f"- 原理: {info['principle']}")
+        if _format_complexity(info):
+            lines.append(f"- 复杂度: {_format_complexity(info)}")
+        if info.get('use_cases'):
+            lines.append(f"- 适用场景: {info['use_cases']}")
+        if info.get('pros'):
+            lines.append(f"- 优点: {info['pros']}")
+        if info.get('cons'):
+            lines.append(f"- 缺点: {info['cons']}")
+        if info.get('hyperparameters'):
+            lines.append(f"- 主要超参数: {', '.join(info['hyperparameters'])}")
+        return '\n'.join(lines)
+
+    if tool == 'compare_algorithms':
+        infos = [find_algorithm(name, arguments.get('category')) for name in arguments.get('algorithms') or []]
+        infos = [info for info in infos if info is not None]
+        if not infos:
+            return None
+        criteria = [c for c in arguments.get('comparison_criteria') or ['complexity', 'use_cases'] if c in _CRITERIA_COLUMNS]
+        return _compare_table(infos, criteria, allow_missing=True)
+
+    return None
@@ -9,18 +9,110 @@ import uuid
 import os
 import requests
 import traceback
+from requests.adapters import HTTPAdapter
 from firebase_functions import https_fn
-from .prompts import build_prompt_for_tool, get_valid_tools
+from .prompts import PROMPT_TEMPLATE_VERSION, build_prompt_for_tool, get_valid_tools
+from .knowledge import fallback_answer, local_answer
+from utils.response_cache import FirestoreCacheRemote, ResponseCache, response_cache_key
+from utils.tool_stats import ToolStats
+
+# 各工具响应的缓存时间 (秒)；未列出的工具 (对话、调试、练习题等) 每次都调用模型
+CACHE_TTLS = {
+    'explain_algorithm': 7 * 24 * 3600,
+    'compare_algorithms': 7 * 24 * 3600,
+    'explain_concept': 7 * 24 * 3600,
+    'suggest_hyperparameters': 24 * 3600,
+    'generate_visualization_code': 24 * 3600,
+    'analyze_ml_results': 3600,
+}
+
+# 实例级的缓存、统计与 HTTP 会话 (热启动的请求复用)
+_response_cache = ResponseCache(remote=FirestoreCacheRemote())
+_tool_stats = ToolStats()
+_session = None
+
+
+def _get_session() -> requests.Session:
+    """复用 TCP/TLS 连接的 HTTP 会话"""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        _session = session
+    return _session
+
+
+def _generate(prompt: str, model_name: str, api_key: str, request_id: str) -> dict:
+    """调用 Gemini API，返回 {'text', 'input_tokens', 'output_tokens'}"""
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+    payload = {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {
+            "maxOutputTokens": 8192,
+            "temperature": 0.7
+        }
+    }
+
+    try:
+        response = _get_session().post(url, params={'key': api_key}, json=payload, timeout=60)
+        if response.status_code != 200:
+            error_msg = f"AI API Error: {response.status_code} - {response.text}"
+            print(f"[{request_id}] {error_msg}")
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.UNAVAILABLE, message=error_msg)
+
+        response.raise_for_status()
+        api_data = response.json()
+    except https_fn.HttpsError:
+        raise
+    except requests.exceptions.Timeout:
+         raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.DEADLINE_EXCEEDED, message='AI 服务请求超时')
+    except Exception as e:
+        error_msg = f"AI API 错误: {str(e)}"
+        print(f"[{request_id}] {error_msg}")
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.UNAVAILABLE, message=f'AI 服务调用失败: {str(e)}')
+
+    # 解析响应
+    try:
+        if 'candidates' not in api_data or not api_data['candidates']:
+             # 检查安全拦截
+             block_reason = api_data.get('promptFeedback', {}).get('blockReason', 'UNKNOWN')
+             raise https_fn.HttpsError(
+                 code=https_fn.FunctionsErrorCode.ABORTED,
+                 message=f'内容被阻止: {block_reason}'
+             )
+
+        candidate = api_data['candidates'][0]
+        finish_reason = candidate.get('finishReason', 'UNKNOWN')
+
+        if finish_reason != 'STOP':
+             raise https_fn.HttpsError(
+                 code=https_fn.FunctionsErrorCode.DATA_LOSS,
+                 message=f'生成未完成: {finish_reason}'
+             )
+
+        result_text = candidate['content']['parts'][0]['text']
+
+    except (KeyError, IndexError) as e:
+        print(f"[{request_id}] 响应解析异常: {str(e)}")
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message='AI 响应格式异常')
+
+    usage = api_data.get('usageMetadata', {})
+    return {
+        'text': result_text,
+        'input_tokens': usage.get('promptTokenCount', 0),
+        'output_tokens': usage.get('candidatesTokenCount', 0)
+    }
+
 
 def handle_mcp_chat(req: https_fn.CallableRequest, api_key: str) -> dict:
     """内部处理 MCP 聊天请求的逻辑 (Callable)"""
-    
+
     request_start_time = time.time()
     request_id = str(uuid.uuid4())[:8]
-    
+
     try:
         print(f"[{request_id}] MCP请求开始 (Callable)")
-        
+
         # 1. 验证请求数据
         data = req.data
         if not data:
@@ -28,10 +120,10 @@ def handle_mcp_chat(req: https_fn.CallableRequest, api_key: str) -> dict:
 
         tool = data.get('tool')
         arguments = data.get('arguments', {})
-        
+
         if not tool or not isinstance(tool, str):
             raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='无效的工具名称')
-            
+
         valid_tools = get_valid_tools()
         if tool not in valid_tools:
             raise https_fn.HttpsError(
@@ -39,84 +131,50 @@ def handle_mcp_chat(req: https_fn.CallableRequest, api_key: str) -> dict:
                 message=f'未知的工具: {tool}',
                 details={'valid_tools': valid_tools}
             )
-            
+
         if tool == "debug_models":
-            url = f"https://generativelanguage.googleapis.com/v1/models?key={api_key}"
-            response = requests.get(url, timeout=10)
+            url = "https://generativelanguage.googleapis.com/v1/models"
+            response = _get_session().get(url, params={'key': api_key}, timeout=10)
             if response.status_code != 200:
                 return {"error": f"{response.status_code} - {response.text}"}
             return response.json()
 
-        # 2. 准备 Prompt
+        # 2. 知识库能完整回答的请求直接本地生成
+        result_text = local_answer(tool, arguments)
+        if result_text is not None:
+            return _respond(request_id, tool, result_text, 'knowledge_base', request_start_time)
+
+        # 3. 准备 Prompt
         prompt = build_prompt_for_tool(tool, arguments)
         model_name = os.getenv("AI_MODEL", "gemini-2.5-flash")
-        
-        # 3. 调用 Gemini API
+
+        # 4. 调用 Gemini API (可缓存的工具按参数缓存，相同的并发请求只调用一次)
         if not api_key:
-             raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.FAILED_PRECONDITION, message='API Key 未配置')
-            
-        # 4. 执行请求 (使用 requests)
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={api_key}"
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "maxOutputTokens": 8192,
-                "temperature": 0.7
-            }
-        }
-        
+            result_text = fallback_answer(tool, arguments)
+            if result_text is not None:
+                return _respond(request_id, tool, result_text, 'fallback', request_start_time)
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.FAILED_PRECONDITION, message='API Key 未配置')
+
+        generate = lambda: _generate(prompt, model_name, api_key, request_id)
         try:
-            response = requests.post(url, json=payload, timeout=60)
-            if response.status_code != 200:
-                error_msg = f"AI API Error: {response.status_code} - {response.text}"
-                print(f"[{request_id}] {error_msg}")
-                raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.UNAVAILABLE, message=error_msg)
-                
-            response.raise_for_status()
-            api_data = response.json()
-        except https_fn.HttpsError:
+            if tool in CACHE_TTLS:
+                key = response_cache_key(tool, arguments, model_name, PROMPT_TEMPLATE_VERSION)
+                generated, source = _response_cache.get_or_compute(key, CACHE_TTLS[tool], generate)
+            else:
+                generated, source = generate(), 'computed'
+        except https_fn.HttpsError as e:
+            # 模型不可用时退回知识库的简要回答
+            result_text = fallback_answer(tool, arguments)
+            if e.code in (https_fn.FunctionsErrorCode.UNAVAILABLE, https_fn.FunctionsErrorCode.DEADLINE_EXCEEDED) \
+                    and result_text is not None:
+                return _respond(request_id, tool, result_text, 'fallback', request_start_time)
             raise
-        except requests.exceptions.Timeout:
-             raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.DEADLINE_EXCEEDED, message='AI 服务请求超时')
-        except Exception as e:
-            error_msg = f"AI API 错误: {str(e)}"
-            print(f"[{request_id}] {error_msg}")
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.UNAVAILABLE, message=f'AI 服务调用失败: {str(e)}')
-            
-        # 5. 解析响应
-        try:
-            if 'candidates' not in api_data or not api_data['candidates']:
-                 # 检查安全拦截
-                 block_reason = api_data.get('promptFeedback', {}).get('blockReason', 'UNKNOWN')
-                 raise https_fn.HttpsError(
-                     code=https_fn.FunctionsErrorCode.ABORTED,
-                     message=f'内容被阻止: {block_reason}'
-                 )
-                
-            candidate = api_data['candidates'][0]
-            finish_reason = candidate.get('finishReason', 'UNKNOWN')
-            
-            if finish_reason != 'STOP':
-                 raise https_fn.HttpsError(
-                     code=https_fn.FunctionsErrorCode.DATA_LOSS,
-                     message=f'生成未完成: {finish_reason}'
-                 )
-                
-            result_text = candidate['content']['parts'][0]['text']
-            
-        except (KeyError, IndexError) as e:
-            print(f"[{request_id}] 响应解析异常: {str(e)}")
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message='AI 响应格式异常')
-            
-        # 6. 返回结果
-        duration = time.time() - request_start_time
-        print(f"[{request_id}] 完成耗时: {duration:.2f}s")
-        
-        return {
-            'status': 'success',
-            'result': result_text,
-            'tool': tool
-        }
+
+        # 5. 返回结果 (只有实际调用模型的请求计入 token 成本)
+        if source == 'computed':
+            return _respond(request_id, tool, generated['text'], 'model', request_start_time,
+                            generated['input_tokens'], generated['output_tokens'])
+        return _respond(request_id, tool, generated['text'], f'cache:{source}', request_start_time)
 
     except https_fn.HttpsError:
         raise
@@ -125,3 +183,32 @@ def handle_mcp_chat(req: https_fn.CallableRequest, api_key: str) -> dict:
         print(f"[{request_id}] 全局异常: {traceback.format_exc()}")
         # 在开发调试阶段返回详细错误，生产环境应屏蔽
         raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'服务器内部错误: {error_detail}')
+
+
+def _respond(
+    request_id: str,
+    tool: str,
+    result_text: str,
+    source: str,
+    start_time: float,
+    input_tokens: int = 0,
+    output_tokens: int = 0
+) -> dict:
+    """记录统计并构造响应"""
+    duration = time.time() - start_time
+    cost = _tool_stats.record(tool, source, duration, input_tokens, output_tokens)
+    print(f"[{request_id}] {tool} 完成耗时: {duration:.2f}s 来源: {source} "
+          f"tokens: {input_tokens}/{output_tokens} 估算成本: ${cost:.6f}")
+
+    return {
+        'status': 'success',
+        'result': result_text,
+        'tool': tool,
+        'source': source,
+        'usage': {
+            'latency_ms': round(duration * 1000, 1),
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'cost_usd': round(cost, 6)
+        }
+    }
@@ -10,131 +10,217 @@ from firebase_admin import firestore
 import traceback
 import json
 
+from typing import Optional
 from ml_engine.preprocessing import preprocess_data
 from ml_engine.trainer import (
     train_classification_model, 
     train_regression_model, 
     train_clustering_model
 )
-from utils.storage import download_dataset_from_storage
+from ml_engine.auto_selection import DEFAULT_TIME_BUDGET
+from ml_engine.models import ModelFactory
+from ml_engine.progress import ProgressCallback, TrainingCancelled, report as report_progress
+from utils.storage import get_dataset_blob, load_dataset, StorageCacheRemote
+from utils.preprocess_cache import PreprocessingCache, preprocessing_key
+from utils.experiment_store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_experiment, list_experiments, list_rollups, save_experiment
 
-def handle_train_model(req: https_fn.CallableRequest) -> dict:
-    """处理模型训练请求 (Callable)"""
+# 同步训练 (Callable) 的采样上限与自动优选时间预算
+# 限制为 50,000 条样本 (自动优选并行训练并逐次减半淘汰候选，在时间预算内可处理)
+MAX_SAMPLES = 50000
+
+def parse_train_request(data: dict, user_id: str = None) -> dict:
+    """提取并验证训练参数，返回参数字典 (参数错误时抛出 INVALID_ARGUMENT)"""
+    if not data:
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='请求数据为空')
+    
+    # 提取参数
+    dataset_url = data.get('dataset_url')
+    model_config = data.get('model_config', {})
+    task_type = data.get('task_type', 'classification')
+    feature_columns = data.get('feature_columns', [])
+    target_column = data.get('target_column')
+    user_id = user_id or data.get('user_id', 'anonymous')
+    
+    # 新增可选参数
+    missing_strategy = data.get('missing_strategy', 'mean')
+    
+    # 参数验证
+    if not dataset_url or not isinstance(dataset_url, str):
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='无效的数据集URL')
+        
+    if not feature_columns or not isinstance(feature_columns, list):
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='特征列必须是非空列表')
+        
+    if target_column and not isinstance(target_column, str):
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='目标列名必须是字符串')
+        
+    if not isinstance(model_config, dict):
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='模型配置必须是字典')
+        
+    valid_strategies = ['mean', 'median', 'constant', 'drop']
+    if missing_strategy not in valid_strategies:
+         raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message=f'不支持的缺失值策略: {missing_strategy}, 可选: {valid_strategies}')
+         
+    # 验证特征列元素
+    if not all(isinstance(c, str) for c in feature_columns):
+         raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='特征列名必须全部为字符串')
+         
+    return {
+        'dataset_url': dataset_url,
+        'model_config': model_config,
+        'task_type': task_type,
+        'feature_columns': feature_columns,
+        'target_column': target_column,
+        'user_id': user_id,
+        'missing_strategy': missing_strategy
+    }
+
+def run_training(
+    params: dict,
+    progress: Optional[ProgressCallback] = None,
+    max_samples: int = MAX_SAMPLES,
+    time_budget: float = DEFAULT_TIME_BUDGET
+) -> dict:
+    """
+    执行训练流程：(预处理缓存) -> 下载 -> 预处理 -> 训练 -> 保存实验记录
+    
+    同步 Callable 与异步训练任务共用；progress 接收各阶段进度，抛出 TrainingCancelled 时中止。
+    
+    Returns:
+        与 train_ml_model 相同的响应字典
+    """
+    dataset_url = params['dataset_url']
+    model_config = params['model_config']
+    task_type = params['task_type']
+    feature_columns = params['feature_columns']
+    target_column = params['target_column']
+    user_id = params['user_id']
+    missing_strategy = params['missing_strategy']
+    
+    model_name = model_config.get('model_name', 'RandomForestClassifier')
+    hyperparameters = model_config.get('hyperparameters', {})
+    
+    supervised_target = target_column if task_type != 'clustering' else None
+    # 模型支持时保留稀疏的独热编码结果
+    sparse_output = task_type != 'clustering' and ModelFactory.supports_sparse(model_name)
+    
+    # 1. 预处理缓存：同一数据集版本与列配置直接复用拟合好的结果
+    report_progress(progress, 'stage', stage='download', status='running')
     try:
-        # 1. 获取参数 (CallableRequest 自动解析 data)
-        data = req.data
-        if not data:
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='请求数据为空')
-        
-        # 2. 提取参数
-        dataset_url = data.get('dataset_url')
-        model_config = data.get('model_config', {})
-        task_type = data.get('task_type', 'classification')
-        feature_columns = data.get('feature_columns', [])
-        target_column = data.get('target_column')
-        user_id = data.get('user_id', 'anonymous')
-        
-        # 新增可选参数
-        missing_strategy = data.get('missing_strategy', 'mean')
-        
-        # 3. 参数验证
-        if not dataset_url or not isinstance(dataset_url, str):
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='无效的数据集URL')
-            
-        if not feature_columns or not isinstance(feature_columns, list):
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='特征列必须是非空列表')
-            
-        if target_column and not isinstance(target_column, str):
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='目标列名必须是字符串')
-            
-        if not isinstance(model_config, dict):
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='模型配置必须是字典')
-            
-        valid_strategies = ['mean', 'median', 'constant', 'drop']
-        if missing_strategy not in valid_strategies:
-             raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message=f'不支持的缺失值策略: {missing_strategy}, 可选: {valid_strategies}')
-             
-        # 验证特征列元素
-        if not all(isinstance(c, str) for c in feature_columns):
-             raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='特征列名必须全部为字符串')
-            
-        # 4. 核心流程：下载 -> 预处理 -> 训练
+        blob = get_dataset_blob(dataset_url)
+        cache = PreprocessingCache(remote=StorageCacheRemote())
+        cache_key = preprocessing_key(
+            dataset=f"{blob.bucket.name}/{blob.name}",
+            generation=blob.generation,
+            feature_columns=feature_columns,
+            target_column=supervised_target,
+            task_type=task_type,
+            missing_strategy=missing_strategy,
+            sparse_output=sparse_output,
+            max_rows=max_samples
+        )
+        cached = cache.get(cache_key)
+    except Exception as e:
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'数据下载或读取失败: {str(e)}')
         
-        # 下载
+    if cached is not None:
+        print(f"命中预处理缓存: {cache_key}")
+        X, y = cached['X'], cached['y']
+        report_progress(progress, 'stage', stage='download', status='cached')
+        report_progress(progress, 'stage', stage='preprocess', status='cached')
+    else:
+        # 2. 下载 (流式读取所需列，超出上限时边读边采样；分类任务按类别分层)
         try:
-            df = download_dataset_from_storage(dataset_url)
-            
-            # 安全策略：如果数据量过大，进行下采样以避免 OOM / Timeout
-            # 限制为 20,000 条样本 (分类任务训练多模型，需要更保守的限制)
-            MAX_SAMPLES = 20000
-            if len(df) > MAX_SAMPLES:
-                print(f"Warning: Dataset size ({len(df)}) exceeds limit ({MAX_SAMPLES}). Downsampling...")
-                df = df.sample(n=MAX_SAMPLES, random_state=42)
-                
+            df = load_dataset(
+                dataset_url,
+                columns=feature_columns + ([supervised_target] if supervised_target else []),
+                target_column=supervised_target,
+                max_rows=max_samples,
+                stratify=task_type == 'classification' and supervised_target is not None,
+                blob=blob
+            )
         except Exception as e:
             raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'数据下载或读取失败: {str(e)}')
+        report_progress(progress, 'stage', stage='download', status='done')
             
-        # 预处理
+        # 3. 预处理
+        report_progress(progress, 'stage', stage='preprocess', status='running')
         try:
-            X, y = preprocess_data(df, feature_columns, target_column, task_type, missing_strategy)
+            X, y, preprocessor = preprocess_data(
+                df, feature_columns, target_column, task_type, missing_strategy,
+                sparse_output=sparse_output, return_preprocessor=True
+            )
         except Exception as e:
              raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'数据预处理失败: {str(e)}')
-            
-        # 训练
-        model_name = model_config.get('model_name', 'RandomForestClassifier')
-        hyperparameters = model_config.get('hyperparameters', {})
+        cache.put(cache_key, X, y, preprocessor)
+        report_progress(progress, 'stage', stage='preprocess', status='done')
         
-        try:
-            if task_type == 'classification':
-                if y is None:
-                    raise ValueError("分类任务需要目标列")
-                metrics, visualization_data = train_classification_model(X, y, model_name, hyperparameters)
-            elif task_type == 'regression':
-                if y is None:
-                    raise ValueError("回归任务需要目标列")
-                metrics, visualization_data = train_regression_model(X, y, model_name, hyperparameters)
-            elif task_type == 'clustering':
-                metrics, visualization_data = train_clustering_model(X, model_name, hyperparameters)
-            else:
-                raise ValueError(f"不支持的任务类型: {task_type}")
-        except Exception as e:
-            print(f"训练错误: {traceback.format_exc()}")
-            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'模型训练失败: {str(e)}')
-            
-        # 5. 持久化记录
-        try:
-            db = firestore.client()
-            experiment_record = {
-                'user_id': user_id,
-                'dataset_url': dataset_url,
-                'model_config': model_config,
-                'task_type': task_type,
-                'feature_columns': feature_columns,
-                'target_column': target_column,
-                'metrics': metrics,
-                'timestamp': firestore.SERVER_TIMESTAMP
-            }
-            experiment_ref = db.collection('experiments').add(experiment_record)
-            experiment_id = experiment_ref[1].id
-        except Exception as e:
-            # 记录失败不应阻断返回结果，但要记录日志
-            print(f"Firestore 写入失败: {str(e)}")
-            experiment_id = None
-            
-        # 6. 返回响应 (直接返回 dict)
-        return {
-            'status': 'success',
+    # 4. 训练
+    report_progress(progress, 'stage', stage='train', status='running')
+    try:
+        if task_type == 'classification':
+            if y is None:
+                raise ValueError("分类任务需要目标列")
+            metrics, visualization_data = train_classification_model(
+                X, y, model_name, hyperparameters, time_budget, progress=progress)
+        elif task_type == 'regression':
+            if y is None:
+                raise ValueError("回归任务需要目标列")
+            metrics, visualization_data = train_regression_model(
+                X, y, model_name, hyperparameters, time_budget, progress=progress)
+        elif task_type == 'clustering':
+            metrics, visualization_data = train_clustering_model(X, model_name, hyperparameters)
+        else:
+            raise ValueError(f"不支持的任务类型: {task_type}")
+    except TrainingCancelled:
+        raise
+    except Exception as e:
+        print(f"训练错误: {traceback.format_exc()}")
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'模型训练失败: {str(e)}')
+    report_progress(progress, 'stage', stage='train', status='done')
+        
+    # 5. 持久化记录
+    report_progress(progress, 'stage', stage='save', status='running')
+    try:
+        db = firestore.client()
+        experiment_record = {
+            'user_id': user_id,
+            'dataset_url': dataset_url,
+            'model_config': model_config,
+            'task_type': task_type,
+            'feature_columns': feature_columns,
+            'target_column': target_column,
             'metrics': metrics,
-            'visualization_data': visualization_data,
-            'model_info': {
-                'model_name': model_name,
-                'hyperparameters': hyperparameters,
-                'task_type': task_type,
-                'n_features': X.shape[1],
-                'n_samples': X.shape[0]
-            },
-            'experiment_id': experiment_id
+            'timestamp': firestore.SERVER_TIMESTAMP
         }
+        experiment_id = save_experiment(db, experiment_record)
+    except Exception as e:
+        # 记录失败不应阻断返回结果，但要记录日志
+        print(f"Firestore 写入失败: {str(e)}")
+        experiment_id = None
+    report_progress(progress, 'stage', stage='save', status='done')
+        
+    # 6. 返回响应 (直接返回 dict)
+    return {
+        'status': 'success',
+        'metrics': metrics,
+        'visualization_data': visualization_data,
+        'model_info': {
+            'model_name': model_name,
+            'hyperparameters': hyperparameters,
+            'task_type': task_type,
+            'n_features': X.shape[1],
+            'n_samples': X.shape[0]
+        },
+        'experiment_id': experiment_id
+    }
+
+def handle_train_model(req: https_fn.CallableRequest) -> dict:
+    """处理模型训练请求 (Callable)"""
+    try:
+        # CallableRequest 自动解析 data
+        params = parse_train_request(req.data)
+        return run_training(params)
         
     except https_fn.HttpsError:
         raise
@@ -142,34 +228,69 @@ def handle_train_model(req: https_fn.CallableRequest) -> dict:
         print(f"全局异常: {traceback.format_exc()}")
         raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=f'服务器内部错误: {str(e)}')
 
+def _isoformat_timestamps(record: dict) -> dict:
+    for key in ('timestamp', 'updated_at'):
+        if record.get(key):
+            record[key] = record[key].isoformat()
+    return record
+
 def handle_get_history(req: https_fn.CallableRequest) -> dict:
-    """处理获取历史记录请求 (Callable)"""
+    """
+    处理获取历史记录请求 (Callable)
+    
+    只读取实验摘要，按 cursor 分页；include_summary 为真时附带每个 (数据集, 任务) 的汇总。
+    完整指标通过 get_experiment_detail 按需获取。
+    """
     try:
         data = req.data or {}
         user_id = data.get('user_id') or 'anonymous'
-        limit = data.get('limit', 10)
+        limit = data.get('limit', DEFAULT_PAGE_SIZE)
+        cursor = data.get('cursor')
         
         try:
-            limit = int(limit)
+            limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
         except:
-            limit = 10
+            limit = DEFAULT_PAGE_SIZE
+        
+        if cursor is not None and not isinstance(cursor, str):
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='无效的分页游标')
         
-        # 查询 (Firestore logic remains same)
         db = firestore.client()
-        experiments_ref = db.collection('experiments')
-        query = experiments_ref.where('user_id', '==', user_id)\
-                               .order_by('timestamp', direction=firestore.Query.DESCENDING)\
-                               .limit(limit)
-        
-        experiments = []
-        for doc in query.stream():
-            experiment = doc.to_dict()
-            experiment['id'] = doc.id
-            if 'timestamp' in experiment and experiment['timestamp']:
-                experiment['timestamp'] = experiment['timestamp'].isoformat()
-            experiments.append(experiment)
-            
-        return {'status': 'success', 'experiments': experiments}
+        try:
+            experiments, next_cursor = list_experiments(db, user_id, limit, cursor)
+        except ValueError as e:
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message=str(e))
+        
+        response = {
+            'status': 'success',
+            'experiments': [_isoformat_timestamps(e) for e in experiments],
+            'next_cursor': next_cursor
+        }
+        if data.get('include_summary'):
+            response['summary'] = [_isoformat_timestamps(r) for r in list_rollups(db, user_id)]
+        return response
         
+    except https_fn.HttpsError:
+        raise
+    except Exception as e:
+        raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=str(e))
+
+def handle_get_experiment(req: https_fn.CallableRequest) -> dict:
+    """处理获取单个实验完整记录的请求 (Callable)"""
+    try:
+        data = req.data or {}
+        user_id = data.get('user_id') or 'anonymous'
+        experiment_id = data.get('experiment_id')
+        if not experiment_id or not isinstance(experiment_id, str):
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INVALID_ARGUMENT, message='无效的实验ID')
+        
+        experiment = get_experiment(firestore.client(), experiment_id)
+        if experiment is None or experiment.get('user_id') != user_id:
+            raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.NOT_FOUND, message='实验不存在')
+        
+        return {'status': 'success', 'experiment': _isoformat_timestamps(experiment)}
+        
+    except https_fn.HttpsError:
+        raise
     except Exception as e:
         raise https_fn.HttpsError(code=https_fn.FunctionsErrorCode.INTERNAL, message=str(e))
@@ -6,6 +6,9 @@ Prompt 模板管理模块
 import json
 from typing import Dict, Any, List
 
+# 修改任一提示词模板时递增，使 AI 响应缓存中的旧结果失效
+PROMPT_TEMPLATE_VERSION = 1
+
 def build_prompt_for_tool(tool: str, arguments: Dict[str, Any]) -> str:
     """
     为不同工具构建提示词
@@ -2,7 +2,7 @@
 机器学习模型实验平台 - Firebase Cloud Functions 后端入口
 """
 
-from firebase_functions import https_fn, options, params
+from firebase_functions import https_fn, tasks_fn, options, params
 from firebase_admin import initialize_app
 
 # 初始化 Firebase Admin (一次性)
@@ -25,6 +25,50 @@ def train_ml_model(req: https_fn.CallableRequest) -> any:
     from api.ml_handlers import handle_train_model
     return handle_train_model(req)
 
+@https_fn.on_call(
+    cors=options.CorsOptions(
+        cors_origins="*",
+        cors_methods=["POST"],
+    )
+)
+def submit_training_job(req: https_fn.CallableRequest) -> any:
+    """提交异步训练任务，立即返回任务 ID (Callable)"""
+    from api.job_handlers import handle_submit_job
+    return handle_submit_job(req)
+
+@https_fn.on_call(
+    cors=options.CorsOptions(
+        cors_origins="*",
+        cors_methods=["POST"],
+    )
+)
+def get_training_job(req: https_fn.CallableRequest) -> any:
+    """查询训练任务的状态与进度 (Callable)"""
+    from api.job_handlers import handle_get_job
+    return handle_get_job(req)
+
+@https_fn.on_call(
+    cors=options.CorsOptions(
+        cors_origins="*",
+        cors_methods=["POST"],
+    )
+)
+def cancel_training_job(req: https_fn.CallableRequest) -> any:
+    """取消训练任务 (Callable)"""
+    from api.job_handlers import handle_cancel_job
+    return handle_cancel_job(req)
+
+@tasks_fn.on_task_dispatched(
+    retry_config=options.RetryConfig(max_attempts=2, min_backoff_seconds=60),
+    rate_limits=options.RateLimits(max_concurrent_dispatches=10),
+    memory=options.MemoryOption.GB_4,
+    timeout_sec=1800  # 任务队列函数最长 30 分钟
+)
+def run_training_job(req: tasks_fn.CallableRequest) -> None:
+    """训练任务工作进程 (Cloud Tasks 队列)"""
+    from api.job_handlers import run_job
+    run_job(req.data['job_id'])
+
 @https_fn.on_call(
     cors=options.CorsOptions(
         cors_origins="*",
@@ -36,6 +80,17 @@ def get_experiment_history(req: https_fn.CallableRequest) -> any:
     from api.ml_handlers import handle_get_history
     return handle_get_history(req)
 
+@https_fn.on_call(
+    cors=options.CorsOptions(
+        cors_origins="*",
+        cors_methods=["POST"],
+    )
+)
+def get_experiment_detail(req: https_fn.CallableRequest) -> any:
+    """获取单个实验的完整记录 (Callable)"""
+    from api.ml_handlers import handle_get_experiment
+    return handle_get_experiment(req)
+
 @https_fn.on_call(
     cors=options.CorsOptions(
         cors_origins="*",
@@ -0,0 +1,268 @@
+"""
+自动模型优选引擎
+候选模型与交叉验证折在进程池中并行训练，并按逐次减半 (successive halving) 在递增的
+子样本上评估候选、提前淘汰较弱的模型；最后一轮保存的各折验证集预测直接用于给集成模型
+打分，集成模型无需再做一遍交叉验证。整个过程受时间预算约束。
+"""
+
+from typing import Dict, Any, Tuple, List, Optional
+import concurrent.futures
+import math
+import multiprocessing
+import time
+import numpy as np
+from .models import ModelFactory
+from .progress import ProgressCallback, checkpoint, report as report_progress
+
+# 自动优选的默认时间预算 (秒)，需为下载、预处理与最终训练留出余量 (函数超时 900 秒)
+DEFAULT_TIME_BUDGET = 480
+
+# 每轮保留 1/HALVING_FACTOR 的候选，同时训练样本翻倍
+HALVING_FACTOR = 2
+
+# 最后一轮至少保留的候选数 (两个以上才能组成集成)
+MIN_SURVIVORS = 2
+
+# 首轮每折训练样本数的下限，样本太少时评估结果不可靠
+MIN_RESOURCE = 1000
+
+ENSEMBLE_NAME = 'VotingEnsemble'
+
+# joblib 的超时抛出 multiprocessing.TimeoutError (不是内置 TimeoutError 的子类)
+RUNG_TIMEOUT_ERRORS = (TimeoutError, multiprocessing.TimeoutError, concurrent.futures.TimeoutError)
+
+
+def _fit_fold(
+    name: str,
+    hyperparameters: Dict[str, Any],
+    X: np.ndarray,
+    y: np.ndarray,
+    train_idx: np.ndarray,
+    val_idx: np.ndarray,
+    classes: Optional[np.ndarray]
+) -> Tuple[str, Optional[np.ndarray], Optional[str]]:
+    """在一折上训练并预测验证集 (在工作进程中执行)
+
+    分类任务返回按全局类别顺序对齐的概率矩阵，回归任务返回预测值；失败时返回错误信息。
+    """
+    try:
+        model = ModelFactory.create_model(name, hyperparameters)
+        model.fit(X[train_idx], y[train_idx])
+        X_val = X[val_idx]
+        if classes is None:
+            return name, np.asarray(model.predict(X_val), dtype=float), None
+
+        # 子样本中可能缺少部分类别，按全局类别顺序补齐概率列
+        columns = np.searchsorted(classes, model.classes_)
+        proba = np.zeros((len(val_idx), len(classes)))
+        if hasattr(model, 'predict_proba'):
+            proba[:, columns] = model.predict_proba(X_val)
+        else:
+            proba[np.arange(len(val_idx)), np.searchsorted(classes, model.predict(X_val))] = 1.0
+        return name, proba, None
+    except Exception as e:
+        return name, None, str(e)
+
+
+class AutoSelector:
+    """并行逐次减半的自动模型优选"""
+
+    def __init__(
+        self,
+        candidates: List[str],
+        hyperparameters: Dict[str, Any],
+        task_type: str = 'classification',
+        time_budget: float = DEFAULT_TIME_BUDGET,
+        n_jobs: int = -1,
+        random_state: int = 42,
+        progress: Optional[ProgressCallback] = None
+    ):
+        if task_type not in ('classification', 'regression'):
+            raise ValueError(f"不支持的任务类型: {task_type}")
+        self.candidates = list(candidates)
+        self.hyperparameters = hyperparameters or {}
+        self.task_type = task_type
+        self.time_budget = time_budget
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.progress = progress
+
+    # --- 调度 ---
+
+    def _fractions(self, n_train: int) -> List[float]:
+        """各轮使用的训练样本比例，最后一轮为全量"""
+        n_rungs = 1
+        remaining = len(self.candidates)
+        while remaining > MIN_SURVIVORS:
+            remaining = max(MIN_SURVIVORS, math.ceil(remaining / HALVING_FACTOR))
+            n_rungs += 1
+        min_fraction = min(1.0, MIN_RESOURCE / max(n_train, 1))
+        fractions = [max(HALVING_FACTOR ** (i - n_rungs + 1), min_fraction) for i in range(n_rungs)]
+        # 数据量较小时前几轮已是全量，合并为一轮
+        while len(fractions) > 1 and fractions[-2] >= 1.0:
+            fractions.pop(0)
+        return fractions
+
+    def _subsample(self, train_idx: np.ndarray, fraction: float, rng: np.random.Generator) -> np.ndarray:
+        if fraction >= 1.0:
+            return train_idx
+        size = max(int(len(train_idx) * fraction), 1)
+        if self.task_type == 'regression':
+            # 时序数据保留最近的一段，保持顺序
+            return train_idx[-size:]
+        return np.sort(rng.choice(train_idx, size=size, replace=False))
+
+    def _run_rung(self, X, y, folds, survivors, fraction, classes, deadline):
+        """并行训练一轮的 (候选 × 折)，返回 {name: [各折预测]} 与 {name: 错误}
+
+        超过 deadline 时放弃本轮剩余任务并抛出 TimeoutError。
+        """
+        from joblib import Parallel, delayed, effective_n_jobs
+
+        rng = np.random.default_rng(self.random_state)
+        tasks = [
+            (name, self._subsample(train_idx, fraction, rng), val_idx)
+            for train_idx, val_idx in folds
+            for name in survivors
+        ]
+        # joblib 的 timeout 只限制单个任务 (且单进程时不支持)，整轮的预算在取回结果时检查
+        timeout = max(deadline - time.time(), 1.0) if effective_n_jobs(self.n_jobs) > 1 else None
+        # 逐个取回结果，每完成一个 (候选 × 折) 检查一次取消与预算；关闭生成器时 joblib 放弃剩余任务
+        results = Parallel(n_jobs=self.n_jobs, timeout=timeout, return_as='generator')(
+            delayed(_fit_fold)(name, self.hyperparameters, X, y, train_idx, val_idx, classes)
+            for name, train_idx, val_idx in tasks
+        )
+
+        predictions = {name: [] for name in survivors}
+        errors = {}
+        finished = 0
+        try:
+            for name, prediction, error in results:
+                finished += 1
+                checkpoint(self.progress)
+                if error is not None:
+                    errors.setdefault(name, error)
+                else:
+                    predictions[name].append(prediction)
+                if finished < len(tasks) and time.time() > deadline:
+                    raise TimeoutError("本轮超出时间预算")
+        except RUNG_TIMEOUT_ERRORS as e:
+            raise TimeoutError(str(e) or "本轮超出时间预算") from e
+        finally:
+            results.close()
+        return {name: preds for name, preds in predictions.items() if name not in errors}, errors
+
+    # --- 打分 ---
+
+    def _score(self, fold_predictions, y, folds, classes) -> float:
+        """各折验证集得分的均值 (分类为准确率，回归为 MAE)"""
+        scores = []
+        for prediction, (_, val_idx) in zip(fold_predictions, folds):
+            if classes is not None:
+                scores.append(np.mean(classes[np.argmax(prediction, axis=1)] == y[val_idx]))
+            else:
+                scores.append(np.mean(np.abs(prediction - y[val_idx])))
+        return float(np.mean(scores))
+
+    def _is_better(self, score: float, best: Optional[float]) -> bool:
+        if best is None:
+            return True
+        return score > best if self.task_type == 'classification' else score < best
+
+    def _ranked(self, scores: Dict[str, float]) -> List[str]:
+        reverse = self.task_type == 'classification'
+        return sorted(scores, key=lambda name: scores[name], reverse=reverse)
+
+    # --- 入口 ---
+
+    def select(self, X: np.ndarray, y: np.ndarray, cv) -> Tuple[str, List[str], Dict[str, Any]]:
+        """逐次减半评估候选模型
+
+        Returns:
+            (胜出者名称, 最后一轮保留的候选, 模型选择报告)；集成胜出时名称为 VotingEnsemble
+        """
+        deadline = time.time() + self.time_budget
+        classes = np.unique(y) if self.task_type == 'classification' else None
+        folds = list(cv.split(X, y))
+        fractions = self._fractions(min(len(train_idx) for train_idx, _ in folds))
+
+        report: Dict[str, Any] = {}
+        survivors = list(self.candidates)
+        last_predictions: Dict[str, List[np.ndarray]] = {}
+        last_scores: Dict[str, float] = {}
+        rung_duration = 0.0
+
+        for rung, fraction in enumerate(fractions):
+            remaining = deadline - time.time()
+            # 下一轮样本翻倍，按上一轮耗时估算；预计超出预算时停止，使用已完成轮次的结果
+            if rung > 0 and remaining < rung_duration * HALVING_FACTOR:
+                break
+            report_progress(self.progress, 'rung', rung=rung, n_rungs=len(fractions), candidates=list(survivors))
+            rung_start = time.time()
+            try:
+                predictions, errors = self._run_rung(X, y, folds, survivors, fraction, classes, deadline)
+            except TimeoutError:
+                if rung == 0:
+                    raise RuntimeError("时间预算内没有完成任何候选模型的评估")
+                break
+            rung_duration = time.time() - rung_start
+
+            for name, error in errors.items():
+                report[name] = {'status': 'failed', 'error': error}
+                print(f"训练 {name} 失败: {error}")
+            if not predictions:
+                break
+
+            scores = {name: self._score(preds, y, folds, classes) for name, preds in predictions.items()}
+            n_samples = int(np.mean([len(train_idx) for train_idx, _ in folds]) * fraction)
+            for name, score in scores.items():
+                report[name] = {'mean_test_score': score, 'status': 'success', 'rung': rung, 'n_samples': n_samples}
+
+            ranked = self._ranked(scores)
+            if rung < len(fractions) - 1:
+                keep = max(MIN_SURVIVORS, math.ceil(len(ranked) / HALVING_FACTOR))
+                for name in ranked[keep:]:
+                    report[name]['status'] = 'pruned'
+                ranked = ranked[:keep]
+            for name in list(errors) + list(scores):
+                report_progress(self.progress, 'model', name=name, **report[name])
+            survivors = ranked
+            last_predictions = {name: predictions[name] for name in ranked}
+            last_scores = {name: scores[name] for name in ranked}
+
+        if not last_scores:
+            raise RuntimeError("没有模型训练成功")
+
+        best_name = self._ranked(last_scores)[0]
+        best_score = last_scores[best_name]
+
+        # 集成模型：复用各折验证集预测 (软投票为概率均值，回归为预测均值)
+        if len(survivors) > 1:
+            ensemble_predictions = [
+                np.mean([last_predictions[name][i] for name in survivors], axis=0)
+                for i in range(len(folds))
+            ]
+            ensemble_score = self._score(ensemble_predictions, y, folds, classes)
+            report[ENSEMBLE_NAME] = {'mean_test_score': ensemble_score, 'status': 'success', 'members': survivors}
+            report_progress(self.progress, 'model', name=ENSEMBLE_NAME, **report[ENSEMBLE_NAME])
+            if self._is_better(ensemble_score, best_score):
+                best_name = ENSEMBLE_NAME
+                print("Voting Ensemble 胜出")
+
+        return best_name, survivors, report
+
+    def fit(self, X: np.ndarray, y: np.ndarray, cv) -> Tuple[Any, Dict[str, Any]]:
+        """选出最佳模型 (或集成) 并在全部训练数据上训练，返回 (模型, 模型选择报告)"""
+        best_name, survivors, report = self.select(X, y, cv)
+        if best_name == ENSEMBLE_NAME:
+            estimators = [(name, ModelFactory.create_model(name, self.hyperparameters)) for name in survivors]
+            if self.task_type == 'classification':
+                from sklearn.ensemble import VotingClassifier
+                model = VotingClassifier(estimators=estimators, voting='soft', n_jobs=self.n_jobs)
+            else:
+                from sklearn.ensemble import VotingRegressor
+                model = VotingRegressor(estimators=estimators, n_jobs=self.n_jobs)
+        else:
+            model = ModelFactory.create_model(best_name, self.hyperparameters)
+        model.fit(X, y)
+        return model, report
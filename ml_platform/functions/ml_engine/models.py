@@ -6,9 +6,22 @@
 from typing import Dict, Any, Type, Optional
 import traceback
 
+# 接受 scipy 稀疏矩阵输入的模型 (AutoSelection 的候选均支持)
+SPARSE_INPUT_MODELS = {
+    'LogisticRegression', 'DecisionTreeClassifier', 'RandomForestClassifier', 'GradientBoostingClassifier',
+    'SVC', 'KNeighborsClassifier', 'LinearRegression', 'Ridge', 'Lasso', 'DecisionTreeRegressor',
+    'RandomForestRegressor', 'GradientBoostingRegressor', 'SVR', 'LGBMRegressor', 'LGBMClassifier',
+    'XGBRegressor', 'XGBClassifier', 'AutoSelection'
+}
+
 class ModelFactory:
     """管理所有支持的机器学习模型"""
 
+    @classmethod
+    def supports_sparse(cls, model_name: str) -> bool:
+        """模型是否可以直接使用稀疏特征矩阵训练"""
+        return model_name in SPARSE_INPUT_MODELS
+
     @classmethod
     def create_model(cls, model_name: str, hyperparameters: Dict[str, Any] = None) -> Any:
         """
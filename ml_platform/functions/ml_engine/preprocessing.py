@@ -3,17 +3,22 @@
 负责数据的清洗、编码和标准化
 """
 
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Any
 import pandas as pd
 import numpy as np
 
+# 分类列中缺失值的填充类别
+MISSING_CATEGORY = 'missing'
+
 def preprocess_data(
     df: pd.DataFrame, 
     feature_columns: List[str], 
     target_column: Optional[str] = None, 
     task_type: str = 'classification',
-    missing_strategy: str = 'mean'  # mean, median, constant, drop
-) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    missing_strategy: str = 'mean',  # mean, median, constant, drop
+    sparse_output: bool = False,
+    return_preprocessor: bool = False
+) -> Tuple[Any, ...]:
     """
     对数据进行预处理
     
@@ -23,13 +28,15 @@ def preprocess_data(
         target_column: 目标列名 (可选)
         task_type: 任务类型 ('classification', 'regression', 'clustering')
         missing_strategy: 缺失值处理策略
+        sparse_output: 独热编码较多、矩阵足够稀疏时返回 CSR 稀疏矩阵 (模型需支持稀疏输入)
+        return_preprocessor: 同时返回拟合好的 ColumnTransformer，便于复用于新数据
         
     Returns:
-        (X_scaled, y): 处理后的特征矩阵和目标向量
+        (X_scaled, y) 或 (X_scaled, y, preprocessor): 处理后的特征矩阵和目标向量
     """
     # 延迟导入 sklearn 组件
     from sklearn.compose import ColumnTransformer
-    from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
+    from sklearn.preprocessing import StandardScaler
     from sklearn.impute import SimpleImputer
     from sklearn.pipeline import Pipeline
     
@@ -83,13 +90,9 @@ def preprocess_data(
     numeric_transformer = Pipeline(steps=numeric_steps)
     
     # 2. 构建分类处理管道
-    categorical_transformer = Pipeline(steps=[
-        ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
-        # OneHot 对于高基数特征会导致维度爆炸，这里做一个简单判断
-        # 如果唯一值数量 > 10，使用 OrdinalEncoder (Label Encoding)
-        # 否则使用 OneHot
-        ('encoder', OneHotOrOrdinalEncoder()) 
-    ])
+    # OneHot 对于高基数特征会导致维度爆炸，编码器内部按唯一值数量选择：
+    # 唯一值数量 >= 10 使用 Ordinal (Label Encoding)，否则使用 OneHot；缺失值作为独立类别
+    categorical_transformer = OneHotOrOrdinalEncoder(sparse_output=sparse_output)
     
     # 组合预处理器
     preprocessor = ColumnTransformer(
@@ -97,14 +100,13 @@ def preprocess_data(
             ('num', numeric_transformer, numeric_features),
             ('cat', categorical_transformer, categorical_features)
         ],
-        remainder='drop' # 丢弃未列出的列（虽然上面已经只选了feature_columns）
+        remainder='drop', # 丢弃未列出的列（虽然上面已经只选了feature_columns）
+        # 不需要稀疏输出时直接拼接为密集矩阵 (有些模型不支持稀疏)
+        sparse_threshold=0.3 if sparse_output else 0
     )
     
     try:
         X_scaled = preprocessor.fit_transform(X)
-        # 如果是稀疏矩阵，转换为密集矩阵 (有些模型不支持稀疏)
-        if hasattr(X_scaled, 'toarray'):
-            X_scaled = X_scaled.toarray()
     except Exception as e:
         raise ValueError(f"特征预处理失败: {str(e)}")
 
@@ -133,6 +135,8 @@ def preprocess_data(
                      y = pd.to_numeric(y, errors='coerce').fillna(0)
                 y = y.values.astype(float)
                 
+    if return_preprocessor:
+        return X_scaled, y, preprocessor
     return X_scaled, y
 
 class OneHotOrOrdinalEncoder:
@@ -140,44 +144,79 @@ class OneHotOrOrdinalEncoder:
     智能编码器：
     低基数 (<10) -> OneHot
     高基数 (>=10) -> Ordinal
+    
+    所有分类列一次完成编码：每列用哈希表得到类别编号，再按 (行, 输出列) 坐标
+    一次性写入输出矩阵；sparse_output=True 时输出 CSR 稀疏矩阵。
+    缺失值编码为 'missing' 类别，未见过的类别在 OneHot 中为全 0，在 Ordinal 中为 -1。
     """
-    def __init__(self, threshold=10):
+    def __init__(self, threshold=10, sparse_output=False):
         self.threshold = threshold
-        self.transformers = {} # col_idx -> transformer
-        self.feature_names_out = None
+        self.sparse_output = sparse_output
+        self.categories_ = [] # 每列的类别 (pd.Index)
+        self.one_hot_ = [] # 每列是否使用 OneHot
+        self.offsets_ = [] # 每列在输出中的起始列
+        self.n_features_out_ = 0
         
-    def fit(self, X, y=None):
-        if hasattr(X, 'iloc'):
-            X = X.values
+    def get_params(self, deep=True):
+        return {'threshold': self.threshold, 'sparse_output': self.sparse_output}
         
-        n_features = X.shape[1]
-        self.transformers = {}
+    def set_params(self, **params):
+        for key, value in params.items():
+            setattr(self, key, value)
+        return self
         
-        from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+    @staticmethod
+    def _columns(X):
+        if hasattr(X, 'iloc'):
+            return [X.iloc[:, i] for i in range(X.shape[1])]
+        X = np.asarray(X, dtype=object)
+        return [pd.Series(X[:, i]) for i in range(X.shape[1])]
         
-        for i in range(n_features):
-            unique_count = len(np.unique(X[:, i].astype(str)))
-            if unique_count < self.threshold:
-                enc = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-            else:
-                enc = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
-            
-            enc.fit(X[:, i:i+1])
-            self.transformers[i] = enc
-            
+    def fit(self, X, y=None):
+        self.categories_, self.one_hot_, self.offsets_ = [], [], []
+        offset = 0
+        for column in self._columns(X):
+            values = column.astype(object).where(column.notna(), MISSING_CATEGORY)
+            uniques = pd.unique(values)
+            try:
+                uniques = np.sort(uniques)
+            except TypeError:
+                pass # 混合类型无法排序时保持出现顺序
+            one_hot = len(uniques) < self.threshold
+            self.categories_.append(pd.Index(uniques))
+            self.one_hot_.append(one_hot)
+            self.offsets_.append(offset)
+            offset += len(uniques) if one_hot else 1
+        self.n_features_out_ = offset
         return self
 
     def transform(self, X):
-        if hasattr(X, 'iloc'):
-            X = X.values
-            
-        output_arrays = []
-        for i in range(X.shape[1]):
-            enc = self.transformers[i]
-            col_transformed = enc.transform(X[:, i:i+1])
-            output_arrays.append(col_transformed)
-            
-        return np.hstack(output_arrays)
+        n_rows = X.shape[0]
+        rows, cols, data = [], [], []
+        row_index = np.arange(n_rows)
+        for column, categories, one_hot, offset in zip(self._columns(X), self.categories_, self.one_hot_, self.offsets_):
+            values = column.astype(object).where(column.notna(), MISSING_CATEGORY)
+            codes = categories.get_indexer(values)
+            if one_hot:
+                known = codes >= 0
+                rows.append(row_index[known])
+                cols.append(offset + codes[known])
+                data.append(np.ones(known.sum()))
+            else:
+                rows.append(row_index)
+                cols.append(np.full(n_rows, offset))
+                data.append(codes.astype(float))
+                
+        shape = (n_rows, self.n_features_out_)
+        if not rows:
+            return np.zeros(shape)
+        rows, cols, data = np.concatenate(rows), np.concatenate(cols), np.concatenate(data)
+        if self.sparse_output:
+            from scipy import sparse
+            return sparse.csr_matrix((data, (rows, cols)), shape=shape)
+        output = np.zeros(shape)
+        output[rows, cols] = data
+        return output
     
     def fit_transform(self, X, y=None):
         return self.fit(X, y).transform(X)
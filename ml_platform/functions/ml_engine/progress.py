@@ -0,0 +1,30 @@
+"""
+训练进度回调
+训练流程在各阶段调用 progress(event, **info) 报告进度：
+
+- ('stage', stage=..., status='running'|'done'|'cached')：下载、预处理、训练、保存等阶段
+- ('rung', rung=..., n_rungs=..., candidates=[...])：自动优选开始新一轮
+- ('model', name=..., status=..., mean_test_score=...)：某个候选模型 (或集成) 得到结果
+- ('checkpoint',)：长时间步骤内部的检查点 (例如每完成一个候选 × 折)，不写进度，只用于及时响应取消
+
+回调可以抛出 TrainingCancelled 中止训练 (例如任务被用户取消)。
+"""
+
+from typing import Callable, Optional
+
+ProgressCallback = Callable[..., None]
+
+
+class TrainingCancelled(Exception):
+    """训练被取消"""
+
+
+def report(progress: Optional[ProgressCallback], event: str, **info) -> None:
+    """未提供回调时不做任何事"""
+    if progress is not None:
+        progress(event, **info)
+
+
+def checkpoint(progress: Optional[ProgressCallback]) -> None:
+    """长时间步骤内部调用，让回调有机会检查取消标记"""
+    report(progress, 'checkpoint')
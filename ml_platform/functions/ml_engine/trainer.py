@@ -8,6 +8,8 @@ import time
 import numpy as np
 import pandas as pd
 from .models import ModelFactory
+from .auto_selection import AutoSelector, DEFAULT_TIME_BUDGET
+from .progress import ProgressCallback, report as report_progress
 
 # 定义支持自动优选的候选模型
 CANDIDATE_MODELS_REGRESSION = ['RandomForestRegressor', 'LGBMRegressor', 'XGBRegressor']
@@ -17,7 +19,9 @@ def train_classification_model(
     X: np.ndarray, 
     y: np.ndarray, 
     model_name: str, 
-    hyperparameters: Dict[str, Any]
+    hyperparameters: Dict[str, Any],
+    time_budget: float = DEFAULT_TIME_BUDGET,
+    progress: Optional[ProgressCallback] = None
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """训练分类模型 (支持自动模型选择)"""
     start_time = time.time()
@@ -29,7 +33,7 @@ def train_classification_model(
         confusion_matrix, classification_report,
         roc_curve, auc
     )
-    from sklearn.ensemble import VotingClassifier
+    from sklearn.model_selection import StratifiedKFold, KFold
     
     # 结果容器
     model_selection_report = {}
@@ -59,26 +63,33 @@ def train_classification_model(
             X, y, test_size=test_size, random_state=42, stratify=None
         )
 
-    # 3. 确定要训练的模型列表
+    # 自适应 CV 折数
+    # 如果训练集样本太少，或最小类样本太少，不能做 3-fold
+    train_min_class_count = np.min(np.unique(y_train, return_counts=True)[1])
+    n_splits = max(2, min(3, train_min_class_count))
+
+    # 3. 自动优选：候选模型与各折并行训练，逐次减半淘汰弱模型
+    if model_name == 'AutoSelection' and len(X_train) >= 5:
+        if train_min_class_count >= n_splits:
+            cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+        else:
+            cv = KFold(n_splits=n_splits, shuffle=True, random_state=42)
+        selector = AutoSelector(CANDIDATE_MODELS_CLASSIFICATION, hyperparameters, 'classification', time_budget,
+                                progress=progress)
+        best_model, model_selection_report = selector.fit(X_train, y_train, cv)
+
+    # 4. 单个模型 (或样本极少无法交叉验证时逐个训练候选)
     models_to_train = []
-    if model_name == 'AutoSelection':
-        models_to_train = CANDIDATE_MODELS_CLASSIFICATION
-    else:
+    if model_name != 'AutoSelection':
         models_to_train = [model_name]
-        
-    trained_estimators = []
+    elif best_model is None:
+        models_to_train = CANDIDATE_MODELS_CLASSIFICATION
 
-    # 4. 遍历训练
     for name in models_to_train:
         try:
             model = ModelFactory.create_model(name, hyperparameters)
             model.fit(X_train, y_train)
             
-            # 自适应 CV 折数
-            # 如果训练集样本太少，或最小类样本太少，不能做 3-fold
-            train_min_class_count = np.min(np.unique(y_train, return_counts=True)[1])
-            n_splits = max(2, min(3, train_min_class_count))
-            
             avg_cv_score = 0.0
             if n_splits < 2 or len(X_train) < 5:
                 # 样本太少无法 CV，直接用训练误差 (不准确但能跑通)
@@ -91,7 +102,6 @@ def train_classification_model(
                     avg_cv_score = float(np.mean(cv_scores))
                 except ValueError:
                     # 失败回退到普通 KFold (非分层)
-                    from sklearn.model_selection import KFold
                     kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
                     cv_scores = cross_val_score(model, X_train, y_train, cv=kf, scoring='accuracy')
                     avg_cv_score = float(np.mean(cv_scores))
@@ -101,8 +111,6 @@ def train_classification_model(
                 'status': 'success'
             }
             
-            trained_estimators.append((name, model))
-            
             if avg_cv_score > best_score:
                 best_score = avg_cv_score
                 best_model = model
@@ -110,28 +118,7 @@ def train_classification_model(
         except Exception as e:
             model_selection_report[name] = {'status': 'failed', 'error': str(e)}
             print(f"训练 {name} 失败: {e}")
-
-    # 5. 集成学习 (如果 AutoSelection 且有多个模型成功)
-    if model_name == 'AutoSelection' and len(trained_estimators) > 1:
-        try:
-            voting_clf = VotingClassifier(estimators=trained_estimators, voting='soft')
-            voting_clf.fit(X_train, y_train)
-            
-            cv_scores = cross_val_score(voting_clf, X_train, y_train, cv=3, scoring='accuracy')
-            avg_cv_score = float(np.mean(cv_scores))
-             
-            model_selection_report['VotingEnsemble'] = {
-                'mean_test_score': avg_cv_score,
-                'status': 'success'
-            }
-            
-            if avg_cv_score > best_score:
-                best_score = avg_cv_score
-                best_model = voting_clf
-                print("Voting Ensemble 胜出")
-                
-        except Exception as e:
-            model_selection_report['VotingEnsemble'] = {'status': 'failed', 'error': str(e)}
+        report_progress(progress, 'model', name=name, **model_selection_report[name])
 
     if best_model is None:
         raise RuntimeError("没有模型训练成功")
@@ -199,7 +186,9 @@ def train_regression_model(
     X: np.ndarray, 
     y: np.ndarray, 
     model_name: str, 
-    hyperparameters: Dict[str, Any]
+    hyperparameters: Dict[str, Any],
+    time_budget: float = DEFAULT_TIME_BUDGET,
+    progress: Optional[ProgressCallback] = None
 ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """训练回归模型 (支持自动模型选择和时间序列验证)"""
     start_time = time.time()
@@ -207,7 +196,6 @@ def train_regression_model(
     # 延迟导入
     from sklearn.model_selection import train_test_split, TimeSeriesSplit, cross_val_score
     from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-    from sklearn.ensemble import VotingRegressor
     
     model_selection_report = {}
     best_model = None
@@ -223,16 +211,16 @@ def train_regression_model(
     # 时序交叉验证器
     tscv = TimeSeriesSplit(n_splits=3)
     
-    # 3. 确定模型列表
-    models_to_train = []
+    # 3. 自动优选：候选模型与各折并行训练，逐次减半淘汰弱模型 (子样本取最近的一段)
     if model_name == 'AutoSelection':
-        models_to_train = CANDIDATE_MODELS_REGRESSION
+        selector = AutoSelector(CANDIDATE_MODELS_REGRESSION, hyperparameters, 'regression', time_budget,
+                                progress=progress)
+        best_model, model_selection_report = selector.fit(X_train, y_train, tscv)
+        models_to_train = []
     else:
         models_to_train = [model_name]
-        
-    trained_estimators = []
 
-    # 4. 遍历训练
+    # 4. 单个模型
     for name in models_to_train:
         try:
             model = ModelFactory.create_model(name, hyperparameters)
@@ -249,36 +237,13 @@ def train_regression_model(
                 'status': 'success'
             }
             
-            trained_estimators.append((name, model))
-            
             if avg_mae < best_score:
                 best_score = avg_mae
                 best_model = model
                 
         except Exception as e:
             model_selection_report[name] = {'status': 'failed', 'error': str(e)}
-
-    # 5. 集成学习
-    if model_name == 'AutoSelection' and len(trained_estimators) > 1:
-        try:
-            voting_reg = VotingRegressor(estimators=trained_estimators)
-            
-            cv_scores = cross_val_score(voting_reg, X_train, y_train, cv=tscv, scoring='neg_mean_absolute_error')
-            avg_mae = -np.mean(cv_scores)
-            
-            voting_reg.fit(X_train, y_train)
-             
-            model_selection_report['VotingEnsemble'] = {
-                'mean_test_score': float(avg_mae),
-                'status': 'success'
-            }
-            
-            if avg_mae < best_score:
-                best_score = avg_mae
-                best_model = voting_reg
-                
-        except Exception as e:
-            model_selection_report['VotingEnsemble'] = {'status': 'failed', 'error': str(e)}
+        report_progress(progress, 'model', name=name, **model_selection_report[name])
 
     if best_model is None:
         raise RuntimeError("没有模型训练成功")
@@ -307,7 +272,10 @@ def train_regression_model(
     # 注意 X_test 已经是 numpy array
     correlation_matrix = []
     try:
-        df_corr = pd.DataFrame(X_test[:, :10])
+        X_corr = X_test[:, :10]
+        if hasattr(X_corr, 'toarray'):
+            X_corr = X_corr.toarray()
+        df_corr = pd.DataFrame(X_corr)
         df_corr['target'] = y_test
         corr = df_corr.corr()
         correlation_matrix = corr.values.tolist()
@@ -0,0 +1,106 @@
+import sys
+import os
+import io
+import pytest
+import pandas as pd
+import numpy as np
+
+# Add functions directory to path so we can import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils import dataset_reader
+from utils.dataset_reader import read_dataset, detect_format, DatasetError, ReservoirSampler
+
+
+def _frame(n=1000):
+    return pd.DataFrame({
+        'a': np.arange(n, dtype=float),
+        'b': ['x' if i % 2 else 'y' for i in range(n)],
+        'unused': np.ones(n),
+        'label': [1 if i % 10 == 0 else 0 for i in range(n)],
+    })
+
+
+def test_csv_reads_only_requested_columns():
+    """Only the requested columns are parsed; numeric features are downcast to float32."""
+    buffer = io.BytesIO(_frame().to_csv(index=False).encode('utf-8'))
+    df = read_dataset(buffer, 'csv', ['a', 'b', 'label'], target_column='label')
+
+    assert list(df.columns) == ['a', 'b', 'label']
+    assert len(df) == 1000
+    assert df['a'].dtype == np.float32
+
+
+def test_csv_gbk_after_sample(monkeypatch):
+    """GBK content beyond the inference sample triggers a GBK re-read."""
+    monkeypatch.setattr(dataset_reader, 'SAMPLE_BYTES', 64)
+    text = 'a,city\n' + ''.join(f'{i},abc\n' for i in range(20)) + '21,北京\n'
+    df = read_dataset(io.BytesIO(text.encode('gbk')), 'csv', ['a', 'city'])
+
+    assert df['city'].iloc[-1] == '北京'
+
+
+def test_missing_column_raises():
+    buffer = io.BytesIO(_frame(10).to_csv(index=False).encode('utf-8'))
+    with pytest.raises(DatasetError):
+        read_dataset(buffer, 'csv', ['a', 'missing'])
+
+
+def test_stratified_sampling_keeps_class_ratio_and_order(monkeypatch):
+    """Sampling while reading keeps the class ratio and the original row order."""
+    monkeypatch.setattr(dataset_reader, 'CHUNK_ROWS', 100)
+    buffer = io.BytesIO(_frame(5000).to_csv(index=False).encode('utf-8'))
+    df = read_dataset(buffer, 'csv', ['a', 'label'], target_column='label', max_rows=500, stratify=True)
+
+    assert len(df) == 500
+    assert (df['label'] == 1).sum() == 50
+    assert df['a'].is_monotonic_increasing
+
+
+def test_rows_without_target_are_dropped():
+    frame = _frame(20)
+    frame.loc[3, 'label'] = None
+    df = read_dataset(io.BytesIO(frame.to_csv(index=False).encode('utf-8')), 'csv', ['a', 'label'], target_column='label')
+
+    assert len(df) == 19
+
+
+def test_reservoir_is_uniform_without_strata():
+    sampler = ReservoirSampler(100)
+    for start in range(0, 10000, 1000):
+        sampler.add(pd.DataFrame({'v': np.arange(start, start + 1000)}))
+    result = sampler.result()
+
+    assert len(result) == 100
+    # 均匀抽样：前后两半各占约一半
+    assert 30 < (result['v'] < 5000).sum() < 70
+
+
+def test_parquet_and_arrow_are_read_natively():
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(_frame(300), preserve_index=False)
+    parquet = io.BytesIO()
+    pq.write_table(table, parquet, row_group_size=100)
+    parquet.seek(0)
+    arrow = io.BytesIO()
+    with pa.ipc.new_file(arrow, table.schema) as writer:
+        writer.write_table(table, max_chunksize=100)
+    arrow.seek(0)
+
+    assert detect_format('data/train.parquet') == 'parquet'
+    assert detect_format('data/train.feather') == 'arrow'
+    for buffer, file_format in ((parquet, 'parquet'), (arrow, 'arrow')):
+        df = read_dataset(buffer, file_format, ['a', 'label'], target_column='label', max_rows=100, stratify=True)
+        assert list(df.columns) == ['a', 'label']
+        assert len(df) == 100
+
+
+def test_cache_roundtrip(monkeypatch, tmp_path):
+    monkeypatch.setattr(dataset_reader, 'CACHE_DIR', str(tmp_path))
+    key = dataset_reader.cache_key('bucket', 'file.csv', 1, ['a'], None, None, False)
+    assert dataset_reader.cache_get(key) is None
+    dataset_reader.cache_put(key, _frame(5))
+    assert len(dataset_reader.cache_get(key)) == 5
+    assert dataset_reader.cache_key('bucket', 'file.csv', 2, ['a'], None, None, False) != key
@@ -0,0 +1,48 @@
+import sys
+import os
+
+# Add functions directory to path so we can import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.experiment_store import build_summary, rollup_id, update_rollup
+
+
+def _record(model_name='RandomForestClassifier', accuracy=0.8):
+    return {
+        'user_id': 'u1',
+        'dataset_url': 'gs://bucket/data.csv',
+        'task_type': 'classification',
+        'target_column': 'label',
+        'feature_columns': ['a', 'b', 'c'],
+        'model_config': {'model_name': model_name, 'hyperparameters': {'n_estimators': 100}},
+        'metrics': {
+            'accuracy': accuracy,
+            'f1_score': 0.7,
+            'confusion_matrix': [[10, 2], [3, 9]],
+            'classification_report': {'0': {'precision': 0.8}},
+            'model_selection_report': {'A': {'mean_test_score': 0.7}}
+        },
+        'timestamp': 'ts'
+    }
+
+
+def test_summary_keeps_scalar_metrics_only():
+    """The summary keeps list-view fields and drops matrices, reports and hyperparameters."""
+    summary = build_summary(_record())
+
+    assert summary['metrics'] == {'accuracy': 0.8, 'f1_score': 0.7}
+    assert summary['model_config'] == {'model_name': 'RandomForestClassifier'}
+    assert summary['n_features'] == 3
+    assert summary['primary_metric'] == {'name': 'accuracy', 'value': 0.8, 'higher_is_better': True}
+
+
+def test_rollup_tracks_count_and_best_experiment():
+    """Rollups count every experiment and keep the best primary metric per dataset and task."""
+    rollup = update_rollup(None, build_summary(_record(accuracy=0.8)), 'e1')
+    rollup = update_rollup(rollup, build_summary(_record('LogisticRegression', accuracy=0.9)), 'e2')
+    rollup = update_rollup(rollup, build_summary(_record(accuracy=0.85)), 'e3')
+
+    assert rollup['count'] == 3
+    assert rollup['last_experiment_id'] == 'e3'
+    assert rollup['best'] == {'experiment_id': 'e2', 'model_name': 'LogisticRegression', 'metric': 'accuracy', 'value': 0.9}
+    assert rollup_id('u1', 'gs://bucket/data.csv', 'classification') != rollup_id('u1', 'gs://bucket/data.csv', 'regression')
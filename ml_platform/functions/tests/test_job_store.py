@@ -0,0 +1,122 @@
+import sys
+import os
+import pytest
+
+# Add functions directory to path so we can import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime, timedelta, timezone
+
+from ml_engine.progress import TrainingCancelled, checkpoint
+from utils import job_store
+from utils.job_store import JobProgress
+
+
+class _Snapshot:
+    def __init__(self, data):
+        self.exists = True
+        self._data = data
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class _DocRef:
+    def __init__(self):
+        self.updates = []
+        self.cancel_requested = False
+
+    def update(self, updates):
+        self.updates.append(updates)
+
+    def get(self, field_paths=None):
+        return _Snapshot({'cancel_requested': self.cancel_requested})
+
+
+class _DB:
+    def __init__(self, doc):
+        self.doc = doc
+
+    def collection(self, name):
+        assert name == job_store.JOBS_COLLECTION
+        return self
+
+    def document(self, job_id):
+        return self.doc
+
+
+def test_job_progress_writes_stage_rung_and_model_updates():
+    """Stage, rung and model events become field updates on the job document."""
+    doc = _DocRef()
+    progress = JobProgress(_DB(doc), 'job-1')
+
+    progress('stage', stage='preprocess', status='running')
+    progress('rung', rung=1, n_rungs=2, candidates=['A', 'B'])
+    progress('model', name='A', status='success', mean_test_score=float('nan'))
+
+    stage_update, rung_update, model_update = doc.updates
+    assert stage_update['stage'] == 'preprocess'
+    assert stage_update['stages.preprocess']['status'] == 'running'
+    assert stage_update['progress'] == job_store.STAGE_PROGRESS['preprocess']
+    assert rung_update['progress'] == pytest.approx(0.575)
+    assert model_update['models.A'] == {'status': 'success', 'mean_test_score': None}
+    assert all('updated_at' in update for update in doc.updates)
+
+
+def test_job_progress_raises_when_cancel_requested(monkeypatch):
+    """A cancel flag on the document aborts training at the next progress report."""
+    monkeypatch.setattr(job_store, 'CANCEL_CHECK_INTERVAL', 0)
+    doc = _DocRef()
+    progress = JobProgress(_DB(doc), 'job-1')
+    progress('stage', stage='train', status='running')
+
+    doc.cancel_requested = True
+    with pytest.raises(TrainingCancelled):
+        progress('model', name='A', status='success', mean_test_score=0.9)
+
+
+def test_claim_takes_queued_job_and_skips_live_lease():
+    """A queued job is claimed with a lease; a running job whose lease is still live is left alone."""
+    now = datetime.now(timezone.utc)
+    updates, claimed = job_store._claim_updates({'status': 'queued'}, now)
+    assert claimed
+    assert updates['status'] == 'running'
+    assert updates['attempts'] == 1
+    assert updates['lease_expires_at'] == now + timedelta(seconds=job_store.LEASE_SECONDS)
+
+    running = {'status': 'running', 'attempts': 1, 'lease_expires_at': now + timedelta(seconds=10)}
+    assert job_store._claim_updates(running, now) == (None, False)
+    assert job_store._claim_updates({'status': 'succeeded'}, now) == (None, False)
+
+
+def test_expired_lease_is_reclaimed_then_failed_after_max_attempts():
+    """A crashed worker's job is retried once more, and marked failed when attempts run out."""
+    now = datetime.now(timezone.utc)
+    crashed = {'status': 'running', 'attempts': 1, 'lease_expires_at': now - timedelta(seconds=1)}
+    updates, claimed = job_store._claim_updates(crashed, now)
+    assert claimed
+    assert updates['attempts'] == 2
+    assert 'started_at' not in updates
+
+    crashed['attempts'] = job_store.MAX_JOB_ATTEMPTS
+    updates, claimed = job_store._claim_updates(crashed, now)
+    assert not claimed
+    assert updates['status'] == 'failed'
+
+    crashed['cancel_requested'] = True
+    updates, claimed = job_store._claim_updates(crashed, now)
+    assert not claimed
+    assert updates['status'] == 'cancelled'
+
+
+def test_checkpoint_aborts_when_lease_sees_cancel():
+    """Checkpoints inside long steps raise as soon as the heartbeat has seen the cancel flag."""
+    doc = _DocRef()
+    lease = job_store.JobLease(_DB(doc), 'job-1', 'lease-1')
+    progress = JobProgress(_DB(doc), 'job-1', lease=lease)
+    checkpoint(progress)
+    assert doc.updates == []
+
+    lease.cancelled.set()
+    with pytest.raises(TrainingCancelled):
+        checkpoint(progress)
@@ -0,0 +1,79 @@
+import sys
+import os
+import numpy as np
+
+# Add functions directory to path so we can import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.preprocess_cache import PreprocessingCache, preprocessing_key
+
+
+class DictRemote:
+    """In-memory stand-in for the Storage remote."""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def download(self, key, local_path):
+        if key not in self.blobs:
+            return False
+        with open(local_path, 'wb') as f:
+            f.write(self.blobs[key])
+        return True
+
+    def upload(self, key, local_path):
+        with open(local_path, 'rb') as f:
+            self.blobs[key] = f.read()
+
+
+def test_key_depends_on_generation_and_spec():
+    base = dict(dataset='b/data.csv', generation=1, feature_columns=['a', 'b'], target_column='y',
+                task_type='classification', missing_strategy='mean')
+    assert preprocessing_key(**base) == preprocessing_key(**dict(base))
+    assert preprocessing_key(**base) != preprocessing_key(**{**base, 'generation': 2})
+    assert preprocessing_key(**base) != preprocessing_key(**{**base, 'feature_columns': ['b', 'a']})
+    assert preprocessing_key(**base) != preprocessing_key(**{**base, 'missing_strategy': 'median'})
+
+
+def test_local_roundtrip_and_remote_fallback(tmp_path):
+    remote = DictRemote()
+    key = preprocessing_key(dataset='b/data.csv', generation=1)
+    X, y = np.arange(6.0).reshape(3, 2), np.array([0, 1, 0])
+
+    writer = PreprocessingCache(cache_dir=str(tmp_path / 'a'), remote=remote, signing_key=b'secret')
+    assert writer.get(key) is None
+    writer.put(key, X, y, preprocessor={'fitted': True})
+    assert key in remote.blobs
+    assert np.array_equal(writer.get(key)['X'], X)
+
+    # A fresh instance with an empty disk pulls the entry from the remote
+    reader = PreprocessingCache(cache_dir=str(tmp_path / 'b'), remote=remote, signing_key=b'secret')
+    entry = reader.get(key)
+    assert np.array_equal(entry['y'], y)
+    assert entry['preprocessor'] == {'fitted': True}
+
+
+def test_rejects_unsigned_or_tampered_entries(tmp_path):
+    remote = DictRemote()
+    key = preprocessing_key(dataset='b/data.csv', generation=1)
+    PreprocessingCache(cache_dir=str(tmp_path / 'a'), remote=remote, signing_key=b'secret').put(
+        key, np.zeros((2, 2)), np.zeros(2), preprocessor=None
+    )
+
+    # Signed with a different key
+    other = PreprocessingCache(cache_dir=str(tmp_path / 'b'), remote=remote, signing_key=b'other')
+    assert other.get(key) is None
+    assert not os.path.exists(os.path.join(str(tmp_path / 'b'), f"{key}.joblib"))
+
+    # Payload modified after signing
+    tampered = bytearray(remote.blobs[key])
+    tampered[-1] ^= 0xFF
+    remote.blobs[key] = bytes(tampered)
+    reader = PreprocessingCache(cache_dir=str(tmp_path / 'c'), remote=remote, signing_key=b'secret')
+    assert reader.get(key) is None
+
+
+def test_remote_disabled_without_signing_key(tmp_path, monkeypatch):
+    monkeypatch.delenv('ML_CACHE_SIGNING_KEY', raising=False)
+    cache = PreprocessingCache(cache_dir=str(tmp_path), remote=DictRemote())
+    assert cache.remote is None
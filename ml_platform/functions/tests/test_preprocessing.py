@@ -93,3 +93,38 @@ def test_target_missing():
     
     assert X.shape[0] == 2
     assert len(y) == 2
+
+def test_sparse_output_keeps_one_hot_sparse():
+    """With sparse_output the encoded matrix stays CSR when it is sparse enough."""
+    df = pd.DataFrame({
+        'num': np.arange(40, dtype=float),
+        'cat1': [f'a{i % 9}' for i in range(40)],
+        'cat2': [f'b{i % 8}' for i in range(40)],
+        'target': [i % 2 for i in range(40)]
+    })
+
+    X_dense, _ = preprocess_data(df, feature_columns=['num', 'cat1', 'cat2'], target_column='target')
+    X_sparse, _, preprocessor = preprocess_data(
+        df, feature_columns=['num', 'cat1', 'cat2'], target_column='target',
+        sparse_output=True, return_preprocessor=True
+    )
+
+    assert isinstance(X_dense, np.ndarray)
+    assert hasattr(X_sparse, 'toarray')
+    assert np.allclose(X_sparse.toarray(), X_dense)
+    # The fitted preprocessor can be reused on new rows
+    assert preprocessor.transform(df[['num', 'cat1', 'cat2']].head(3)).shape == (3, X_dense.shape[1])
+
+def test_encoder_missing_and_unknown_categories():
+    """Missing values become their own category; unseen categories encode as zeros / -1."""
+    from ml_engine.preprocessing import OneHotOrOrdinalEncoder
+
+    train = pd.DataFrame({'low': ['a', None, 'b', 'a'], 'high': [str(i) for i in range(4)]})
+    encoder = OneHotOrOrdinalEncoder(threshold=4).fit(train)
+    # low: a, b, missing -> 3 one-hot columns; high: 4 unique (>= threshold) -> 1 ordinal column
+    assert encoder.n_features_out_ == 4
+
+    out = encoder.transform(pd.DataFrame({'low': ['z', None], 'high': ['1', 'unseen']}))
+    assert out[0, :3].tolist() == [0, 0, 0]
+    assert out[1, :3].sum() == 1
+    assert out[:, 3].tolist() == [1, -1]
@@ -0,0 +1,80 @@
+import sys
+import os
+import threading
+import time
+import pytest
+
+# Add functions directory to path so we can import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.knowledge import fallback_answer, local_answer
+from api.prompts import get_valid_tools
+from utils.response_cache import ResponseCache, response_cache_key
+
+
+def test_key_ignores_whitespace_and_empty_arguments():
+    """Equivalent arguments map to one key; model and template version are part of it."""
+    a = response_cache_key('explain_algorithm', {'algorithm_name': ' quick_sort ', 'category': 'sorting', 'detail_level': None}, 'm', 1)
+    b = response_cache_key('explain_algorithm', {'category': 'sorting', 'algorithm_name': 'quick_sort'}, 'm', 1)
+    assert a == b
+    assert a != response_cache_key('explain_algorithm', {'category': 'sorting', 'algorithm_name': 'quick_sort'}, 'm', 2)
+    assert a != response_cache_key('explain_algorithm', {'category': 'sorting', 'algorithm_name': 'quick_sort'}, 'other', 1)
+
+
+def test_concurrent_identical_requests_call_once_and_expire():
+    """Concurrent misses share one computation; entries expire after the TTL."""
+    now = [0.0]
+    cache = ResponseCache(clock=lambda: now[0])
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'text': 'answer'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', 60, compute))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(source for _, source in results) == ['coalesced'] * 3 + ['computed']
+    assert cache.get_or_compute('k', 60, compute) == ({'text': 'answer'}, 'memory')
+
+    now[0] = 61
+    cache.get_or_compute('k', 60, compute)
+    assert len(calls) == 2
+
+
+def test_errors_are_not_cached():
+    cache = ResponseCache()
+
+    def fail():
+        raise RuntimeError('upstream down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('k', 60, fail)
+    assert cache.get_or_compute('k', 60, lambda: 'ok') == ('ok', 'computed')
+
+
+def test_knowledge_base_fast_path_and_fallback():
+    """Structured comparisons of known algorithms are answered locally; other requests go to the model."""
+    answer = local_answer('compare_algorithms', {'algorithms': ['quick_sort', '归并排序'], 'category': 'sorting'})
+    assert 'O(n log n)' in answer and '快速排序' in answer and '归并排序' in answer
+
+    assert local_answer('compare_algorithms', {'algorithms': ['quick_sort', 'heap_sort'], 'category': 'sorting'}) is None
+    assert local_answer('compare_algorithms', {'algorithms': ['quick_sort', 'merge_sort'], 'category': 'sorting',
+                                               'comparison_criteria': ['performance']}) is None
+    assert local_answer('explain_algorithm', {'algorithm_name': 'quick_sort', 'category': 'sorting'}) is None
+
+    assert '分治法' in fallback_answer('explain_algorithm', {'algorithm_name': 'Quick Sort', 'category': 'sorting'})
+
+
+def test_tool_stats_is_not_exposed_to_callers():
+    """Per-instance usage and cost stats are not a public tool of the callable function."""
+    assert 'tool_stats' not in get_valid_tools()
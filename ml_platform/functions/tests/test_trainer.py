@@ -0,0 +1,165 @@
+import sys
+import os
+import numpy as np
+
+# Add functions directory to path so we can import ml_engine
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ml_engine import auto_selection
+from ml_engine.auto_selection import AutoSelector, ENSEMBLE_NAME
+
+
+def _classification_data(n=600):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n, 5))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    return X, y
+
+
+def test_successive_halving_prunes_weak_candidates(monkeypatch):
+    """Weak candidates are dropped on the subsample rung; survivors reach the full rung."""
+    from sklearn.model_selection import StratifiedKFold
+
+    monkeypatch.setattr(auto_selection, 'MIN_RESOURCE', 50)
+    X, y = _classification_data()
+    selector = AutoSelector(
+        ['LogisticRegression', 'GaussianNB', 'DecisionTreeClassifier', 'KNeighborsClassifier'],
+        {}, 'classification', n_jobs=1
+    )
+    assert selector._fractions(400) == [0.5, 1.0]
+
+    best_name, survivors, report = selector.select(X, y, StratifiedKFold(n_splits=3, shuffle=True, random_state=0))
+
+    assert len(survivors) == 2
+    pruned = [name for name, entry in report.items() if entry.get('status') == 'pruned']
+    assert len(pruned) == 2
+    assert all(report[name]['rung'] == 0 for name in pruned)
+    assert all(report[name]['rung'] == 1 for name in survivors)
+    assert 'LogisticRegression' in survivors
+    assert report[ENSEMBLE_NAME]['members'] == survivors
+    assert best_name in survivors + [ENSEMBLE_NAME]
+
+
+def test_rung_over_budget_keeps_results_of_finished_rungs(monkeypatch):
+    """A rung that overruns the budget is abandoned; selection falls back to the previous rung."""
+    import time
+    from sklearn.model_selection import StratifiedKFold
+
+    monkeypatch.setattr(auto_selection, 'MIN_RESOURCE', 50)
+    fit_fold = auto_selection._fit_fold
+    started = []
+
+    def slow_on_full_rung(name, hyperparameters, X, y, train_idx, val_idx, classes):
+        started.append(len(train_idx))
+        if len(train_idx) > 300:
+            time.sleep(0.5)
+        return fit_fold(name, hyperparameters, X, y, train_idx, val_idx, classes)
+
+    monkeypatch.setattr(auto_selection, '_fit_fold', slow_on_full_rung)
+    X, y = _classification_data()
+    candidates = ['LogisticRegression', 'GaussianNB', 'DecisionTreeClassifier', 'KNeighborsClassifier']
+    selector = AutoSelector(candidates, {}, 'classification', time_budget=1.0, n_jobs=1)
+
+    best_name, survivors, report = selector.select(X, y, StratifiedKFold(n_splits=3, shuffle=True, random_state=0))
+
+    # 全量轮次只跑了部分任务就被放弃，结果来自子样本轮次
+    full_rung_tasks = [n for n in started if n > 300]
+    assert 0 < len(full_rung_tasks) < 2 * 3
+    assert all(entry.get('rung') == 0 for name, entry in report.items() if name in candidates)
+    assert len(survivors) == 2
+    assert best_name in survivors + [ENSEMBLE_NAME]
+
+
+def test_joblib_timeout_is_treated_as_rung_timeout(monkeypatch):
+    """joblib raises multiprocessing.TimeoutError, which is not the builtin TimeoutError."""
+    import multiprocessing
+    import joblib
+    import pytest
+    from sklearn.model_selection import KFold
+
+    class TimingOutParallel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __call__(self, tasks):
+            def results():
+                raise multiprocessing.TimeoutError()
+                yield  # pragma: no cover
+            return results()
+
+    monkeypatch.setattr(joblib, 'Parallel', TimingOutParallel)
+    X, y = _classification_data(200)
+    selector = AutoSelector(['LogisticRegression', 'GaussianNB'], {}, n_jobs=2)
+    with pytest.raises(RuntimeError, match='时间预算'):
+        selector.select(X, y, KFold(n_splits=3, shuffle=True, random_state=0))
+
+
+def test_small_dataset_uses_single_full_rung():
+    """With few samples every candidate is evaluated once on full folds."""
+    selector = AutoSelector(['LogisticRegression', 'GaussianNB', 'DecisionTreeClassifier'], {}, n_jobs=1)
+    assert selector._fractions(200) == [1.0]
+
+
+def test_failed_candidate_is_reported():
+    """A candidate that cannot be built is reported as failed without stopping selection."""
+    from sklearn.model_selection import KFold
+
+    X, y = _classification_data(200)
+    selector = AutoSelector(['LogisticRegression', 'NoSuchModel'], {}, n_jobs=1)
+    model, report = selector.fit(X, y, KFold(n_splits=3, shuffle=True, random_state=0))
+
+    assert report['NoSuchModel']['status'] == 'failed'
+    assert report['LogisticRegression']['status'] == 'success'
+    assert model.predict(X[:5]).shape == (5,)
+
+
+def test_regression_ensemble_scored_from_fold_predictions():
+    """Regression selection reports MAE and scores the ensemble without refitting it."""
+    from sklearn.model_selection import TimeSeriesSplit
+
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(300, 3))
+    y = X @ np.array([1.0, -2.0, 0.5]) + rng.normal(scale=0.1, size=300)
+    selector = AutoSelector(['LinearRegression', 'DecisionTreeRegressor'], {}, 'regression', n_jobs=1)
+    best_name, survivors, report = selector.select(X, y, TimeSeriesSplit(n_splits=3))
+
+    assert best_name == 'LinearRegression'
+    assert report['LinearRegression']['mean_test_score'] < report['DecisionTreeRegressor']['mean_test_score']
+    assert ENSEMBLE_NAME in report
+
+
+def test_progress_reports_rungs_and_models():
+    """The progress callback sees each rung, every candidate result and the ensemble; raising aborts selection."""
+    import pytest
+    from sklearn.model_selection import KFold
+    from ml_engine.progress import TrainingCancelled
+
+    X, y = _classification_data(200)
+    events = []
+    selector = AutoSelector(['LogisticRegression', 'GaussianNB'], {}, n_jobs=1,
+                            progress=lambda event, **info: events.append((event, info)))
+    selector.select(X, y, KFold(n_splits=3, shuffle=True, random_state=0))
+
+    assert events[0] == ('rung', {'rung': 0, 'n_rungs': 1, 'candidates': ['LogisticRegression', 'GaussianNB']})
+    models = [info['name'] for event, info in events if event == 'model']
+    assert models == ['LogisticRegression', 'GaussianNB', ENSEMBLE_NAME]
+
+    def cancel(event, **info):
+        raise TrainingCancelled()
+
+    selector = AutoSelector(['LogisticRegression', 'GaussianNB'], {}, n_jobs=1, progress=cancel)
+    with pytest.raises(TrainingCancelled):
+        selector.select(X, y, KFold(n_splits=3, shuffle=True, random_state=0))
+
+    # 轮次内部每完成一个 (候选 × 折) 都有检查点，取消不必等到整轮结束
+    fitted = []
+
+    def cancel_on_checkpoint(event, **info):
+        if event == 'checkpoint':
+            fitted.append(info)
+            raise TrainingCancelled()
+
+    selector = AutoSelector(['LogisticRegression', 'GaussianNB'], {}, n_jobs=1, progress=cancel_on_checkpoint)
+    with pytest.raises(TrainingCancelled):
+        selector.select(X, y, KFold(n_splits=3, shuffle=True, random_state=0))
+    assert len(fitted) == 1
@@ -0,0 +1,303 @@
+"""
+数据集读取模块
+从文件流中按块读取数据集：只解析需要的列，边读边采样 (分类任务按类别分层)，
+原生支持 CSV、Parquet 与 Arrow (Feather/IPC)；解析结果可缓存在本地磁盘。
+"""
+
+from typing import Dict, Iterator, List, Optional
+from collections import Counter
+import codecs
+import hashlib
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+# 用于推断编码与列类型的样本大小
+SAMPLE_BYTES = 256 * 1024
+
+# 每次解析的行数
+CHUNK_ROWS = 50000
+
+# 类别数超过该值时不再分层，改为均匀采样 (每个类别都要保留完整的候选行)
+MAX_STRATA = 20
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+# 本地解析缓存 (Cloud Functions 实例的 /tmp 在热启动间保留)
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ml_dataset_cache')
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_PRIORITY = '__priority'
+_ROW = '__row'
+
+
+class DatasetError(ValueError):
+    """数据集本身的问题 (缺列、空文件)，重新读取也无法解决"""
+
+
+def detect_format(file_path: str, content_type: Optional[str] = None) -> str:
+    """根据扩展名或 Content-Type 判断文件格式: csv / parquet / arrow"""
+    path = file_path.lower()
+    content_type = (content_type or '').lower()
+    if path.endswith(PARQUET_EXTENSIONS) or 'parquet' in content_type:
+        return 'parquet'
+    if path.endswith(ARROW_EXTENSIONS) or 'arrow' in content_type:
+        return 'arrow'
+    return 'csv'
+
+
+def detect_encoding(sample: bytes) -> str:
+    """判断 CSV 编码：UTF-8 (含 BOM)，否则按 GBK 处理"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # 样本末尾可能截断在多字节字符中间，使用增量解码
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'gbk'
+
+
+def infer_csv_dtypes(sample: bytes, encoding: str, columns: List[str], target_column: Optional[str] = None) -> Dict[str, str]:
+    """用样本推断列类型：数值特征按 float32 解析，文本列按 object 解析，目标列交给 pandas 推断"""
+    # 丢弃最后一行 (可能不完整)
+    end = sample.rfind(b'\n')
+    df = pd.read_csv(io.BytesIO(sample[:end + 1] if end > 0 else sample), encoding=encoding,
+                     usecols=lambda c: c in columns)
+    dtypes = {}
+    for column in df.columns:
+        if column == target_column:
+            continue
+        if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]):
+            dtypes[column] = 'float32'
+        elif df[column].dtype == object:
+            dtypes[column] = 'object'
+    return dtypes
+
+
+class ReservoirSampler:
+    """
+    边读边采样：每行分配一个随机优先级，保留优先级最高的 size 行 (等价于无放回均匀抽样)。
+    指定分层列时各类别分别保留候选行，结束时按类别占比分配名额 (每个类别至少一行)。
+    结果按原始行顺序返回，时序数据的先后关系不变。
+    """
+
+    def __init__(self, size: int, strata_column: Optional[str] = None, seed: int = 42):
+        self.size = size
+        self.strata_column = strata_column
+        self.rng = np.random.default_rng(seed)
+        self.counts = Counter()
+        self.total = 0
+        self._chunks = []
+        self._buffered = 0
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        if chunk.empty:
+            return
+        chunk = chunk.assign(**{
+            _ROW: np.arange(self.total, self.total + len(chunk)),
+            _PRIORITY: self.rng.random(len(chunk)),
+        })
+        self.total += len(chunk)
+        if self.strata_column is not None:
+            self.counts.update(chunk[self.strata_column].value_counts().to_dict())
+            if len(self.counts) > MAX_STRATA:
+                self.strata_column = None
+        self._chunks.append(chunk)
+        self._buffered += len(chunk)
+        # 攒够一定行数再裁剪，减少排序次数
+        if self._buffered > 2 * self.size * max(len(self.counts), 1):
+            self._trim()
+
+    def _trim(self) -> None:
+        kept = pd.concat(self._chunks, ignore_index=True)
+        if self.strata_column is None:
+            kept = kept.nlargest(self.size, _PRIORITY)
+        else:
+            kept = (kept.sort_values(_PRIORITY, ascending=False)
+                        .groupby(self.strata_column, sort=False).head(self.size))
+        self._chunks = [kept]
+        self._buffered = len(kept)
+
+    def result(self) -> pd.DataFrame:
+        if not self._chunks:
+            return pd.DataFrame()
+        kept = pd.concat(self._chunks, ignore_index=True)
+        if self.total > self.size:
+            if self.strata_column is None:
+                kept = kept.nlargest(self.size, _PRIORITY)
+            else:
+                quotas = {value: max(1, int(self.size * count / self.total)) for value, count in self.counts.items()}
+                kept = kept.sort_values(_PRIORITY, ascending=False)
+                rank = kept.groupby(self.strata_column, sort=False).cumcount()
+                kept = kept[rank < kept[self.strata_column].map(quotas)]
+        return kept.sort_values(_ROW).drop(columns=[_ROW, _PRIORITY]).reset_index(drop=True)
+
+
+def _check_columns(available: List[str], columns: List[str]) -> None:
+    missing = [c for c in columns if c not in available]
+    if missing:
+        raise DatasetError(f"数据集中缺少以下列: {missing}")
+
+
+def _iter_csv(fileobj, columns, target_column, encoding=None, infer_dtypes=True) -> Iterator[pd.DataFrame]:
+    sample = fileobj.read(SAMPLE_BYTES)
+    if not sample:
+        raise DatasetError("文件内容为空")
+    encoding = encoding or detect_encoding(sample)
+    header = pd.read_csv(io.BytesIO(sample), encoding=encoding, nrows=0).columns.tolist()
+    _check_columns(header, columns)
+    dtypes = infer_csv_dtypes(sample, encoding, columns, target_column) if infer_dtypes else None
+    fileobj.seek(0)
+    yield from pd.read_csv(fileobj, encoding=encoding, usecols=columns, dtype=dtypes, chunksize=CHUNK_ROWS)
+
+
+def _iter_parquet(fileobj, columns) -> Iterator[pd.DataFrame]:
+    import pyarrow.parquet as pq
+
+    # 只读取页脚与所需列的数据页
+    parquet_file = pq.ParquetFile(fileobj)
+    _check_columns(parquet_file.schema_arrow.names, columns)
+    for batch in parquet_file.iter_batches(batch_size=CHUNK_ROWS, columns=columns):
+        yield batch.to_pandas()
+
+
+def _iter_arrow(fileobj, columns) -> Iterator[pd.DataFrame]:
+    import pyarrow as pa
+
+    try:
+        reader = pa.ipc.open_file(fileobj)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        # 流式 IPC 格式
+        fileobj.seek(0)
+        reader = pa.ipc.open_stream(fileobj)
+        batches = iter(reader)
+    _check_columns(reader.schema.names, columns)
+    for batch in batches:
+        yield pa.Table.from_batches([batch]).select(columns).to_pandas()
+
+
+def read_dataset(
+    fileobj,
+    file_format: str,
+    columns: List[str],
+    target_column: Optional[str] = None,
+    max_rows: Optional[int] = None,
+    stratify: bool = False
+) -> pd.DataFrame:
+    """
+    按块读取数据集
+
+    Args:
+        fileobj: 可 seek 的二进制文件对象
+        file_format: csv / parquet / arrow
+        columns: 需要读取的列 (含目标列)
+        target_column: 目标列，缺失目标值的行在读取时丢弃
+        max_rows: 最多保留的行数，超出时边读边采样
+        stratify: 是否按目标列分层采样 (分类任务)
+    """
+    columns = list(dict.fromkeys(columns))
+    if file_format == 'parquet':
+        return _collect(_iter_parquet(fileobj, columns), columns, target_column, max_rows, stratify)
+    if file_format == 'arrow':
+        return _collect(_iter_arrow(fileobj, columns), columns, target_column, max_rows, stratify)
+
+    try:
+        return _collect(_iter_csv(fileobj, columns, target_column), columns, target_column, max_rows, stratify)
+    except UnicodeDecodeError:
+        # 样本之后出现非 UTF-8 内容，按 GBK 重新读取
+        fileobj.seek(0)
+        return _collect(_iter_csv(fileobj, columns, target_column, encoding='gbk'),
+                        columns, target_column, max_rows, stratify)
+    except DatasetError:
+        raise
+    except ValueError as e:
+        # 样本之后的数据与推断的类型不符，交给 pandas 自行推断
+        print(f"按样本推断的列类型解析失败，重新读取: {e}")
+        fileobj.seek(0)
+        return _collect(_iter_csv(fileobj, columns, target_column, infer_dtypes=False),
+                        columns, target_column, max_rows, stratify)
+
+
+def _collect(chunks, columns, target_column, max_rows, stratify) -> pd.DataFrame:
+    """消费数据块：丢弃目标值缺失的行，超出 max_rows 时边读边采样"""
+    sampler = ReservoirSampler(max_rows, target_column if stratify else None) if max_rows else None
+    parts = []
+    dropped = 0
+    for chunk in chunks:
+        if target_column:
+            before = len(chunk)
+            chunk = chunk.dropna(subset=[target_column])
+            dropped += before - len(chunk)
+        if sampler is not None:
+            sampler.add(chunk)
+        else:
+            parts.append(chunk)
+
+    if dropped:
+        print(f"读取数据: 丢弃了 {dropped} 行目标值缺失的样本")
+    if sampler is not None:
+        if sampler.total > max_rows:
+            print(f"读取数据: 共 {sampler.total} 行，{'分层' if sampler.strata_column else '均匀'}采样 {max_rows} 行")
+        df = sampler.result()
+    else:
+        df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    return df[columns]
+
+
+# --- 本地缓存 ---
+
+def cache_key(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def cache_get(key: str) -> Optional[pd.DataFrame]:
+    path = os.path.join(CACHE_DIR, f"{key}.pkl")
+    try:
+        df = pd.read_pickle(path)
+        os.utime(path)  # 记录最近使用时间，淘汰时按此排序
+        return df
+    except (FileNotFoundError, EOFError):
+        return None
+    except Exception as e:
+        print(f"读取数据集缓存失败: {e}")
+        return None
+
+
+def cache_put(key: str, df: pd.DataFrame) -> None:
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = os.path.join(CACHE_DIR, f"{key}.pkl")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        evict_lru(CACHE_DIR, CACHE_MAX_BYTES)
+    except Exception as e:
+        print(f"写入数据集缓存失败: {e}")
+
+
+def evict_lru(cache_dir: str, max_bytes: int) -> None:
+    """缓存目录总大小超出上限时删除最久未使用的文件"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,174 @@
+"""
+实验记录存储模块
+每次实验拆成两份文档：
+- experiments/{id}: 轻量摘要 (模型、任务、标量指标、时间戳)，历史列表只读取这一份
+- experiment_details/{id}: 完整记录 (模型配置、特征列、含混淆矩阵/选择报告的全部指标)，按需读取
+并在写入时增量维护 experiment_rollups：每个用户在每个 (数据集, 任务) 上的实验数与最佳得分。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+
+from firebase_admin import firestore
+
+EXPERIMENTS_COLLECTION = 'experiments'
+DETAILS_COLLECTION = 'experiment_details'
+ROLLUPS_COLLECTION = 'experiment_rollups'
+
+# 摘要中保留的标量指标 (历史列表展示用)
+SUMMARY_METRICS = [
+    'accuracy', 'precision', 'recall', 'f1_score',
+    'mse', 'rmse', 'mae', 'r2_score',
+    'n_clusters', 'silhouette_score', 'davies_bouldin_score', 'calinski_harabasz_score',
+    'training_duration'
+]
+
+# 各任务用于比较实验优劣的主指标: (指标名, 是否越大越好)
+PRIMARY_METRICS = {
+    'classification': ('accuracy', True),
+    'regression': ('r2_score', True),
+    'clustering': ('silhouette_score', True),
+}
+
+# 历史列表读取的字段；旧记录的摘要与详情保存在同一文档中，投影后同样只传输这些字段
+SUMMARY_FIELDS = [
+    'user_id', 'dataset_url', 'task_type', 'target_column', 'model_config.model_name',
+    'n_features', 'primary_metric', 'timestamp'
+] + [f'metrics.{name}' for name in SUMMARY_METRICS]
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+def primary_metric(task_type: str, metrics: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """返回任务的主指标 {'name', 'value', 'higher_is_better'}，指标缺失时返回 None"""
+    if task_type not in PRIMARY_METRICS:
+        return None
+    name, higher_is_better = PRIMARY_METRICS[task_type]
+    value = metrics.get(name)
+    if value is None:
+        return None
+    return {'name': name, 'value': value, 'higher_is_better': higher_is_better}
+
+
+def build_summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    """从完整实验记录提取摘要文档"""
+    metrics = record.get('metrics') or {}
+    return {
+        'user_id': record['user_id'],
+        'dataset_url': record['dataset_url'],
+        'task_type': record['task_type'],
+        'target_column': record.get('target_column'),
+        'model_config': {'model_name': (record.get('model_config') or {}).get('model_name')},
+        'n_features': len(record.get('feature_columns') or []),
+        'metrics': {name: metrics[name] for name in SUMMARY_METRICS if name in metrics},
+        'primary_metric': primary_metric(record['task_type'], metrics),
+        'timestamp': record.get('timestamp', firestore.SERVER_TIMESTAMP)
+    }
+
+
+def rollup_id(user_id: str, dataset_url: str, task_type: str) -> str:
+    digest = hashlib.sha1(f"{dataset_url}|{task_type}".encode('utf-8')).hexdigest()[:20]
+    return f"{user_id}_{digest}"
+
+
+def update_rollup(current: Optional[Dict[str, Any]], summary: Dict[str, Any], experiment_id: str) -> Dict[str, Any]:
+    """把一条新实验合并进 (数据集, 任务) 汇总"""
+    rollup = dict(current or {
+        'user_id': summary['user_id'],
+        'dataset_url': summary['dataset_url'],
+        'task_type': summary['task_type'],
+        'count': 0,
+        'best': None
+    })
+    rollup['count'] = rollup.get('count', 0) + 1
+    rollup['last_experiment_id'] = experiment_id
+    rollup['updated_at'] = firestore.SERVER_TIMESTAMP
+
+    metric = summary.get('primary_metric')
+    best = rollup.get('best')
+    if metric is not None:
+        improved = (best is None or
+                    (metric['value'] > best['value'] if metric['higher_is_better'] else metric['value'] < best['value']))
+        if improved:
+            rollup['best'] = {
+                'experiment_id': experiment_id,
+                'model_name': summary['model_config']['model_name'],
+                'metric': metric['name'],
+                'value': metric['value']
+            }
+    return rollup
+
+
+def save_experiment(db, record: Dict[str, Any]) -> str:
+    """在同一事务中写入摘要、详情并更新汇总，返回实验 ID"""
+    summary_ref = db.collection(EXPERIMENTS_COLLECTION).document()
+    detail_ref = db.collection(DETAILS_COLLECTION).document(summary_ref.id)
+    rollup_ref = db.collection(ROLLUPS_COLLECTION).document(
+        rollup_id(record['user_id'], record['dataset_url'], record['task_type']))
+    summary = build_summary(record)
+
+    @firestore.transactional
+    def _save(transaction):
+        # 事务中的读取必须在写入之前
+        snap = rollup_ref.get(transaction=transaction)
+        rollup = update_rollup(snap.to_dict() if snap.exists else None, summary, summary_ref.id)
+        transaction.set(summary_ref, summary)
+        transaction.set(detail_ref, {**record, 'timestamp': summary['timestamp']})
+        transaction.set(rollup_ref, rollup)
+
+    _save(db.transaction())
+    return summary_ref.id
+
+
+def list_experiments(
+    db,
+    user_id: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    按时间倒序分页读取实验摘要
+
+    Args:
+        cursor: 上一页返回的 next_cursor (上一页最后一条实验的 ID)
+
+    Returns:
+        (实验摘要列表, 下一页游标；没有更多数据时为 None)
+    """
+    collection = db.collection(EXPERIMENTS_COLLECTION)
+    query = (collection.where('user_id', '==', user_id)
+                       .order_by('timestamp', direction=firestore.Query.DESCENDING)
+                       .select(SUMMARY_FIELDS))
+    if cursor:
+        last = collection.document(cursor).get(field_paths=['user_id', 'timestamp'])
+        if not last.exists or last.get('user_id') != user_id:
+            raise ValueError('无效的分页游标')
+        query = query.start_after(last)
+
+    # 多取一条用于判断是否还有下一页
+    docs = list(query.limit(page_size + 1).stream())
+    experiments = []
+    for doc in docs[:page_size]:
+        experiment = doc.to_dict()
+        experiment['id'] = doc.id
+        experiments.append(experiment)
+    next_cursor = docs[page_size - 1].id if len(docs) > page_size else None
+    return experiments, next_cursor
+
+
+def list_rollups(db, user_id: str) -> List[Dict[str, Any]]:
+    query = db.collection(ROLLUPS_COLLECTION).where('user_id', '==', user_id)
+    return [doc.to_dict() for doc in query.stream()]
+
+
+def get_experiment(db, experiment_id: str) -> Optional[Dict[str, Any]]:
+    """读取完整实验记录；旧记录没有详情文档，完整内容保存在摘要集合中"""
+    snap = db.collection(DETAILS_COLLECTION).document(experiment_id).get()
+    if not snap.exists:
+        snap = db.collection(EXPERIMENTS_COLLECTION).document(experiment_id).get()
+        if not snap.exists:
+            return None
+    experiment = snap.to_dict()
+    experiment['id'] = experiment_id
+    return experiment
@@ -0,0 +1,349 @@
+"""
+训练任务存储模块
+训练任务保存在 Firestore 的 training_jobs 集合中：提交时创建文档，工作进程按阶段更新进度，
+客户端轮询 get_training_job 或直接订阅文档快照；取消通过 cancel_requested 标记通知工作进程。
+运行中的任务带有租约 (lease_expires_at)，由工作进程心跳续期，崩溃后租约过期即可被重试重新领取。
+"""
+
+from typing import Any, Dict, Optional, Tuple
+import math
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+
+from ml_engine.progress import TrainingCancelled
+
+JOBS_COLLECTION = 'training_jobs'
+
+# 排队或运行中的任务
+ACTIVE_STATUSES = ['queued', 'running']
+FINAL_STATUSES = ['succeeded', 'failed', 'cancelled']
+
+# 每个用户同时排队/运行的任务数上限
+MAX_ACTIVE_JOBS_PER_USER = int(os.environ.get('ML_MAX_ACTIVE_JOBS_PER_USER', '2'))
+
+# 超过该时间没有进度更新的活动任务视为已失效 (工作进程崩溃)，不再占用并发名额
+STALE_JOB_SECONDS = 3600
+
+# 各阶段开始时的总体进度；训练阶段按自动优选的轮次在 train 与 save 之间推进
+STAGE_PROGRESS = {'download': 0.0, 'preprocess': 0.1, 'train': 0.2, 'save': 0.95}
+
+# 两次检查取消标记之间的最小间隔 (秒)
+CANCEL_CHECK_INTERVAL = 2.0
+
+# 运行中任务的租约：工作进程每 HEARTBEAT_INTERVAL 秒续期一次，租约过期说明工作进程已崩溃或被终止。
+# 租约时长不超过 Cloud Tasks 重试的最小退避 (main.py 中 min_backoff_seconds=60)，重试到达时租约已过期
+LEASE_SECONDS = 60
+HEARTBEAT_INTERVAL = 15
+
+# 每个任务最多执行的次数，与 Cloud Tasks 的 max_attempts 一致；用完后租约过期的任务标记为失败
+MAX_JOB_ATTEMPTS = 2
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """用户的活动任务数已达上限"""
+
+
+def _jobs(db):
+    return db.collection(JOBS_COLLECTION)
+
+
+def _is_stale(job: Dict[str, Any]) -> bool:
+    updated_at = job.get('updated_at')
+    if updated_at is None:
+        return False
+    return datetime.now(timezone.utc) - updated_at > timedelta(seconds=STALE_JOB_SECONDS)
+
+
+def create_job(db, user_id: str, params: Dict[str, Any]) -> str:
+    """在事务中检查并发上限并创建任务，返回任务 ID"""
+    job_ref = _jobs(db).document()
+    active_query = (_jobs(db).where('user_id', '==', user_id)
+                             .where('status', 'in', ACTIVE_STATUSES))
+
+    @firestore.transactional
+    def _create(transaction):
+        active = [snap for snap in transaction.get(active_query) if not _is_stale(snap.to_dict())]
+        if len(active) >= MAX_ACTIVE_JOBS_PER_USER:
+            raise ConcurrencyLimitExceeded(f"同时运行的训练任务最多 {MAX_ACTIVE_JOBS_PER_USER} 个")
+        transaction.set(job_ref, {
+            'user_id': user_id,
+            'status': 'queued',
+            'stage': None,
+            'progress': 0.0,
+            'stages': {},
+            'models': {},
+            'params': params,
+            'cancel_requested': False,
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+
+    _create(db.transaction())
+    return job_ref.id
+
+
+def get_job(db, job_id: str) -> Optional[Dict[str, Any]]:
+    snap = _jobs(db).document(job_id).get()
+    if not snap.exists:
+        return None
+    job = snap.to_dict()
+    job['id'] = snap.id
+    return job
+
+
+def _lease_deadline() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)
+
+
+def _lease_expired(job: Dict[str, Any], now: datetime) -> bool:
+    """运行中任务的租约是否已过期 (没有租约的旧任务按 updated_at 判断)"""
+    expires_at = job.get('lease_expires_at')
+    if expires_at is None:
+        return _is_stale(job)
+    return expires_at <= now
+
+
+def _claim_updates(job: Dict[str, Any], now: datetime) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    领取任务时要写入的字段，返回 (updates, claimed)
+
+    排队中的任务直接领取；运行中但租约已过期的任务 (工作进程崩溃) 在尝试次数内重新领取，
+    次数用完则标记为失败。其他情况不领取。
+    """
+    status = job.get('status')
+    if status == 'running' and not _lease_expired(job, now):
+        return None, False
+    if status not in ('queued', 'running'):
+        return None, False
+    if job.get('cancel_requested'):
+        return {'status': 'cancelled', 'updated_at': firestore.SERVER_TIMESTAMP}, False
+
+    attempts = job.get('attempts') or (1 if status == 'running' else 0)
+    if attempts >= MAX_JOB_ATTEMPTS:
+        return {
+            'status': 'failed',
+            'error': f'工作进程中断，已重试 {attempts} 次',
+            'finished_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, False
+
+    updates = {
+        'status': 'running',
+        'attempts': attempts + 1,
+        'lease_id': uuid.uuid4().hex,
+        'lease_expires_at': now + timedelta(seconds=LEASE_SECONDS),
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+    if status == 'queued':
+        updates['started_at'] = firestore.SERVER_TIMESTAMP
+    return updates, True
+
+
+def claim_job(db, job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    把排队中 (或租约已过期) 的任务标记为运行中并返回任务数据，其中 lease_id 用于续期
+
+    任务不存在、已被取消或正由其他工作进程执行 (例如重复分发) 时返回 None。
+    """
+    job_ref = _jobs(db).document(job_id)
+
+    @firestore.transactional
+    def _claim(transaction):
+        snap = job_ref.get(transaction=transaction)
+        if not snap.exists:
+            return None
+        job = snap.to_dict()
+        updates, claimed = _claim_updates(job, datetime.now(timezone.utc))
+        if updates:
+            transaction.update(job_ref, updates)
+        if not claimed:
+            return None
+        job.update(updates)
+        return job
+
+    return _claim(db.transaction())
+
+
+def fail_abandoned_job(db, job_id: str) -> bool:
+    """
+    尝试次数已用完、租约也已过期的运行中任务不会再有工作进程领取，标记为失败
+
+    由查询接口调用，避免客户端一直看到 running。返回是否做了标记。
+    """
+    job_ref = _jobs(db).document(job_id)
+
+    @firestore.transactional
+    def _fail(transaction):
+        snap = job_ref.get(transaction=transaction)
+        if not snap.exists:
+            return False
+        job = snap.to_dict()
+        if job.get('status') != 'running' or not _lease_expired(job, datetime.now(timezone.utc)):
+            return False
+        if (job.get('attempts') or 1) < MAX_JOB_ATTEMPTS and not _is_stale(job):
+            # 还会有重试
+            return False
+        transaction.update(job_ref, {
+            'status': 'failed',
+            'error': '工作进程中断',
+            'finished_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        return True
+
+    return _fail(db.transaction())
+
+
+class JobLease:
+    """
+    工作进程持有的任务租约：后台线程定期续期，同时读取取消标记
+
+    取消或租约被其他工作进程接管时设置对应事件，JobProgress 在下一个检查点中止训练。
+    """
+
+    def __init__(self, db, job_id: str, lease_id: str, interval: Optional[float] = None):
+        self.job_ref = _jobs(db).document(job_id)
+        self.db = db
+        self.lease_id = lease_id
+        self.interval = HEARTBEAT_INTERVAL if interval is None else interval
+        self.cancelled = threading.Event()
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='job-lease', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.renew()
+            except Exception as e:
+                # 续期失败不中止训练，下一次再试；真正过期后由重试接管
+                print(f"任务租约续期失败: {e}")
+            if self.lost.is_set():
+                return
+
+    def renew(self) -> None:
+        @firestore.transactional
+        def _renew(transaction):
+            snap = self.job_ref.get(transaction=transaction)
+            job = snap.to_dict() if snap.exists else {}
+            if job.get('status') != 'running' or job.get('lease_id') != self.lease_id:
+                self.lost.set()
+                return
+            if job.get('cancel_requested'):
+                self.cancelled.set()
+            transaction.update(self.job_ref, {'lease_expires_at': _lease_deadline()})
+
+        _renew(self.db.transaction())
+
+    @property
+    def interrupted(self) -> bool:
+        return self.cancelled.is_set() or self.lost.is_set()
+
+
+def request_cancel(db, job_id: str) -> str:
+    """请求取消任务：排队中的任务直接取消，运行中的任务由工作进程在下一个进度事件或检查点中止"""
+    job_ref = _jobs(db).document(job_id)
+
+    @firestore.transactional
+    def _cancel(transaction):
+        snap = job_ref.get(transaction=transaction)
+        status = snap.get('status')
+        if status in FINAL_STATUSES:
+            return status
+        updates = {'cancel_requested': True, 'updated_at': firestore.SERVER_TIMESTAMP}
+        if status == 'queued':
+            updates['status'] = 'cancelled'
+        transaction.update(job_ref, updates)
+        return updates.get('status', status)
+
+    return _cancel(db.transaction())
+
+
+def finish_job(db, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+    updates = {
+        'status': status,
+        'finished_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }
+    if status == 'succeeded':
+        updates['progress'] = 1.0
+    if result is not None:
+        updates['result'] = result
+        updates['experiment_id'] = result.get('experiment_id')
+    if error is not None:
+        updates['error'] = error
+    _jobs(db).document(job_id).update(updates)
+
+
+def _clean(value):
+    """Firestore 不接受 NaN/numpy 类型，转换为普通 Python 值"""
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class JobProgress:
+    """训练进度回调：把阶段与候选模型结果写入任务文档，并检查取消标记"""
+
+    def __init__(self, db, job_id: str, lease: Optional[JobLease] = None):
+        self.job_ref = _jobs(db).document(job_id)
+        self.lease = lease
+        self._last_cancel_check = 0.0
+
+    def __call__(self, event: str, **info) -> None:
+        updates = {}
+        if event == 'stage':
+            stage, status = info['stage'], info['status']
+            updates[f'stages.{stage}'] = {'status': status, 'at': firestore.SERVER_TIMESTAMP}
+            updates['stage'] = stage
+            if status == 'running' and stage in STAGE_PROGRESS:
+                updates['progress'] = STAGE_PROGRESS[stage]
+        elif event == 'rung':
+            # 训练阶段的进度按轮次推进
+            span = STAGE_PROGRESS['save'] - STAGE_PROGRESS['train']
+            updates['progress'] = STAGE_PROGRESS['train'] + span * info['rung'] / info['n_rungs']
+            updates['rung'] = _clean(info)
+        elif event == 'model':
+            name = info.pop('name')
+            updates[f'models.{name}'] = _clean(info)
+        elif event == 'checkpoint':
+            self.check_cancelled()
+            return
+        else:
+            return
+        updates['updated_at'] = firestore.SERVER_TIMESTAMP
+        self.job_ref.update(updates)
+        self.check_cancelled()
+
+    def check_cancelled(self, force: bool = False) -> None:
+        # 租约线程已经读到取消标记 (或租约被接管) 时无需再读文档
+        if self.lease is not None and self.lease.interrupted:
+            raise TrainingCancelled()
+        now = time.monotonic()
+        if not force and now - self._last_cancel_check < CANCEL_CHECK_INTERVAL:
+            return
+        self._last_cancel_check = now
+        snap = self.job_ref.get(field_paths=['cancel_requested'])
+        if snap.exists and snap.get('cancel_requested'):
+            raise TrainingCancelled()
@@ -0,0 +1,133 @@
+"""
+预处理结果缓存
+拟合好的预处理器与变换后的特征矩阵按 (数据集 generation, 特征列, 目标列, 任务类型, 缺失值策略, ...)
+内容寻址，用 joblib 保存在本地磁盘，并可同步到远端存储 (Cloud Storage)；
+同一数据集与列配置的重复实验直接复用，跳过下载、解析与预处理。
+
+joblib 文件反序列化时可以执行任意代码，因此每个条目都带有 HMAC-SHA256 签名
+(密钥来自 ML_CACHE_SIGNING_KEY)，签名校验通过后才会加载；未配置密钥时不使用远端。
+"""
+
+from typing import Any, Dict, Optional
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import tempfile
+
+from utils.dataset_reader import evict_lru
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'ml_preprocess_cache')
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# 预处理逻辑或文件格式变化时递增，使旧的缓存条目失效
+FORMAT_VERSION = 2
+
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+_READ_CHUNK_SIZE = 1024 * 1024
+
+
+def preprocessing_key(**spec) -> str:
+    """根据数据集版本与预处理配置生成内容地址"""
+    payload = json.dumps({'version': FORMAT_VERSION, **spec}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PreprocessingCache:
+    """
+    本地磁盘 + 可选远端的两级缓存
+
+    remote 需提供 download(key, local_path) -> bool 与 upload(key, local_path)；
+    本地未命中时从远端下载，写入时同时上传，冷启动的实例也能复用。
+
+    文件格式：32 字节签名 + joblib 内容，签名为 HMAC(signing_key, key + 内容)，
+    绑定缓存键，条目不能被替换成其他键的内容。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        remote: Any = None,
+        max_bytes: int = CACHE_MAX_BYTES,
+        signing_key: Optional[bytes] = None
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if signing_key is None:
+            configured = os.environ.get('ML_CACHE_SIGNING_KEY', '')
+            signing_key = configured.encode('utf-8') if configured else None
+        if signing_key is None and remote is not None:
+            # 没有共享密钥时其他实例写入的条目无法验证，只使用本地缓存
+            print("未配置 ML_CACHE_SIGNING_KEY，预处理缓存不使用远端存储")
+            remote = None
+        self.remote = remote
+        # 仅本地使用时以进程内随机密钥签名，防止读取非本进程写入的文件
+        self.signing_key = signing_key or secrets.token_bytes(32)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.joblib")
+
+    def _signature(self, key: str, fileobj) -> bytes:
+        mac = hmac.new(self.signing_key, key.encode('utf-8'), hashlib.sha256)
+        for chunk in iter(lambda: fileobj.read(_READ_CHUNK_SIZE), b''):
+            mac.update(chunk)
+        return mac.digest()
+
+    def _load_verified(self, key: str, path: str) -> Optional[Dict[str, Any]]:
+        import joblib
+
+        with open(path, 'rb') as f:
+            expected = f.read(SIGNATURE_SIZE)
+            if len(expected) != SIGNATURE_SIZE or not hmac.compare_digest(expected, self._signature(key, f)):
+                return None
+            f.seek(SIGNATURE_SIZE)
+            return joblib.load(f)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """返回 {'X', 'y', 'preprocessor'}，未命中或签名不符返回 None"""
+        path = self._path(key)
+        try:
+            if not os.path.exists(path):
+                if self.remote is None:
+                    return None
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                if not self.remote.download(key, tmp_path):
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    return None
+                os.replace(tmp_path, path)
+                evict_lru(self.cache_dir, self.max_bytes)
+            entry = self._load_verified(key, path)
+            if entry is None:
+                print(f"预处理缓存签名校验失败，丢弃条目: {key}")
+                os.remove(path)
+                return None
+            os.utime(path)  # 记录最近使用时间，淘汰时按此排序
+            return entry
+        except Exception as e:
+            print(f"读取预处理缓存失败: {e}")
+            return None
+
+    def put(self, key: str, X: Any, y: Any, preprocessor: Any) -> None:
+        import joblib
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w+b') as f:
+                f.write(b'\0' * SIGNATURE_SIZE)
+                joblib.dump({'X': X, 'y': y, 'preprocessor': preprocessor}, f)
+                f.seek(SIGNATURE_SIZE)
+                signature = self._signature(key, f)
+                f.seek(0)
+                f.write(signature)
+            os.replace(tmp_path, path)
+            evict_lru(self.cache_dir, self.max_bytes)
+            if self.remote is not None:
+                self.remote.upload(key, path)
+        except Exception as e:
+            # 缓存失败不影响训练
+            print(f"写入预处理缓存失败: {e}")
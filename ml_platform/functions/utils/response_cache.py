@@ -0,0 +1,163 @@
+"""
+AI 响应缓存
+按 (工具, 规范化后的参数, 模型, 提示词模板版本) 缓存生成结果：
+实例内存中保留一份带 TTL 的 LRU 缓存，可选的远端 (Firestore) 让不同实例共享结果；
+同一实例内相同请求并发到达时只调用一次模型 (single-flight)，其余请求等待同一结果。
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+def normalize_arguments(value: Any) -> Any:
+    """去掉空值与首尾空白、统一空白字符，使等价的参数得到相同的键"""
+    if isinstance(value, dict):
+        normalized = {str(k): normalize_arguments(v) for k, v in value.items()}
+        return {k: v for k, v in normalized.items() if v not in (None, '', [], {})}
+    if isinstance(value, (list, tuple)):
+        return [normalize_arguments(v) for v in value]
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    return value
+
+
+def response_cache_key(tool: str, arguments: Dict[str, Any], model: str, template_version: int) -> str:
+    payload = json.dumps(
+        {'tool': tool, 'arguments': normalize_arguments(arguments or {}), 'model': model, 'version': template_version},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    带 TTL 的 LRU 缓存 + single-flight
+
+    remote 需提供 get(key) -> Optional[value] 与 set(key, value, ttl)；本地未命中时先查远端。
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, remote: Any = None, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.remote = remote
+        self.clock = clock
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+
+    def _get_local(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_local(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (self.clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Any]) -> Tuple[Any, str]:
+        """
+        返回 (结果, 来源)；来源为 memory / remote / coalesced / computed
+
+        compute 抛出的异常会传给所有等待同一结果的请求，且不写入缓存。
+        """
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                return value, 'memory'
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, 'coalesced'
+
+        source = 'computed'
+        try:
+            value = self._get_remote(key)
+            if value is not None:
+                source = 'remote'
+            else:
+                value = compute()
+                self._set_remote(key, value, ttl)
+            flight.value = value
+            with self._lock:
+                self._put_local(key, value, ttl)
+            return value, source
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.event.set()
+
+    def _get_remote(self, key: str) -> Optional[Any]:
+        if self.remote is None:
+            return None
+        try:
+            return self.remote.get(key)
+        except Exception as e:
+            # 远端缓存不可用时直接调用模型
+            print(f"读取远端响应缓存失败: {e}")
+            return None
+
+    def _set_remote(self, key: str, value: Any, ttl: float) -> None:
+        if self.remote is None:
+            return
+        try:
+            self.remote.set(key, value, ttl)
+        except Exception as e:
+            print(f"写入远端响应缓存失败: {e}")
+
+
+class FirestoreCacheRemote:
+    """
+    以 Firestore 文档作为跨实例共享的缓存层
+
+    过期时间保存在 expires_at 时间戳字段，可为该字段配置 TTL 策略自动清理过期文档。
+    """
+
+    def __init__(self, collection: str = 'mcp_response_cache'):
+        self.collection = collection
+
+    def _doc(self, key: str):
+        from firebase_admin import firestore
+        return firestore.client().collection(self.collection).document(key)
+
+    def get(self, key: str) -> Optional[Any]:
+        snap = self._doc(key).get()
+        if not snap.exists:
+            return None
+        data = snap.to_dict()
+        expires_at = data.get('expires_at')
+        if expires_at is None or expires_at <= datetime.now(timezone.utc):
+            return None
+        return data.get('value')
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._doc(key).set({'value': value, 'expires_at': datetime.now(timezone.utc) + timedelta(seconds=ttl)})
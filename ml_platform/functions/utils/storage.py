@@ -3,25 +3,33 @@
 负责从 Firebase Storage 或其他来源处理文件
 """
 
-from typing import Optional
+from typing import List, Optional, Tuple
 import urllib.parse
 import io
+import os
 import pandas as pd
 from firebase_admin import storage
 
-def download_dataset_from_storage(dataset_url: str) -> pd.DataFrame:
+from utils.dataset_reader import detect_format, read_dataset, cache_key, cache_get, cache_put
+
+# 流式读取时每次请求的字节数
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 预处理缓存在项目缓存 Bucket 中的目录
+PREPROCESS_CACHE_PREFIX = 'cache/preprocessing'
+
+def parse_storage_url(dataset_url: str) -> Tuple[str, str]:
     """
-    从 Firebase Storage 下载数据集并转换为 DataFrame
+    解析 Storage URL
     
     Args:
         dataset_url: 数据集的 URL (支持 gs:// 或 https:// 格式)
         
     Returns:
-        pd.DataFrame: 数据集内容
+        (bucket_name, file_path)
         
     Raises:
-        ValueError: URL 格式错误或文件无法读取
-        Exception: 下载过程中的其他错误
+        ValueError: URL 格式错误
     """
     if not dataset_url:
         raise ValueError("URL 不能为空")
@@ -29,43 +37,60 @@ def download_dataset_from_storage(dataset_url: str) -> pd.DataFrame:
     bucket_name = ""
     file_path = ""
     
+    # 解析 URL
+    if dataset_url.startswith('gs://'):
+        # 格式: gs://bucket-name/path/to/file.csv
+        parts = dataset_url[5:].split('/', 1)
+        if len(parts) < 2:
+            raise ValueError(f"gs:// URL 格式错误: {dataset_url}")
+        bucket_name = parts[0]
+        file_path = parts[1]
+    elif dataset_url.startswith('http'):
+        # 格式: https://firebasestorage.googleapis.com/...
+        # 尝试解析标准 Firebase Storage URL
+        parsed = urllib.parse.urlparse(dataset_url)
+        path_parts = parsed.path.split('/')
+        
+        # Firebase Storage URL 通常包含 /b/bucket-name/o/file-path
+        if '/b/' in parsed.path and '/o/' in parsed.path:
+            try:
+                b_index = path_parts.index('b')
+                o_index = path_parts.index('o')
+                if b_index + 1 < len(path_parts):
+                    bucket_name = path_parts[b_index + 1]
+                if o_index + 1 < len(path_parts):
+                    # URL中的路径是被编码的
+                    file_path = urllib.parse.unquote(path_parts[o_index + 1])
+            except ValueError:
+                pass
+        
+        # 如果解析失败，回退到 requests 直接下载（如果允许外部网络）
+        # 注意：Cloud Functions 默认可能没有外网（视配置而定），且这里主要针对内部 Storage
+        if not bucket_name or not file_path:
+             # TODO: 如果需要支持非 Storage 的 http 链接，需要引入 requests
+             # 但考虑到依赖和安全，暂时只支持 Storage
+             raise ValueError(f"无法解析的 Firebase Storage URL: {dataset_url}")
+    else:
+         raise ValueError(f"不支持的 URL 协议: {dataset_url}")
+
+    return bucket_name, file_path
+
+def download_dataset_from_storage(dataset_url: str) -> pd.DataFrame:
+    """
+    从 Firebase Storage 下载数据集并转换为 DataFrame
+    
+    Args:
+        dataset_url: 数据集的 URL (支持 gs:// 或 https:// 格式)
+        
+    Returns:
+        pd.DataFrame: 数据集内容
+        
+    Raises:
+        ValueError: URL 格式错误或文件无法读取
+        Exception: 下载过程中的其他错误
+    """
     try:
-        # 解析 URL
-        if dataset_url.startswith('gs://'):
-            # 格式: gs://bucket-name/path/to/file.csv
-            parts = dataset_url[5:].split('/', 1)
-            if len(parts) < 2:
-                raise ValueError(f"gs:// URL 格式错误: {dataset_url}")
-            bucket_name = parts[0]
-            file_path = parts[1]
-        elif dataset_url.startswith('http'):
-            # 格式: https://firebasestorage.googleapis.com/...
-            # 尝试解析标准 Firebase Storage URL
-            parsed = urllib.parse.urlparse(dataset_url)
-            path_parts = parsed.path.split('/')
-            
-            # Firebase Storage URL 通常包含 /b/bucket-name/o/file-path
-            if '/b/' in parsed.path and '/o/' in parsed.path:
-                try:
-                    b_index = path_parts.index('b')
-                    o_index = path_parts.index('o')
-                    if b_index + 1 < len(path_parts):
-                        bucket_name = path_parts[b_index + 1]
-                    if o_index + 1 < len(path_parts):
-                        # URL中的路径是被编码的
-                        file_path = urllib.parse.unquote(path_parts[o_index + 1])
-                except ValueError:
-                    pass
-            
-            # 如果解析失败，回退到 requests 直接下载（如果允许外部网络）
-            # 注意：Cloud Functions 默认可能没有外网（视配置而定），且这里主要针对内部 Storage
-            if not bucket_name or not file_path:
-                 # TODO: 如果需要支持非 Storage 的 http 链接，需要引入 requests
-                 # 但考虑到依赖和安全，暂时只支持 Storage
-                 raise ValueError(f"无法解析的 Firebase Storage URL: {dataset_url}")
-        else:
-             raise ValueError(f"不支持的 URL 协议: {dataset_url}")
-            
+        bucket_name, file_path = parse_storage_url(dataset_url)
         print(f"正在从 Bucket: {bucket_name} 下载文件: {file_path}")
         
         # 下载文件
@@ -90,3 +115,88 @@ def download_dataset_from_storage(dataset_url: str) -> pd.DataFrame:
         
     except Exception as e:
         raise Exception(f"数据集下载或解析失败: {str(e)}")
+
+def get_dataset_blob(dataset_url: str):
+    """
+    获取数据集对象的元数据 (generation、大小、类型)，不下载内容
+    
+    Raises:
+        ValueError: URL 格式错误、文件不存在或为空
+    """
+    bucket_name, file_path = parse_storage_url(dataset_url)
+    blob = storage.bucket(bucket_name).get_blob(file_path)
+    if blob is None:
+        raise ValueError(f"文件不存在: {file_path}")
+    if not blob.size:
+        raise ValueError("文件内容为空")
+    return blob
+
+def load_dataset(
+    dataset_url: str,
+    columns: List[str],
+    target_column: Optional[str] = None,
+    max_rows: Optional[int] = None,
+    stratify: bool = False,
+    blob=None
+) -> pd.DataFrame:
+    """
+    流式读取 Storage 中的数据集 (只读取需要的列，超出 max_rows 时边读边采样)
+    
+    解析结果按对象 generation 缓存，同一数据集的重复实验跳过下载与解析；
+    文件被覆盖后 generation 改变，缓存自然失效。
+    
+    Args:
+        dataset_url: 数据集的 URL (支持 gs:// 或 https:// 格式)
+        columns: 需要读取的列 (特征列 + 目标列)
+        target_column: 目标列，缺失目标值的行在读取时丢弃
+        max_rows: 最多保留的行数
+        stratify: 是否按目标列分层采样 (分类任务)
+        blob: 已获取的对象元数据 (get_dataset_blob)，避免重复请求
+        
+    Returns:
+        pd.DataFrame: 数据集内容
+    """
+    blob = blob or get_dataset_blob(dataset_url)
+    bucket_name, file_path = blob.bucket.name, blob.name
+        
+    key = cache_key(bucket_name, file_path, blob.generation, list(columns), target_column, max_rows, stratify)
+    df = cache_get(key)
+    if df is not None:
+        print(f"命中数据集缓存: {file_path} (generation {blob.generation})")
+        return df
+        
+    file_format = detect_format(file_path, blob.content_type)
+    print(f"正在从 Bucket: {bucket_name} 流式读取文件: {file_path} ({file_format}, {blob.size} 字节)")
+    
+    # 固定 generation，读取过程中文件被覆盖时失败而不是读到混合内容
+    with blob.open('rb', chunk_size=DOWNLOAD_CHUNK_SIZE, if_generation_match=blob.generation) as fileobj:
+        df = read_dataset(fileobj, file_format, columns, target_column, max_rows, stratify)
+        
+    cache_put(key, df)
+    return df
+
+class StorageCacheRemote:
+    """
+    把预处理缓存保存到 Storage (PreprocessingCache 的远端)
+    
+    固定使用项目自己的 Bucket (ML_PREPROCESS_CACHE_BUCKET，默认为应用的默认 Bucket)，
+    不能使用调用方传入的数据集所在 Bucket，否则任何能写入该 Bucket 的人都能投放缓存条目。
+    """
+    
+    def __init__(self, bucket_name: Optional[str] = None, prefix: str = PREPROCESS_CACHE_PREFIX):
+        self.bucket_name = bucket_name or os.environ.get('ML_PREPROCESS_CACHE_BUCKET') or None
+        self.prefix = prefix
+        
+    def _blob(self, key: str):
+        return storage.bucket(self.bucket_name).blob(f"{self.prefix}/{key}.joblib")
+        
+    def download(self, key: str, local_path: str) -> bool:
+        from google.api_core.exceptions import NotFound
+        try:
+            self._blob(key).download_to_filename(local_path)
+            return True
+        except NotFound:
+            return False
+            
+    def upload(self, key: str, local_path: str) -> None:
+        self._blob(key).upload_from_filename(local_path)
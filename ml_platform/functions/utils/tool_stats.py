@@ -0,0 +1,66 @@
+"""
+MCP 工具调用统计
+按工具记录调用次数、结果来源 (模型 / 缓存 / 知识库)、延迟分位数、token 用量与估算成本。
+统计保存在实例内存中，随实例回收而清空。
+"""
+
+from typing import Any, Dict, Optional
+from collections import Counter, defaultdict, deque
+import os
+import threading
+
+# 每百万 token 的价格 (美元)，默认按 gemini-2.5-flash 计
+INPUT_COST_PER_MTOK = float(os.environ.get('MCP_INPUT_COST_PER_MTOK', '0.30'))
+OUTPUT_COST_PER_MTOK = float(os.environ.get('MCP_OUTPUT_COST_PER_MTOK', '2.50'))
+
+# 每个工具保留最近多少次调用的延迟用于计算分位数
+LATENCY_WINDOW = 500
+
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    return (input_tokens * INPUT_COST_PER_MTOK + output_tokens * OUTPUT_COST_PER_MTOK) / 1_000_000
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ToolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = Counter()
+        self._sources = defaultdict(Counter)
+        self._latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+        self._tokens = defaultdict(lambda: [0, 0])
+        self._cost = Counter()
+
+    def record(self, tool: str, source: str, latency: float, input_tokens: int = 0, output_tokens: int = 0) -> float:
+        """记录一次调用，返回本次的估算成本 (只有实际调用模型时才有成本)"""
+        cost = estimate_cost(input_tokens, output_tokens)
+        with self._lock:
+            self._calls[tool] += 1
+            self._sources[tool][source] += 1
+            self._latencies[tool].append(latency)
+            self._tokens[tool][0] += input_tokens
+            self._tokens[tool][1] += output_tokens
+            self._cost[tool] += cost
+        return cost
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {}
+            for tool, calls in self._calls.items():
+                latencies = list(self._latencies[tool])
+                stats[tool] = {
+                    'calls': calls,
+                    'sources': dict(self._sources[tool]),
+                    'latency_p50_ms': round(_percentile(latencies, 0.5) * 1000, 1),
+                    'latency_p95_ms': round(_percentile(latencies, 0.95) * 1000, 1),
+                    'input_tokens': self._tokens[tool][0],
+                    'output_tokens': self._tokens[tool][1],
+                    'cost_usd': round(self._cost[tool], 6)
+                }
+            return stats
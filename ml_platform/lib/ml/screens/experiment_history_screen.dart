@@ -255,7 +255,19 @@ class _ExperimentHistoryScreenState extends State<ExperimentHistoryScreen> {
     );
   }
   
-  void _navigateToDetail(Map<String, dynamic> experiment) {
+  Future<void> _navigateToDetail(Map<String, dynamic> summary) async {
+    // 列表只包含摘要指标，打开详情时再获取完整记录 (混淆矩阵、模型选择报告等)
+    var experiment = summary;
+    final experimentId = summary['id'] as String?;
+    if (experimentId != null) {
+      try {
+        experiment = await _mlService.getExperimentDetail(experimentId, userId: 'anonymous');
+      } catch (e) {
+        debugPrint('获取实验详情失败，使用摘要: $e');
+      }
+    }
+    if (!mounted) return;
+    
     final config = experiment['modelConfig'] ?? experiment['model_config'] ?? {};
     final featureColumns = (experiment['feature_columns'] as List?)?.cast<String>() ?? [];
     
@@ -188,4 +188,31 @@ class MLService {
       throw MLException('无法获取历史记录: $e', originalError: e);
     }
   }
+
+  /// 获取单个实验的完整记录 (历史列表只包含摘要)
+  Future<Map<String, dynamic>> getExperimentDetail(
+    String experimentId, {
+    String? userId,
+  }) async {
+    try {
+      final currentUserId = userId ?? FirebaseService().currentUser?.uid ?? 'anonymous';
+      
+      final callable = _functions.httpsCallable(
+        'get_experiment_detail',
+        options: HttpsCallableOptions(timeout: _queryTimeout),
+      );
+      
+      final response = await callable.call({
+        'user_id': currentUserId,
+        'experiment_id': experimentId,
+      });
+      
+      final data = Map<String, dynamic>.from(response.data as Map);
+      return Map<String, dynamic>.from(data['experiment'] as Map);
+      
+    } catch (e) {
+      debugPrint('获取实验详情失败: $e');
+      throw MLException('无法获取实验详情: $e', originalError: e);
+    }
+  }
 }
@@ -162,19 +162,26 @@ class AIClient:
         Returns:
             生成的文本
         """
-        # 对于同步客户端,使用线程池执行
+        # 对于同步客户端,使用共享线程池执行 (SDK 客户端复用连接)
         import asyncio
-        from concurrent.futures import ThreadPoolExecutor
         
-        with ThreadPoolExecutor() as executor:
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                executor,
-                self.generate,
-                prompt,
-                max_tokens
-            )
-            return result
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            self.generate,
+            prompt,
+            max_tokens
+        )
+    
+    _executor = None
+    
+    @classmethod
+    def _get_executor(cls):
+        """所有客户端共享的线程池，避免每次调用都创建并销毁线程"""
+        if cls._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            cls._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-client")
+        return cls._executor
 
 
 # 便捷函数
@@ -0,0 +1,58 @@
+"""
+AI 响应缓存 (asyncio 版本)
+按 (工具, 规范化后的参数, 模型, 提示词模板版本) 缓存生成结果，带 TTL 的 LRU；
+相同的请求并发到达时只调用一次模型，其余请求等待同一结果。
+缓存键由 functions/utils/response_cache.py 的 response_cache_key 生成，与 Cloud Functions 一致。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class AsyncResponseCache:
+    """带 TTL 的 LRU 缓存 + single-flight"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def _get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """返回 (结果, 来源)；来源为 memory / coalesced / computed"""
+        value = self._get(key)
+        if value is not None:
+            return value, 'memory'
+        if key in self._in_flight:
+            # shield: 某个等待者被取消时不影响正在进行的调用
+            return await asyncio.shield(self._in_flight[key]), 'coalesced'
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        future.set_result(value)
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value, 'computed'
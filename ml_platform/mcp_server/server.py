@@ -5,6 +5,7 @@ MCP Server for ML Platform
 
 import asyncio
 import json
+import time
 from typing import Any, Optional
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
@@ -15,7 +16,33 @@ from mcp.types import (
     ImageContent,
 )
 import os
+import sys
+
+# 知识库、缓存键与调用统计使用 functions 目录中的同一份实现
+FUNCTIONS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'functions'))
+if FUNCTIONS_DIR not in sys.path:
+    sys.path.append(FUNCTIONS_DIR)
+
 from ai_client import create_ai_client
+from response_cache import AsyncResponseCache
+from api.knowledge import load_algorithm_knowledge
+from utils.response_cache import response_cache_key
+from utils.tool_stats import ToolStats
+
+# 修改任一提示词模板时递增，使缓存中的旧结果失效
+PROMPT_TEMPLATE_VERSION = 1
+
+# 各工具响应的缓存时间 (秒)；调试类工具不缓存
+CACHE_TTLS = {
+    "explain_algorithm": 7 * 24 * 3600,
+    "compare_algorithms": 7 * 24 * 3600,
+    "suggest_hyperparameters": 24 * 3600,
+    "generate_visualization_code": 24 * 3600,
+    "analyze_ml_results": 3600,
+}
+
+# 知识库中可以直接对比的维度
+LOCAL_COMPARISON_CRITERIA = {"complexity", "use_cases", "pros_cons"}
 
 
 class MLPlatformMCPServer:
@@ -30,90 +57,16 @@ class MLPlatformMCPServer:
         # 算法知识库
         self.algorithm_knowledge = self._load_algorithm_knowledge()
         
+        # 响应缓存与调用统计
+        self.response_cache = AsyncResponseCache()
+        self.tool_stats = ToolStats()
+        
         # 注册工具
         self._register_tools()
         
     def _load_algorithm_knowledge(self) -> dict:
-        """加载算法知识库"""
-        return {
-            "sorting": {
-                "bubble_sort": {
-                    "name": "冒泡排序",
-                    "complexity": {"time": "O(n²)", "space": "O(1)"},
-                    "principle": "重复遍历列表,比较相邻元素并交换位置",
-                    "use_cases": "小规模数据排序,教学演示"
-                },
-                "quick_sort": {
-                    "name": "快速排序",
-                    "complexity": {"time": "O(n log n)", "space": "O(log n)"},
-                    "principle": "分治法,选择基准元素进行分区",
-                    "use_cases": "通用排序,平均性能最优"
-                },
-                "merge_sort": {
-                    "name": "归并排序",
-                    "complexity": {"time": "O(n log n)", "space": "O(n)"},
-                    "principle": "分治法,将数组分割后合并",
-                    "use_cases": "稳定排序,链表排序"
-                }
-            },
-            "data_structures": {
-                "binary_tree": {
-                    "name": "二叉树",
-                    "operations": ["插入", "删除", "查找", "遍历"],
-                    "complexity": {"search": "O(log n)", "insert": "O(log n)"},
-                    "use_cases": "数据存储,表达式解析"
-                },
-                "hash_table": {
-                    "name": "哈希表",
-                    "operations": ["插入", "删除", "查找"],
-                    "complexity": {"average": "O(1)", "worst": "O(n)"},
-                    "use_cases": "快速查找,缓存实现"
-                }
-            },
-            "os_algorithms": {
-                "fcfs": {
-                    "name": "先来先服务调度",
-                    "principle": "按到达时间顺序执行进程",
-                    "pros": "简单公平",
-                    "cons": "平均等待时间长"
-                },
-                "sjf": {
-                    "name": "最短作业优先",
-                    "principle": "优先执行服务时间最短的进程",
-                    "pros": "平均等待时间最短",
-                    "cons": "可能导致饥饿"
-                },
-                "round_robin": {
-                    "name": "时间片轮转",
-                    "principle": "每个进程分配固定时间片",
-                    "pros": "公平性好,响应时间快",
-                    "cons": "上下文切换开销"
-                }
-            },
-            "ml_algorithms": {
-                "random_forest": {
-                    "name": "随机森林",
-                    "type": "集成学习",
-                    "principle": "多个决策树投票",
-                    "hyperparameters": ["n_estimators", "max_depth", "min_samples_split"],
-                    "use_cases": "分类和回归,特征重要性分析"
-                },
-                "kmeans": {
-                    "name": "K-Means聚类",
-                    "type": "无监督学习",
-                    "principle": "迭代优化聚类中心",
-                    "hyperparameters": ["n_clusters", "max_iter", "init"],
-                    "use_cases": "客户分群,图像压缩"
-                },
-                "svm": {
-                    "name": "支持向量机",
-                    "type": "监督学习",
-                    "principle": "寻找最优分类超平面",
-                    "hyperparameters": ["C", "kernel", "gamma"],
-                    "use_cases": "二分类,文本分类"
-                }
-            }
-        }
+        """加载算法知识库 (与 Cloud Functions 共用 functions/api/algorithm_knowledge.json)"""
+        return load_algorithm_knowledge()
     
     def _register_tools(self):
         """注册 MCP 工具"""
@@ -262,6 +215,11 @@ class MLPlatformMCPServer:
                         },
                         "required": ["error_message"]
                     }
+                ),
+                Tool(
+                    name="tool_stats",
+                    description="查看各工具的调用次数、缓存命中与延迟统计",
+                    inputSchema={"type": "object", "properties": {}}
                 )
             ]
         
@@ -287,12 +245,62 @@ class MLPlatformMCPServer:
             elif name == "debug_visualization":
                 return await self._debug_visualization(arguments)
             
+            elif name == "tool_stats":
+                return [TextContent(
+                    type="text",
+                    text=json.dumps(self.tool_stats.snapshot(), indent=2, ensure_ascii=False)
+                )]
+            
             else:
                 return [TextContent(
                     type="text",
                     text=f"未知工具: {name}"
                 )]
     
+    async def _generate(self, tool: str, args: dict, prompt: str, max_tokens: int) -> str:
+        """调用模型；可缓存的工具按参数缓存，相同的并发请求只调用一次"""
+        start = time.perf_counter()
+        if tool in CACHE_TTLS:
+            key = response_cache_key(tool, args, f"{self.ai_client.provider}/{self.ai_client.model}",
+                                     PROMPT_TEMPLATE_VERSION)
+            text, source = await self.response_cache.get_or_compute(
+                key, CACHE_TTLS[tool], lambda: self.ai_client.generate_async(prompt, max_tokens=max_tokens)
+            )
+        else:
+            text, source = await self.ai_client.generate_async(prompt, max_tokens=max_tokens), "computed"
+        self.tool_stats.record(tool, "model" if source == "computed" else f"cache:{source}",
+                               time.perf_counter() - start)
+        return text
+    
+    def _local_comparison(self, algorithms: list, category: str, criteria: list) -> Optional[str]:
+        """所有算法都已收录且对比维度都是知识库字段时，直接生成对比表格"""
+        knowledge = self.algorithm_knowledge.get(category, {})
+        if len(algorithms) < 2 or not set(criteria) <= LOCAL_COMPARISON_CRITERIA:
+            return None
+        header = ["算法", "原理"]
+        for criterion in criteria:
+            header += {"complexity": ["复杂度"], "use_cases": ["适用场景"], "pros_cons": ["优点", "缺点"]}[criterion]
+        rows = []
+        for algo in algorithms:
+            info = knowledge.get(algo)
+            if not info:
+                return None
+            cells = [info["name"], info.get("principle", "-")]
+            for criterion in criteria:
+                if criterion == "complexity":
+                    values = [", ".join(f"{k}: {v}" for k, v in info["complexity"].items()) if "complexity" in info else None]
+                elif criterion == "use_cases":
+                    values = [info.get("use_cases")]
+                else:
+                    values = [info.get("pros"), info.get("cons")]
+                if any(v is None for v in values):
+                    return None
+                cells += values
+            rows.append(cells)
+        lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+        lines += ["| " + " | ".join(row) + " |" for row in rows]
+        return f"## {category} 算法对比\n\n" + "\n".join(lines)
+    
     async def _explain_algorithm(self, args: dict) -> list[TextContent]:
         """解释算法"""
         algorithm_name = args["algorithm_name"]
@@ -331,13 +339,7 @@ class MLPlatformMCPServer:
 - 优化技巧
 """
         
-        message = self.client.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
-        explanation = message.content[0].text
+        explanation = await self._generate("explain_algorithm", args, prompt, max_tokens=2000)
         
         return [TextContent(
             type="text",
@@ -366,7 +368,7 @@ class MLPlatformMCPServer:
 - 交互控制 (播放/暂停/速度调节)
 """
         
-        code = await self.ai_client.generate_async(prompt, max_tokens=3000)
+        code = await self._generate("generate_visualization_code", args, prompt, max_tokens=3000)
         
         return [TextContent(
             type="text",
@@ -396,7 +398,7 @@ class MLPlatformMCPServer:
 请以考研学生能理解的方式解释。
 """
         
-        analysis = await self.ai_client.generate_async(prompt, max_tokens=2000)
+        analysis = await self._generate("analyze_ml_results", args, prompt, max_tokens=2000)
         
         return [TextContent(
             type="text",
@@ -432,7 +434,7 @@ class MLPlatformMCPServer:
 4. 调优策略 (网格搜索/随机搜索/贝叶斯优化)
 """
         
-        suggestions = await self.ai_client.generate_async(prompt, max_tokens=1500)
+        suggestions = await self._generate("suggest_hyperparameters", args, prompt, max_tokens=1500)
         
         return [TextContent(
             type="text",
@@ -445,6 +447,13 @@ class MLPlatformMCPServer:
         category = args["category"]
         criteria = args.get("comparison_criteria", ["complexity", "use_cases"])
         
+        # 知识库能完整回答时不调用模型
+        start = time.perf_counter()
+        local = self._local_comparison(algorithms, category, criteria)
+        if local is not None:
+            self.tool_stats.record("compare_algorithms", "knowledge_base", time.perf_counter() - start)
+            return [TextContent(type="text", text=local)]
+        
         # 收集算法信息
         algo_infos = {}
         for algo in algorithms:
@@ -467,7 +476,7 @@ class MLPlatformMCPServer:
 4. 选择建议 (什么情况下用哪个)
 """
         
-        comparison = await self.ai_client.generate_async(prompt, max_tokens=2000)
+        comparison = await self._generate("compare_algorithms", args, prompt, max_tokens=2000)
         
         return [TextContent(
             type="text",
@@ -500,7 +509,7 @@ class MLPlatformMCPServer:
 4. 预防类似问题的建议
 """
         
-        debug_help = await self.ai_client.generate_async(prompt, max_tokens=2000)
+        debug_help = await self._generate("debug_visualization", args, prompt, max_tokens=2000)
         
         return [TextContent(
             type="text",
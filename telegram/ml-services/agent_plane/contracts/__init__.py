@@ -1,6 +1,7 @@
-from .models import AgentConversationItem, AgentContextSnapshot, AgentImagePayload, AgentRespondRequest, AgentRespondResponse
+from .models import AgentContextStats, AgentConversationItem, AgentContextSnapshot, AgentImagePayload, AgentRespondRequest, AgentRespondResponse
 
 __all__ = [
+    "AgentContextStats",
     "AgentConversationItem",
     "AgentContextSnapshot",
     "AgentImagePayload",
@@ -84,6 +84,14 @@ class AgentRespondRequest(BaseModel):
     contextSnapshot: AgentContextSnapshot
 
 
+class AgentContextStats(BaseModel):
+    promptTokens: int
+    baselineTokens: int
+    savedTokens: int
+    tokenBudget: int
+    summarizedTurns: int = 0
+
+
 class AgentRespondData(BaseModel):
     message: str
     suggestions: List[str] = Field(default_factory=list)
@@ -91,6 +99,7 @@ class AgentRespondData(BaseModel):
     model: str = "unknown"
     mode: str = "agent_primary"
     fallback: bool = False
+    contextStats: Optional[AgentContextStats] = None
 
 
 class AgentRespondResponse(BaseModel):
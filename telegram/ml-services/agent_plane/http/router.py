@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import json
+from typing import AsyncIterator
+
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
 from agent_plane.contracts.models import AgentRespondRequest, AgentRespondResponse
 from agent_plane.orchestrator import AgentOrchestrator
@@ -9,17 +13,41 @@ router = APIRouter(tags=["agent-plane"])
 orchestrator = AgentOrchestrator()
 
 
+def _sse(event: str, data: dict[str, object]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.get("/health")
 async def health() -> dict[str, object]:
+    snapshot = getattr(orchestrator.provider, "snapshot", None)
     return {
         "status": "ok",
         "service": "agent-plane",
+        "providers": snapshot() if callable(snapshot) else {},
     }
 
 
 @router.post("/respond", response_model=AgentRespondResponse)
 async def respond(payload: AgentRespondRequest) -> AgentRespondResponse:
     try:
-        return orchestrator.respond(payload)
+        return await orchestrator.respond_async(payload)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"agent_plane_failed: {exc}") from exc
+
+
+@router.post("/respond/stream")
+async def respond_stream(payload: AgentRespondRequest) -> StreamingResponse:
+    """以 server-sent events 返回：meta → delta* → done；生成中途失败时以 error 事件结束。"""
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in orchestrator.respond_stream(payload):
+                yield _sse(event, data)
+        except Exception as exc:
+            yield _sse("error", {"detail": f"agent_plane_failed: {exc}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
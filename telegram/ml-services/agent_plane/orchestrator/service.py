@@ -1,44 +1,100 @@
 from __future__ import annotations
 
+from typing import AsyncIterator
+
 from agent_plane.contracts.models import AgentRespondData, AgentRespondRequest, AgentRespondResponse
-from agent_plane.planner import build_execution_plan
-from agent_plane.prompts import build_agent_system_instruction, render_context_blocks
-from agent_plane.providers import GeminiProvider
-from agent_plane.state import compact_history
+from agent_plane.planner import AgentExecutionPlan, build_execution_plan
+from agent_plane.prompts import build_agent_system_instruction, collect_context_sections
+from agent_plane.providers import AgentProvider, build_default_router, collect_stream
+from agent_plane.state import CompactedContext, ConversationContextManager
 
 
 class AgentOrchestrator:
-    def __init__(self, provider: GeminiProvider | None = None) -> None:
-        self.provider = provider or GeminiProvider()
+    def __init__(
+        self,
+        provider: AgentProvider | None = None,
+        context_manager: ConversationContextManager | None = None,
+    ) -> None:
+        self.provider = provider or build_default_router()
+        self.context_manager = context_manager or ConversationContextManager()
 
-    def respond(self, request: AgentRespondRequest) -> AgentRespondResponse:
+    def _prepare(self, request: AgentRespondRequest) -> tuple[AgentExecutionPlan, CompactedContext, dict[str, object]]:
         plan = build_execution_plan(request.message, request.contextSnapshot)
-        history = compact_history(request.conversationHistory)
-        context_blocks = render_context_blocks(request.contextSnapshot, plan.active_scopes)
-
-        prompt_sections = [f"用户问题：{request.message.strip()}"]
-        if context_blocks:
-            prompt_sections.append(f"以下是与当前用户有关的上下文，请优先利用它回答：\n{context_blocks}")
-
-        provider_result = self.provider.generate(
-            system_instruction=build_agent_system_instruction(plan.response_style),
-            prompt="\n\n".join(prompt_sections),
-            history=history,
-            image_data=request.imageData,
+        system_instruction = build_agent_system_instruction(plan.response_style)
+        question = f"用户问题：{request.message.strip()}"
+        compacted = self.context_manager.build(
+            user_id=request.userId,
+            conversation_id=request.conversationId,
+            history=request.conversationHistory,
+            sections=collect_context_sections(request.contextSnapshot, plan.active_scopes),
+            fixed_text=system_instruction + question,
+        )
+
+        prompt_sections = [question]
+        if compacted.summary:
+            prompt_sections.append(f"此前对话的摘要：\n{compacted.summary}")
+        if compacted.context_blocks:
+            prompt_sections.append(f"以下是与当前用户有关的上下文，请优先利用它回答：\n{compacted.context_blocks}")
+
+        provider_kwargs: dict[str, object] = {
+            "system_instruction": system_instruction,
+            "prompt": "\n\n".join(prompt_sections),
+            "history": compacted.history,
+            "image_data": request.imageData,
+        }
+        return plan, compacted, provider_kwargs
+
+    def _build_data(
+        self, plan: AgentExecutionPlan, compacted: CompactedContext, provider_result: dict[str, object]
+    ) -> AgentRespondData:
+        return AgentRespondData(
+            message=str(provider_result["message"]),
+            suggestions=self._build_follow_up_suggestions(plan.active_scopes),
+            usedScopes=plan.active_scopes,
+            model=str(provider_result["model"]),
+            mode="agent_primary",
+            fallback=bool(provider_result.get("fallback")),
+            contextStats=compacted.stats,
         )
 
-        suggestions = self._build_follow_up_suggestions(plan.active_scopes)
-        return AgentRespondResponse(
-            success=True,
-            data=AgentRespondData(
-                message=str(provider_result["message"]),
-                suggestions=suggestions,
-                usedScopes=plan.active_scopes,
-                model=str(provider_result["model"]),
-                mode="agent_primary",
-                fallback=False,
-            ),
+    def respond(self, request: AgentRespondRequest) -> AgentRespondResponse:
+        plan, compacted, provider_kwargs = self._prepare(request)
+        provider_result = self.provider.generate(**provider_kwargs)
+        return AgentRespondResponse(success=True, data=self._build_data(plan, compacted, provider_result))
+
+    async def respond_async(self, request: AgentRespondRequest) -> AgentRespondResponse:
+        """与 respond 相同的结果，但通过异步流式接口生成，不占用工作线程。"""
+        plan, compacted, provider_kwargs = self._prepare(request)
+        provider_result = await collect_stream(self.provider.stream(**provider_kwargs))
+        return AgentRespondResponse(success=True, data=self._build_data(plan, compacted, provider_result))
+
+    async def respond_stream(self, request: AgentRespondRequest) -> AsyncIterator[tuple[str, dict[str, object]]]:
+        """
+        产出 (事件, 数据)：先是 meta (使用的上下文)，然后逐段 delta，
+        最后 done 携带与 /respond 相同结构的完整 data。
+        """
+        plan, compacted, provider_kwargs = self._prepare(request)
+        yield "meta", {"usedScopes": plan.active_scopes, "mode": "agent_primary"}
+
+        parts: list[str] = []
+        done = None
+        async for chunk in self.provider.stream(**provider_kwargs):
+            if chunk.text:
+                parts.append(chunk.text)
+                yield "delta", {"text": chunk.text}
+            if chunk.done:
+                done = chunk
+
+        data = self._build_data(
+            plan,
+            compacted,
+            {
+                "message": "".join(parts).strip(),
+                "model": done.model if done else "",
+                "fallback": done.fallback if done else False,
+            },
         )
+        yield "done", data.model_dump()
 
     def _build_follow_up_suggestions(self, scopes: list[str]) -> list[str]:
         if "notifications" in scopes:
@@ -1,3 +1,4 @@
-from .policy import AgentExecutionPlan, build_execution_plan
+from .matcher import KeywordAutomaton
+from .policy import AgentExecutionPlan, build_execution_plan, score_scopes
 
-__all__ = ["AgentExecutionPlan", "build_execution_plan"]
+__all__ = ["AgentExecutionPlan", "KeywordAutomaton", "build_execution_plan", "score_scopes"]
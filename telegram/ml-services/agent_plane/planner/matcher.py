@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and (char.isalnum() or char == "_")
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 多模式匹配：所有分区的关键词编译进同一个自动机，
+    一次扫描消息即可得到每个分区的加权得分，耗时与关键词数量无关。
+
+    英文关键词要求整词匹配 (避免 "post" 命中 "postgres")，中文关键词按子串匹配。
+    """
+
+    def __init__(self, keywords: Mapping[str, Iterable[Tuple[str, float]]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态结束的关键词：(关键词长度, 分区, 权重, 是否整词匹配)
+        self._output: List[List[Tuple[int, str, float, bool]]] = [[]]
+        for scope, entries in keywords.items():
+            for keyword, weight in entries:
+                self._add(keyword.strip().lower(), scope, weight)
+        self._build_failure_links()
+
+    def _add(self, keyword: str, scope: str, weight: float) -> None:
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        whole_word = _is_word_char(keyword[0]) or _is_word_char(keyword[-1])
+        self._output[state].append((len(keyword), scope, weight, whole_word))
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    @property
+    def state_count(self) -> int:
+        return len(self._goto)
+
+    def score(self, text: str) -> Dict[str, float]:
+        """返回命中分区的得分：同一关键词多次出现只计一次。"""
+        scores: Dict[str, float] = {}
+        seen: set[Tuple[str, str]] = set()
+        goto = self._goto
+        fail = self._fail
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, scope, weight, whole_word in self._output[state]:
+                start = index - length + 1
+                if whole_word and (
+                    (start > 0 and _is_word_char(text[start - 1]))
+                    or (index + 1 < len(text) and _is_word_char(text[index + 1]))
+                ):
+                    continue
+                key = (text[start : index + 1], scope)
+                if key in seen:
+                    continue
+                seen.add(key)
+                scores[scope] = scores.get(scope, 0.0) + weight
+        return scores
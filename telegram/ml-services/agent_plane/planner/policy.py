@@ -1,48 +1,67 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Tuple
 
 from agent_plane.contracts.models import AgentContextSnapshot, AgentScope
+from agent_plane.planner.matcher import KeywordAutomaton
 
-FEED_KEYWORDS = ("动态", "推荐", "feed", "space", "帖子", "关注", "时间线")
-NOTIFICATION_KEYWORDS = ("通知", "提醒", "谁找我", "谁赞", "谁回复", "未读")
-NEWS_KEYWORDS = ("新闻", "热点", "头条", "快讯", "时事", "今天发生")
+# (关键词, 权重)；明确指向某个分区的词权重更高，得分决定多个分区同时命中时的顺序
+SCOPE_KEYWORDS: Dict[AgentScope, Tuple[Tuple[str, float], ...]] = {
+    "feed": (
+        ("动态", 2.0), ("feed", 2.0), ("时间线", 2.0), ("timeline", 2.0),
+        ("推荐", 1.0), ("space", 1.0), ("帖子", 1.0), ("关注", 1.0), ("post", 1.0), ("posts", 1.0),
+    ),
+    "notifications": (
+        ("通知", 2.0), ("notification", 2.0), ("notifications", 2.0), ("未读", 2.0), ("unread", 2.0),
+        ("提醒", 1.0), ("谁找我", 1.0), ("谁赞", 1.0), ("谁回复", 1.0), ("mention", 1.0), ("mentions", 1.0),
+    ),
+    "news": (
+        ("新闻", 2.0), ("news", 2.0), ("头条", 2.0), ("headline", 2.0), ("headlines", 2.0),
+        ("热点", 1.0), ("快讯", 1.0), ("时事", 1.0), ("今天发生", 1.0),
+    ),
+}
+SCOPE_ORDER: Tuple[AgentScope, ...] = ("feed", "notifications", "news")
+MIN_SCOPE_SCORE = 1.0
+
+SCOPE_MATCHER = KeywordAutomaton(SCOPE_KEYWORDS)
 
 
 @dataclass(frozen=True)
 class AgentExecutionPlan:
     active_scopes: List[AgentScope]
     response_style: str
+    scope_scores: Dict[str, float] = field(default_factory=dict)
 
 
-def _contains_any(text: str, keywords: tuple[str, ...]) -> bool:
-    return any(keyword in text for keyword in keywords)
+def score_scopes(message: str) -> Dict[str, float]:
+    return SCOPE_MATCHER.score(message.strip().lower())
 
 
-def build_execution_plan(message: str, snapshot: AgentContextSnapshot) -> AgentExecutionPlan:
-    normalized = message.strip().lower()
-    active_scopes: list[AgentScope] = []
-    detected_explicit_scope = False
-
-    if _contains_any(normalized, FEED_KEYWORDS) and snapshot.feed and snapshot.feed.items:
-        active_scopes.append("feed")
-        detected_explicit_scope = True
-    if _contains_any(normalized, NOTIFICATION_KEYWORDS) and snapshot.notifications and snapshot.notifications.items:
-        active_scopes.append("notifications")
-        detected_explicit_scope = True
-    if _contains_any(normalized, NEWS_KEYWORDS) and snapshot.news and snapshot.news.items:
-        active_scopes.append("news")
-        detected_explicit_scope = True
-
-    if not active_scopes and not detected_explicit_scope:
-        for scope in snapshot.requestedScopes:
-            if scope == "feed" and snapshot.feed and snapshot.feed.items:
-                active_scopes.append(scope)
-            if scope == "notifications" and snapshot.notifications and snapshot.notifications.items:
-                active_scopes.append(scope)
-            if scope == "news" and snapshot.news and snapshot.news.items:
-                active_scopes.append(scope)
+def _available_scopes(snapshot: AgentContextSnapshot) -> Tuple[AgentScope, ...]:
+    available: list[AgentScope] = []
+    if snapshot.feed and snapshot.feed.items:
+        available.append("feed")
+    if snapshot.notifications and snapshot.notifications.items:
+        available.append("notifications")
+    if snapshot.news and snapshot.news.items:
+        available.append("news")
+    return tuple(available)
+
+
+@lru_cache(maxsize=2048)
+def _plan(
+    normalized: str, available: Tuple[AgentScope, ...], requested: Tuple[AgentScope, ...]
+) -> Tuple[Tuple[AgentScope, ...], str, Tuple[Tuple[str, float], ...]]:
+    scores = SCOPE_MATCHER.score(normalized)
+    active_scopes = sorted(
+        (scope for scope in SCOPE_ORDER if scope in available and scores.get(scope, 0.0) >= MIN_SCOPE_SCORE),
+        key=lambda scope: -scores[scope],
+    )
+
+    if not active_scopes:
+        active_scopes = [scope for scope in requested if scope in available]
 
     if not active_scopes:
         response_style = "general_assistant"
@@ -51,4 +70,14 @@ def build_execution_plan(message: str, snapshot: AgentContextSnapshot) -> AgentE
     else:
         response_style = "blended_context"
 
-    return AgentExecutionPlan(active_scopes=active_scopes, response_style=response_style)
+    return tuple(active_scopes), response_style, tuple(sorted(scores.items()))
+
+
+def build_execution_plan(message: str, snapshot: AgentContextSnapshot) -> AgentExecutionPlan:
+    # 计划只取决于消息与可用分区，重复的 (消息, 分区) 直接命中缓存
+    active_scopes, response_style, scores = _plan(
+        message.strip().lower(), _available_scopes(snapshot), tuple(snapshot.requestedScopes)
+    )
+    return AgentExecutionPlan(
+        active_scopes=list(active_scopes), response_style=response_style, scope_scores=dict(scores)
+    )
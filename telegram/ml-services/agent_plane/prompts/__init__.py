@@ -1,3 +1,17 @@
-from .templates import build_agent_system_instruction, render_context_blocks
+from .templates import (
+    ContextRow,
+    ContextSection,
+    build_agent_system_instruction,
+    collect_context_sections,
+    render_context_blocks,
+    render_context_sections,
+)
 
-__all__ = ["build_agent_system_instruction", "render_context_blocks"]
+__all__ = [
+    "ContextRow",
+    "ContextSection",
+    "build_agent_system_instruction",
+    "collect_context_sections",
+    "render_context_blocks",
+    "render_context_sections",
+]
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import List
 
 from agent_plane.contracts.models import AgentContextSnapshot, AgentScope
@@ -21,31 +22,66 @@ def build_agent_system_instruction(style: str) -> str:
     )
 
 
-def render_context_blocks(snapshot: AgentContextSnapshot, scopes: List[AgentScope]) -> str:
-    sections: list[str] = []
+@dataclass(frozen=True)
+class ContextRow:
+    key: str
+    text: str
+
+
+@dataclass(frozen=True)
+class ContextSection:
+    title: str
+    rows: List[ContextRow]
+
+
+def collect_context_sections(snapshot: AgentContextSnapshot, scopes: List[AgentScope]) -> List[ContextSection]:
+    """按作用域整理上下文条目；分条保存，超出 token 预算时可以逐条裁剪。"""
+    sections: list[ContextSection] = []
 
     if "feed" in scopes and snapshot.feed:
         rows = [
-            f"- @{item.authorUsername or 'unknown'}: {item.title or item.snippet}（{item.recallSource or 'feed'}）"
+            ContextRow(
+                key=f"feed:{item.postId}",
+                text=f"- @{item.authorUsername or 'unknown'}: {item.title or item.snippet}（{item.recallSource or 'feed'}）",
+            )
             for item in snapshot.feed.items[:5]
         ]
         if rows:
-            sections.append("【最近动态】\n" + "\n".join(rows))
+            sections.append(ContextSection("【最近动态】", rows))
 
     if "notifications" in scopes and snapshot.notifications:
         rows = [
-            f"- {item.actorUsername or '有人'} · {item.type} · {item.actionText or item.postSnippet or '有新的互动'}"
+            ContextRow(
+                key=f"notification:{item.id}",
+                text=f"- {item.actorUsername or '有人'} · {item.type} · {item.actionText or item.postSnippet or '有新的互动'}",
+            )
             for item in snapshot.notifications.items[:5]
         ]
         if rows:
-            sections.append("【最近通知】\n" + "\n".join(rows))
+            sections.append(ContextSection("【最近通知】", rows))
 
     if "news" in scopes and snapshot.news:
         rows = [
-            f"- {item.title}（{item.source or 'news'}）：{item.summary}"
+            ContextRow(
+                key=f"news:{item.postId or item.url or item.title}",
+                text=f"- {item.title}（{item.source or 'news'}）：{item.summary}",
+            )
             for item in snapshot.news.items[:5]
         ]
         if rows:
-            sections.append("【新闻简报】\n" + "\n".join(rows))
+            sections.append(ContextSection("【新闻简报】", rows))
 
-    return "\n\n".join(sections)
+    return sections
+
+
+def render_context_sections(sections: List[ContextSection]) -> str:
+    # provider 是无状态的，每次请求都完整发送上下文
+    blocks: list[str] = []
+    for section in sections:
+        if section.rows:
+            blocks.append(section.title + "\n" + "\n".join(row.text for row in section.rows))
+    return "\n\n".join(blocks)
+
+
+def render_context_blocks(snapshot: AgentContextSnapshot, scopes: List[AgentScope]) -> str:
+    return render_context_sections(collect_context_sections(snapshot, scopes))
@@ -1,3 +1,14 @@
+from .base import AgentProvider, ProviderChunk, collect_stream
 from .gemini import GeminiProvider
+from .router import ProviderHealth, ProviderRouter, RoutedProvider, build_default_router
 
-__all__ = ["GeminiProvider"]
+__all__ = [
+    "AgentProvider",
+    "GeminiProvider",
+    "ProviderChunk",
+    "ProviderHealth",
+    "ProviderRouter",
+    "RoutedProvider",
+    "build_default_router",
+    "collect_stream",
+]
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional, Protocol
+
+from agent_plane.contracts.models import AgentConversationItem, AgentImagePayload
+
+
+@dataclass(frozen=True)
+class ProviderChunk:
+    """流式生成的一段输出；最后一段 done=True，携带模型名与 token 用量。"""
+
+    text: str = ""
+    done: bool = False
+    model: str = ""
+    tokens_used: int = 0
+    fallback: bool = False
+
+
+class AgentProvider(Protocol):
+    def generate(
+        self,
+        *,
+        system_instruction: str,
+        prompt: str,
+        history: Iterable[AgentConversationItem],
+        image_data: Optional[AgentImagePayload] = None,
+    ) -> dict[str, object]: ...
+
+    def stream(
+        self,
+        *,
+        system_instruction: str,
+        prompt: str,
+        history: Iterable[AgentConversationItem],
+        image_data: Optional[AgentImagePayload] = None,
+    ) -> AsyncIterator[ProviderChunk]: ...
+
+
+async def collect_stream(chunks: AsyncIterator[ProviderChunk]) -> dict[str, object]:
+    """把流式输出合并成与 generate 相同的结果。"""
+    parts: list[str] = []
+    model = ""
+    tokens_used = 0
+    fallback = False
+    async for chunk in chunks:
+        if chunk.text:
+            parts.append(chunk.text)
+        if chunk.done:
+            model = chunk.model
+            tokens_used = chunk.tokens_used
+            fallback = chunk.fallback
+    message = "".join(parts).strip()
+    if not message:
+        raise RuntimeError("provider_empty_response")
+    return {"message": message, "model": model, "tokens_used": tokens_used, "fallback": fallback}
@@ -1,35 +1,43 @@
 from __future__ import annotations
 
+import json
 import os
-from typing import Iterable, Optional
+from typing import AsyncIterator, Iterable, Optional
 
+import httpx
 import requests
 
 from agent_plane.contracts.models import AgentConversationItem, AgentImagePayload
+from agent_plane.providers.base import ProviderChunk
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
 
 
 class GeminiProvider:
-    def __init__(self) -> None:
+    def __init__(self, model_name: str | None = None, transport: httpx.AsyncBaseTransport | None = None) -> None:
         self.api_key = (os.getenv("GEMINI_API_KEY") or "").strip()
-        self.model_name = (os.getenv("AI_AGENT_GEMINI_MODEL") or "gemini-2.0-flash").strip()
+        self.model_name = (model_name or os.getenv("AI_AGENT_GEMINI_MODEL") or "gemini-2.0-flash").strip()
         self.timeout_s = float(os.getenv("AI_AGENT_TIMEOUT_SECONDS", "25") or "25")
+        self.base_url = (os.getenv("AI_AGENT_GEMINI_BASE_URL") or DEFAULT_BASE_URL).strip().rstrip("/")
+        self.max_connections = int(os.getenv("AI_AGENT_MAX_CONNECTIONS", "20") or "20")
+        self._transport = transport
+        self._session: requests.Session | None = None
+        self._async_client: httpx.AsyncClient | None = None
 
-    def generate(
+    def _headers(self) -> dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "x-goog-api-key": self.api_key,
+        }
+
+    def _build_contents(
         self,
-        *,
         system_instruction: str,
         prompt: str,
         history: Iterable[AgentConversationItem],
-        image_data: Optional[AgentImagePayload] = None,
-    ) -> dict[str, object]:
-        if not self.api_key:
-            raise RuntimeError("gemini_api_key_missing")
-
-        api_url = (
-            f"https://generativelanguage.googleapis.com/v1beta/models/"
-            f"{self.model_name}:generateContent?key={self.api_key}"
-        )
-
+        image_data: Optional[AgentImagePayload],
+    ) -> list[dict[str, object]]:
         contents: list[dict[str, object]] = [
             {"role": "model", "parts": [{"text": system_instruction}]},
         ]
@@ -55,12 +63,48 @@ class GeminiProvider:
                 }
             )
         contents.append({"role": "user", "parts": current_parts})
+        return contents
+
+    def _get_session(self) -> requests.Session:
+        # 复用连接，避免每次请求重新握手
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=self._transport,
+                timeout=httpx.Timeout(self.timeout_s, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._async_client
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def generate(
+        self,
+        *,
+        system_instruction: str,
+        prompt: str,
+        history: Iterable[AgentConversationItem],
+        image_data: Optional[AgentImagePayload] = None,
+    ) -> dict[str, object]:
+        if not self.api_key:
+            raise RuntimeError("gemini_api_key_missing")
 
-        response = requests.post(
-            api_url,
-            json={"contents": contents},
+        response = self._get_session().post(
+            f"{self.base_url}/models/{self.model_name}:generateContent",
+            json={"contents": self._build_contents(system_instruction, prompt, history, image_data)},
             timeout=self.timeout_s,
-            headers={"Content-Type": "application/json", "Accept": "application/json"},
+            headers=self._headers(),
         )
         response.raise_for_status()
         payload = response.json()
@@ -73,3 +117,47 @@ class GeminiProvider:
           "model": self.model_name,
           "tokens_used": int(payload.get("usageMetadata", {}).get("totalTokenCount", 0) or 0),
         }
+
+    async def stream(
+        self,
+        *,
+        system_instruction: str,
+        prompt: str,
+        history: Iterable[AgentConversationItem],
+        image_data: Optional[AgentImagePayload] = None,
+    ) -> AsyncIterator[ProviderChunk]:
+        """通过 streamGenerateContent (SSE) 逐段产出文本，最后产出 done 块。"""
+        if not self.api_key:
+            raise RuntimeError("gemini_api_key_missing")
+
+        tokens_used = 0
+        produced = False
+        async with self._get_async_client().stream(
+            "POST",
+            f"/models/{self.model_name}:streamGenerateContent",
+            params={"alt": "sse"},
+            json={"contents": self._build_contents(system_instruction, prompt, history, image_data)},
+            headers={**self._headers(), "Accept": "text/event-stream"},
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if not data or data == "[DONE]":
+                    continue
+                payload = json.loads(data)
+                usage = payload.get("usageMetadata") or {}
+                tokens_used = int(usage.get("totalTokenCount", tokens_used) or tokens_used)
+                for candidate in payload.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        text = part.get("text")
+                        if isinstance(text, str) and text:
+                            produced = True
+                            yield ProviderChunk(text=text)
+
+        if not produced:
+            raise RuntimeError("gemini_empty_response")
+        yield ProviderChunk(done=True, model=self.model_name, tokens_used=tokens_used)
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+
+from agent_plane.contracts.models import AgentConversationItem, AgentImagePayload
+from agent_plane.providers.base import AgentProvider, ProviderChunk
+
+CANNED_ANSWER = "抱歉，AI 助手暂时繁忙，请稍后再试。"
+
+
+class ProviderHealth:
+    """
+    单个 provider 的健康状况：首包延迟与错误率的 EWMA、延迟分位数，以及熔断器。
+
+    首包延迟 (流式) 与整段生成延迟 (同步) 分别放在两个窗口里：对冲只看首包延迟，
+    若混入整段生成的耗时，p95 会被拉高到远超首包的水平，对冲就几乎不会触发。
+
+    熔断器连续失败 failure_threshold 次 (或错误率 EWMA 超过阈值) 后打开，
+    cooldown_s 内直接跳过该 provider；冷却结束后半开，只放行一个探测请求，成功则关闭。
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        failure_threshold: int = 3,
+        error_rate_threshold: float = 0.5,
+        min_samples: int = 10,
+        cooldown_s: float = 30.0,
+        window: int = 200,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+        self.clock = clock
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._generation_latencies: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if self.clock() - self.opened_at < self.cooldown_s:
+                    return False
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency_s: float, first_chunk: bool = True) -> None:
+        """first_chunk=False 表示 latency_s 是整段生成的耗时，只计入生成延迟窗口。"""
+        with self._lock:
+            self.requests += 1
+            if first_chunk:
+                self._latencies.append(latency_s)
+                self.latency_ewma = (
+                    latency_s
+                    if self.latency_ewma is None
+                    else self.alpha * latency_s + (1 - self.alpha) * self.latency_ewma
+                )
+            else:
+                self._generation_latencies.append(latency_s)
+            self.error_ewma *= 1 - self.alpha
+            self.consecutive_failures = 0
+            self.state = "closed"
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.error_ewma = self.alpha + (1 - self.alpha) * self.error_ewma
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if (
+                self.state == "half_open"
+                or self.consecutive_failures >= self.failure_threshold
+                or (self.requests >= self.min_samples and self.error_ewma >= self.error_rate_threshold)
+            ):
+                self.state = "open"
+                self.opened_at = self.clock()
+
+    def release(self) -> None:
+        """请求被取消 (对冲中落败) 时不计成功或失败，只释放半开状态的探测名额。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def latency_quantile(self, q: float, first_chunk: bool = True) -> Optional[float]:
+        with self._lock:
+            window = self._latencies if first_chunk else self._generation_latencies
+            if len(window) < self.min_samples:
+                return None
+            ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "state": self.state,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if (p95 := self.latency_quantile(0.95)) is not None else None,
+            "generation_p95_ms": (
+                round(gen_p95 * 1000, 1)
+                if (gen_p95 := self.latency_quantile(0.95, first_chunk=False)) is not None
+                else None
+            ),
+            "error_rate_ewma": round(self.error_ewma, 3),
+            "requests": self.requests,
+        }
+
+
+@dataclass
+class RoutedProvider:
+    name: str
+    provider: AgentProvider
+    health: ProviderHealth
+
+
+class AllProvidersFailed(RuntimeError):
+    pass
+
+
+class ProviderRouter:
+    """
+    按顺序路由到多个 provider (例如主模型与更便宜的备用模型)：
+
+    - 对冲：主 provider 超过其首包延迟 p95 仍无输出时，向下一个 provider 发出第二个请求，先出首包者胜出
+    - 熔断：熔断打开的 provider 直接跳过，不再等待超时
+    - 兜底：全部失败时返回同一提示词最近一次的成功回答，或固定的提示语 (fallback=True)
+    """
+
+    def __init__(
+        self,
+        providers: List[RoutedProvider],
+        hedge_delay_s: float = 2.0,
+        min_hedge_delay_s: float = 0.05,
+        hedge_quantile: float = 0.95,
+        first_chunk_timeout_s: float = 10.0,
+        canned_answer: str = CANNED_ANSWER,
+        answer_cache_size: int = 256,
+    ) -> None:
+        if not providers:
+            raise ValueError("provider_router_requires_providers")
+        self.providers = providers
+        self.hedge_delay_s = hedge_delay_s
+        self.min_hedge_delay_s = min_hedge_delay_s
+        self.hedge_quantile = hedge_quantile
+        self.first_chunk_timeout_s = first_chunk_timeout_s
+        self.canned_answer = canned_answer
+        self.answer_cache_size = answer_cache_size
+        self._answers: OrderedDict[str, str] = OrderedDict()
+        self._answers_lock = threading.Lock()
+
+    # --- 兜底回答 ---
+
+    def _answer_key(self, system_instruction: str, prompt: str) -> str:
+        return hashlib.sha1(f"{system_instruction}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, message: str) -> None:
+        with self._answers_lock:
+            self._answers[key] = message
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.answer_cache_size:
+                self._answers.popitem(last=False)
+
+    def _fallback(self, key: str) -> dict[str, object]:
+        with self._answers_lock:
+            cached = self._answers.get(key)
+        if cached is not None:
+            return {"message": cached, "model": "cached", "tokens_used": 0, "fallback": True}
+        return {"message": self.canned_answer, "model": "canned", "tokens_used": 0, "fallback": True}
+
+    def _hedge_delay(self, routed: RoutedProvider) -> float:
+        observed = routed.health.latency_quantile(self.hedge_quantile)
+        delay = self.hedge_delay_s if observed is None else observed
+        return max(delay, self.min_hedge_delay_s)
+
+    def snapshot(self) -> dict[str, object]:
+        return {routed.name: routed.health.snapshot() for routed in self.providers}
+
+    # --- 同步接口 (依次尝试，不做对冲) ---
+
+    def generate(
+        self,
+        *,
+        system_instruction: str,
+        prompt: str,
+        history: Iterable[AgentConversationItem],
+        image_data: Optional[AgentImagePayload] = None,
+    ) -> dict[str, object]:
+        history = list(history)
+        key = self._answer_key(system_instruction, prompt)
+        for routed in self.providers:
+            if not routed.health.allow_request():
+                continue
+            started = time.monotonic()
+            try:
+                result = routed.provider.generate(
+                    system_instruction=system_instruction, prompt=prompt, history=history, image_data=image_data
+                )
+            except Exception:
+                routed.health.record_failure()
+                continue
+            routed.health.record_success(time.monotonic() - started, first_chunk=False)
+            self._remember(key, str(result["message"]))
+            return result
+        return self._fallback(key)
+
+    # --- 流式接口 ---
+
+    async def _first_chunk(
+        self, kwargs: dict[str, object]
+    ) -> tuple[RoutedProvider, ProviderChunk, AsyncIterator[ProviderChunk]]:
+        """启动首个可用的 provider，超过对冲延迟或失败时启动下一个；返回最先产出首包的那个。"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.first_chunk_timeout_s
+        queue = list(self.providers)
+        pending: dict[asyncio.Task, tuple[RoutedProvider, AsyncIterator[ProviderChunk], float]] = {}
+
+        def launch() -> bool:
+            # 真正发出请求时才询问熔断器，避免半开状态的探测名额被占住却从未使用
+            while queue:
+                routed = queue.pop(0)
+                if not routed.health.allow_request():
+                    continue
+                iterator = routed.provider.stream(**kwargs).__aiter__()
+                pending[asyncio.ensure_future(iterator.__anext__())] = (routed, iterator, loop.time())
+                return True
+            return False
+
+        async def cancel(task: asyncio.Task) -> None:
+            routed, iterator, _ = pending.pop(task)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            try:
+                await iterator.aclose()
+            except Exception:
+                pass
+            routed.health.release()
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    for task in list(pending):
+                        routed = pending[task][0]
+                        await cancel(task)
+                        routed.health.record_failure()
+                    break
+                # 只有一个请求在进行且还有备选时，到对冲延迟就发出第二个请求
+                wait_s = remaining
+                if queue and len(pending) == 1:
+                    (only,) = pending.values()
+                    wait_s = min(remaining, max(only[2] + self._hedge_delay(only[0]) - loop.time(), 0))
+                done, _ = await asyncio.wait(pending, timeout=wait_s, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if queue and len(pending) == 1:
+                        launch()
+                    continue
+
+                for task in done:
+                    routed, iterator, started = pending.pop(task)
+                    try:
+                        chunk = task.result()
+                    except Exception:
+                        # 包括没有任何输出就结束 (StopAsyncIteration)
+                        routed.health.record_failure()
+                        continue
+                    routed.health.record_success(loop.time() - started)
+                    for other in list(pending):
+                        await cancel(other)
+                    return routed, chunk, iterator
+
+                if queue and not pending:
+                    launch()
+        finally:
+            for task in list(pending):
+                await cancel(task)
+        raise AllProvidersFailed("all_providers_failed")
+
+    async def stream(
+        self,
+        *,
+        system_instruction: str,
+        prompt: str,
+        history: Iterable[AgentConversationItem],
+        image_data: Optional[AgentImagePayload] = None,
+    ) -> AsyncIterator[ProviderChunk]:
+        kwargs: dict[str, object] = {
+            "system_instruction": system_instruction,
+            "prompt": prompt,
+            "history": list(history),
+            "image_data": image_data,
+        }
+        key = self._answer_key(system_instruction, prompt)
+        try:
+            routed, first, iterator = await self._first_chunk(kwargs)
+        except AllProvidersFailed:
+            result = self._fallback(key)
+            yield ProviderChunk(text=str(result["message"]))
+            yield ProviderChunk(done=True, model=str(result["model"]), fallback=True)
+            return
+
+        # 首包之后不再切换 provider：已经输出的内容无法撤回
+        parts: list[str] = []
+        chunk = first
+        try:
+            while True:
+                if chunk.text:
+                    parts.append(chunk.text)
+                yield chunk
+                if chunk.done:
+                    break
+                chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            pass
+        except Exception:
+            routed.health.record_failure()
+            raise
+        finally:
+            await iterator.aclose()
+        if parts:
+            self._remember(key, "".join(parts).strip())
+
+
+def build_default_router() -> ProviderRouter:
+    """主模型 + 更便宜的备用模型 (AI_AGENT_GEMINI_FALLBACK_MODEL，设为空则不启用)。"""
+    from agent_plane.providers.gemini import GeminiProvider
+
+    primary = GeminiProvider()
+    providers = [RoutedProvider(primary.model_name, primary, ProviderHealth())]
+    fallback_model = os.getenv("AI_AGENT_GEMINI_FALLBACK_MODEL", "gemini-2.0-flash-lite").strip()
+    if fallback_model and fallback_model != primary.model_name:
+        providers.append(RoutedProvider(fallback_model, GeminiProvider(model_name=fallback_model), ProviderHealth()))
+    return ProviderRouter(
+        providers,
+        hedge_delay_s=float(os.getenv("AI_AGENT_HEDGE_DELAY_SECONDS", "2.0") or "2.0"),
+        first_chunk_timeout_s=float(os.getenv("AI_AGENT_FIRST_CHUNK_TIMEOUT_SECONDS", "10") or "10"),
+    )
@@ -1,3 +1,5 @@
+from .context import CompactedContext, ConversationContextManager
 from .conversation import compact_history
+from .tokens import estimate_tokens
 
-__all__ = ["compact_history"]
+__all__ = ["CompactedContext", "ConversationContextManager", "compact_history", "estimate_tokens"]
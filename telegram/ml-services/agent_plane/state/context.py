@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from agent_plane.contracts.models import AgentContextStats, AgentConversationItem
+from agent_plane.prompts import ContextSection, render_context_sections
+from agent_plane.state.conversation import compact_history
+from agent_plane.state.tokens import estimate_tokens
+
+# 每条消息在请求体中的固定开销 (role、parts 等结构)
+TURN_OVERHEAD_TOKENS = 4
+SUMMARY_LINE_CHARS = 60
+# 每个会话记住的已摘要消息数，超出后最早的记录被淘汰
+SUMMARIZED_DIGESTS = 512
+_SENTENCE_END = re.compile(r"[。！？!?\n]")
+
+
+def _summarize_turn(item: AgentConversationItem) -> str:
+    """抽取式摘要：保留每条消息的第一句。"""
+    text = " ".join(item.content.split())
+    match = _SENTENCE_END.search(text)
+    sentence = text[: match.start() + 1] if match else text
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS] + "…"
+    return f"{'用户' if item.role == 'user' else '助手'}：{sentence}"
+
+
+def _turn_tokens(item: AgentConversationItem) -> int:
+    return estimate_tokens(item.content.strip()) + TURN_OVERHEAD_TOKENS
+
+
+def _turn_digest(item: AgentConversationItem) -> str:
+    return hashlib.sha1(f"{item.role}\x00{item.content}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ConversationState:
+    summary_lines: List[str] = field(default_factory=list)
+    summarized: set[str] = field(default_factory=set)
+    summarized_order: deque[str] = field(default_factory=deque)
+    touched_at: float = 0.0
+
+
+@dataclass(frozen=True)
+class CompactedContext:
+    history: List[AgentConversationItem]
+    summary: str
+    context_blocks: str
+    stats: AgentContextStats
+
+
+class ConversationContextManager:
+    """
+    在 token 预算内组装提示词上下文：
+    最近的对话原样保留，更早的对话折叠成按会话缓存、增量更新的摘要。
+
+    后端只发送最近若干条消息 (滑动窗口)，因此摘要按每条消息的内容摘要识别已处理过的消息，
+    而不依赖历史的前缀；滑出窗口的消息仍保留在摘要中。
+    会话状态按 (userId, conversationId) 区分，不同用户使用相同的会话 ID 也不会共享摘要。
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        recent_turns: int = 8,
+        context_share: float = 0.4,
+        summary_max_tokens: int = 400,
+        max_conversations: int = 1024,
+        state_ttl_s: float = 6 * 3600,
+    ) -> None:
+        self.token_budget = token_budget or int(os.getenv("AI_AGENT_PROMPT_TOKEN_BUDGET", "2000") or "2000")
+        self.recent_turns = recent_turns
+        self.context_share = context_share
+        self.summary_max_tokens = summary_max_tokens
+        self.max_conversations = max_conversations
+        self.state_ttl_s = state_ttl_s
+        self._states: OrderedDict[tuple[str, str], ConversationState] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_state(self, user_id: Optional[str], conversation_id: Optional[str]) -> ConversationState:
+        if not user_id or not conversation_id:
+            return ConversationState()
+        key = (user_id, conversation_id)
+        now = time.monotonic()
+        state = self._states.get(key)
+        if state is None or now - state.touched_at > self.state_ttl_s:
+            state = ConversationState()
+            self._states[key] = state
+        state.touched_at = now
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_conversations:
+            self._states.popitem(last=False)
+        return state
+
+    def _update_summary(self, state: ConversationState, older: List[AgentConversationItem]) -> None:
+        """只为第一次移出最近窗口的消息生成摘要，按时间顺序追加。"""
+        for item in older:
+            digest = _turn_digest(item)
+            if digest in state.summarized:
+                continue
+            state.summary_lines.append(_summarize_turn(item))
+            state.summarized.add(digest)
+            state.summarized_order.append(digest)
+            if len(state.summarized_order) > SUMMARIZED_DIGESTS:
+                state.summarized.discard(state.summarized_order.popleft())
+
+        # 摘要超出上限时丢弃最早的部分
+        while state.summary_lines and estimate_tokens("\n".join(state.summary_lines)) > self.summary_max_tokens:
+            state.summary_lines.pop(0)
+
+    def _fit_context(self, sections: List[ContextSection], limit: int) -> str:
+        sections = [ContextSection(section.title, list(section.rows)) for section in sections]
+        rendered = render_context_sections(sections)
+        # 超出份额时从条目最多的分区末尾开始裁剪
+        while estimate_tokens(rendered) > limit and any(section.rows for section in sections):
+            largest = max(sections, key=lambda section: len(section.rows))
+            largest.rows.pop()
+            rendered = render_context_sections(sections)
+        return rendered
+
+    def build(
+        self,
+        *,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+        history: Iterable[AgentConversationItem],
+        sections: List[ContextSection],
+        fixed_text: str,
+    ) -> CompactedContext:
+        """fixed_text 为无论如何都要发送的部分 (系统指令与当前问题)。"""
+        turns = [item for item in history if item.content.strip()]
+        older = turns[: -self.recent_turns] if len(turns) > self.recent_turns else []
+        recent = turns[len(older):]
+        fixed_tokens = estimate_tokens(fixed_text)
+
+        with self._lock:
+            state = self._get_state(user_id, conversation_id)
+            self._update_summary(state, older)
+            summary_lines = list(state.summary_lines)
+            summarized_turns = len(state.summarized)
+
+        available = max(self.token_budget - fixed_tokens, 0)
+        context_blocks = self._fit_context(sections, int(available * self.context_share))
+        context_tokens = estimate_tokens(context_blocks)
+
+        remaining = available - context_tokens - estimate_tokens("\n".join(summary_lines))
+        kept_turns: list[AgentConversationItem] = []
+        for item in reversed(recent):
+            cost = _turn_tokens(item)
+            if cost > remaining:
+                break
+            kept_turns.insert(0, item)
+            remaining -= cost
+
+        # 放不下的近期对话也折叠进本次摘要：优先保留较新的，按时间顺序排列
+        dropped = recent[: len(recent) - len(kept_turns)]
+        dropped_lines: list[str] = []
+        for item in reversed(dropped):
+            line = _summarize_turn(item)
+            if estimate_tokens(line) > remaining:
+                break
+            dropped_lines.insert(0, line)
+            remaining -= estimate_tokens(line)
+        summary_lines.extend(dropped_lines)
+        summary = "\n".join(summary_lines)
+        while summary_lines and estimate_tokens(summary) + context_tokens > available:
+            summary_lines.pop(0)
+            summary = "\n".join(summary_lines)
+
+        prompt_tokens = (
+            fixed_tokens + context_tokens + estimate_tokens(summary) + sum(_turn_tokens(item) for item in kept_turns)
+        )
+        baseline_tokens = (
+            fixed_tokens
+            + estimate_tokens(render_context_sections(sections))
+            + sum(_turn_tokens(item) for item in compact_history(turns))
+        )
+        stats = AgentContextStats(
+            promptTokens=prompt_tokens,
+            baselineTokens=baseline_tokens,
+            savedTokens=baseline_tokens - prompt_tokens,
+            tokenBudget=self.token_budget,
+            summarizedTurns=summarized_turns + len(dropped),
+        )
+        return CompactedContext(history=kept_turns, summary=summary, context_blocks=context_blocks, stats=stats)
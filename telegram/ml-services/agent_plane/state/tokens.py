@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import re
+
+# 中日韩文字与全角标点大约一个字一个 token，其余文本大约四个字符一个 token
+_WIDE_CHARS = re.compile(r"[　-〿㐀-䶿一-鿿豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    wide = len(_WIDE_CHARS.findall(text))
+    narrow = len(text) - wide
+    return wide + (narrow + 3) // 4
@@ -0,0 +1,115 @@
+import unittest
+from pathlib import Path
+import sys
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from agent_plane.contracts.models import (
+    AgentContextSnapshot,
+    AgentConversationItem,
+    AgentNewsItem,
+    AgentUserSnapshot,
+    NewsContextSnapshot,
+)
+from agent_plane.prompts import collect_context_sections, render_context_blocks
+from agent_plane.state import ConversationContextManager
+
+
+def _history(turns: int, length: int = 200) -> list[AgentConversationItem]:
+    return [
+        AgentConversationItem(
+            role="user" if index % 2 == 0 else "assistant",
+            content=f"第{index}轮的消息。" + "详细内容" * (length // 4),
+        )
+        for index in range(turns)
+    ]
+
+
+def _snapshot() -> AgentContextSnapshot:
+    return AgentContextSnapshot(
+        user=AgentUserSnapshot(id="u1", username="tester"),
+        news=NewsContextSnapshot(
+            items=[
+                AgentNewsItem(postId=f"n{index}", title=f"新闻标题{index}", summary="新闻摘要" * 20, source="wire")
+                for index in range(3)
+            ]
+        ),
+        generatedAt="2026-04-16T00:00:00Z",
+    )
+
+
+class AgentContextCompactionTestCase(unittest.TestCase):
+    def test_render_context_blocks_keeps_full_rows(self) -> None:
+        rendered = render_context_blocks(_snapshot(), ["news"])
+        self.assertTrue(rendered.startswith("【新闻简报】\n- 新闻标题0（wire）：新闻摘要"))
+        self.assertEqual(rendered.count("\n- "), 3)
+
+    def test_long_history_fits_budget_with_incremental_summary(self) -> None:
+        manager = ConversationContextManager(token_budget=800)
+        sections = collect_context_sections(_snapshot(), ["news"])
+
+        first = manager.build(
+            user_id="u1", conversation_id="c1", history=_history(30), sections=sections, fixed_text="系统指令"
+        )
+        self.assertLessEqual(first.stats.promptTokens, 800)
+        self.assertGreater(first.stats.savedTokens, 0)
+        self.assertEqual(first.stats.baselineTokens - first.stats.promptTokens, first.stats.savedTokens)
+        self.assertIn("用户：第0轮的消息。", first.summary)
+        self.assertLessEqual(len(first.history), manager.recent_turns)
+        self.assertEqual(first.history[-1].content, _history(30)[-1].content)
+
+        manager.build(
+            user_id="u1", conversation_id="c1", history=_history(32), sections=sections, fixed_text="系统指令"
+        )
+        self.assertEqual(len(manager._states[("u1", "c1")].summarized), 24)
+        self.assertEqual(len(manager._states[("u1", "c1")].summary_lines), 24)
+
+    def test_sliding_history_window_extends_summary_in_order(self) -> None:
+        manager = ConversationContextManager(token_budget=4000, recent_turns=8)
+        full = _history(20, length=8)
+
+        # 后端每次只发送最近 10 条消息
+        for end in range(10, 21, 2):
+            compacted = manager.build(
+                user_id="u1", conversation_id="c1", history=full[end - 10 : end], sections=[], fixed_text="系统指令"
+            )
+
+        state = manager._states[("u1", "c1")]
+        self.assertEqual(len(state.summary_lines), 12)
+        self.assertEqual(state.summary_lines, [f"{'用户' if i % 2 == 0 else '助手'}：第{i}轮的消息。" for i in range(12)])
+        self.assertEqual(compacted.summary.splitlines()[0], "用户：第0轮的消息。")
+        self.assertEqual(compacted.history, full[12:])
+
+    def test_same_conversation_id_is_not_shared_between_users(self) -> None:
+        manager = ConversationContextManager(token_budget=4000, recent_turns=2)
+        manager.build(user_id="u1", conversation_id="c1", history=_history(6, length=8), sections=[], fixed_text="")
+        other = manager.build(user_id="u2", conversation_id="c1", history=[], sections=[], fixed_text="")
+
+        self.assertEqual(other.summary, "")
+        self.assertEqual(len(manager._states[("u1", "c1")].summary_lines), 4)
+        self.assertEqual(manager._states[("u2", "c1")].summary_lines, [])
+
+    def test_dropped_recent_turns_are_summarized_chronologically(self) -> None:
+        manager = ConversationContextManager(token_budget=160, recent_turns=8)
+        compacted = manager.build(user_id="u1", conversation_id=None, history=_history(8), sections=[], fixed_text="")
+
+        self.assertLess(len(compacted.history), 8)
+        lines = compacted.summary.splitlines()
+        indexes = [int(line.split("第")[1].split("轮")[0]) for line in lines]
+        self.assertEqual(indexes, sorted(indexes))
+        self.assertEqual(indexes[-1] + 1, 8 - len(compacted.history))
+
+    def test_context_rows_are_sent_in_full_every_turn(self) -> None:
+        manager = ConversationContextManager(token_budget=4000)
+        sections = collect_context_sections(_snapshot(), ["news"])
+
+        first = manager.build(user_id="u1", conversation_id="c1", history=[], sections=sections, fixed_text="")
+        second = manager.build(user_id="u1", conversation_id="c1", history=[], sections=sections, fixed_text="")
+        self.assertEqual(first.context_blocks, second.context_blocks)
+        self.assertEqual(second.context_blocks.count("\n- "), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -16,7 +16,69 @@ from agent_plane.contracts.models import (
     NewsContextSnapshot,
     NotificationContextSnapshot,
 )
-from agent_plane.planner import build_execution_plan
+from agent_plane.planner import KeywordAutomaton, build_execution_plan, score_scopes
+from agent_plane.planner.policy import SCOPE_KEYWORDS, _plan
+
+BENCH_MESSAGES = [
+    "帮我看下最近通知里最重要的内容",
+    "今天有什么热点新闻，顺便看看关注的人发了什么动态",
+    "Any unread notifications or news headlines for me today?",
+    "给我一个下一步建议，最好能结合我最近的时间线",
+]
+
+
+class _Counter:
+    def __init__(self) -> None:
+        self.steps = 0
+
+
+class _CountingDict(dict):
+    """自动机的 goto 表：记录每次状态转移查询。"""
+
+    counter: _Counter
+
+    def __contains__(self, key) -> bool:
+        self.counter.steps += 1
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self.counter.steps += 1
+        return super().get(key, default)
+
+
+class _CountingList(list):
+    """自动机的 fail 表：记录每次沿失败链回退。"""
+
+    counter: _Counter
+
+    def __getitem__(self, index):
+        self.counter.steps += 1
+        return super().__getitem__(index)
+
+
+def _scan_steps(automaton: KeywordAutomaton, message: str) -> int:
+    counter = _Counter()
+    goto = []
+    for transitions in automaton._goto:
+        counting = _CountingDict(transitions)
+        counting.counter = counter
+        goto.append(counting)
+    fail = _CountingList(automaton._fail)
+    fail.counter = counter
+    original = automaton._goto, automaton._fail
+    automaton._goto, automaton._fail = goto, fail
+    try:
+        automaton.score(message.lower())
+    finally:
+        automaton._goto, automaton._fail = original
+    return counter.steps
+
+
+def _with_filler(count: int) -> dict:
+    return {
+        scope: keywords + tuple((f"{scope}term{index}x", 1.0) for index in range(count))
+        for scope, keywords in SCOPE_KEYWORDS.items()
+    }
 
 
 class AgentPolicyTestCase(unittest.TestCase):
@@ -61,7 +123,35 @@ class AgentPolicyTestCase(unittest.TestCase):
 
         plan = build_execution_plan("帮我看下最近通知里最重要的内容", snapshot)
         self.assertEqual(plan.active_scopes, ["notifications"])
+        self.assertEqual(plan.scope_scores, {"notifications": 2.0})
+
+        plan = build_execution_plan("Any new NEWS? also my unread notifications and news", snapshot)
+        self.assertEqual(plan.active_scopes, ["notifications", "news"])
+        self.assertEqual(plan.response_style, "blended_context")
+
+        _plan.cache_clear()
+        build_execution_plan("帮我看下最近通知", snapshot)
+        build_execution_plan("  帮我看下最近通知 ", snapshot)
+        self.assertEqual(_plan.cache_info().hits, 1)
+
+    def test_english_keywords_match_whole_words_only(self) -> None:
+        self.assertEqual(score_scopes("postgres 和 newsletter 怎么配置"), {})
+        self.assertEqual(score_scopes("看看我关注的人的 posts"), {"feed": 2.0})
+        self.assertEqual(score_scopes("新闻新闻新闻"), {"news": 2.0})
+
+    def test_scoring_cost_does_not_grow_with_keyword_count(self) -> None:
+        small = KeywordAutomaton(_with_filler(10))
+        large = KeywordAutomaton(_with_filler(5000))
+        self.assertEqual(small.score(BENCH_MESSAGES[1]), large.score(BENCH_MESSAGES[1]))
 
+        # 统计状态转移次数而不是耗时：失败链回退的总次数不超过消息长度，
+        # 因此每条消息的转移次数至多为长度的常数倍，与关键词数量无关
+        for message in BENCH_MESSAGES:
+            small_steps = _scan_steps(small, message)
+            large_steps = _scan_steps(large, message)
+            self.assertLessEqual(small_steps, 4 * len(message))
+            self.assertLessEqual(large_steps, 4 * len(message))
+        self.assertGreater(large.state_count, small.state_count * 100)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,178 @@
+import asyncio
+import unittest
+from pathlib import Path
+import sys
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from agent_plane.providers import ProviderChunk, ProviderHealth, ProviderRouter, RoutedProvider
+
+
+class ScriptedProvider:
+    """首包前等待 delay 秒；fail=True 时直接抛错。"""
+
+    def __init__(self, name: str, text: str = "", delay: float = 0.0, fail: bool = False) -> None:
+        self.name = name
+        self.text = text or f"来自 {name} 的回答"
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    def generate(self, **kwargs) -> dict[str, object]:
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name}_failed")
+        return {"message": self.text, "model": self.name, "tokens_used": 3}
+
+    async def stream(self, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError(f"{self.name}_failed")
+            yield ProviderChunk(text=self.text)
+            yield ProviderChunk(done=True, model=self.name, tokens_used=3)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+KWARGS = {"system_instruction": "系统指令", "prompt": "用户问题：你好", "history": []}
+
+
+def _router(*providers: ScriptedProvider, clock=None, **options) -> ProviderRouter:
+    routed = [
+        RoutedProvider(p.name, p, ProviderHealth(failure_threshold=2, cooldown_s=30, clock=clock or FakeClock()))
+        for p in providers
+    ]
+    return ProviderRouter(routed, **options)
+
+
+async def _collect(iterator) -> list[ProviderChunk]:
+    return [chunk async for chunk in iterator]
+
+
+class ProviderRouterTestCase(unittest.TestCase):
+    def test_slow_primary_is_hedged_and_loser_cancelled(self) -> None:
+        primary = ScriptedProvider("primary", delay=1.0)
+        backup = ScriptedProvider("backup", delay=0.01)
+        router = _router(primary, backup, hedge_delay_s=0.05, min_hedge_delay_s=0.01)
+
+        chunks = asyncio.run(_collect(router.stream(**KWARGS)))
+
+        self.assertEqual(chunks[-1].model, "backup")
+        self.assertFalse(chunks[-1].fallback)
+        self.assertEqual(primary.cancelled, 1)
+        # 对冲落败不计为失败
+        self.assertEqual(router.providers[0].health.consecutive_failures, 0)
+
+    def test_fast_primary_never_triggers_hedge(self) -> None:
+        primary = ScriptedProvider("primary")
+        backup = ScriptedProvider("backup")
+        router = _router(primary, backup, hedge_delay_s=0.5)
+
+        chunks = asyncio.run(_collect(router.stream(**KWARGS)))
+
+        self.assertEqual(chunks[-1].model, "primary")
+        self.assertEqual(backup.calls, 0)
+
+    def test_breaker_opens_then_skips_and_recovers_after_cooldown(self) -> None:
+        clock = FakeClock()
+        primary = ScriptedProvider("primary", fail=True)
+        backup = ScriptedProvider("backup")
+        router = _router(primary, backup, clock=clock)
+
+        for _ in range(2):
+            self.assertEqual(router.generate(**KWARGS)["model"], "backup")
+        self.assertEqual(router.providers[0].health.state, "open")
+
+        router.generate(**KWARGS)
+        self.assertEqual(primary.calls, 2)
+
+        # 冷却结束后半开，探测请求成功即关闭
+        clock.now = 31
+        primary.fail = False
+        self.assertEqual(router.generate(**KWARGS)["model"], "primary")
+        self.assertEqual(router.providers[0].health.state, "closed")
+
+    def test_half_open_fallback_is_not_held_when_primary_answers(self) -> None:
+        clock = FakeClock()
+        primary = ScriptedProvider("primary")
+        backup = ScriptedProvider("backup")
+        router = _router(primary, backup, clock=clock, hedge_delay_s=0.5)
+        backup_health = router.providers[1].health
+        for _ in range(2):
+            backup_health.record_failure()
+        clock.now = 31
+
+        for _ in range(3):
+            chunks = asyncio.run(_collect(router.stream(**KWARGS)))
+            self.assertEqual(chunks[-1].model, "primary")
+        self.assertEqual(backup.calls, 0)
+
+        # 备用模型从未被启动，探测名额仍然可用
+        self.assertTrue(backup_health.allow_request())
+
+    def test_failed_half_open_probe_reopens_breaker(self) -> None:
+        clock = FakeClock()
+        health = ProviderHealth(failure_threshold=1, cooldown_s=10, clock=clock)
+        health.record_failure()
+        self.assertFalse(health.allow_request())
+
+        clock.now = 11
+        self.assertTrue(health.allow_request())
+        self.assertFalse(health.allow_request())
+        health.record_failure()
+        self.assertEqual(health.state, "open")
+        self.assertFalse(health.allow_request())
+
+    def test_all_failed_returns_cached_answer_then_canned(self) -> None:
+        primary = ScriptedProvider("primary", text="缓存下来的回答")
+        router = _router(primary)
+        asyncio.run(_collect(router.stream(**KWARGS)))
+
+        primary.fail = True
+        chunks = asyncio.run(_collect(router.stream(**KWARGS)))
+        self.assertEqual(chunks[0].text, "缓存下来的回答")
+        self.assertEqual(chunks[-1].model, "cached")
+        self.assertTrue(chunks[-1].fallback)
+
+        other = router.generate(system_instruction="系统指令", prompt="另一个问题", history=[])
+        self.assertEqual(other["model"], "canned")
+        self.assertTrue(other["fallback"])
+
+    def test_hedge_delay_tracks_observed_p95(self) -> None:
+        router = _router(ScriptedProvider("primary"), hedge_delay_s=2.0, min_hedge_delay_s=0.0)
+        health = router.providers[0].health
+        self.assertEqual(router._hedge_delay(router.providers[0]), 2.0)
+        for index in range(20):
+            health.record_success(0.1 + index * 0.01)
+        self.assertAlmostEqual(router._hedge_delay(router.providers[0]), 0.29)
+
+    def test_sync_generation_latency_does_not_feed_hedge_delay(self) -> None:
+        router = _router(ScriptedProvider("primary"), hedge_delay_s=2.0, min_hedge_delay_s=0.0)
+        health = router.providers[0].health
+        for _ in range(20):
+            health.record_success(0.1)
+            health.record_success(8.0, first_chunk=False)
+        router.generate(system_instruction="系统指令", prompt="用户问题：你好", history=[])
+
+        self.assertAlmostEqual(router._hedge_delay(router.providers[0]), 0.1)
+        self.assertAlmostEqual(health.latency_ewma, 0.1)
+        self.assertEqual(len(health._generation_latencies), 21)
+        self.assertIsNotNone(health.snapshot()["generation_p95_ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import unittest
+from pathlib import Path
+import sys
+from unittest import mock
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from agent_plane.contracts.models import AgentContextSnapshot, AgentRespondRequest, AgentUserSnapshot
+from agent_plane.orchestrator import AgentOrchestrator
+from agent_plane.providers import GeminiProvider, ProviderChunk
+
+
+class FakeStreamingProvider:
+    def __init__(self, parts: list[str]) -> None:
+        self.parts = parts
+
+    def generate(self, **kwargs) -> dict[str, object]:
+        return {"message": "".join(self.parts), "model": "fake-model", "tokens_used": 0}
+
+    async def stream(self, **kwargs):
+        for part in self.parts:
+            await asyncio.sleep(0)
+            yield ProviderChunk(text=part)
+        yield ProviderChunk(done=True, model="fake-model", tokens_used=7)
+
+
+def _request(message: str = "今天有什么值得关注") -> AgentRespondRequest:
+    return AgentRespondRequest(
+        userId="u1",
+        message=message,
+        contextSnapshot=AgentContextSnapshot(
+            user=AgentUserSnapshot(id="u1", username="tester"),
+            generatedAt="2026-04-16T00:00:00Z",
+        ),
+    )
+
+
+async def _collect(iterator) -> list:
+    return [item async for item in iterator]
+
+
+class AgentStreamingTestCase(unittest.TestCase):
+    def test_orchestrator_streams_deltas_then_full_data(self) -> None:
+        orchestrator = AgentOrchestrator(FakeStreamingProvider(["你好", "，", "世界"]))
+
+        events = asyncio.run(_collect(orchestrator.respond_stream(_request())))
+
+        self.assertEqual([event for event, _ in events], ["meta", "delta", "delta", "delta", "done"])
+        self.assertEqual(events[-1][1]["message"], "你好，世界")
+        self.assertEqual(events[-1][1]["model"], "fake-model")
+        response = asyncio.run(orchestrator.respond_async(_request()))
+        self.assertEqual(response.data.message, "你好，世界")
+        self.assertEqual(response.data.suggestions, events[-1][1]["suggestions"])
+
+    def test_gemini_provider_parses_sse_stream(self) -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.assertTrue(request.url.path.endswith(":streamGenerateContent"))
+            self.assertEqual(request.url.params["alt"], "sse")
+            self.assertEqual(request.headers["x-goog-api-key"], "test-key")
+            self.assertNotIn("key=", str(request.url))
+            body = "".join(
+                f"data: {json.dumps(payload)}\r\n\r\n"
+                for payload in [
+                    {"candidates": [{"content": {"parts": [{"text": "第一段"}]}}]},
+                    {"candidates": [{"content": {"parts": [{"text": "第二段"}]}}],
+                     "usageMetadata": {"totalTokenCount": 42}},
+                ]
+            )
+            return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+        with mock.patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"}):
+            provider = GeminiProvider(transport=httpx.MockTransport(handler))
+
+        async def run() -> list[ProviderChunk]:
+            try:
+                return await _collect(provider.stream(system_instruction="s", prompt="p", history=[]))
+            finally:
+                await provider.aclose()
+
+        chunks = asyncio.run(run())
+        self.assertEqual([chunk.text for chunk in chunks if not chunk.done], ["第一段", "第二段"])
+        self.assertTrue(chunks[-1].done)
+        self.assertEqual(chunks[-1].tokens_used, 42)
+
+    def test_stream_endpoint_emits_server_sent_events(self) -> None:
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from agent_plane.http import router
+
+        # agent_plane.http.router 在包上被 APIRouter 实例遮蔽，从 sys.modules 取模块
+        router_module = sys.modules["agent_plane.http.router"]
+        app = FastAPI()
+        app.include_router(router, prefix="/agent")
+        with mock.patch.object(router_module, "orchestrator", AgentOrchestrator(FakeStreamingProvider(["a", "b"]))):
+            response = TestClient(app).post("/agent/respond/stream", json=_request().model_dump())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+        self.assertEqual(events, ["event: meta", "event: delta", "event: delta", "event: done"])
+
+
+if __name__ == "__main__":
+    unittest.main()